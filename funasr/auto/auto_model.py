@@ -16,7 +16,6 @@ from tqdm import tqdm
 
 from funasr.utils.misc import deep_update
 from funasr.register import tables
-from funasr.utils.load_utils import load_bytes
 from funasr.download.file import download_from_url
 from funasr.utils.timestamp_tools import timestamp_sentence
 from funasr.download.download_from_hub import download_model
@@ -26,6 +25,7 @@ from funasr.utils.load_utils import load_audio_text_image_video
 from funasr.train_utils.set_all_random_seed import set_all_random_seed
 from funasr.train_utils.load_pretrained_model import load_pretrained_model
 from funasr.utils import export_utils
+from funasr.utils.compile_utils import compile_model
 
 try:
     from funasr.models.campplus.utils import sv_chunk, postprocess, distribute_spk
@@ -88,8 +88,8 @@ def prepare_data_iterator(data_in, input_len=None, data_type=None, key=None):
             data_list = data_in
             key_list = ["rand_key_" + ''.join(random.choice(chars) for _ in range(13)) for _ in range(len(data_in))]
     else: # raw text; audio sample point, fbank; bytes
-        if isinstance(data_in, bytes): # audio bytes
-            data_in = load_bytes(data_in)
+        # audio bytes are converted by the models (load_audio_text_image_video), the streaming ones write them
+        # straight into their sample buffer
         if key is None:
             key = "rand_key_" + ''.join(random.choice(chars) for _ in range(13))
         data_list = [data_in]
@@ -135,7 +135,7 @@ class AutoModel:
             spk_kwargs["model_revision"] = kwargs.get("spk_model_revision", "master")
             spk_kwargs["device"] = kwargs["device"]
             spk_model, spk_kwargs = self.build_model(**spk_kwargs)
-            self.cb_model = ClusterBackend().to(kwargs["device"])
+            self.cb_model = ClusterBackend(**kwargs.get("cb_kwargs", {})).to(kwargs["device"])
             spk_mode = kwargs.get("spk_mode", 'punc_segment')
             if spk_mode not in ["default", "vad_segment", "punc_segment"]:
                 logging.error("spk_mode should be one of default, vad_segment and punc_segment.")
@@ -150,6 +150,13 @@ class AutoModel:
         self.spk_model = spk_model
         self.spk_kwargs = spk_kwargs
         self.model_path = kwargs.get("model_path")
+
+        # compiled inference with shape buckets, the metrics are in self.compile_stats.summary()
+        self.compile_stats = None
+        if kwargs.get("compile", False):
+            model.eval()
+            compile_conf = {k: v for k, v in kwargs.items() if k.startswith("compile_")}
+            self.compile_stats = compile_model(model, input_size=kwargs.get("input_size", None), **compile_conf)
         
     def build_model(self, **kwargs):
         assert "model" in kwargs
@@ -290,9 +297,36 @@ class AutoModel:
         if pbar:
             # pbar.update(1)
             pbar.set_description(f"rtf_avg: {time_escape_total/time_speech_total:0.3f}")
+        if self.compile_stats is not None and model is self.model:
+            logging.info(f"compile buckets: {self.compile_stats.summary()}")
         torch.cuda.empty_cache()
         return asr_result_list
 
+    def inference_spk_embedding(self, results, windows, kwargs=None, **cfg):
+        """
+        Speaker embeddings of the sv_chunk windows of all the vad segments: windows[i] are the windows of
+        results[i]. They are sorted by duration and sent through spk_model in batches of spk_batch_size windows,
+        and results[i]["spk_embedding"] gets the embeddings of its windows, in order.
+        """
+        speech = [w[2] for windows_i in windows for w in windows_i]
+        if len(speech) == 0:
+            return
+        order = sorted(range(len(speech)), key=lambda i: len(speech[i]))
+        spk_batch_size = max(int(kwargs.get("spk_batch_size", 64)), 1)
+        embeddings = [None] * len(speech)
+        for beg_idx in range(0, len(order), spk_batch_size):
+            batch_idx = order[beg_idx:beg_idx + spk_batch_size]
+            spk_res = self.inference([speech[i] for i in batch_idx], input_len=None, model=self.spk_model,
+                                     kwargs=kwargs, **cfg)
+            spk_embedding = torch.cat([r["spk_embedding"] for r in spk_res], dim=0)
+            for i, embedding in zip(batch_idx, spk_embedding):
+                embeddings[i] = embedding
+        offset = 0
+        for result, windows_i in zip(results, windows):
+            if len(windows_i) > 0:
+                result["spk_embedding"] = torch.stack(embeddings[offset:offset + len(windows_i)])
+            offset += len(windows_i)
+
     def inference_with_vad(self, input, input_len=None, **cfg):
         kwargs = self.kwargs
         # step.1: compute the vad model
@@ -347,6 +381,7 @@ class AutoModel:
             # pbar_sample = tqdm(colour="blue", total=n, dynamic_ncols=True)
 
             all_segments = []
+            spk_windows = [[] for _ in range(n)]
             for j, _ in enumerate(range(0, n)):
                 # pbar_sample.update(1)
                 batch_size_ms_cum += (sorted_data[j][0][1] - sorted_data[j][0][0])
@@ -359,16 +394,15 @@ class AutoModel:
                 speech_j, speech_lengths_j = slice_padding_audio_samples(speech, speech_lengths, sorted_data[beg_idx:end_idx])
                 results = self.inference(speech_j, input_len=None, model=model, kwargs=kwargs, **cfg)
                 if self.spk_model is not None:
-                    # compose vad segments: [[start_time_sec, end_time_sec, speech], [...]]
+                    # compose vad segments: [[start_time_sec, end_time_sec, speech], [...]], the speaker embeddings
+                    # of the windows of the whole file are extracted in batches after the asr
                     for _b in range(len(speech_j)):
                         vad_segments = [[sorted_data[beg_idx:end_idx][_b][0][0]/1000.0,
                                         sorted_data[beg_idx:end_idx][_b][0][1]/1000.0,
                                         np.array(speech_j[_b])]]
                         segments = sv_chunk(vad_segments)
                         all_segments.extend(segments)
-                        speech_b = [i[2] for i in segments]
-                        spk_res = self.inference(speech_b, input_len=None, model=self.spk_model, kwargs=kwargs, **cfg)
-                        results[_b]['spk_embedding'] = spk_res[0]['spk_embedding']
+                        spk_windows[sorted_data[beg_idx + _b][1]] = segments
                 beg_idx = end_idx
                 if len(results) < 1:
                     continue
@@ -385,6 +419,8 @@ class AutoModel:
             for j in range(n):
                 index = sorted_data[j][1]
                 restored_data[index] = results_sorted[j]
+            if self.spk_model is not None:
+                self.inference_spk_embedding(restored_data, spk_windows, kwargs=kwargs, **cfg)
             result = {}
 
             # results combine for texts, timestamps, speaker embeddings and others
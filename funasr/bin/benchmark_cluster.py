@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# -*- encoding: utf-8 -*-
+
+import os
+import json
+import time
+import hydra
+import logging
+import tracemalloc
+import numpy as np
+from omegaconf import DictConfig, OmegaConf
+from sklearn.metrics import adjusted_rand_score
+
+from funasr.models.campplus.cluster_backend import ClusterBackend
+from funasr.train_utils.set_all_random_seed import set_all_random_seed
+
+
+@hydra.main(config_name=None, version_base=None)
+def main_hydra(cfg: DictConfig):
+    kwargs = OmegaConf.to_container(cfg, resolve=True)
+    logging.basicConfig(level=getattr(logging, kwargs.get("log_level", "INFO").upper()))
+    main(**kwargs)
+
+
+def make_embeddings(num: int, num_spks: int, dim: int, spread: float, turn_len: int):
+    """Speaker turns of turn_len consecutive windows, embeddings spread around a random center per speaker."""
+    centers = np.random.randn(num_spks, dim)
+    turns = np.random.randint(0, num_spks, size=(num + turn_len - 1) // turn_len)
+    labels = np.repeat(turns, turn_len)[:num]
+    embs = centers[labels] + spread * np.random.randn(num, dim)
+    return embs.astype(np.float32), labels
+
+
+def run(cluster_backend, embs, labels, oracle_num):
+    tracemalloc.start()
+    time_start = time.perf_counter()
+    pred = cluster_backend(embs, oracle_num=oracle_num)
+    total_time = time.perf_counter() - time_start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "time": total_time,
+        "peak_memory_mb": peak / 2 ** 20,
+        "num_spks": int(len(np.unique(pred))),
+        "ari": adjusted_rand_score(labels, pred),
+    }
+
+
+def main(**kwargs):
+    """
+    Compare the clustering backends on synthetic speaker embeddings by number of embeddings: time, peak
+    numpy memory, number of speakers found and adjusted rand index against the true speakers. "dense" is the
+    former spectral clustering (full affinity and eigendecomposition), run up to max_dense embeddings.
+    """
+    set_all_random_seed(kwargs.get("seed", 0))
+    num_embeddings = kwargs.get("num_embeddings", [1000, 2000, 5000, 10000, 20000, 50000])
+    num_spks = kwargs.get("num_spks", 8)
+    max_dense = kwargs.get("max_dense", 10000)
+    oracle_num = num_spks if kwargs.get("oracle", False) else None
+    backends = {
+        "dense": ClusterBackend(cluster_method="spectral", sparse_thr=float("inf")),
+        "spectral": ClusterBackend(cluster_method="spectral", max_neighbors=kwargs.get("max_neighbors", 128)),
+        "hierarchical": ClusterBackend(cluster_method="hierarchical",
+                                       hierarchical_thr=kwargs.get("hierarchical_thr", 20000)),
+    }
+
+    result = []
+    for num in num_embeddings:
+        embs, labels = make_embeddings(num, num_spks, kwargs.get("dim", 192), kwargs.get("spread", 0.8),
+                                       kwargs.get("turn_len", 20))
+        result_i = {"num_embeddings": num}
+        for name, cluster_backend in backends.items():
+            if name == "dense" and num > max_dense:
+                continue
+            result_i[name] = run(cluster_backend, embs, labels, oracle_num)
+        logging.info(f"cluster benchmark: {result_i}")
+        result.append(result_i)
+
+    output_file = kwargs.get("output_file", "cluster_benchmark.json")
+    if os.path.dirname(output_file):
+        os.makedirs(os.path.dirname(output_file), exist_ok=True)
+    with open(output_file, "w") as fout:
+        json.dump(result, fout, indent=2)
+    return result
+
+
+"""
+python funasr/bin/benchmark_cluster.py \
+++num_embeddings="[1000,2000,5000,10000,20000,50000]" \
+++num_spks=8 \
+++max_dense=10000 \
+++output_file="./cluster_benchmark.json"
+"""
+if __name__ == "__main__":
+    main_hydra()
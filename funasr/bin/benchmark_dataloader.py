@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# -*- encoding: utf-8 -*-
+
+import os
+import json
+import time
+import hydra
+import logging
+import torch
+import numpy as np
+from omegaconf import DictConfig, OmegaConf
+
+from funasr.register import tables
+from funasr.download.download_from_hub import download_model
+from funasr.train_utils.set_all_random_seed import set_all_random_seed
+
+
+@hydra.main(config_name=None, version_base=None)
+def main_hydra(cfg: DictConfig):
+    kwargs = OmegaConf.to_container(cfg, resolve=True)
+    logging.basicConfig(level=getattr(logging, kwargs.get("log_level", "INFO").upper()))
+    if kwargs.get("debug", False):
+        import pdb; pdb.set_trace()
+
+    assert "model" in kwargs
+    if "model_conf" not in kwargs:
+        logging.info("download models from model hub: {}".format(kwargs.get("hub", "ms")))
+        kwargs = download_model(is_training=kwargs.get("is_training", True), **kwargs)
+
+    main(**kwargs)
+
+
+def main(**kwargs):
+    """
+    Measure the maximum loading throughput of the training dataloader of a config, without building
+    the model: the batches are fetched as fast as the DataLoader workers can produce them.
+    """
+    set_all_random_seed(kwargs.get("seed", 0))
+
+    # build tokenizer
+    tokenizer = kwargs.get("tokenizer", None)
+    if tokenizer is not None:
+        tokenizer_class = tables.tokenizer_classes.get(tokenizer)
+        tokenizer = tokenizer_class(**kwargs.get("tokenizer_conf", {}))
+    kwargs["tokenizer"] = tokenizer
+
+    # build frontend
+    frontend = kwargs.get("frontend", None)
+    if frontend is not None:
+        frontend_class = tables.frontend_classes.get(frontend)
+        frontend = frontend_class(**kwargs.get("frontend_conf", {}))
+        kwargs["input_size"] = frontend.output_size()
+    kwargs["frontend"] = frontend
+
+    dataset_conf = kwargs.get("dataset_conf")
+    dataset_conf["profile_workers"] = True
+    if kwargs.get("valid_data_set_list", None) is None:
+        kwargs["valid_data_set_list"] = kwargs.get("train_data_set_list")
+    dataloader_class = tables.dataloader_classes.get(dataset_conf.get("dataloader", "DataloaderMapStyle"))
+    dataloader = dataloader_class(**kwargs)
+    dataloader_tr, _ = dataloader.build_iter(0)
+
+    max_steps = kwargs.get("max_steps", -1)
+    warmup_steps = kwargs.get("warmup_steps", 10)
+    num_samples, num_frames = 0, 0
+    batch_wait = []
+    workers = {}
+    time_beg = time.perf_counter()
+    time_start = None
+    for batch_idx, batch in enumerate(dataloader_tr):
+        time1 = time.perf_counter()
+        if batch_idx == warmup_steps:
+            # skip the start-up of the workers
+            time_start = time_beg
+        if time_start is not None:
+            batch_wait.append(time1 - time_beg)
+            worker_stats = batch.pop("worker_stats", None)
+            if worker_stats is not None:
+                worker = workers.setdefault(worker_stats["worker_id"], {"samples": 0, "load_time": 0.0})
+                worker["samples"] += worker_stats["num_samples"]
+                worker["load_time"] += worker_stats["load_time"]
+            num_samples += next((v.shape[0] for v in batch.values() if isinstance(v, torch.Tensor)), 0)
+            if "speech_lengths" in batch:
+                num_frames += int(batch["speech_lengths"].sum())
+        if (batch_idx + 1) % kwargs.get("log_interval", 50) == 0:
+            logging.info(f"step: {batch_idx + 1}, samples: {num_samples}")
+        if 0 < max_steps <= batch_idx + 1:
+            break
+        time_beg = time.perf_counter()
+
+    if time_start is None:
+        raise RuntimeError(f"Too few batches for benchmarking, got {batch_idx + 1} <= warmup_steps: {warmup_steps}")
+    total_time = time.perf_counter() - time_start
+    batch_wait = np.array(batch_wait)
+    result = {
+        "num_workers": dataset_conf.get("num_workers", 4),
+        "batches": len(batch_wait),
+        "samples": num_samples,
+        "frames": num_frames,
+        "total_time": total_time,
+        "batches_per_sec": len(batch_wait) / total_time,
+        "samples_per_sec": num_samples / total_time,
+        "frames_per_sec": num_frames / total_time,
+        "batch_wait_mean": float(batch_wait.mean()),
+        "batch_wait_p50": float(np.percentile(batch_wait, 50)),
+        "batch_wait_p95": float(np.percentile(batch_wait, 95)),
+        "workers_samples_per_sec": {
+            str(k): v["samples"] / v["load_time"] if v["load_time"] > 0 else 0.0 for k, v in sorted(workers.items())
+        },
+    }
+    logging.info(f"dataloader benchmark: {result}")
+    output_file = kwargs.get("output_file", "dataloader_benchmark.json")
+    if os.path.dirname(output_file):
+        os.makedirs(os.path.dirname(output_file), exist_ok=True)
+    with open(output_file, "w") as fout:
+        json.dump(result, fout, indent=2)
+    return result
+
+
+"""
+python funasr/bin/benchmark_dataloader.py \
+--config-path "/Users/zhifu/funasr1.0/examples/aishell/paraformer/conf" \
+--config-name "train_asr_paraformer_conformer_12e_6d_2048_256.yaml" \
+++train_data_set_list="/Users/zhifu/funasr1.0/data/list/audio_datasets.jsonl" \
+++dataset_conf.num_workers=8 \
+++max_steps=1000 \
+++output_file="./dataloader_benchmark.json"
+"""
+if __name__ == "__main__":
+    main_hydra()
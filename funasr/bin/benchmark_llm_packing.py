@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# -*- encoding: utf-8 -*-
+
+import os
+import json
+import time
+import hydra
+import logging
+import torch
+import numpy as np
+from omegaconf import DictConfig, OmegaConf
+
+from funasr.datasets.llm_datasets.packing import pack_collate
+from funasr.models.llm_asr.packing import packed_attention_mask
+from funasr.train_utils.set_all_random_seed import set_all_random_seed
+
+
+@hydra.main(config_name=None, version_base=None)
+def main_hydra(cfg: DictConfig):
+    kwargs = OmegaConf.to_container(cfg, resolve=True)
+    logging.basicConfig(level=getattr(logging, kwargs.get("log_level", "INFO").upper()))
+    main(**kwargs)
+
+
+def build_llm(llm_conf: dict, device):
+    from transformers import AutoModelForCausalLM, LlamaConfig, LlamaForCausalLM
+
+    init_param_path = llm_conf.get("init_param_path", None)
+    if init_param_path is not None:
+        model = AutoModelForCausalLM.from_pretrained(init_param_path, load_in_8bit=None, device_map=None)
+    else:
+        config = LlamaConfig(
+            vocab_size=llm_conf.get("vocab_size", 32000),
+            hidden_size=llm_conf.get("hidden_size", 512),
+            intermediate_size=llm_conf.get("intermediate_size", 1376),
+            num_hidden_layers=llm_conf.get("num_hidden_layers", 4),
+            num_attention_heads=llm_conf.get("num_attention_heads", 8),
+            num_key_value_heads=llm_conf.get("num_attention_heads", 8),
+            max_position_embeddings=llm_conf.get("max_position_embeddings", 4096),
+        )
+        model = LlamaForCausalLM(config)
+    return model.to(device)
+
+
+def make_samples(num_samples: int, min_len: int, max_len: int, vocab_size: int, prompt_len: int):
+    samples = []
+    for length in np.random.randint(min_len, max_len + 1, size=num_samples):
+        input_ids = torch.randint(0, vocab_size, (int(length),))
+        labels_ids = input_ids.clone()
+        labels_ids[:prompt_len] = -100
+        samples.append({
+            "input_ids": input_ids,
+            "attention_mask": torch.ones(int(length), dtype=torch.int32),
+            "labels_ids": labels_ids,
+        })
+    return samples
+
+
+def run(model, batches, packed: bool, device, warmup_steps: int):
+    optim = torch.optim.SGD(model.parameters(), lr=1e-5)
+    num_tokens, num_slots = 0, 0
+    time_start = None
+    for i, batch in enumerate(batches):
+        if i == warmup_steps:
+            if device.type == "cuda":
+                torch.cuda.synchronize()
+            time_start = time.perf_counter()
+        input_ids = batch["input_ids"].to(device)
+        labels_ids = batch["labels_ids"].to(device)
+        if packed:
+            segment_ids = batch["segment_ids"].to(device)
+            attention_mask = packed_attention_mask(segment_ids, next(model.parameters()).dtype)
+            position_ids = batch["position_ids"].to(device)
+            valid = segment_ids >= 0
+        else:
+            attention_mask = batch["attention_mask"].to(device)
+            position_ids = None
+            valid = attention_mask > 0
+        input_ids = input_ids.clamp(min=0)
+        loss = model(input_ids=input_ids, attention_mask=attention_mask, position_ids=position_ids,
+                     labels=labels_ids).loss
+        loss.backward()
+        optim.step()
+        optim.zero_grad()
+        if time_start is not None:
+            num_tokens += int(valid.sum())
+            num_slots += valid.numel()
+    if device.type == "cuda":
+        torch.cuda.synchronize()
+    total_time = time.perf_counter() - time_start
+    return {
+        "steps": len(batches) - warmup_steps,
+        "tokens": num_tokens,
+        "padding_ratio": 1.0 - num_tokens / max(num_slots, 1),
+        "total_time": total_time,
+        "tokens_per_sec": num_tokens / total_time,
+    }
+
+
+def main(**kwargs):
+    """
+    Compare the training throughput (real tokens per second, padding excluded) of one padded row per
+    sample with packed rows (dataset_conf.pack_length) on synthetic LLM samples of random lengths.
+    """
+    set_all_random_seed(kwargs.get("seed", 0))
+    device = torch.device(kwargs.get("device", "cuda" if torch.cuda.is_available() else "cpu"))
+    llm_conf = kwargs.get("llm_conf", {})
+    model = build_llm(llm_conf, device)
+    model.train()
+
+    batch_size = kwargs.get("batch_size", 16)
+    pack_length = kwargs.get("pack_length", 1024)
+    max_steps = kwargs.get("max_steps", 20)
+    warmup_steps = kwargs.get("warmup_steps", 3)
+    samples = make_samples(batch_size * (max_steps + warmup_steps), kwargs.get("min_len", 32),
+                           kwargs.get("max_len", 256), model.config.vocab_size, kwargs.get("prompt_len", 8))
+
+    padded_batches, packed_batches = [], []
+    pad = torch.nn.utils.rnn.pad_sequence
+    for i in range(0, len(samples), batch_size):
+        data = samples[i:i + batch_size]
+        padded_batches.append({
+            "input_ids": pad([s["input_ids"] for s in data], batch_first=True, padding_value=-100),
+            "attention_mask": pad([s["attention_mask"] for s in data], batch_first=True, padding_value=0),
+            "labels_ids": pad([s["labels_ids"] for s in data], batch_first=True, padding_value=-100),
+        })
+    # packed rows hold the same number of real tokens per step as the padded batches
+    num_tokens = sum(s["input_ids"].shape[0] for s in samples)
+    tokens_per_step = num_tokens // len(padded_batches)
+    i = 0
+    while i < len(samples):
+        j, tokens = i, 0
+        while j < len(samples) and tokens < tokens_per_step:
+            tokens += samples[j]["input_ids"].shape[0]
+            j += 1
+        packed_batches.append(pack_collate(samples[i:j], pack_length))
+        i = j
+    packed_batches = packed_batches[:len(padded_batches)]
+
+    result = {
+        "batch_size": batch_size,
+        "pack_length": pack_length,
+        "padded": run(model, padded_batches, False, device, warmup_steps),
+        "packed": run(model, packed_batches, True, device, warmup_steps),
+    }
+    result["speedup"] = result["packed"]["tokens_per_sec"] / result["padded"]["tokens_per_sec"]
+    logging.info(f"packing benchmark: {result}")
+    output_file = kwargs.get("output_file", "llm_packing_benchmark.json")
+    if os.path.dirname(output_file):
+        os.makedirs(os.path.dirname(output_file), exist_ok=True)
+    with open(output_file, "w") as fout:
+        json.dump(result, fout, indent=2)
+    return result
+
+
+"""
+python funasr/bin/benchmark_llm_packing.py \
+++llm_conf.init_param_path="/nfs/maziyang.mzy/models/vicuna-7b-v1.5" \
+++batch_size=16 \
+++pack_length=1024 \
+++min_len=32 \
+++max_len=256 \
+++output_file="./llm_packing_benchmark.json"
+"""
+if __name__ == "__main__":
+    main_hydra()
@@ -215,7 +215,8 @@ def main(**kwargs):
             f"epoch: {(trainer.max_epoch - epoch) * time_escaped:.3f} hours\n")
 
 
-    if trainer.rank == 0:
+    trainer.wait_for_checkpoint()
+    if trainer.rank == 0 and not trainer.sharded_checkpoint:
         average_checkpoints(trainer.output_dir, trainer.avg_nbest_model)
 
     trainer.close()
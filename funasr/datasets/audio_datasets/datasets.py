@@ -1,3 +1,4 @@
+import time
 import torch
 import random
 
@@ -5,6 +6,26 @@ from funasr.register import tables
 from funasr.utils.load_utils import extract_fbank, load_audio_text_image_video
 
 
+def pad_batch(data_list, padding_value=0.0, pad_to_multiple: int = 1, pin_memory: bool = False):
+    """
+    Pad a list of [T, ...] tensors into one preallocated [B, T_max, ...] tensor.
+
+    T_max is rounded up to a multiple of `pad_to_multiple`, so that the number of distinct
+    shapes (kernel selection, recompilation) stays small. The samples are written in place,
+    only the padded tails are filled with `padding_value`.
+    """
+    max_len = max(data.shape[0] for data in data_list)
+    if pad_to_multiple > 1:
+        max_len = (max_len + pad_to_multiple - 1) // pad_to_multiple * pad_to_multiple
+    first = data_list[0]
+    outputs = torch.empty((len(data_list), max_len, *first.shape[1:]), dtype=first.dtype, pin_memory=pin_memory)
+    for i, data in enumerate(data_list):
+        length = data.shape[0]
+        outputs[i, :length] = data
+        outputs[i, length:] = padding_value
+    return outputs
+
+
 @tables.register("dataset_classes", "AudioDataset")
 class AudioDataset(torch.utils.data.Dataset):
     """
@@ -17,6 +38,8 @@ class AudioDataset(torch.utils.data.Dataset):
                  tokenizer=None,
                  int_pad_value: int = -1,
                  float_pad_value: float = 0.0,
+                 profile_workers: bool = False,
+                 pad_to_multiple: int = 1,
                   **kwargs):
         super().__init__()
         index_ds_class = tables.index_ds_classes.get(index_ds)
@@ -39,6 +62,13 @@ class AudioDataset(torch.utils.data.Dataset):
 
         self.int_pad_value = int_pad_value
         self.float_pad_value = float_pad_value
+        self.pad_to_multiple = pad_to_multiple
+        # batches collated in the main process are pinned here, the DataLoader pins those of the workers
+        self.pin_memory = kwargs.get("pin_memory", True) and torch.cuda.is_available()
+        # each DataLoader worker holds its own copy, so these count the samples of the current worker
+        self.profile_workers = profile_workers
+        self.worker_load_time = 0.0
+        self.worker_num_samples = 0
     
     def get_source_len(self, index):
         item = self.index_ds[index]
@@ -52,6 +82,7 @@ class AudioDataset(torch.utils.data.Dataset):
         return len(self.index_ds)
     
     def __getitem__(self, index):
+        time1 = time.perf_counter()
         item = self.index_ds[index]
         # import pdb;
         # pdb.set_trace()
@@ -73,14 +104,28 @@ class AudioDataset(torch.utils.data.Dataset):
         ids_lengths = len(ids)
         text_lengths = torch.tensor([ids_lengths], dtype=torch.int32)
 
+        if self.profile_workers:
+            self.worker_load_time += time.perf_counter() - time1
+            self.worker_num_samples += 1
         return {"speech": speech[0, :, :],
                 "speech_lengths": speech_lengths,
                 "text": text,
                 "text_lengths": text_lengths,
                 }
     
+    def pop_worker_stats(self):
+        """Loading statistics of the current worker since the last call, attached to the batch by the collator."""
+        worker_info = torch.utils.data.get_worker_info()
+        worker_stats = {"worker_id": worker_info.id if worker_info is not None else 0,
+                        "num_samples": self.worker_num_samples,
+                        "load_time": self.worker_load_time,
+                        }
+        self.worker_load_time = 0.0
+        self.worker_num_samples = 0
+        return worker_stats
     
     def collator(self, samples: list=None):
+        time1 = time.perf_counter()
         outputs = {}
         for sample in samples:
             for key in sample.keys():
@@ -88,6 +133,7 @@ class AudioDataset(torch.utils.data.Dataset):
                     outputs[key] = []
                 outputs[key].append(sample[key])
 
+        pin_memory = self.pin_memory and torch.utils.data.get_worker_info() is None
         for key, data_list in outputs.items():
             if isinstance(data_list[0], torch.Tensor):
                 if data_list[0].dtype == torch.int64 or data_list[0].dtype == torch.int32:
@@ -95,8 +141,13 @@ class AudioDataset(torch.utils.data.Dataset):
                     pad_value = self.int_pad_value
                 else:
                     pad_value = self.float_pad_value
-                
-                outputs[key] = torch.nn.utils.rnn.pad_sequence(data_list, batch_first=True, padding_value=pad_value)
+                # only the encoder input is padded up to the multiple, the targets are compared with
+                # decoder outputs of max(text_lengths) steps and keep their length
+                pad_to_multiple = self.pad_to_multiple if key == "speech" else 1
+                outputs[key] = pad_batch(data_list, pad_value, pad_to_multiple=pad_to_multiple, pin_memory=pin_memory)
+        if self.profile_workers:
+            self.worker_load_time += time.perf_counter() - time1
+            outputs["worker_stats"] = self.pop_worker_stats()
         return outputs
 
 
@@ -190,13 +241,15 @@ class AudioDatasetHotword(AudioDataset):
                         outputs[key] = []
                     outputs[key].append(sample[key])
 
+        pin_memory = self.pin_memory and torch.utils.data.get_worker_info() is None
         for key, data_list in outputs.items():
             if isinstance(data_list[0], torch.Tensor):
                 if data_list[0].dtype == torch.int64 or data_list[0].dtype == torch.int32:
                     pad_value = self.int_pad_value
                 else:
                     pad_value = self.float_pad_value
-                outputs[key] = torch.nn.utils.rnn.pad_sequence(data_list, batch_first=True, padding_value=pad_value)
+                pad_to_multiple = self.pad_to_multiple if key == "speech" else 1
+                outputs[key] = pad_batch(data_list, pad_value, pad_to_multiple=pad_to_multiple, pin_memory=pin_memory)
         
         hotword_list, hotword_lengths = [], []
         text = outputs['text']
@@ -124,6 +124,7 @@ class EspnetStyleBatchSampler(DistributedSampler):
         rank_batches = buffer_batches[start_idx:end_idx]
         
         # Return an iterator over the batches for the current rank
+        self.num_batches = len(rank_batches)
         return iter(rank_batches)
     
     def __len__(self):
@@ -108,6 +108,8 @@ class CustomDistributedBatchSampler(Sampler):
         if self.drop_last and len(batches[-1]) != self.batch_size:
             batches = batches[:-1]
 
+        # the per-rank batch plan of this epoch, used by the low-sync trainer
+        self.num_batches = len(batches)
         return iter(batches)
 
     def __len__(self):
@@ -201,6 +203,7 @@ class CustomDistributedBufferBatchSampler(Sampler):
             buffer.sort(key=lambda x: self.dataset.get_source_len(x))
             sorted_batches.extend(self._create_batches_from_buffer(buffer))
 
+        self.num_batches = len(sorted_batches)
         return iter(sorted_batches)
 
     def _create_batches_from_buffer(self, buffer):
@@ -285,6 +288,7 @@ class CustomDistributedDynamicBatchSampler(DistributedSampler):
         if batch and (not self.drop_last or len(batch) * max_len_in_batch == self.batch_size):
             batches.append(batch)
         
+        self.num_batches = len(batches)
         return iter(batches)
     
     def __len__(self):
@@ -379,6 +383,7 @@ class CustomDistributedBufferDynamicBatchSampler(DistributedSampler):
         # Assign all batches for the current rank directly
         final_batches = rank_batches[self.rank]
 
+        self.num_batches = len(final_batches)
         return iter(final_batches)
 
     
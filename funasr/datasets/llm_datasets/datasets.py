@@ -3,6 +3,7 @@ import copy
 
 from funasr.register import tables
 from funasr.utils.load_utils import extract_fbank, load_audio_text_image_video
+from funasr.datasets.llm_datasets.packing import pack_collate
 
 
 @tables.register("dataset_classes", "AudioLLMNARDataset")
@@ -43,6 +44,8 @@ class AudioLLMNARDataset(torch.utils.data.Dataset):
         self.prompt_af = ""
         self.IGNORE_INDEX = kwargs.get("IGNORE_INDEX", -100)
         self.int_pad_value = self.IGNORE_INDEX
+        # > 0: concatenate samples into packed rows of pack_length tokens, see pack_collate
+        self.pack_length = kwargs.get("pack_length", 0)
     
     def get_source_len(self, index):
         item = self.index_ds[index]
@@ -125,6 +128,10 @@ class AudioLLMNARDataset(torch.utils.data.Dataset):
     
     
     def collator(self, samples: list=None):
+        if self.pack_length > 0:
+            return pack_collate(samples, self.pack_length, int_pad_value=self.int_pad_value,
+                                float_pad_value=self.float_pad_value, ignore_index=self.IGNORE_INDEX)
+
         outputs = {}
         for sample in samples:
             for key in sample.keys():
@@ -184,6 +191,7 @@ class AudioLLMDataset(torch.utils.data.Dataset):
         self.prompt_af = ""
         self.IGNORE_INDEX = kwargs.get("IGNORE_INDEX", -100)
         self.int_pad_value = self.IGNORE_INDEX
+        self.pack_length = kwargs.get("pack_length", 0)
     
     def get_source_len(self, index):
         item = self.index_ds[index]
@@ -251,6 +259,10 @@ class AudioLLMDataset(torch.utils.data.Dataset):
                 }
     
     def collator(self, samples: list = None):
+        if self.pack_length > 0:
+            return pack_collate(samples, self.pack_length, int_pad_value=self.int_pad_value,
+                                float_pad_value=self.float_pad_value, ignore_index=self.IGNORE_INDEX)
+
         outputs = {}
         for sample in samples:
             for key in sample.keys():
@@ -310,6 +322,7 @@ class AudioLLMARDataset(torch.utils.data.Dataset):
         self.prompt_af = ""
         self.IGNORE_INDEX = kwargs.get("IGNORE_INDEX", -100)
         self.int_pad_value = self.IGNORE_INDEX
+        self.pack_length = kwargs.get("pack_length", 0)
     
     def get_source_len(self, index):
         item = self.index_ds[index]
@@ -377,6 +390,10 @@ class AudioLLMARDataset(torch.utils.data.Dataset):
                 }
     
     def collator(self, samples: list = None):
+        if self.pack_length > 0:
+            return pack_collate(samples, self.pack_length, int_pad_value=self.int_pad_value,
+                                float_pad_value=self.float_pad_value, ignore_index=self.IGNORE_INDEX)
+
         outputs = {}
         for sample in samples:
             for key in sample.keys():
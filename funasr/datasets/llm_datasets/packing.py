@@ -0,0 +1,84 @@
+import torch
+
+
+def pack_samples(lengths, pack_length: int):
+    """
+    First-fit-decreasing assignment of samples to rows of `pack_length` tokens.
+
+    Returns (rows, offsets, row_lengths): the row and the start position of every sample, and the
+    number of used tokens of every row. A sample longer than `pack_length` gets a row on its own.
+    """
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i], reverse=True)
+    rows, offsets = [0] * len(lengths), [0] * len(lengths)
+    row_lengths = []
+    for i in order:
+        for r, used in enumerate(row_lengths):
+            if used + lengths[i] <= pack_length:
+                break
+        else:
+            r = len(row_lengths)
+            row_lengths.append(0)
+        rows[i], offsets[i] = r, row_lengths[r]
+        row_lengths[r] += lengths[i]
+    return rows, offsets, row_lengths
+
+
+def pack_collate(samples: list,
+                 pack_length: int,
+                 int_pad_value: int = -100,
+                 float_pad_value: float = 0.0,
+                 ignore_index: int = -100,
+                 token_key: str = "input_ids",
+                 ):
+    """
+    Collate LLM samples into fixed-length packed rows instead of one padded row per sample.
+
+    The token level keys (the 1-d tensors as long as `input_ids`: input_ids, attention_mask, labels_ids,
+    label_mask, audio_mask) of several samples are concatenated into rows of `pack_length` tokens, the
+    other keys (speech, text, ...) stay padded per sample. The layout is described by:
+        packed_rows, packed_offsets, packed_lengths: (num_samples,) row, start and length of every sample
+        segment_ids: (num_rows, pack_length) index of the sample owning every token, -1 for padding
+        position_ids: (num_rows, pack_length) positions restarting at 0 for every sample
+    The first label of every sample is set to `ignore_index`, so that the last token of a sample is never
+    trained to predict the first token of the next one. The attention has to be restricted to the blocks of
+    `segment_ids`, see `funasr.models.llm_asr.packing.packed_attention_mask`.
+    """
+    lengths = [sample[token_key].shape[0] for sample in samples]
+    token_keys = [key for key, value in samples[0].items()
+                  if isinstance(value, torch.Tensor) and value.dim() == 1 and value.shape[0] == lengths[0]]
+    rows, offsets, row_lengths = pack_samples(lengths, pack_length)
+    num_rows, width = len(row_lengths), max(pack_length, max(lengths))
+
+    outputs = {}
+    for key in samples[0].keys():
+        data_list = [sample[key] for sample in samples]
+        if not isinstance(data_list[0], torch.Tensor):
+            outputs[key] = data_list
+            continue
+        if data_list[0].dtype == torch.int64 or data_list[0].dtype == torch.int32:
+            pad_value = int_pad_value
+        else:
+            pad_value = float_pad_value
+        if key in token_keys:
+            packed = torch.full((num_rows, width), pad_value, dtype=data_list[0].dtype)
+            for data, r, o, length in zip(data_list, rows, offsets, lengths):
+                packed[r, o:o + length] = data
+            outputs[key] = packed
+        else:
+            outputs[key] = torch.nn.utils.rnn.pad_sequence(data_list, batch_first=True, padding_value=pad_value)
+
+    segment_ids = torch.full((num_rows, width), -1, dtype=torch.int64)
+    position_ids = torch.zeros((num_rows, width), dtype=torch.int64)
+    for i, (r, o, length) in enumerate(zip(rows, offsets, lengths)):
+        segment_ids[r, o:o + length] = i
+        position_ids[r, o:o + length] = torch.arange(length)
+        if "labels_ids" in outputs:
+            outputs["labels_ids"][r, o] = ignore_index
+        if "label_mask" in outputs:
+            outputs["label_mask"][r, o] = False
+    outputs["segment_ids"] = segment_ids
+    outputs["position_ids"] = position_ids
+    outputs["packed_rows"] = torch.tensor(rows, dtype=torch.int64)
+    outputs["packed_offsets"] = torch.tensor(offsets, dtype=torch.int64)
+    outputs["packed_lengths"] = torch.tensor(lengths, dtype=torch.int64)
+    return outputs
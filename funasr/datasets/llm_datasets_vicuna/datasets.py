@@ -3,6 +3,7 @@ import copy
 
 from funasr.register import tables
 from funasr.utils.load_utils import extract_fbank, load_audio_text_image_video
+from funasr.datasets.llm_datasets.packing import pack_collate
 
 
 @tables.register("dataset_classes", "AudioLLMVicunaDataset")
@@ -44,6 +45,8 @@ class AudioLLMVicunaDataset(torch.utils.data.Dataset):
         self.prompt_af = ""
         self.IGNORE_INDEX = kwargs.get("IGNORE_INDEX", -100)
         self.int_pad_value = self.IGNORE_INDEX
+        # > 0: concatenate samples into packed rows of pack_length tokens, see pack_collate
+        self.pack_length = kwargs.get("pack_length", 0)
         self.audio_adaptor_downsample_rate = kwargs.get("audio_adaptor_downsample_rate", 5)
         self.audio_encoder_downsample_rate = kwargs.get("audio_encoder_downsample_rate", 2)
         self.prompt_template = "USER: {}\n ASSISTANT:"
@@ -131,6 +134,10 @@ class AudioLLMVicunaDataset(torch.utils.data.Dataset):
                 }
     
     def collator(self, samples: list = None):
+        if self.pack_length > 0:
+            return pack_collate(samples, self.pack_length, int_pad_value=self.int_pad_value,
+                                float_pad_value=self.float_pad_value, ignore_index=self.IGNORE_INDEX)
+
         outputs = {}
         for sample in samples:
             for key in sample.keys():
@@ -229,10 +229,14 @@ class BiCifParaformer(Paraformer):
         # init beamsearch
         is_use_ctc = kwargs.get("decoding_ctc_weight", 0.0) > 0.00001 and self.ctc != None
         is_use_lm = kwargs.get("lm_weight", 0.0) > 0.00001 and kwargs.get("lm_file", None) is not None
-        if self.beam_search is None and (is_use_lm or is_use_ctc):
+        is_use_ngram = kwargs.get("ngram_weight", 0.0) > 0.00001 and kwargs.get("ngram_file", None) is not None
+        is_use_context = kwargs.get("context_weight", 0.0) > 0.00001 and kwargs.get("hotword", None) is not None
+        if self.beam_search is None and (is_use_lm or is_use_ctc or is_use_ngram or is_use_context):
             logging.info("enable beam_search")
             self.init_beam_search(**kwargs)
             self.nbest = kwargs.get("nbest", 1)
+        if is_use_context:
+            self.update_context_graph(self.generate_hotwords_list(kwargs.get("hotword"), tokenizer=tokenizer, frontend=frontend))
         
         meta_data = {}
         # if isinstance(data_in, torch.Tensor):  # fbank
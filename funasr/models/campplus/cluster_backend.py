@@ -5,6 +5,9 @@
 # Modified from 3D-Speaker (https://github.com/alibaba-damo-academy/3D-Speaker)
 
 import scipy
+import scipy.sparse
+import scipy.sparse.linalg
+import scipy.optimize
 import torch
 import sklearn
 import numpy as np
@@ -16,14 +19,24 @@ from sklearn.cluster import HDBSCAN
 class SpectralCluster:
     r"""A spectral clustering mehtod using unnormalized Laplacian of affinity matrix.
     This implementation is adapted from https://github.com/speechbrain/speechbrain.
+    From sparse_thr embeddings, the pruned affinity is built as a sparse kNN graph by blocks of rows, and only
+    the smallest eigenvectors of its Laplacian are computed with Lanczos (scipy eigsh), so that the memory is
+    O(N * max_neighbors) instead of O(N^2).
     """
 
-    def __init__(self, min_num_spks=1, max_num_spks=15, pval=0.022):
+    def __init__(self, min_num_spks=1, max_num_spks=15, pval=0.022, sparse_thr=2048, max_neighbors=128,
+                 block_size=256):
         self.min_num_spks = min_num_spks
         self.max_num_spks = max_num_spks
         self.pval = pval
+        self.sparse_thr = sparse_thr
+        self.max_neighbors = max_neighbors
+        self.block_size = block_size
 
     def __call__(self, X, oracle_num=None):
+        if X.shape[0] >= self.sparse_thr:
+            return self.sparse_cluster(X, oracle_num)
+
         # Similarity matrix computation
         sim_mat = self.get_sim_mat(X)
 
@@ -49,21 +62,18 @@ class SpectralCluster:
         M = sklearn.metrics.pairwise.cosine_similarity(X, X)
         return M
 
-    def p_pruning(self, A):
-        if A.shape[0] * self.pval < 6:
-            pval = 6. / A.shape[0]
-        else:
-            pval = self.pval
+    def get_pval(self, num):
+        if num * self.pval < 6:
+            return 6. / num
+        return self.pval
 
+    def p_pruning(self, A):
+        pval = self.get_pval(A.shape[0])
         n_elems = int((1 - pval) * A.shape[0])
 
-        # For each row in a affinity matrix
-        for i in range(A.shape[0]):
-            low_indexes = np.argsort(A[i, :])
-            low_indexes = low_indexes[0:n_elems]
-
-            # Replace smaller similarity values by 0s
-            A[i, low_indexes] = 0
+        # Replace the smaller similarity values of each row by 0s
+        low_indexes = np.argsort(A, axis=1)[:, :n_elems]
+        np.put_along_axis(A, low_indexes, 0, axis=1)
         return A
 
     def get_laplacian(self, M):
@@ -74,8 +84,12 @@ class SpectralCluster:
         return L
 
     def get_spec_embs(self, L, k_oracle=None):
-        lambdas, eig_vecs = scipy.linalg.eigh(L)
+        # only the eigenvalues used below
+        num_eigs = k_oracle if k_oracle is not None else self.max_num_spks + 1
+        lambdas, eig_vecs = scipy.linalg.eigh(L, subset_by_index=[0, min(num_eigs, L.shape[0]) - 1])
+        return self.select_spec_embs(lambdas, eig_vecs, k_oracle)
 
+    def select_spec_embs(self, lambdas, eig_vecs, k_oracle=None):
         if k_oracle is not None:
             num_of_spk = k_oracle
         else:
@@ -86,6 +100,46 @@ class SpectralCluster:
         emb = eig_vecs[:, :num_of_spk]
         return emb, num_of_spk
 
+    def sparse_cluster(self, X, oracle_num=None):
+        sim_mat = self.get_knn_sim_mat(X)
+        sym_sim_mat = 0.5 * (sim_mat + sim_mat.T)
+        laplacian = self.get_sparse_laplacian(sym_sim_mat)
+        emb, num_of_spk = self.get_sparse_spec_embs(laplacian, oracle_num)
+        return self.cluster_embs(emb, num_of_spk)
+
+    def get_knn_sim_mat(self, X):
+        # the rows of p_pruning as a sparse matrix: the largest cosine similarities of each row, at most
+        # max_neighbors, computed by blocks of rows
+        X = np.asarray(X, dtype=np.float32)
+        X = X / np.linalg.norm(X, axis=1, keepdims=True)
+        num = X.shape[0]
+        num_neighbors = num - int((1 - self.get_pval(num)) * num)
+        num_neighbors = max(min(num_neighbors, self.max_neighbors), 1)
+        indices = np.empty((num, num_neighbors), dtype=np.int64)
+        values = np.empty((num, num_neighbors), dtype=np.float32)
+        for beg in range(0, num, self.block_size):
+            sim = X[beg:beg + self.block_size] @ X.T
+            indices[beg:beg + self.block_size] = np.argpartition(sim, num - num_neighbors, axis=1)[:, -num_neighbors:]
+            values[beg:beg + self.block_size] = np.take_along_axis(sim, indices[beg:beg + self.block_size], axis=1)
+        rows = np.repeat(np.arange(num), num_neighbors)
+        return scipy.sparse.csr_matrix((values.reshape(-1), (rows, indices.reshape(-1))), shape=(num, num))
+
+    def get_sparse_laplacian(self, M):
+        M = (M - scipy.sparse.diags(M.diagonal())).tocsr()
+        M.eliminate_zeros()
+        D = np.asarray(abs(M).sum(axis=1)).reshape(-1)
+        return (scipy.sparse.diags(D) - M).astype(np.float64)
+
+    def get_sparse_spec_embs(self, L, k_oracle=None):
+        num_eigs = min(k_oracle if k_oracle is not None else self.max_num_spks + 1, L.shape[0] - 1)
+        # the smallest eigenvalues of L are the largest of shift * I - L, shift bounds the spectrum of L
+        shift = 2 * L.diagonal().max()
+        shifted = scipy.sparse.identity(L.shape[0], format="csr") * shift - L
+        lambdas, eig_vecs = scipy.sparse.linalg.eigsh(shifted, k=num_eigs, which="LA", tol=1e-6)
+        lambdas = shift - lambdas
+        order = np.argsort(lambdas)
+        return self.select_spec_embs(lambdas[order], eig_vecs[:, order], k_oracle)
+
     def cluster_embs(self, emb, k):
         _, labels, _ = k_means(emb, k)
         return labels
@@ -132,6 +186,32 @@ class UmapHdbscan:
         return labels
 
 
+class HierarchicalCluster:
+    r"""Two stages clustering for very long inputs: the blocks of block_size consecutive embeddings are
+    over-clustered with k-means into num_subclusters each, then the normalized centers of all the sub-clusters
+    are clustered by `cluster` and their labels given to their embeddings.
+    """
+
+    def __init__(self, cluster, block_size=4096, num_subclusters=64):
+        self.cluster = cluster
+        self.block_size = block_size
+        self.num_subclusters = num_subclusters
+
+    def __call__(self, X, oracle_num=None):
+        X = np.asarray(X, dtype=np.float32)
+        X = X / np.linalg.norm(X, axis=1, keepdims=True)
+        sub_labels = np.empty(X.shape[0], dtype=np.int64)
+        centers = []
+        for beg in range(0, X.shape[0], self.block_size):
+            block = X[beg:beg + self.block_size]
+            block_centers, block_labels, _ = k_means(block, min(self.num_subclusters, block.shape[0]), n_init=1)
+            sub_labels[beg:beg + self.block_size] = block_labels + sum(len(c) for c in centers)
+            centers.append(block_centers)
+        centers = np.concatenate(centers, axis=0)
+        labels = self.cluster(centers / np.linalg.norm(centers, axis=1, keepdims=True), oracle_num)
+        return labels[sub_labels]
+
+
 class ClusterBackend(torch.nn.Module):
     r"""Perfom clustering for input embeddings and output the labels.
     Args:
@@ -139,13 +219,21 @@ class ClusterBackend(torch.nn.Module):
         model_config: The model config.
     """
 
-    def __init__(self):
+    def __init__(self, merge_thr=0.78, cluster_method="default", sparse_thr=2048, max_neighbors=128,
+                 hierarchical_thr=20000, **kwargs):
         super().__init__()
-        self.model_config = {'merge_thr':0.78}
+        self.model_config = {'merge_thr': merge_thr}
+        # default: spectral clustering below 2048 embeddings, umap + hdbscan above
+        # spectral: spectral clustering at all sizes, on a sparse kNN affinity from sparse_thr embeddings
+        # hierarchical: as spectral, and two stages from hierarchical_thr embeddings
+        assert cluster_method in ["default", "spectral", "hierarchical"]
+        self.cluster_method = cluster_method
+        self.hierarchical_thr = hierarchical_thr
         # self.other_config = kwargs
 
-        self.spectral_cluster = SpectralCluster()
+        self.spectral_cluster = SpectralCluster(sparse_thr=sparse_thr, max_neighbors=max_neighbors)
         self.umap_hdbscan_cluster = UmapHdbscan()
+        self.hierarchical_cluster = HierarchicalCluster(self.spectral_cluster)
 
     def forward(self, X, **params):
         # clustering and return the labels
@@ -155,7 +243,9 @@ class ClusterBackend(torch.nn.Module):
         ) == 2, 'modelscope error: the shape of input should be [N, C]'
         if X.shape[0] < 20:
             return np.zeros(X.shape[0], dtype='int')
-        if X.shape[0] < 2048 or k is not None:
+        if self.cluster_method == "hierarchical" and X.shape[0] >= self.hierarchical_thr:
+            labels = self.hierarchical_cluster(X, k)
+        elif X.shape[0] < 2048 or k is not None or self.cluster_method != "default":
             # unexpected corner case
             labels = self.spectral_cluster(X, k)
         else:
@@ -170,16 +260,17 @@ class ClusterBackend(torch.nn.Module):
     def merge_by_cos(self, labels, embs, cos_thr):
         # merge the similar speakers by cosine similarity
         assert cos_thr > 0 and cos_thr <= 1
-        while True:
-            spk_num = labels.max() + 1
-            if spk_num == 1:
-                break
-            spk_center = []
-            for i in range(spk_num):
-                spk_emb = embs[labels == i].mean(0)
-                spk_center.append(spk_emb)
-            assert len(spk_center) > 0
-            spk_center = np.stack(spk_center, axis=0)
+        embs = np.asarray(embs, dtype=np.float64)
+        valid = labels >= 0
+        spk_num = labels.max() + 1
+        # sums and counts of the speakers, updated on merge; new_label maps the labels to the merged ones
+        one_hot = scipy.sparse.csr_matrix((np.ones(valid.sum()), (labels[valid], np.flatnonzero(valid))),
+                                          shape=(spk_num, len(labels)))
+        spk_sum = one_hot @ embs
+        spk_count = np.bincount(labels[valid], minlength=spk_num)
+        new_label = np.arange(spk_num)
+        while len(spk_sum) > 1:
+            spk_center = spk_sum / spk_count[:, None]
             norm_spk_center = spk_center / np.linalg.norm(
                 spk_center, axis=1, keepdims=True)
             affinity = np.matmul(norm_spk_center, norm_spk_center.T)
@@ -187,9 +278,103 @@ class ClusterBackend(torch.nn.Module):
             spks = np.unravel_index(np.argmax(affinity), affinity.shape)
             if affinity[spks] < cos_thr:
                 break
-            for i in range(len(labels)):
-                if labels[i] == spks[1]:
-                    labels[i] = spks[0]
-                elif labels[i] > spks[1]:
-                    labels[i] -= 1
+            spk_sum[spks[0]] += spk_sum[spks[1]]
+            spk_count[spks[0]] += spk_count[spks[1]]
+            spk_sum = np.delete(spk_sum, spks[1], axis=0)
+            spk_count = np.delete(spk_count, spks[1])
+            new_label[new_label == spks[1]] = spks[0]
+            new_label[new_label > spks[1]] -= 1
+        labels[valid] = new_label[labels[valid]]
+        return labels
+
+
+class OnlineCluster:
+    r"""Incremental speaker clustering for streaming diarization, with a bounded memory per stream.
+    Each new embedding gets the speaker of the closest running centroid if their cosine similarity reaches
+    assign_thr, else a new speaker (up to max_num_spks). Every recluster_interval embeddings, the last
+    max_history embeddings are clustered again by `cluster_backend`; the new clusters are matched to the
+    current speakers by their overlap (Hungarian assignment), so that the speaker ids are kept, and the
+    centroids of the speakers of the history are rebuilt from it. The labels already given are not changed.
+    """
+
+    def __init__(self, cluster_backend=None, assign_thr=0.6, max_num_spks=15, max_history=1000,
+                 recluster_interval=100):
+        self.cluster_backend = ClusterBackend() if cluster_backend is None else cluster_backend
+        self.assign_thr = assign_thr
+        self.max_num_spks = max_num_spks
+        self.max_history = max_history
+        self.recluster_interval = recluster_interval
+        self.reset()
+
+    def reset(self):
+        self.spk_sum = None
+        self.spk_count = np.zeros(0, dtype=np.int64)
+        # the last max_history embeddings and their labels, in a ring
+        self.history = None
+        self.history_labels = np.zeros(self.max_history, dtype=np.int64)
+        self.num_seen = 0
+        self.num_since_recluster = 0
+
+    def __call__(self, embs):
+        """
+        embs: (N, D) embeddings in time order
+        return: (N,) speaker ids
+        """
+        embs = np.asarray(embs, dtype=np.float64)
+        embs = embs / np.linalg.norm(embs, axis=1, keepdims=True)
+        if self.history is None:
+            self.history = np.zeros((self.max_history, embs.shape[1]))
+            self.spk_sum = np.zeros((0, embs.shape[1]))
+        labels = np.zeros(len(embs), dtype=np.int64)
+        for i, emb in enumerate(embs):
+            labels[i] = self.assign(emb)
+            idx = self.num_seen % self.max_history
+            self.history[idx] = emb
+            self.history_labels[idx] = labels[i]
+            self.num_seen += 1
+            self.num_since_recluster += 1
+            if self.num_since_recluster >= self.recluster_interval:
+                self.recluster()
         return labels
+
+    def assign(self, emb):
+        active = self.spk_count > 0
+        if active.any():
+            center = self.spk_sum / np.maximum(np.linalg.norm(self.spk_sum, axis=1, keepdims=True), 1e-12)
+            sim = np.where(active, center @ emb, -np.inf)
+            spk = int(np.argmax(sim))
+            if sim[spk] >= self.assign_thr or active.sum() >= self.max_num_spks:
+                self.spk_sum[spk] += emb
+                self.spk_count[spk] += 1
+                return spk
+        # new speaker
+        self.spk_sum = np.concatenate([self.spk_sum, emb[None]], axis=0)
+        self.spk_count = np.append(self.spk_count, 1)
+        return len(self.spk_count) - 1
+
+    def recluster(self):
+        self.num_since_recluster = 0
+        num = min(self.num_seen, self.max_history)
+        if num < 20:
+            # ClusterBackend gives a single speaker below 20 embeddings
+            return
+        history, old_labels = self.history[:num], self.history_labels[:num]
+        new_labels = np.asarray(self.cluster_backend(history, oracle_num=None))
+        # match the new clusters to the current speakers of the history by their common embeddings
+        in_history, old_index = np.unique(old_labels, return_inverse=True)
+        overlap = np.zeros((new_labels.max() + 1, len(in_history)), dtype=np.int64)
+        np.add.at(overlap, (new_labels, old_index), 1)
+        rows, cols = scipy.optimize.linear_sum_assignment(-overlap)
+        mapping = np.full(len(overlap), -1, dtype=np.int64)
+        mapping[rows] = in_history[cols]
+        for i in np.flatnonzero(mapping < 0):
+            mapping[i] = len(self.spk_count)
+            self.spk_sum = np.concatenate([self.spk_sum, np.zeros((1, history.shape[1]))], axis=0)
+            self.spk_count = np.append(self.spk_count, 0)
+        labels = mapping[new_labels]
+        # the speakers of the history get their centroids from it, the ones merged by the clustering are dropped
+        self.spk_sum[in_history] = 0
+        self.spk_count[in_history] = 0
+        np.add.at(self.spk_sum, labels, history)
+        self.spk_count += np.bincount(labels, minlength=len(self.spk_count))
+        self.history_labels[:num] = labels
@@ -12,7 +12,7 @@ from contextlib import contextmanager
 from distutils.version import LooseVersion
 
 from funasr.register import tables
-from funasr.models.campplus.utils import extract_feature
+from funasr.models.campplus.utils import extract_feature, sv_chunk
 from funasr.utils.load_utils import load_audio_text_image_video
 from funasr.models.campplus.components import DenseLayer, StatsPool, \
     TDNNLayer, CAMDenseTDNNBlock, TransitLayer, get_nonlinear, FCM
@@ -112,6 +112,8 @@ class CAMPPlus(torch.nn.Module):
                  frontend=None,
                  **kwargs,
                  ):
+        if kwargs.get("online_diarization", False):
+            return self.inference_online(data_in, key=key, **kwargs)
         # extract fbank feats
         meta_data = {}
         time1 = time.perf_counter()
@@ -124,4 +126,58 @@ class CAMPPlus(torch.nn.Module):
         meta_data["extract_feat"] = f"{time3 - time2:0.3f}"
         meta_data["batch_data_time"] = np.array(speech_times).sum().item() / 16000.0
         results = [{"spk_embedding": self.forward(speech.to(torch.float32))}]
-        return results, meta_data
\ No newline at end of file
+        return results, meta_data
+
+    def init_cache(self, cache: dict = {}, **kwargs):
+        from funasr.models.campplus.cluster_backend import ClusterBackend, OnlineCluster
+        cache["cluster"] = OnlineCluster(cluster_backend=ClusterBackend(**kwargs.get("cb_kwargs", {})),
+                                         assign_thr=kwargs.get("assign_thr", 0.6),
+                                         max_num_spks=kwargs.get("max_num_spks", 15),
+                                         max_history=kwargs.get("max_history", 1000),
+                                         recluster_interval=kwargs.get("recluster_interval", 100))
+        cache["time"] = 0.0
+        return cache
+
+    def inference_online(self,
+                         data_in,
+                         key: list = None,
+                         cache: dict = {},
+                         **kwargs,
+                         ):
+        """
+        Streaming diarization: data_in is the audio of one finalized (vad) segment of a stream, whose speakers
+        are given by an OnlineCluster kept in `cache`. The segment is cut in windows by sv_chunk, the windows get
+        their speakers as they come, and the segment the majority one.
+        segment_start: start of the segment in the stream (s), by default the end of the previous segment
+        """
+        meta_data = {}
+        if len(cache) == 0:
+            self.init_cache(cache, **kwargs)
+        time1 = time.perf_counter()
+        audio_sample_list = load_audio_text_image_video(data_in, fs=16000, audio_fs=kwargs.get("fs", 16000), data_type="sound")
+        assert len(audio_sample_list) == 1, "batch_size must be set 1"
+        audio_sample = audio_sample_list[0]
+        segment_start = kwargs.get("segment_start", None)
+        segment_start = cache["time"] if segment_start is None else segment_start
+        segment_end = segment_start + len(audio_sample) / 16000.0
+        cache["time"] = segment_end
+        windows = sv_chunk([[segment_start, segment_end, audio_sample.numpy()]])
+        time2 = time.perf_counter()
+        meta_data["load_data"] = f"{time2 - time1:0.3f}"
+        if len(windows) == 0:
+            return [{"key": key[0], "spk": -1, "value": []}], meta_data
+
+        speech, speech_lengths, speech_times = extract_feature([torch.from_numpy(w[2]) for w in windows])
+        speech = speech.to(device=kwargs["device"])
+        time3 = time.perf_counter()
+        meta_data["extract_feat"] = f"{time3 - time2:0.3f}"
+        meta_data["batch_data_time"] = len(audio_sample) / 16000.0
+        embeddings = self.forward(speech.to(torch.float32)).cpu().numpy()
+        labels = cache["cluster"](embeddings)
+        results = [{"key": key[0],
+                    "spk": int(np.bincount(labels).argmax()),
+                    "value": [[w[0], w[1], int(label)] for w, label in zip(windows, labels)],
+                    "spk_embedding": embeddings}]
+        if kwargs.get("is_final", False):
+            self.init_cache(cache, **kwargs)
+        return results, meta_data
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+# -*- encoding: utf-8 -*-
+# Copyright FunASR (https://github.com/alibaba-damo-academy/FunASR). All Rights Reserved.
+#  MIT License  (https://opensource.org/licenses/MIT)
+
+import os
+import json
+import numpy as np
+from typing import List, Union
+
+from sklearn.cluster._kmeans import k_means
+
+from funasr.metrics.compute_eer import _compute_eer
+from funasr.metrics.compute_min_dcf import ComputeErrorRates, ComputeMinDcf
+
+
+def normalize(embs):
+    embs = np.asarray(embs, dtype=np.float32)
+    if embs.ndim == 1:
+        embs = embs[None, :]
+    return embs / np.maximum(np.linalg.norm(embs, axis=1, keepdims=True), 1e-12)
+
+
+class SpeakerIndex:
+    r"""Registry of enrolled speaker embeddings (e.g. from CAM++) for speaker identification and verification.
+    The normalized embeddings are rows of one contiguous float32 matrix, memory-mapped in `index_dir`
+    (embeddings.npy and meta.json) if given, so that the cosine scores of a batch of queries against all the
+    speakers are one matrix product. Rows are appended on add, and the last row is moved into a removed one.
+    With `build_ivf`, the search only scores the speakers of the nprobe closest coarse lists (IVF), optionally
+    with product-quantized codes (PQ) of num_subvectors bytes per speaker, reranked with the exact scores.
+    """
+
+    def __init__(self, index_dir: str = None, dim: int = 192, capacity: int = 1024):
+        self.index_dir = index_dir
+        self.ivf_centers = None
+        self.pq_codebooks = None
+        meta_path = None if index_dir is None else os.path.join(index_dir, "meta.json")
+        if meta_path is not None and os.path.exists(meta_path):
+            with open(meta_path, "r") as fin:
+                meta = json.load(fin)
+            self.dim, self.keys = meta["dim"], meta["keys"]
+            self.embeddings = np.load(os.path.join(index_dir, "embeddings.npy"), mmap_mode="r+")
+            if os.path.exists(os.path.join(index_dir, "ivf.npz")):
+                ivf = np.load(os.path.join(index_dir, "ivf.npz"))
+                self.ivf_centers, self.list_ids = ivf["centers"], ivf["list_ids"]
+                if "codebooks" in ivf:
+                    self.pq_codebooks, self.pq_codes = ivf["codebooks"], ivf["codes"]
+        else:
+            self.dim, self.keys = dim, []
+            self.embeddings = self.allocate(capacity)
+        self.key2index = {key: i for i, key in enumerate(self.keys)}
+
+    def __len__(self):
+        return len(self.keys)
+
+    def allocate(self, capacity):
+        if self.index_dir is None:
+            return np.zeros((capacity, self.dim), dtype=np.float32)
+        os.makedirs(self.index_dir, exist_ok=True)
+        path = os.path.join(self.index_dir, "embeddings.npy")
+        tmp_path = path + ".tmp"
+        embeddings = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.float32, shape=(capacity, self.dim))
+        if hasattr(self, "embeddings"):
+            embeddings[:len(self)] = self.embeddings[:len(self)]
+            del self.embeddings
+        embeddings.flush()
+        del embeddings
+        os.replace(tmp_path, path)
+        return np.load(path, mmap_mode="r+")
+
+    def add(self, keys: Union[str, List[str]], embs):
+        """Enrolls (or updates) speakers, embs: (N, D) or (D,)"""
+        keys = [keys] if isinstance(keys, str) else list(keys)
+        embs = normalize(embs)
+        assert len(keys) == len(embs) and embs.shape[1] == self.dim
+        new_keys = [key for key in dict.fromkeys(keys) if key not in self.key2index]
+        if len(self) + len(new_keys) > len(self.embeddings):
+            self.embeddings = self.allocate(max(2 * len(self.embeddings), len(self) + len(new_keys)))
+        for key in new_keys:
+            self.key2index[key] = len(self.keys)
+            self.keys.append(key)
+        rows = np.array([self.key2index[key] for key in keys], dtype=np.int64)
+        self.embeddings[rows] = embs
+        if self.ivf_centers is not None:
+            self.resize_ivf(len(self))
+            self.list_ids[rows], codes = self.encode(embs)
+            if self.pq_codebooks is not None:
+                self.pq_codes[rows] = codes
+
+    def remove(self, keys: Union[str, List[str]]):
+        keys = [keys] if isinstance(keys, str) else keys
+        for key in keys:
+            row = self.key2index.pop(key)
+            last = len(self.keys) - 1
+            if row != last:
+                # the last row fills the hole, the matrix stays contiguous
+                self.embeddings[row] = self.embeddings[last]
+                self.keys[row] = self.keys[last]
+                self.key2index[self.keys[row]] = row
+                if self.ivf_centers is not None:
+                    self.list_ids[row] = self.list_ids[last]
+                    if self.pq_codebooks is not None:
+                        self.pq_codes[row] = self.pq_codes[last]
+            self.keys.pop()
+        if self.ivf_centers is not None:
+            self.resize_ivf(len(self))
+
+    def save(self):
+        assert self.index_dir is not None
+        self.embeddings.flush()
+        with open(os.path.join(self.index_dir, "meta.json"), "w") as fout:
+            json.dump({"dim": self.dim, "keys": self.keys}, fout)
+        if self.ivf_centers is not None:
+            ivf = {"centers": self.ivf_centers, "list_ids": self.list_ids}
+            if self.pq_codebooks is not None:
+                ivf.update(codebooks=self.pq_codebooks, codes=self.pq_codes)
+            np.savez(os.path.join(self.index_dir, "ivf.npz"), **ivf)
+
+    def build_ivf(self, num_lists: int = 64, num_subvectors: int = None, num_codes: int = 256):
+        """
+        Coarse k-means lists of the enrolled speakers, and if num_subvectors is given, PQ codebooks of
+        num_codes (<= 256) centers per subvector of dim // num_subvectors. The speakers added later are encoded
+        with them, rebuild after many changes.
+        """
+        embs = np.asarray(self.embeddings[:len(self)])
+        self.ivf_centers = k_means(embs, min(num_lists, len(self)), n_init=1)[0].astype(np.float32)
+        self.pq_codebooks = None
+        if num_subvectors is not None:
+            assert self.dim % num_subvectors == 0 and num_codes <= 256
+            sub_embs = embs.reshape(len(self), num_subvectors, -1)
+            self.pq_codebooks = np.stack([
+                k_means(sub_embs[:, m], min(num_codes, len(self)), n_init=1)[0] for m in range(num_subvectors)
+            ]).astype(np.float32)
+        self.list_ids, codes = self.encode(embs)
+        if self.pq_codebooks is not None:
+            self.pq_codes = codes
+
+    def resize_ivf(self, num):
+        list_ids = np.zeros(num, dtype=np.int32)
+        list_ids[:min(num, len(self.list_ids))] = self.list_ids[:num]
+        self.list_ids = list_ids
+        if self.pq_codebooks is not None:
+            pq_codes = np.zeros((num, self.pq_codes.shape[1]), dtype=np.uint8)
+            pq_codes[:min(num, len(self.pq_codes))] = self.pq_codes[:num]
+            self.pq_codes = pq_codes
+
+    def encode(self, embs):
+        list_ids = np.argmax(embs @ self.ivf_centers.T, axis=1).astype(np.int32)
+        if self.pq_codebooks is None:
+            return list_ids, None
+        sub_embs = embs.reshape(len(embs), len(self.pq_codebooks), -1)
+        # nearest center of each subvector, by squared distance
+        dist = (np.einsum("nmd,mkd->nmk", sub_embs, self.pq_codebooks) * -2
+                + (self.pq_codebooks ** 2).sum(-1)[None])
+        return list_ids, np.argmin(dist, axis=2).astype(np.uint8)
+
+    def search(self, queries, top_k: int = 5, nprobe: int = None, rerank: int = None, block_size: int = 65536):
+        """
+        Top-k cosine scores of the queries (Q, D) against the enrolled speakers.
+        nprobe: with build_ivf, only the speakers of the nprobe closest lists are scored, exhaustive if None
+        rerank: with PQ, the rerank best approximate candidates are scored exactly (default 4 * top_k)
+        return: scores (Q, k) and keys (Q lists of k)
+        """
+        queries = normalize(queries)
+        top_k = min(top_k, len(self))
+        if top_k == 0:
+            return np.zeros((len(queries), 0), dtype=np.float32), [[] for _ in queries]
+        if nprobe is None or self.ivf_centers is None:
+            scores, rows = self.exhaustive_search(queries, top_k, block_size)
+        else:
+            scores = np.full((len(queries), top_k), -np.inf, dtype=np.float32)
+            rows = np.zeros((len(queries), top_k), dtype=np.int64)
+            probes = np.argsort(-(queries @ self.ivf_centers.T), axis=1)[:, :nprobe]
+            # the rows of each list
+            list_rows = np.argsort(self.list_ids, kind="stable")
+            bounds = np.searchsorted(self.list_ids[list_rows], np.arange(len(self.ivf_centers) + 1))
+            for i, query in enumerate(queries):
+                candidates = np.concatenate([list_rows[bounds[l]:bounds[l + 1]] for l in probes[i]])
+                if self.pq_codebooks is not None:
+                    # asymmetric distance: the query subvectors against the codebooks, summed over the codes
+                    table = np.einsum("md,mkd->mk", query.reshape(len(self.pq_codebooks), -1), self.pq_codebooks)
+                    approx = table[np.arange(len(table)), self.pq_codes[candidates]].sum(axis=1)
+                    num_rerank = min(rerank or 4 * top_k, len(candidates))
+                    candidates = candidates[np.argpartition(-approx, num_rerank - 1)[:num_rerank]]
+                num = min(top_k, len(candidates))
+                if num == 0:
+                    continue
+                cand_scores = self.embeddings[candidates] @ query
+                best = np.argpartition(-cand_scores, num - 1)[:num]
+                best = best[np.argsort(-cand_scores[best])]
+                scores[i, :num], rows[i, :num] = cand_scores[best], candidates[best]
+        return scores, [[self.keys[r] for r, s in zip(row, score) if s > -np.inf] for row, score in zip(rows, scores)]
+
+    def exhaustive_search(self, queries, top_k, block_size):
+        scores = np.full((len(queries), top_k), -np.inf, dtype=np.float32)
+        rows = np.zeros((len(queries), top_k), dtype=np.int64)
+        # blocks of speakers, merged into the running top-k
+        for beg in range(0, len(self), block_size):
+            block_scores = queries @ self.embeddings[beg:min(beg + block_size, len(self))].T
+            all_scores = np.concatenate([scores, block_scores], axis=1)
+            all_rows = np.concatenate([rows, np.arange(beg, beg + block_scores.shape[1])[None].repeat(len(queries), 0)],
+                                      axis=1)
+            best = np.argpartition(-all_scores, top_k - 1, axis=1)[:, :top_k]
+            scores, rows = np.take_along_axis(all_scores, best, 1), np.take_along_axis(all_rows, best, 1)
+        order = np.argsort(-scores, axis=1)
+        return np.take_along_axis(scores, order, 1), np.take_along_axis(rows, order, 1)
+
+    def verify(self, keys: Union[str, List[str]], embs):
+        """Cosine scores of embeddings against the claimed enrolled speakers"""
+        keys = [keys] if isinstance(keys, str) else keys
+        rows = np.array([self.key2index[key] for key in keys], dtype=np.int64)
+        return (self.embeddings[rows] * normalize(embs)).sum(axis=1)
+
+
+def compute_verification_metrics(scores, labels, p_target=0.01, c_miss=1, c_fa=1):
+    """
+    EER and minDCF of verification trials, labels: 1 for target trials, with funasr/metrics/compute_eer.py and
+    compute_min_dcf.py
+    """
+    scores, labels = np.asarray(scores, dtype=float), np.asarray(labels, dtype=int)
+    eer, eer_threshold = _compute_eer(labels, scores)
+    fnrs, fprs, thresholds = ComputeErrorRates(scores.tolist(), labels.tolist())
+    min_dcf, min_dcf_threshold = ComputeMinDcf(fnrs, fprs, thresholds, p_target, c_miss, c_fa)
+    return {"eer": eer, "eer_threshold": eer_threshold, "min_dcf": min_dcf, "min_dcf_threshold": min_dcf_threshold}
@@ -124,98 +124,112 @@ def postprocess(segments: list, vad_segments: list,
                 labels: np.ndarray, embeddings: np.ndarray) -> list:
     assert len(segments) == len(labels)
     labels = correct_labels(labels)
-    distribute_res = []
-    for i in range(len(segments)):
-        distribute_res.append([segments[i][0], segments[i][1], labels[i]])
+    starts = np.array([seg[0] for seg in segments], dtype=np.float64)
+    ends = np.array([seg[1] for seg in segments], dtype=np.float64)
     # merge the same speakers chronologically
-    distribute_res = merge_seque(distribute_res)
-
-    # accquire speaker center
-    spk_embs = []
-    for i in range(labels.max() + 1):
-        spk_emb = embeddings[labels == i].mean(0)
-        spk_embs.append(spk_emb)
-    spk_embs = np.stack(spk_embs)
-
-    def is_overlapped(t1, t2):
-        if t1 > t2 + 1e-4:
-            return True
-        return False
-
-    # distribute the overlap region
-    for i in range(1, len(distribute_res)):
-        if is_overlapped(distribute_res[i - 1][1], distribute_res[i][0]):
-            p = (distribute_res[i][0] + distribute_res[i - 1][1]) / 2
-            distribute_res[i][0] = p
-            distribute_res[i - 1][1] = p
+    starts, ends, labels = merge_seque_arrays(starts, ends, labels)
+
+    # distribute the overlap region, each boundary only depends on its two segments
+    overlapped = ends[:-1] > starts[1:] + 1e-4
+    p = (starts[1:] + ends[:-1]) / 2
+    starts[1:][overlapped] = p[overlapped]
+    ends[:-1][overlapped] = p[overlapped]
 
     # smooth the result
-    distribute_res = smooth(distribute_res)
+    return smooth(to_segments(starts, ends, labels))
+
 
-    return distribute_res
+def to_segments(starts, ends, labels):
+    return [[st, ed, label] for st, ed, label in zip(starts.tolist(), ends.tolist(), labels.tolist())]
 
 
 def correct_labels(labels):
-    labels_id = 0
-    id2id = {}
-    new_labels = []
-    for i in labels:
-        if i not in id2id:
-            id2id[i] = labels_id
-            labels_id += 1
-        new_labels.append(id2id[i])
-    return np.array(new_labels)
+    # relabel by order of first appearance
+    labels = np.asarray(labels)
+    _, first_index, inverse = np.unique(labels, return_index=True, return_inverse=True)
+    rank = np.empty(len(first_index), dtype=np.int64)
+    rank[np.argsort(first_index)] = np.arange(len(first_index))
+    return rank[inverse.reshape(-1)]
+
+
+def merge_seque_arrays(starts, ends, labels):
+    # a segment is merged into the previous one if they have the same speaker and it starts before its end
+    new = np.ones(len(starts), dtype=bool)
+    new[1:] = (labels[1:] != labels[:-1]) | (starts[1:] > ends[:-1])
+    first = np.flatnonzero(new)
+    last = np.append(first[1:] - 1, len(starts) - 1)
+    return starts[first], ends[last], labels[first]
+
 
 def merge_seque(distribute_res):
-    res = [distribute_res[0]]
-    for i in range(1, len(distribute_res)):
-        if distribute_res[i][2] != res[-1][2] or distribute_res[i][
-                0] > res[-1][1]:
-            res.append(distribute_res[i])
-        else:
-            res[-1][1] = distribute_res[i][1]
-    return res
+    starts, ends, labels = merge_seque_arrays(np.array([r[0] for r in distribute_res], dtype=np.float64),
+                                              np.array([r[1] for r in distribute_res], dtype=np.float64),
+                                              np.array([r[2] for r in distribute_res]))
+    return to_segments(starts, ends, labels)
+
 
 def smooth(res, mindur=1):
     # if only one segment, return directly
     if len(res) < 2:
         return res
-    # short segments are assigned to nearest speakers.
-    for i in range(len(res)):
-        res[i][0] = round(res[i][0], 2)
-        res[i][1] = round(res[i][1], 2)
-        if res[i][1] - res[i][0] < mindur:
-            if i == 0:
-                res[i][2] = res[i + 1][2]
-            elif i == len(res) - 1:
-                res[i][2] = res[i - 1][2]
-            elif res[i][0] - res[i - 1][1] <= res[i + 1][0] - res[i][1]:
-                res[i][2] = res[i - 1][2]
-            else:
-                res[i][2] = res[i + 1][2]
+    raw_starts = np.array([r[0] for r in res], dtype=np.float64)
+    starts = np.array([round(r[0], 2) for r in res], dtype=np.float64)
+    ends = np.array([round(r[1], 2) for r in res], dtype=np.float64)
+    labels = np.array([r[2] for r in res])
+    # short segments are assigned to nearest speakers: the previous one (after its own assignment) or the next
+    # one (before), as segments are processed in order, with the gap to the next computed on its unrounded start
+    short = ends - starts < mindur
+    to_prev = np.zeros(len(res), dtype=bool)
+    to_prev[1:-1] = starts[1:-1] - ends[:-2] <= raw_starts[2:] - ends[1:-1]
+    to_prev[-1] = True
+    to_prev[0] = False
+    to_prev &= short
+    to_next = short & ~to_prev
+    labels[:-1][to_next[:-1]] = labels[1:][to_next[:-1]]
+    # the segments assigned to the previous one take the label of the last segment before them which is not
+    source = np.where(to_prev, 0, np.arange(len(res)))
+    labels = labels[np.maximum.accumulate(source)]
     # merge the speakers
-    res = merge_seque(res)
+    starts, ends, labels = merge_seque_arrays(starts, ends, labels)
 
-    return res
+    return to_segments(starts, ends, labels)
 
 
 def distribute_spk(sentence_list, sd_time_list):
+    """
+    The speaker of each sentence is the one of the speaker segment overlapping it the most (the first one in
+    case of a tie, 0 if none). When the segments are sorted by start and end, which is the case of the ones of
+    postprocess, the segments overlapping a sentence are a range found by binary search.
+    """
+    if len(sentence_list) == 0:
+        return []
+    spk_st = np.array([sd_time[0] for sd_time in sd_time_list], dtype=np.float64) * 1000
+    spk_ed = np.array([sd_time[1] for sd_time in sd_time_list], dtype=np.float64) * 1000
+    spks = [sd_time[2] for sd_time in sd_time_list]
+    sentence_start = np.array([d['start'] for d in sentence_list], dtype=np.float64)
+    sentence_end = np.array([d['end'] for d in sentence_list], dtype=np.float64)
+    if np.all(np.diff(spk_st) >= 0) and np.all(np.diff(spk_ed) >= 0):
+        beg = np.searchsorted(spk_ed, sentence_start, side="right")
+        end = np.maximum(np.searchsorted(spk_st, sentence_end, side="left"), beg)
+    else:
+        beg = np.zeros(len(sentence_list), dtype=np.int64)
+        end = np.full(len(sentence_list), len(sd_time_list), dtype=np.int64)
+    # (sentence, segment) pairs of the ranges
+    counts = end - beg
+    sentence_index = np.repeat(np.arange(len(sentence_list)), counts)
+    spk_index = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(beg, counts)
+    overlap = np.maximum(np.minimum(sentence_end[sentence_index], spk_ed[spk_index])
+                         - np.maximum(sentence_start[sentence_index], spk_st[spk_index]), 0)
+    max_overlap = np.zeros(len(sentence_list), dtype=np.float64)
+    np.maximum.at(max_overlap, sentence_index, overlap)
+    best = (overlap == max_overlap[sentence_index]) & (overlap > 0)
+    best_sentence, first = np.unique(sentence_index[best], return_index=True)
+    sentence_spk = np.zeros(len(sentence_list), dtype=np.int64)
+    sentence_spk[best_sentence] = [int(spks[i]) for i in spk_index[best][first]]
+
     sd_sentence_list = []
-    for d in sentence_list:
-        sentence_start = d['start']
-        sentence_end = d['end']
-        sentence_spk = 0
-        max_overlap = 0
-        for sd_time in sd_time_list:
-            spk_st, spk_ed, spk = sd_time
-            spk_st = spk_st*1000
-            spk_ed = spk_ed*1000
-            overlap = max(
-                min(sentence_end, spk_ed) - max(sentence_start, spk_st), 0)
-            if overlap > max_overlap:
-                max_overlap = overlap
-                sentence_spk = spk
-        d['spk'] = int(sentence_spk)
+    for d, spk in zip(sentence_list, sentence_spk.tolist()):
+        d['spk'] = spk
         sd_sentence_list.append(d)
     return sd_sentence_list
 
@@ -553,7 +553,7 @@ class ConformerEncoder(nn.Module):
             torch.Tensor: Not to be used now.
 
         """
-        masks = (~make_pad_mask(ilens)[:, None, :]).to(xs_pad.device)
+        masks = (~make_pad_mask(ilens, maxlen=xs_pad.size(1))[:, None, :]).to(xs_pad.device)
 
         if (
                 isinstance(self.embed, Conv2dSubsampling)
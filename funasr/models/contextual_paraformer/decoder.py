@@ -267,10 +267,10 @@ class ContextualParaformerDecoder(ParaformerSANMDecoder):
             olens: (batch, )
         """
         tgt = ys_in_pad
-        tgt_mask = myutils.sequence_mask(ys_in_lens, device=tgt.device)[:, :, None]
+        tgt_mask = myutils.sequence_mask(ys_in_lens, maxlen=tgt.size(1), device=tgt.device)[:, :, None]
 
         memory = hs_pad
-        memory_mask = myutils.sequence_mask(hlens, device=memory.device)[:, None, :]
+        memory_mask = myutils.sequence_mask(hlens, maxlen=memory.size(1), device=memory.device)[:, None, :]
 
         x = tgt
         x, tgt_mask, memory, memory_mask, _ = self.decoders(
@@ -3,14 +3,9 @@
 # Copyright FunASR (https://github.com/alibaba-damo-academy/FunASR). All Rights Reserved.
 #  MIT License  (https://opensource.org/licenses/MIT)
 
-import os
-import re
 import time
 import torch
-import codecs
 import logging
-import tempfile
-import requests
 import numpy as np
 from typing import Dict, Tuple
 from contextlib import contextmanager
@@ -21,6 +16,7 @@ from funasr.utils import postprocess_utils
 from funasr.metrics.compute_acc import th_accuracy
 from funasr.models.paraformer.model import Paraformer
 from funasr.utils.datadir_writer import DatadirWriter
+from funasr.utils.hotword_utils import hotword_key
 from funasr.models.paraformer.search import Hypothesis
 from funasr.train_utils.device_funcs import force_gatherable
 from funasr.models.transformer.utils.add_sos_eos import add_sos_eos
@@ -268,15 +264,21 @@ class ContextualParaformer(Paraformer):
             hw_embed, (h_n, _) = self.bias_encoder(hw_embed)
             hw_embed = h_n.repeat(encoder_out.shape[0], 1, 1)
         else:
-            hw_lengths = [len(i) for i in hw_list]
-            hw_list_pad = pad_list([torch.Tensor(i).long() for i in hw_list], 0).to(encoder_out.device)
-            if self.use_decoder_embedding:
-                hw_embed = self.decoder.embed(hw_list_pad)
-            else:
-                hw_embed = self.bias_embed(hw_list_pad)
-            hw_embed = torch.nn.utils.rnn.pack_padded_sequence(hw_embed, hw_lengths, batch_first=True,
-                                                               enforce_sorted=False)
-            _, (h_n, _) = self.bias_encoder(hw_embed)
+            # the bias encoder outputs of a hotword list are reused in inference
+            key = ("bias_encoder", hotword_key(hw_list), str(encoder_out.device))
+            h_n = None if self.training else self.hotword_cache.get(key)
+            if h_n is None:
+                hw_lengths = [len(i) for i in hw_list]
+                hw_list_pad = pad_list([torch.Tensor(i).long() for i in hw_list], 0).to(encoder_out.device)
+                if self.use_decoder_embedding:
+                    hw_embed = self.decoder.embed(hw_list_pad)
+                else:
+                    hw_embed = self.bias_embed(hw_list_pad)
+                hw_embed = torch.nn.utils.rnn.pack_padded_sequence(hw_embed, hw_lengths, batch_first=True,
+                                                                   enforce_sorted=False)
+                _, (h_n, _) = self.bias_encoder(hw_embed)
+                if not self.training:
+                    self.hotword_cache.put(key, h_n.detach())
             hw_embed = h_n.repeat(encoder_out.shape[0], 1, 1)
 
         decoder_outs = self.decoder(
@@ -299,7 +301,9 @@ class ContextualParaformer(Paraformer):
 
         is_use_ctc = kwargs.get("decoding_ctc_weight", 0.0) > 0.00001 and self.ctc != None
         is_use_lm = kwargs.get("lm_weight", 0.0) > 0.00001 and kwargs.get("lm_file", None) is not None
-        if self.beam_search is None and (is_use_lm or is_use_ctc):
+        is_use_ngram = kwargs.get("ngram_weight", 0.0) > 0.00001 and kwargs.get("ngram_file", None) is not None
+        is_use_context = kwargs.get("context_weight", 0.0) > 0.00001 and kwargs.get("hotword", None) is not None
+        if self.beam_search is None and (is_use_lm or is_use_ctc or is_use_ngram or is_use_context):
             logging.info("enable beam_search")
             self.init_beam_search(**kwargs)
             self.nbest = kwargs.get("nbest", 1)
@@ -326,6 +330,8 @@ class ContextualParaformer(Paraformer):
 
         # hotword
         self.hotword_list = self.generate_hotwords_list(kwargs.get("hotword", None), tokenizer=tokenizer, frontend=frontend)
+        if is_use_context:
+            self.update_context_graph(self.hotword_list)
 
         # Encoder
         encoder_out, encoder_out_lens = self.encode(speech, speech_lengths)
@@ -405,107 +411,6 @@ class ContextualParaformer(Paraformer):
         
         return results, meta_data
 
-    def generate_hotwords_list(self, hotword_list_or_file, tokenizer=None, frontend=None):
-        def load_seg_dict(seg_dict_file):
-            seg_dict = {}
-            assert isinstance(seg_dict_file, str)
-            with open(seg_dict_file, "r", encoding="utf8") as f:
-                lines = f.readlines()
-                for line in lines:
-                    s = line.strip().split()
-                    key = s[0]
-                    value = s[1:]
-                    seg_dict[key] = " ".join(value)
-            return seg_dict
-        
-        def seg_tokenize(txt, seg_dict):
-            pattern = re.compile(r'^[\u4E00-\u9FA50-9]+$')
-            out_txt = ""
-            for word in txt:
-                word = word.lower()
-                if word in seg_dict:
-                    out_txt += seg_dict[word] + " "
-                else:
-                    if pattern.match(word):
-                        for char in word:
-                            if char in seg_dict:
-                                out_txt += seg_dict[char] + " "
-                            else:
-                                out_txt += "<unk>" + " "
-                    else:
-                        out_txt += "<unk>" + " "
-            return out_txt.strip().split()
-        
-        seg_dict = None
-        if frontend.cmvn_file is not None:
-            model_dir = os.path.dirname(frontend.cmvn_file)
-            seg_dict_file = os.path.join(model_dir, 'seg_dict')
-            if os.path.exists(seg_dict_file):
-                seg_dict = load_seg_dict(seg_dict_file)
-            else:
-                seg_dict = None
-        # for None
-        if hotword_list_or_file is None:
-            hotword_list = None
-        # for local txt inputs
-        elif os.path.exists(hotword_list_or_file) and hotword_list_or_file.endswith('.txt'):
-            logging.info("Attempting to parse hotwords from local txt...")
-            hotword_list = []
-            hotword_str_list = []
-            with codecs.open(hotword_list_or_file, 'r') as fin:
-                for line in fin.readlines():
-                    hw = line.strip()
-                    hw_list = hw.split()
-                    if seg_dict is not None:
-                        hw_list = seg_tokenize(hw_list, seg_dict)
-                    hotword_str_list.append(hw)
-                    hotword_list.append(tokenizer.tokens2ids(hw_list))
-                hotword_list.append([self.sos])
-                hotword_str_list.append('<s>')
-            logging.info("Initialized hotword list from file: {}, hotword list: {}."
-                         .format(hotword_list_or_file, hotword_str_list))
-        # for url, download and generate txt
-        elif hotword_list_or_file.startswith('http'):
-            logging.info("Attempting to parse hotwords from url...")
-            work_dir = tempfile.TemporaryDirectory().name
-            if not os.path.exists(work_dir):
-                os.makedirs(work_dir)
-            text_file_path = os.path.join(work_dir, os.path.basename(hotword_list_or_file))
-            local_file = requests.get(hotword_list_or_file)
-            open(text_file_path, "wb").write(local_file.content)
-            hotword_list_or_file = text_file_path
-            hotword_list = []
-            hotword_str_list = []
-            with codecs.open(hotword_list_or_file, 'r') as fin:
-                for line in fin.readlines():
-                    hw = line.strip()
-                    hw_list = hw.split()
-                    if seg_dict is not None:
-                        hw_list = seg_tokenize(hw_list, seg_dict)
-                    hotword_str_list.append(hw)
-                    hotword_list.append(tokenizer.tokens2ids(hw_list))
-                hotword_list.append([self.sos])
-                hotword_str_list.append('<s>')
-            logging.info("Initialized hotword list from file: {}, hotword list: {}."
-                         .format(hotword_list_or_file, hotword_str_list))
-        # for text str input
-        elif not hotword_list_or_file.endswith('.txt'):
-            logging.info("Attempting to parse hotwords as str...")
-            hotword_list = []
-            hotword_str_list = []
-            for hw in hotword_list_or_file.strip().split():
-                hotword_str_list.append(hw)
-                hw_list = hw.strip().split()
-                if seg_dict is not None:
-                    hw_list = seg_tokenize(hw_list, seg_dict)
-                hotword_list.append(tokenizer.tokens2ids(hw_list))
-            hotword_list.append([self.sos])
-            hotword_str_list.append('<s>')
-            logging.info("Hotword list: {}.".format(hotword_str_list))
-        else:
-            hotword_list = None
-        return hotword_list
-
     def export(
         self,
         **kwargs,
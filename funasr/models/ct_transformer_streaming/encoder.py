@@ -318,7 +318,7 @@ class SANMVadEncoder(torch.nn.Module):
         Returns:
             position embedded tensor and mask
         """
-        masks = (~make_pad_mask(ilens)[:, None, :]).to(xs_pad.device)
+        masks = (~make_pad_mask(ilens, maxlen=xs_pad.size(1))[:, None, :]).to(xs_pad.device)
         sub_masks = subsequent_mask(masks.size(-1), device=xs_pad.device).unsqueeze(0)
         no_future_masks = masks & sub_masks
         xs_pad *= self.output_size()**0.5
@@ -338,7 +338,7 @@ class Data2VecEncoder(nn.Module):
     ):
         # create padding_mask by ilens
         if ilens is not None:
-            padding_mask = make_pad_mask(lengths=ilens).to(xs_pad.device)
+            padding_mask = make_pad_mask(lengths=ilens, maxlen=xs_pad.size(1)).to(xs_pad.device)
         else:
             padding_mask = None
 
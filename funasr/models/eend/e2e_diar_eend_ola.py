@@ -6,6 +6,7 @@ import numpy as np
 import torch
 import torch.nn as  nn
 import torch.nn.functional as F
+from scipy.optimize import linear_sum_assignment
 
 from funasr.frontends.wav_frontend import WavFrontendMel23
 from funasr.models.eend.encoder import EENDOLATransformerEncoder
@@ -173,12 +174,12 @@ class DiarEENDOLAModel(nn.Module):
                 att = att[:n_speakers, ]
                 attractors_active.append(att)
             elif threshold is not None:
-                silence = torch.nonzero(p < threshold)[0]
-                n_spk = silence[0] if silence.size else None
+                silence = torch.nonzero(p < threshold)
+                n_spk = silence[0, 0] if len(silence) else None
                 att = att[:n_spk, ]
                 attractors_active.append(att)
             else:
-                NotImplementedError('n_speakers or threshold has to be given.')
+                raise NotImplementedError('n_speakers or threshold has to be given.')
         raw_n_speakers = [att.shape[0] for att in attractors_active]
         attractors = [
             pad_attractor(att, self.max_n_speaker) if att.shape[0] <= self.max_n_speaker else att[:self.max_n_speaker]
@@ -190,19 +191,97 @@ class DiarEENDOLAModel(nn.Module):
 
         return ys, emb, attractors, raw_n_speakers
 
+    def estimate_batch(self,
+                       speech: List[torch.Tensor],
+                       batch_size: int = 16,
+                       chunk_size: int = 2000,
+                       **kwargs):
+        """
+        Diarization of many recordings: the ones up to chunk_size frames are sorted by length and estimated
+        batch_size at a time, so that the batches are little padded, the longer ones by estimate_streaming.
+        return: ys, the (T, n_speakers) decisions of each recording, in the input order
+        """
+        ys = [None] * len(speech)
+        short = [i for i in range(len(speech)) if not chunk_size or len(speech[i]) <= chunk_size]
+        short = sorted(short, key=lambda i: len(speech[i]), reverse=True)
+        for beg in range(0, len(short), batch_size):
+            batch = short[beg:beg + batch_size]
+            batch_ys = self.estimate_sequential([speech[i] for i in batch], **kwargs)[0]
+            for i, y in zip(batch, batch_ys):
+                ys[i] = y
+        for i in range(len(speech)):
+            if ys[i] is None:
+                ys[i] = self.estimate_streaming(speech[i], chunk_size=chunk_size, **kwargs)[0]
+        return ys
+
+    @torch.no_grad()
+    def estimate_streaming(self,
+                           speech: torch.Tensor,
+                           chunk_size: int = 2000,
+                           buffer_size: int = 1000,
+                           **kwargs):
+        """
+        Blockwise diarization of one long recording (T, D) with a speaker-tracing buffer, the memory is bounded
+        by chunk_size + buffer_size frames whatever T. Each chunk is estimated together with the buffer, i.e.
+        buffer_size frames of the previous blocks and their speaker probabilities, the speakers of the block are
+        matched to the ones found so far by the correlation of their probabilities on the buffer frames
+        (Hungarian), and the unmatched ones are new speakers. The buffer keeps the frames that best tell the
+        speakers apart (largest sum of pairwise probability differences).
+        kwargs: n_speakers, shuffle and threshold of estimate_sequential
+        return: ys (T, n_speakers) decisions and n_speakers
+        """
+        buffer_feats = speech[:0]
+        buffer_probs = torch.zeros(0, 0, device=speech.device)
+        n_speakers = 0
+        ys = []
+        for beg in range(0, len(speech), chunk_size):
+            feats = torch.cat([buffer_feats, speech[beg:beg + chunk_size]], dim=0)
+            y, emb, attractors, raw_n_speakers = self.estimate_sequential([feats], **kwargs)
+            n_local = min(raw_n_speakers[0], self.max_n_speaker)
+            probs = torch.sigmoid(torch.matmul(emb[0], attractors[0][:n_local].permute(1, 0)))
+            # speakers of the block to global ones
+            perm = [-1] * n_local
+            if n_local > 0 and len(buffer_feats) > 0 and n_speakers > 0:
+                corr = torch.matmul(buffer_probs.permute(1, 0), probs[:len(buffer_feats)]).cpu().numpy()
+                for g, l in zip(*linear_sum_assignment(-corr)):
+                    if corr[g, l] > 0:
+                        perm[l] = int(g)
+            for l in range(n_local):
+                if perm[l] < 0:
+                    perm[l] = n_speakers
+                    n_speakers += 1
+            perm = torch.tensor(perm, dtype=torch.long, device=speech.device)
+            y_global = torch.zeros(len(feats), n_speakers, device=speech.device)
+            y_global[:, perm] = y[0][:, :n_local]
+            ys.append(y_global[len(buffer_feats):])
+            probs_global = torch.zeros(len(feats), n_speakers, device=speech.device)
+            probs_global[:, perm] = probs
+            # the speakers absent from the block keep their probabilities on the buffer frames
+            absent = torch.ones(buffer_probs.shape[1], dtype=torch.bool, device=speech.device)
+            absent[perm[perm < len(absent)]] = False
+            probs_global[:len(buffer_feats), :len(absent)][:, absent] = buffer_probs[:, absent]
+            # update the buffer
+            if len(feats) > buffer_size:
+                diff = (probs_global[:, :, None] - probs_global[:, None, :]).abs().sum(dim=(1, 2))
+                keep = torch.sort(torch.topk(diff, buffer_size).indices).values
+                buffer_feats, buffer_probs = feats[keep], probs_global[keep]
+            else:
+                buffer_feats, buffer_probs = feats, probs_global
+        ys = [F.pad(y, (0, n_speakers - y.shape[1])) for y in ys]
+        return torch.cat(ys, dim=0), n_speakers
+
     def recover_y_from_powerlabel(self, logit, n_speaker):
         pred = torch.argmax(torch.softmax(logit, dim=-1), dim=-1)
-        oov_index = torch.where(pred == self.mapping_dict['oov'])[0]
-        for i in oov_index:
-            if i > 0:
-                pred[i] = pred[i - 1]
-            else:
-                pred[i] = 0
-        pred = [self.inv_mapping_func(i) for i in pred]
-        decisions = [bin(num)[2:].zfill(self.max_n_speaker)[::-1] for num in pred]
-        decisions = torch.from_numpy(
-            np.stack([np.array([int(i) for i in dec]) for dec in decisions], axis=0)).to(logit.device).to(
-            torch.float32)
+        # an oov frame takes the label of the previous frame, 0 at the beginning
+        index = torch.arange(len(pred), device=pred.device)
+        index = torch.where(pred != self.mapping_dict['oov'], index, -1)
+        index = torch.cummax(index, dim=0).values
+        pred = torch.where(index >= 0, pred[index.clamp(min=0)], 0)
+        if not hasattr(self, "label2dec"):
+            self.label2dec = torch.tensor([self.inv_mapping_func(i) for i in range(self.mapping_dict['oov'] + 1)])
+        pred = self.label2dec.to(pred.device)[pred]
+        bits = torch.arange(self.max_n_speaker, device=pred.device)
+        decisions = ((pred[:, None] >> bits) & 1).to(torch.float32)
         decisions = decisions[:, :n_speaker]
         return decisions
 
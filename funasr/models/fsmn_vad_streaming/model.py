@@ -8,6 +8,7 @@ import json
 import time
 import math
 import torch
+import numpy as np
 from torch import nn
 from enum import Enum
 from dataclasses import dataclass
@@ -15,7 +16,8 @@ from funasr.register import tables
 from typing import List, Tuple, Dict, Any, Optional
 
 from funasr.utils.datadir_writer import DatadirWriter
-from funasr.utils.load_utils import load_audio_text_image_video, extract_fbank
+from funasr.utils.load_utils import load_audio_text_image_video, extract_fbank, load_audio_to_buffer, PcmBuffer
+from funasr.models.fsmn_vad_streaming.vad_utils import compute_decibel, compute_frame_probs, compute_frame_states
 
 
 class VadStateMachine(Enum):
@@ -316,10 +318,8 @@ class FsmnVADStreaming(nn.Module):
 			cache["stats"].data_buf = cache["stats"].data_buf_all
 		else:
 			cache["stats"].data_buf_all = torch.cat((cache["stats"].data_buf_all, cache["stats"].waveform[0]))
-		for offset in range(0, cache["stats"].waveform.shape[1] - frame_sample_length + 1, frame_shift_length):
-			cache["stats"].decibel.append(
-				10 * math.log10((cache["stats"].waveform[0][offset: offset + frame_sample_length]).square().sum() + \
-				                0.000001))
+		cache["stats"].decibel.extend(
+			compute_decibel(cache["stats"].waveform[0].cpu().numpy(), frame_sample_length, frame_shift_length).tolist())
 	
 	def ComputeScores(self, feats: torch.Tensor, cache: dict = {}) -> None:
 		scores = self.encoder(feats, cache=cache["encoder"]).to('cpu')  # return B * T * D
@@ -373,12 +373,8 @@ class FsmnVADStreaming(nn.Module):
 			expected_sample_number = len(cache["stats"].data_buf)
 		
 		cur_seg.doa = 0
-		for sample_cpy_out in range(0, data_to_pop):
-			# cur_seg.buffer[out_pos ++] = data_buf_.back();
-			out_pos += 1
-		for sample_cpy_out in range(data_to_pop, expected_sample_number):
-			# cur_seg.buffer[out_pos++] = data_buf_.back()
-			out_pos += 1
+		# cur_seg.buffer[out_pos++] = data_buf_.back() for the samples to pop and the expected ones
+		out_pos += max(data_to_pop, 0) + max(expected_sample_number - data_to_pop, 0)
 		if cur_seg.end_ms != start_frm * self.vad_opts.frame_in_ms:
 			print('Something wrong with the VAD algorithm\n')
 		cache["stats"].data_buf_start_frame += frm_cnt
@@ -439,49 +435,18 @@ class FsmnVADStreaming(nn.Module):
 			vad_latency += int(self.vad_opts.lookback_time_start_point / self.vad_opts.frame_in_ms)
 		return vad_latency
 	
-	def GetFrameState(self, t: int, cache: dict = {}):
-		frame_state = FrameState.kFrameStateInvalid
-		cur_decibel = cache["stats"].decibel[t]
-		cur_snr = cur_decibel - cache["stats"].noise_average_decibel
-		# for each frame, calc log posterior probability of each state
-		if cur_decibel < self.vad_opts.decibel_thres:
-			frame_state = FrameState.kFrameStateSil
-			self.DetectOneFrame(frame_state, t, False, cache=cache)
-			return frame_state
-		
-		sum_score = 0.0
-		noise_prob = 0.0
+	def GetFrameStates(self, beg: int, end: int, cache: dict = {}):
+		"""Speech (1) or silence (0) of the frames [beg, end) of the kept buffers, with their decibel and probs."""
+		decibel = np.array(cache["stats"].decibel[beg:end], dtype=np.float64)
 		assert len(cache["stats"].sil_pdf_ids) == self.vad_opts.silence_pdf_num
-		if len(cache["stats"].sil_pdf_ids) > 0:
-			assert len(cache["stats"].scores) == 1  # 只支持batch_size = 1的测试
-			sil_pdf_scores = [cache["stats"].scores[0][t][sil_pdf_id] for sil_pdf_id in cache["stats"].sil_pdf_ids]
-			sum_score = sum(sil_pdf_scores)
-			noise_prob = math.log(sum_score) * self.vad_opts.speech_2_noise_ratio
-			total_score = 1.0
-			sum_score = total_score - sum_score
-		speech_prob = math.log(sum_score)
-		if self.vad_opts.output_frame_probs:
-			frame_prob = E2EVadFrameProb()
-			frame_prob.noise_prob = noise_prob
-			frame_prob.speech_prob = speech_prob
-			frame_prob.score = sum_score
-			frame_prob.frame_id = t
-			cache["stats"].frame_probs.append(frame_prob)
-		if math.exp(speech_prob) >= math.exp(noise_prob) + cache["stats"].speech_noise_thres:
-			if cur_snr >= self.vad_opts.snr_thres and cur_decibel >= self.vad_opts.decibel_thres:
-				frame_state = FrameState.kFrameStateSpeech
-			else:
-				frame_state = FrameState.kFrameStateSil
-		else:
-			frame_state = FrameState.kFrameStateSil
-			if cache["stats"].noise_average_decibel < -99.9:
-				cache["stats"].noise_average_decibel = cur_decibel
-			else:
-				cache["stats"].noise_average_decibel = (cur_decibel + cache["stats"].noise_average_decibel * (
-					self.vad_opts.noise_frame_num_used_for_snr
-					- 1)) / self.vad_opts.noise_frame_num_used_for_snr
-		
-		return frame_state
+		assert len(cache["stats"].scores) == 1  # 只支持batch_size = 1的测试
+		scores = cache["stats"].scores[0][beg:end].detach().cpu().numpy()
+		noise_prob, speech_prob, speech_score = compute_frame_probs(scores, cache["stats"].sil_pdf_ids,
+		                                                            self.vad_opts.speech_2_noise_ratio)
+		frame_states, cache["stats"].noise_average_decibel = compute_frame_states(
+			decibel, noise_prob, speech_prob, cache["stats"].noise_average_decibel, cache["stats"].speech_noise_thres,
+			self.vad_opts.snr_thres, self.vad_opts.decibel_thres, self.vad_opts.noise_frame_num_used_for_snr)
+		return frame_states, decibel, (noise_prob, speech_prob, speech_score)
 	
 	def forward(self, feats: torch.Tensor,
 	            waveform: torch.tensor,
@@ -541,7 +506,10 @@ class FsmnVADStreaming(nn.Module):
 	def init_cache(self, cache: dict = {}, **kwargs):
 		
 		cache["frontend"] = {}
-		cache["prev_samples"] = torch.empty(0)
+		if isinstance(cache.get("prev_samples", None), PcmBuffer):
+			cache["prev_samples"].reset()
+		else:
+			cache["prev_samples"] = PcmBuffer()
 		cache["encoder"] = {}
 
 		if kwargs.get("max_end_silence_time") is not None:
@@ -583,20 +551,19 @@ class FsmnVADStreaming(nn.Module):
 		is_streaming_input = kwargs.get("is_streaming_input", False) if chunk_size >= 15000 else kwargs.get("is_streaming_input", True)
 		is_final = kwargs.get("is_final", False) if is_streaming_input else kwargs.get("is_final", True)
 		cfg = {"is_final": is_final, "is_streaming_input": is_streaming_input}
-		audio_sample_list = load_audio_text_image_video(data_in,
-		                                                fs=frontend.fs,
-		                                                audio_fs=kwargs.get("fs", 16000),
-		                                                data_type=kwargs.get("data_type", "sound"),
-		                                                tokenizer=tokenizer,
-		                                                cache=cfg,
-		                                                )
+		# the samples left by the previous call and this chunk, a view of the stream buffer
+		audio_sample = load_audio_to_buffer(data_in,
+		                                    cache["prev_samples"],
+		                                    fs=frontend.fs,
+		                                    audio_fs=kwargs.get("fs", 16000),
+		                                    data_type=kwargs.get("data_type", "sound"),
+		                                    tokenizer=tokenizer,
+		                                    cache=cfg,
+		                                    )
 		_is_final = cfg["is_final"]  # if data_in is a file or url, set is_final=True
 		is_streaming_input = cfg["is_streaming_input"]
 		time2 = time.perf_counter()
 		meta_data["load_data"] = f"{time2 - time1:0.3f}"
-		assert len(audio_sample_list) == 1, "batch_size must be set 1"
-		
-		audio_sample = torch.cat((cache["prev_samples"], audio_sample_list[0]))
 		
 		n = int(len(audio_sample) // chunk_stride_samples + int(_is_final))
 		m = int(len(audio_sample) % chunk_stride_samples * (1 - int(_is_final)))
@@ -626,7 +593,8 @@ class FsmnVADStreaming(nn.Module):
 			if len(segments_i) > 0:
 				segments.extend(*segments_i)
 		
-		cache["prev_samples"] = audio_sample[:-m]
+		# keep the m samples of the incomplete chunk
+		cache["prev_samples"].consume(len(audio_sample) - m)
 		if _is_final:
 			self.init_cache(cache)
 		
@@ -657,28 +625,35 @@ class FsmnVADStreaming(nn.Module):
 	def DetectCommonFrames(self, cache: dict = {}) -> int:
 		if cache["stats"].vad_state_machine == VadStateMachine.kVadInStateEndPointDetected:
 			return 0
-		for i in range(self.vad_opts.nn_eval_block_size - 1, -1, -1):
-			frame_state = FrameState.kFrameStateInvalid
-			frame_state = self.GetFrameState(cache["stats"].frm_cnt - 1 - i - cache["stats"].last_drop_frames,
-			                                 cache=cache)
-			self.DetectOneFrame(frame_state, cache["stats"].frm_cnt - 1 - i, False, cache=cache)
-		
+		self.DetectFrames(False, cache=cache)
 		return 0
 	
 	def DetectLastFrames(self, cache: dict = {}) -> int:
 		if cache["stats"].vad_state_machine == VadStateMachine.kVadInStateEndPointDetected:
 			return 0
-		for i in range(self.vad_opts.nn_eval_block_size - 1, -1, -1):
-			frame_state = FrameState.kFrameStateInvalid
-			frame_state = self.GetFrameState(cache["stats"].frm_cnt - 1 - i - cache["stats"].last_drop_frames,
-			                                 cache=cache)
-			if i != 0:
-				self.DetectOneFrame(frame_state, cache["stats"].frm_cnt - 1 - i, False, cache=cache)
-			else:
-				self.DetectOneFrame(frame_state, cache["stats"].frm_cnt - 1, True, cache=cache)
-		
+		self.DetectFrames(True, cache=cache)
 		return 0
 	
+	def DetectFrames(self, is_final: bool, cache: dict = {}) -> None:
+		# the frame states of the block are computed at once, only the state machine steps per frame
+		beg = cache["stats"].frm_cnt - self.vad_opts.nn_eval_block_size
+		frame_states, decibel, (noise_prob, speech_prob, speech_score) = self.GetFrameStates(
+			beg - cache["stats"].last_drop_frames, cache["stats"].frm_cnt - cache["stats"].last_drop_frames, cache=cache)
+		for i in range(len(frame_states)):
+			t = beg + i
+			if decibel[i] < self.vad_opts.decibel_thres:
+				# the frames below decibel_thres go through the detection twice
+				self.DetectOneFrame(FrameState.kFrameStateSil, t - cache["stats"].last_drop_frames, False, cache=cache)
+			elif self.vad_opts.output_frame_probs:
+				frame_prob = E2EVadFrameProb()
+				frame_prob.noise_prob = noise_prob[i]
+				frame_prob.speech_prob = speech_prob[i]
+				frame_prob.score = speech_score[i]
+				frame_prob.frame_id = t - cache["stats"].last_drop_frames
+				cache["stats"].frame_probs.append(frame_prob)
+			frame_state = FrameState.kFrameStateSpeech if frame_states[i] else FrameState.kFrameStateSil
+			self.DetectOneFrame(frame_state, t, is_final and t == cache["stats"].frm_cnt - 1, cache=cache)
+	
 	def DetectOneFrame(self, cur_frm_state: FrameState, cur_frm_idx: int, is_final_frame: bool,
 	                   cache: dict = {}) -> None:
 		tmp_cur_frm_state = FrameState.kFrameStateInvalid
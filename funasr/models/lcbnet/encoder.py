@@ -215,7 +215,7 @@ class TransformerTextEncoder(nn.Module):
         Returns:
             position embedded tensor and mask
         """
-        masks = (~make_pad_mask(ilens)[:, None, :]).to(xs_pad.device)
+        masks = (~make_pad_mask(ilens, maxlen=xs_pad.size(1))[:, None, :]).to(xs_pad.device)
         xs_pad = self.embed(xs_pad)
 
         xs_pad, masks = self.encoders(xs_pad, masks)
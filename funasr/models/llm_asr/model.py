@@ -18,6 +18,7 @@ from funasr.utils.load_utils import load_audio_text_image_video, extract_fbank
 from funasr.utils import postprocess_utils
 from funasr.utils.datadir_writer import DatadirWriter
 from funasr.register import tables
+from funasr.models.llm_asr.packing import packed_attention_mask, scatter_packed
 
 
 @tables.register("model_classes", "LLMASR")
@@ -188,14 +189,28 @@ class LLMASR(nn.Module):
         else:
             inputs_embeds = self.llm.model.model.model.embed_tokens(input_ids)
 
+        # packed rows (dataset_conf.pack_length > 0): several samples per row, see pack_collate
+        segment_ids = kwargs.get("segment_ids", None)
+        position_ids = None
         if audio_mask is not None:
             batch_size, token_num, dims = inputs_embeds.shape
             _, l, _ = encoder_out.shape
-            # [audio, bos, prompt, input, pad]
-            encoder_outs_pad = F.pad(encoder_out, (0, 0, 0, token_num - l, 0, 0), value=0.0)
+            if segment_ids is not None:
+                # the frames of every sample start at the beginning of its own span
+                packed_offsets = kwargs["packed_offsets"]
+                encoder_outs_pad = scatter_packed(encoder_out, kwargs["packed_rows"], packed_offsets,
+                                                  torch.zeros_like(packed_offsets), kwargs["packed_lengths"],
+                                                  token_num, num_rows=batch_size)
+            else:
+                # [audio, bos, prompt, input, pad]
+                encoder_outs_pad = F.pad(encoder_out, (0, 0, 0, token_num - l, 0, 0), value=0.0)
             inputs_embeds = encoder_outs_pad * audio_mask[:, :, None] + inputs_embeds * (1.0-audio_mask[:, :, None])
+        if segment_ids is not None:
+            attention_mask = packed_attention_mask(segment_ids, inputs_embeds.dtype)
+            position_ids = kwargs["position_ids"]
 
-        model_outputs = self.llm(inputs_embeds=inputs_embeds, attention_mask=attention_mask, labels=labels_ids)
+        model_outputs = self.llm(inputs_embeds=inputs_embeds, attention_mask=attention_mask, labels=labels_ids,
+                                 position_ids=position_ids)
         loss = model_outputs.loss
 
 
@@ -0,0 +1,59 @@
+import torch
+import torch.nn.functional as F
+
+
+def packed_attention_mask(segment_ids: torch.Tensor, dtype=torch.float32):
+    """
+    Block-diagonal causal mask of packed rows.
+
+    segment_ids: (num_rows, width), index of the sample owning every token, -1 for padding.
+    Returns the (num_rows, 1, width, width) additive mask (0 to attend, the dtype minimum otherwise),
+    the 4-d mask format accepted by the transformers causal LMs.
+    """
+    width = segment_ids.shape[1]
+    causal = torch.ones((width, width), dtype=torch.bool, device=segment_ids.device).tril()
+    allowed = (segment_ids[:, :, None] == segment_ids[:, None, :]) & (segment_ids[:, None, :] >= 0) & causal
+    # padding tokens attend to themselves only, which keeps the softmax finite
+    allowed |= torch.eye(width, dtype=torch.bool, device=segment_ids.device)
+    mask = torch.zeros(allowed.shape, dtype=dtype, device=segment_ids.device)
+    mask.masked_fill_(~allowed, torch.finfo(dtype).min)
+    return mask[:, None, :, :]
+
+
+def scatter_packed(encoder_out: torch.Tensor,
+                   rows: torch.Tensor,
+                   offsets: torch.Tensor,
+                   starts: torch.Tensor,
+                   lengths: torch.Tensor,
+                   width: int,
+                   num_rows: int = None,
+                   ):
+    """
+    Scatter per-sample encoder outputs into the packed token layout.
+
+    Frame j of sample n goes to row rows[n], position offsets[n] + starts[n] + j, frames falling
+    outside of the span [0, lengths[n]) of the sample are dropped, as the padding of the unpacked
+    layout would do.
+    """
+    num_samples, num_frames, dims = encoder_out.shape
+    num_rows = int(rows.max()) + 1 if num_rows is None else num_rows
+    frame_idx = torch.arange(num_frames, device=encoder_out.device)[None, :]
+    pos = starts[:, None] + frame_idx
+    valid = (pos >= 0) & (pos < lengths[:, None])
+    sample_idx, frame_idx = valid.nonzero(as_tuple=True)
+    outputs = encoder_out.new_zeros((num_rows, width, dims))
+    outputs[rows[sample_idx], offsets[sample_idx] + pos[sample_idx, frame_idx]] = encoder_out[sample_idx, frame_idx]
+    return outputs
+
+
+def shift_packed_left(x: torch.Tensor, segment_ids: torch.Tensor):
+    """Shift every sample left by one token inside its own span, the last token of a sample becomes zero."""
+    shifted = F.pad(x[:, 1:], (0, 0, 0, 1), value=0.0)
+    next_ids = F.pad(segment_ids[:, 1:], (0, 1), value=-1)
+    return shifted * (next_ids == segment_ids)[:, :, None].type(x.dtype)
+
+
+def packed_sum(x: torch.Tensor, segment_ids: torch.Tensor, num_samples: int):
+    """Per-sample sum of a packed (num_rows, width) tensor, e.g. the audio token lengths from audio_mask."""
+    valid = segment_ids >= 0
+    return x.new_zeros(num_samples).index_add_(0, segment_ids[valid], x[valid])
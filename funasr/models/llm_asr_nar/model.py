@@ -19,6 +19,7 @@ from funasr.utils import postprocess_utils
 from funasr.models.paraformer.cif_predictor import mae_loss
 from funasr.utils.datadir_writer import DatadirWriter
 from funasr.register import tables
+from funasr.models.llm_asr.packing import packed_attention_mask, scatter_packed, shift_packed_left, packed_sum
 
 
 @tables.register("model_classes", "LLMASRNAR")
@@ -172,8 +173,16 @@ class LLMASRNAR(nn.Module):
         
         batch_size = speech.shape[0]
         
+        # packed rows (dataset_conf.pack_length > 0): several samples per row, see pack_collate
+        segment_ids = kwargs.get("segment_ids", None)
+        position_ids = None
+        audio_token_lengths = None
+        if segment_ids is not None and audio_mask is not None:
+            audio_token_lengths = packed_sum(audio_mask, segment_ids, batch_size)
+
         # audio encoder
-        encoder_out, encoder_out_lens = self.encode(speech, speech_lengths, audio_mask=audio_mask)
+        encoder_out, encoder_out_lens = self.encode(speech, speech_lengths, audio_mask=audio_mask,
+                                                    audio_token_lengths=audio_token_lengths)
         
         # adaptor
         encoder_out = self.adaptor(encoder_out)
@@ -188,14 +197,28 @@ class LLMASRNAR(nn.Module):
             else:
                 inputs_embeds = self.llm.model.model.model.embed_tokens(input_ids)
 
-            if audio_mask is not None:
+            if audio_mask is not None and segment_ids is not None:
+                # every sample is aligned as if it were alone in a row
+                _, token_num, dims = inputs_embeds.shape
+                _, l, _ = encoder_out.shape
+                packed_lengths = kwargs["packed_lengths"]
+                encoder_outs_pad = scatter_packed(encoder_out, kwargs["packed_rows"], kwargs["packed_offsets"],
+                                                  packed_lengths - l - 1, packed_lengths, token_num,
+                                                  num_rows=inputs_embeds.shape[0])
+                inputs_embeds = encoder_outs_pad * audio_mask[:, :, None] + inputs_embeds * (1.0-audio_mask[:, :, None])
+                inputs_embeds = shift_packed_left(inputs_embeds, segment_ids)
+            elif audio_mask is not None:
                 batch_size, token_num, dims = inputs_embeds.shape
                 _, l, _ = encoder_out.shape
                 encoder_outs_pad = F.pad(encoder_out, (0, 0, token_num-l-1, 1, 0, 0), value=0.0)
                 inputs_embeds = encoder_outs_pad * audio_mask[:, :, None] + inputs_embeds * (1.0-audio_mask[:, :, None])
                 inputs_embeds = F.pad(inputs_embeds[:, 1:, :], (0, 0, 0, 1, 0, 0), value=0.0)
+        if segment_ids is not None:
+            attention_mask = packed_attention_mask(segment_ids, inputs_embeds.dtype)
+            position_ids = kwargs["position_ids"]
 
-        model_outputs = self.llm(inputs_embeds=inputs_embeds, attention_mask=attention_mask, labels=labels_ids)
+        model_outputs = self.llm(inputs_embeds=inputs_embeds, attention_mask=attention_mask, labels=labels_ids,
+                                 position_ids=position_ids)
         loss = model_outputs.loss
 
 
@@ -218,7 +241,9 @@ class LLMASRNAR(nn.Module):
     ):
     
         audio_mask = kwargs.get("audio_mask", None)
-        audio_token_lengths = audio_mask.sum(-1) if audio_mask is not None else None
+        audio_token_lengths = kwargs.get("audio_token_lengths", None)
+        if audio_token_lengths is None and audio_mask is not None:
+            audio_token_lengths = audio_mask.sum(-1)
         text_token_int = kwargs.get("text_token_int", None)
         if audio_token_lengths is None:
             audio_token_lengths = torch.tensor([len(text_token_int)], dtype=torch.int64)
@@ -513,8 +538,15 @@ class LLMASRNARPrompt(nn.Module):
         batch_size = speech.shape[0]
 
         stats = {}
+        # packed rows (dataset_conf.pack_length > 0): several samples per row, see pack_collate
+        segment_ids = kwargs.get("segment_ids", None)
+        position_ids = None
+        audio_token_lengths = None
+        if segment_ids is not None and audio_mask is not None:
+            audio_token_lengths = packed_sum(audio_mask, segment_ids, batch_size)
+
         # audio encoder
-        outs = self.encode(speech, speech_lengths, audio_mask=audio_mask)
+        outs = self.encode(speech, speech_lengths, audio_mask=audio_mask, audio_token_lengths=audio_token_lengths)
         enc, enc_lens = outs[0], outs[1]
         encoder_out, encoder_out_lens, loss_pre = outs[2], outs[3], outs[4]
         
@@ -542,7 +574,15 @@ class LLMASRNARPrompt(nn.Module):
             else:
                 inputs_embeds = self.llm.model.model.model.embed_tokens(input_ids)
             
-            if audio_mask is not None:
+            if audio_mask is not None and segment_ids is not None:
+                prompt_bos_length = kwargs.get("prompt_bos_length", None)
+                assert prompt_bos_length is not None
+                encoder_outs_pad = scatter_packed(encoder_out, kwargs["packed_rows"], kwargs["packed_offsets"],
+                                                  prompt_bos_length[:, 0].long(), kwargs["packed_lengths"],
+                                                  inputs_embeds.shape[1], num_rows=inputs_embeds.shape[0])
+                inputs_embeds = encoder_outs_pad * audio_mask[:, :, None] + inputs_embeds * (1.0 - audio_mask[:, :, None])
+                inputs_embeds = shift_packed_left(inputs_embeds, segment_ids)
+            elif audio_mask is not None:
                 # inputs_embeds： [bos, prompt, input, pad, target]
                 prompt_bos_length = kwargs.get("prompt_bos_length", None)
                 assert prompt_bos_length is not None
@@ -557,7 +597,11 @@ class LLMASRNARPrompt(nn.Module):
         # loss:
         # inputs_embeds[:-1] -> [prompt, input, pad, target]
         # labels_ids[1:] ->  [prompt, input, target, eos] -> [-1, input, target, eos];
-        model_outputs = self.llm(inputs_embeds=inputs_embeds, attention_mask=attention_mask, labels=labels_ids)
+        if segment_ids is not None:
+            attention_mask = packed_attention_mask(segment_ids, inputs_embeds.dtype)
+            position_ids = kwargs["position_ids"]
+        model_outputs = self.llm(inputs_embeds=inputs_embeds, attention_mask=attention_mask, labels=labels_ids,
+                                 position_ids=position_ids)
         loss_llm = model_outputs.loss
         stats["loss_llm"] = torch.clone(loss_llm.detach())
         if self.ctc_weight > 0.0:
@@ -584,7 +628,9 @@ class LLMASRNARPrompt(nn.Module):
     ):
         
         audio_mask = kwargs.get("audio_mask", None)
-        audio_token_lengths = audio_mask.sum(-1) if audio_mask is not None else None
+        audio_token_lengths = kwargs.get("audio_token_lengths", None)
+        if audio_token_lengths is None and audio_mask is not None:
+            audio_token_lengths = audio_mask.sum(-1)
         text_token_int = kwargs.get("text_token_int", None)
         if audio_token_lengths is None and text_token_int is not None:
             audio_token_lengths = torch.tensor([len(text_token_int)], dtype=torch.int64)
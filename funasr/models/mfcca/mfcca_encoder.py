@@ -345,7 +345,7 @@ class MFCCAEncoder(AbsEncoder):
             torch.Tensor: Output length (#batch).
             torch.Tensor: Not to be used now.
         """
-        masks = (~make_pad_mask(ilens)[:, None, :]).to(xs_pad.device)
+        masks = (~make_pad_mask(ilens, maxlen=xs_pad.size(1))[:, None, :]).to(xs_pad.device)
         if (
                 isinstance(self.embed, Conv2dSubsampling)
                 or isinstance(self.embed, Conv2dSubsampling6)
@@ -403,7 +403,7 @@ class MFCCAEncoder(AbsEncoder):
             torch.Tensor: Output length (#batch).
             torch.Tensor: Not to be used now.
         """
-        masks = (~make_pad_mask(ilens)[:, None, :]).to(xs_pad.device)
+        masks = (~make_pad_mask(ilens, maxlen=xs_pad.size(1))[:, None, :]).to(xs_pad.device)
         if (
                 isinstance(self.embed, Conv2dSubsampling)
                 or isinstance(self.embed, Conv2dSubsampling6)
@@ -373,10 +373,10 @@ class ParaformerSANMDecoder(BaseTransformerDecoder):
             olens: (batch, )
         """
         tgt = ys_in_pad
-        tgt_mask = myutils.sequence_mask(ys_in_lens, device=tgt.device)[:, :, None]
+        tgt_mask = myutils.sequence_mask(ys_in_lens, maxlen=tgt.size(1), device=tgt.device)[:, :, None]
         
         memory = hs_pad
-        memory_mask = myutils.sequence_mask(hlens, device=memory.device)[:, None, :]
+        memory_mask = myutils.sequence_mask(hlens, maxlen=memory.size(1), device=memory.device)[:, None, :]
         if chunk_mask is not None:
             memory_mask = memory_mask * chunk_mask
             if tgt_mask.size(1) != memory_mask.size(1):
@@ -422,10 +422,10 @@ class ParaformerSANMDecoder(BaseTransformerDecoder):
     ):
 
         tgt = ys_in_pad
-        tgt_mask = myutils.sequence_mask(ys_in_lens, device=tgt.device)[:, :, None]
+        tgt_mask = myutils.sequence_mask(ys_in_lens, maxlen=tgt.size(1), device=tgt.device)[:, :, None]
 
         memory = hs_pad
-        memory_mask = myutils.sequence_mask(hlens, device=memory.device)[:, None, :]
+        memory_mask = myutils.sequence_mask(hlens, maxlen=memory.size(1), device=memory.device)[:, None, :]
 
         tgt, tgt_mask, memory, memory_mask, _ = self.decoders[0](tgt, tgt_mask, memory, memory_mask)
         attn_mat = self.model.decoders[1].get_attn_mat(tgt, tgt_mask, memory, memory_mask)
@@ -440,10 +440,10 @@ class ParaformerSANMDecoder(BaseTransformerDecoder):
     ):
 
         tgt = ys_in_pad
-        tgt_mask = myutils.sequence_mask(ys_in_lens, device=tgt.device)[:, :, None]
+        tgt_mask = myutils.sequence_mask(ys_in_lens, maxlen=tgt.size(1), device=tgt.device)[:, :, None]
 
         memory = hs_pad
-        memory_mask = myutils.sequence_mask(hlens, device=memory.device)[:, None, :]
+        memory_mask = myutils.sequence_mask(hlens, maxlen=memory.size(1), device=memory.device)[:, None, :]
 
         tgt, tgt_mask, memory, memory_mask, _ = self.decoders[0](tgt, tgt_mask, memory, memory_mask)
         tgt, tgt_mask, memory, memory_mask, _ = self.decoders[1](tgt, tgt_mask, memory, memory_mask)
@@ -736,10 +736,10 @@ class ParaformerSANMDecoderExport(torch.nn.Module):
     ):
 
         tgt = ys_in_pad
-        tgt_mask = myutils.sequence_mask(ys_in_lens, device=tgt.device)[:, :, None]
+        tgt_mask = myutils.sequence_mask(ys_in_lens, maxlen=tgt.size(1), device=tgt.device)[:, :, None]
 
         memory = hs_pad
-        memory_mask = myutils.sequence_mask(hlens, device=memory.device)[:, None, :]
+        memory_mask = myutils.sequence_mask(hlens, maxlen=memory.size(1), device=memory.device)[:, None, :]
         _, memory_mask = self.prepare_mask(memory_mask)
 
         tgt, tgt_mask, memory, memory_mask, _ = self.model.decoders[0](tgt, tgt_mask, memory, memory_mask)
@@ -755,10 +755,10 @@ class ParaformerSANMDecoderExport(torch.nn.Module):
     ):
 
         tgt = ys_in_pad
-        tgt_mask = myutils.sequence_mask(ys_in_lens, device=tgt.device)[:, :, None]
+        tgt_mask = myutils.sequence_mask(ys_in_lens, maxlen=tgt.size(1), device=tgt.device)[:, :, None]
 
         memory = hs_pad
-        memory_mask = myutils.sequence_mask(hlens, device=memory.device)[:, None, :]
+        memory_mask = myutils.sequence_mask(hlens, maxlen=memory.size(1), device=memory.device)[:, None, :]
         _, memory_mask = self.prepare_mask(memory_mask)
 
         tgt, tgt_mask, memory, memory_mask, _ = self.model.decoders[0](tgt, tgt_mask, memory, memory_mask)
@@ -1057,7 +1057,7 @@ class ParaformerSANDecoder(BaseTransformerDecoder):
             olens: (batch, )
         """
         tgt = ys_in_pad
-        tgt_mask = (~make_pad_mask(ys_in_lens)[:, None, :]).to(tgt.device)
+        tgt_mask = (~make_pad_mask(ys_in_lens, maxlen=tgt.size(1))[:, None, :]).to(tgt.device)
 
         memory = hs_pad
         memory_mask = (~make_pad_mask(hlens, maxlen=memory.size(1)))[:, None, :].to(
@@ -3,9 +3,14 @@
 # Copyright FunASR (https://github.com/alibaba-damo-academy/FunASR). All Rights Reserved.
 #  MIT License  (https://opensource.org/licenses/MIT)
 
+import os
 import time
 import torch
+import codecs
+import hashlib
 import logging
+import tempfile
+import requests
 from torch.cuda.amp import autocast
 from typing import Union, Dict, List, Tuple, Optional
 
@@ -15,6 +20,7 @@ from funasr.utils import postprocess_utils
 from funasr.metrics.compute_acc import th_accuracy
 from funasr.train_utils.device_funcs import to_device
 from funasr.utils.datadir_writer import DatadirWriter
+from funasr.utils.hotword_utils import HotwordCache, load_seg_dict, seg_tokenize
 from funasr.models.paraformer.search import Hypothesis
 from funasr.models.paraformer.cif_predictor import mae_loss
 from funasr.train_utils.device_funcs import force_gatherable
@@ -165,6 +171,8 @@ class Paraformer(torch.nn.Module):
         self.length_normalized_loss = length_normalized_loss
         self.beam_search = None
         self.error_calculator = None
+        # tokenized hotword lists (and bias encoder outputs of the contextual models), keyed by content
+        self.hotword_cache = HotwordCache(kwargs.get("hotword_cache_size", 16))
     
     def forward(
         self,
@@ -387,9 +395,10 @@ class Paraformer(torch.nn.Module):
     def init_beam_search(self,
                          **kwargs,
                          ):
-        from funasr.models.paraformer.search import BeamSearchPara
+        from funasr.models.paraformer.search import BeamSearchPara, BatchBeamSearchPara
         from funasr.models.transformer.scorers.ctc import CTCPrefixScorer
         from funasr.models.transformer.scorers.length_bonus import LengthBonus
+        from funasr.models.transformer.scorers.scorer_interface import BatchScorerInterface
     
         # 1. Build ASR model
         scorers = {}
@@ -406,18 +415,33 @@ class Paraformer(torch.nn.Module):
 
         
         # 3. Build ngram model
-        # ngram is not supported now
         ngram = None
+        if kwargs.get("ngram_file", None) is not None and kwargs.get("ngram_weight", 0.0) > 0:
+            from funasr.models.transformer.scorers.ngram import NgramScorer
+            ngram = NgramScorer(kwargs["ngram_file"], token_list, sos=self.sos, eos=self.eos)
         scorers["ngram"] = ngram
         
+        # 4. Build context graph of the hotwords, set by `update_context_graph`
+        context = None
+        if kwargs.get("context_weight", 0.0) > 0:
+            from funasr.models.transformer.scorers.context_graph import ContextGraph
+            context = ContextGraph(len(token_list), eos=self.eos, context_score=kwargs.get("context_score", 1.0))
+        scorers["context"] = context
+        
         weights = dict(
-            decoder=1.0 - kwargs.get("decoding_ctc_weight"),
+            decoder=1.0 - kwargs.get("decoding_ctc_weight", 0.0),
             ctc=kwargs.get("decoding_ctc_weight", 0.0),
             lm=kwargs.get("lm_weight", 0.0),
             ngram=kwargs.get("ngram_weight", 0.0),
+            context=kwargs.get("context_weight", 0.0),
             length_bonus=kwargs.get("penalty", 0.0),
         )
-        beam_search = BeamSearchPara(
+        # vectorized over the utterances and hypotheses if all the scorers score batches
+        batch_beam_search = kwargs.get("batch_beam_search", True) and all(
+            isinstance(v, BatchScorerInterface) for k, v in scorers.items() if v is not None and weights.get(k, 0) != 0
+        )
+        beam_search_class = BatchBeamSearchPara if batch_beam_search else BeamSearchPara
+        beam_search = beam_search_class(
             beam_size=kwargs.get("beam_size", 2),
             weights=weights,
             scorers=scorers,
@@ -444,10 +468,14 @@ class Paraformer(torch.nn.Module):
         # init beamsearch
         is_use_ctc = kwargs.get("decoding_ctc_weight", 0.0) > 0.00001 and self.ctc != None
         is_use_lm = kwargs.get("lm_weight", 0.0) > 0.00001 and kwargs.get("lm_file", None) is not None
-        if self.beam_search is None and (is_use_lm or is_use_ctc):
+        is_use_ngram = kwargs.get("ngram_weight", 0.0) > 0.00001 and kwargs.get("ngram_file", None) is not None
+        is_use_context = kwargs.get("context_weight", 0.0) > 0.00001 and kwargs.get("hotword", None) is not None
+        if self.beam_search is None and (is_use_lm or is_use_ctc or is_use_ngram or is_use_context):
             logging.info("enable beam_search")
             self.init_beam_search(**kwargs)
             self.nbest = kwargs.get("nbest", 1)
+        if is_use_context:
+            self.update_context_graph(self.generate_hotwords_list(kwargs.get("hotword"), tokenizer=tokenizer, frontend=frontend))
         
         meta_data = {}
         if isinstance(data_in, torch.Tensor) and kwargs.get("data_type", "sound") == "fbank": # fbank
@@ -496,10 +524,17 @@ class Paraformer(torch.nn.Module):
             key = key[0]
         if len(key) < b:
             key = key*b
+        if hasattr(self.beam_search, "batch_search"):
+            nbest_hyps_list = self.beam_search(
+                x=encoder_out, am_scores=decoder_out, x_lens=encoder_out_lens, am_lens=pre_token_length,
+                maxlenratio=kwargs.get("maxlenratio", 0.0), minlenratio=kwargs.get("minlenratio", 0.0)
+            )
         for i in range(b):
             x = encoder_out[i, :encoder_out_lens[i], :]
             am_scores = decoder_out[i, :pre_token_length[i], :]
-            if self.beam_search is not None:
+            if hasattr(self.beam_search, "batch_search"):
+                nbest_hyps = nbest_hyps_list[i][: self.nbest]
+            elif self.beam_search is not None:
                 nbest_hyps = self.beam_search(
                     x=x, am_scores=am_scores, maxlenratio=kwargs.get("maxlenratio", 0.0), minlenratio=kwargs.get("minlenratio", 0.0)
                 )
@@ -550,6 +585,69 @@ class Paraformer(torch.nn.Module):
                 
         return results, meta_data
 
+    def update_context_graph(self, hotword_list):
+        """Set the hotwords (from `generate_hotwords_list`) biased by the context scorer of the beam search"""
+        if self.beam_search is None or "context" not in self.beam_search.full_scorers:
+            return
+        # the last entry is the <s> placeholder of the bias encoders
+        self.beam_search.full_scorers["context"].build([] if hotword_list is None else hotword_list[:-1])
+
+    def generate_hotwords_list(self, hotword_list_or_file, tokenizer=None, frontend=None):
+        seg_dict = None
+        if frontend.cmvn_file is not None:
+            model_dir = os.path.dirname(frontend.cmvn_file)
+            seg_dict_file = os.path.join(model_dir, 'seg_dict')
+            if os.path.exists(seg_dict_file):
+                seg_dict = load_seg_dict(seg_dict_file)
+            else:
+                seg_dict = None
+        # for None
+        if hotword_list_or_file is None:
+            return None
+        # for local txt inputs
+        elif os.path.exists(hotword_list_or_file) and hotword_list_or_file.endswith('.txt'):
+            logging.info("Attempting to parse hotwords from local txt...")
+            with codecs.open(hotword_list_or_file, 'r') as fin:
+                hotword_str_list = [line.strip() for line in fin.readlines()]
+        # for url, download and generate txt
+        elif hotword_list_or_file.startswith('http'):
+            logging.info("Attempting to parse hotwords from url...")
+            work_dir = tempfile.TemporaryDirectory().name
+            if not os.path.exists(work_dir):
+                os.makedirs(work_dir)
+            text_file_path = os.path.join(work_dir, os.path.basename(hotword_list_or_file))
+            local_file = requests.get(hotword_list_or_file)
+            open(text_file_path, "wb").write(local_file.content)
+            hotword_list_or_file = text_file_path
+            with codecs.open(hotword_list_or_file, 'r') as fin:
+                hotword_str_list = [line.strip() for line in fin.readlines()]
+        # for text str input
+        elif not hotword_list_or_file.endswith('.txt'):
+            logging.info("Attempting to parse hotwords as str...")
+            hotword_str_list = hotword_list_or_file.strip().split()
+        else:
+            return None
+
+        # tokenized once per content, a list of 10k+ hotwords is costly to segment
+        key = ("hotword", hashlib.md5("\n".join(hotword_str_list).encode("utf-8")).hexdigest())
+        hotword_list = self.hotword_cache.get(key)
+        if hotword_list is None:
+            hotword_list = []
+            for hw in hotword_str_list:
+                hw_list = hw.split()
+                if seg_dict is not None:
+                    hw_list = seg_tokenize(hw_list, seg_dict)
+                hotword_list.append(tokenizer.tokens2ids(hw_list))
+            hotword_list.append([self.sos])
+            self.hotword_cache.put(key, hotword_list)
+        hotword_str_list = hotword_str_list + ['<s>']
+        if hotword_list_or_file.endswith('.txt'):
+            logging.info("Initialized hotword list from file: {}, hotword list: {}."
+                         .format(hotword_list_or_file, hotword_str_list))
+        else:
+            logging.info("Hotword list: {}.".format(hotword_str_list))
+        return hotword_list
+
     def export(self, **kwargs):
         from .export_meta import export_rebuild_model
         if 'max_seq_len' not in kwargs:
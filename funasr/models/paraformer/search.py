@@ -10,6 +10,7 @@ from typing import Any, Dict, List, NamedTuple, Tuple, Union
 
 from funasr.metrics.common import end_detect
 from funasr.models.transformer.scorers.scorer_interface import PartialScorerInterface, ScorerInterface
+from funasr.models.transformer.search import BatchBeamSearch
 
 
 class Hypothesis(NamedTuple):
@@ -450,3 +451,29 @@ class BeamSearchPara(torch.nn.Module):
             else:
                 remained_hyps.append(hyp)
         return remained_hyps
+
+
+class BatchBeamSearchPara(BatchBeamSearch):
+    """BeamSearchPara vectorized over the utterances of a batch and their hypotheses:
+    the Paraformer decoder output of each position is added to the scores of the scorers (CTC, LM).
+    """
+
+    def forward(
+        self, x: torch.Tensor, am_scores: torch.Tensor, x_lens: torch.Tensor = None, am_lens: torch.Tensor = None,
+        maxlenratio: float = 0.0, minlenratio: float = 0.0
+    ) -> Union[List[Hypothesis], List[List[Hypothesis]]]:
+        """Perform beam search.
+
+        Args:
+            x (torch.Tensor): Encoded speech feature (B, T, D), or (T, D) for one utterance
+            am_scores (torch.Tensor): Decoder output (B, L, n_vocab), or (L, n_vocab)
+            x_lens (torch.Tensor): Encoded speech lengths (B,)
+            am_lens (torch.Tensor): Number of predicted tokens (B,), the max output lengths
+
+        Returns:
+            N-best decoding results of each utterance, or of the utterance if x is (T, D)
+
+        """
+        return super().forward(x, x_lens=x_lens, maxlenratio=maxlenratio, minlenratio=minlenratio,
+                               am_scores=am_scores, am_lens=am_lens)
+
@@ -22,7 +22,7 @@ from funasr.train_utils.device_funcs import force_gatherable
 from funasr.losses.label_smoothing_loss import LabelSmoothingLoss
 from funasr.models.transformer.utils.add_sos_eos import add_sos_eos
 from funasr.models.transformer.utils.nets_utils import make_pad_mask, pad_list
-from funasr.utils.load_utils import load_audio_text_image_video, extract_fbank
+from funasr.utils.load_utils import load_audio_text_image_video, extract_fbank, load_audio_to_buffer, PcmBuffer
 
 
 if LooseVersion(torch.__version__) >= LooseVersion("1.6.0"):
@@ -398,7 +398,10 @@ class ParaformerStreaming(Paraformer):
                     "chunk_size": chunk_size}
         cache["decoder"] = cache_decoder
         cache["frontend"] = {}
-        cache["prev_samples"] = torch.empty(0)
+        if isinstance(cache.get("prev_samples", None), PcmBuffer):
+            cache["prev_samples"].reset()
+        else:
+            cache["prev_samples"] = PcmBuffer()
         
         return cache
     
@@ -510,20 +513,19 @@ class ParaformerStreaming(Paraformer):
         
         time1 = time.perf_counter()
         cfg = {"is_final": kwargs.get("is_final", False)}
-        audio_sample_list = load_audio_text_image_video(data_in,
-                                                        fs=frontend.fs,
-                                                        audio_fs=kwargs.get("fs", 16000),
-                                                        data_type=kwargs.get("data_type", "sound"),
-                                                        tokenizer=tokenizer,
-                                                        cache=cfg,
-                                                        )
+        # the samples left by the previous call and this chunk, a view of the stream buffer
+        audio_sample = load_audio_to_buffer(data_in,
+                                            cache["prev_samples"],
+                                            fs=frontend.fs,
+                                            audio_fs=kwargs.get("fs", 16000),
+                                            data_type=kwargs.get("data_type", "sound"),
+                                            tokenizer=tokenizer,
+                                            cache=cfg,
+                                            )
         _is_final = cfg["is_final"] # if data_in is a file or url, set is_final=True
         
         time2 = time.perf_counter()
         meta_data["load_data"] = f"{time2 - time1:0.3f}"
-        assert len(audio_sample_list) == 1, "batch_size must be set 1"
-        
-        audio_sample = torch.cat((cache["prev_samples"], audio_sample_list[0]))
         
         n = int(len(audio_sample) // chunk_stride_samples + int(_is_final))
         m = int(len(audio_sample) % chunk_stride_samples * (1-int(_is_final)))
@@ -552,7 +554,8 @@ class ParaformerStreaming(Paraformer):
         result = [result_i]
         
         
-        cache["prev_samples"] = audio_sample[:-m]
+        # keep the m samples of the incomplete chunk
+        cache["prev_samples"].consume(len(audio_sample) - m)
         if _is_final:
             self.init_cache(cache, **kwargs)
         
@@ -361,10 +361,10 @@ class FsmnDecoderSCAMAOpt(BaseTransformerDecoder):
             olens: (batch, )
         """
         tgt = ys_in_pad
-        tgt_mask = myutils.sequence_mask(ys_in_lens, device=tgt.device)[:, :, None]
+        tgt_mask = myutils.sequence_mask(ys_in_lens, maxlen=tgt.size(1), device=tgt.device)[:, :, None]
 
         memory = hs_pad
-        memory_mask = myutils.sequence_mask(hlens, device=memory.device)[:, None, :]
+        memory_mask = myutils.sequence_mask(hlens, maxlen=memory.size(1), device=memory.device)[:, None, :]
         if chunk_mask is not None:
             memory_mask = memory_mask * chunk_mask
             if tgt_mask.size(1) != memory_mask.size(1):
@@ -24,7 +24,7 @@ from funasr.train_utils.device_funcs import force_gatherable
 from funasr.losses.label_smoothing_loss import LabelSmoothingLoss
 from funasr.models.transformer.utils.add_sos_eos import add_sos_eos
 from funasr.models.transformer.utils.nets_utils import make_pad_mask, pad_list
-from funasr.utils.load_utils import load_audio_text_image_video, extract_fbank
+from funasr.utils.load_utils import load_audio_text_image_video, extract_fbank, load_audio_to_buffer, PcmBuffer
 from funasr.models.scama.utils import sequence_mask
 
 if LooseVersion(torch.__version__) >= LooseVersion("1.6.0"):
@@ -582,7 +582,10 @@ class SCAMA(nn.Module):
         cache["frontend"] = {}
 
 
-        cache["prev_samples"] = torch.empty(0).to(device=device)
+        if isinstance(cache.get("prev_samples", None), PcmBuffer):
+            cache["prev_samples"].reset()
+        else:
+            cache["prev_samples"] = PcmBuffer()
 
         return cache
 
@@ -616,20 +619,19 @@ class SCAMA(nn.Module):
     
         time1 = time.perf_counter()
         cfg = {"is_final": kwargs.get("is_final", False)}
-        audio_sample_list = load_audio_text_image_video(data_in,
-                                                        fs=frontend.fs,
-                                                        audio_fs=kwargs.get("fs", 16000),
-                                                        data_type=kwargs.get("data_type", "sound"),
-                                                        tokenizer=tokenizer,
-                                                        cache=cfg,
-                                                        )
+        # the samples left by the previous call and this chunk, a view of the stream buffer
+        audio_sample = load_audio_to_buffer(data_in,
+                                            cache["prev_samples"],
+                                            fs=frontend.fs,
+                                            audio_fs=kwargs.get("fs", 16000),
+                                            data_type=kwargs.get("data_type", "sound"),
+                                            tokenizer=tokenizer,
+                                            cache=cfg,
+                                            )
         _is_final = cfg["is_final"]  # if data_in is a file or url, set is_final=True
     
         time2 = time.perf_counter()
         meta_data["load_data"] = f"{time2 - time1:0.3f}"
-        assert len(audio_sample_list) == 1, "batch_size must be set 1"
-    
-        audio_sample = torch.cat((cache["prev_samples"], audio_sample_list[0]))
     
         n = int(len(audio_sample) // chunk_stride_samples + int(_is_final))
         m = int(len(audio_sample) % chunk_stride_samples * (1 - int(_is_final)))
@@ -655,7 +657,8 @@ class SCAMA(nn.Module):
         result_i = {"key": key[0], "text": text_postprocessed}
         result = [result_i]
     
-        cache["prev_samples"] = audio_sample[:-m]
+        # keep the m samples of the incomplete chunk
+        cache["prev_samples"].consume(len(audio_sample) - m)
         if _is_final:
             self.init_cache(cache, **kwargs)
     
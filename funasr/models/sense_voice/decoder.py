@@ -48,12 +48,14 @@ def sense_voice_decode_forward(
 	x = tgt.to(memory.dtype)
 	
 	if use_padmask and hlens is not None:
-		memory_mask = (~make_pad_mask(hlens)[:, None, :]).to(memory.device)
+		memory_mask = (~make_pad_mask(hlens, maxlen=memory.size(1))[:, None, :]).to(memory.device)
 	else:
 		memory_mask = None
 	
+	# with kv_cache (PyTorchInference), x is the last token: the self-attention keys and values of the previous
+	# ones are prepended by the hooks, the cross-attention ones are computed at the first step and reused
 	for layer, block in enumerate(self.blocks):
-		x = block(x, memory, mask=self.mask, memory_mask=memory_mask, is_pad_mask=False, is_pad_memory_mask=True)
+		x = block(x, memory, mask=self.mask, memory_mask=memory_mask, kv_cache=kv_cache, is_pad_mask=False, is_pad_memory_mask=True)
 
 
 	x = self.ln(x)
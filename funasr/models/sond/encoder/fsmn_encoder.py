@@ -186,7 +186,7 @@ class FsmnEncoder(AbsEncoder):
             inputs = self.position_encoder(inputs)
 
         inputs = self.dropout(inputs)
-        masks = (~make_pad_mask(ilens)[:, None, :]).to(xs_pad.device)
+        masks = (~make_pad_mask(ilens, maxlen=xs_pad.size(1))[:, None, :]).to(xs_pad.device)
         inputs = self.fsmn_layers(inputs, masks)[0]
         inputs = self.dnn_layers(inputs)[0]
 
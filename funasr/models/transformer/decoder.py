@@ -2,6 +2,7 @@
 #  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
 
 """Decoder definition."""
+import math
 from typing import Any
 from typing import List
 from typing import Sequence
@@ -149,6 +150,69 @@ class DecoderLayer(nn.Module):
 
         return x, tgt_mask, memory, memory_mask
 
+    def forward_kv(self, tgt, memory, memory_mask=None, cache=None):
+        """Compute decoded features of the last position, with the keys and values of the previous ones cached.
+
+        Args:
+            tgt (torch.Tensor): Input tensor of the last position (#batch, 1, size).
+            memory (torch.Tensor): Encoded memory, float32 (#batch, maxlen_in, size).
+            memory_mask (torch.Tensor): Encoded memory mask (#batch, 1, maxlen_in).
+            cache (dict): "key" and "value" of the self-attention over the previous positions
+                (#batch, n_head, maxlen_out - 1, d_k), and "src_key" and "src_value" of the
+                source attention over the memory (#batch, n_head, maxlen_in, d_k), computed at
+                the first position if absent.
+
+        Returns:
+            torch.Tensor: Output tensor (#batch, 1, size).
+            dict: Cache with the keys and values of the last position appended.
+
+        """
+        n_batch = tgt.size(0)
+        residual = tgt
+        if self.normalize_before:
+            tgt = self.norm1(tgt)
+
+        q, k, v = self.self_attn.forward_qkv(tgt, tgt, tgt)
+        if cache is not None and "key" in cache:
+            k = torch.cat([cache["key"], k], dim=2)
+            v = torch.cat([cache["value"], v], dim=2)
+        scores = torch.matmul(q, k.transpose(-2, -1)) / math.sqrt(self.self_attn.d_k)
+        att = self.self_attn.forward_attention(v, scores, None)
+        if self.concat_after:
+            x = residual + self.concat_linear1(torch.cat((tgt, att), dim=-1))
+        else:
+            x = residual + self.dropout(att)
+        if not self.normalize_before:
+            x = self.norm1(x)
+
+        residual = x
+        if self.normalize_before:
+            x = self.norm2(x)
+        src_attn = self.src_attn
+        src_q = src_attn.linear_q(x).view(n_batch, -1, src_attn.h, src_attn.d_k).transpose(1, 2)
+        if cache is not None and "src_key" in cache:
+            src_k, src_v = cache["src_key"], cache["src_value"]
+        else:
+            src_k = src_attn.linear_k(memory).view(n_batch, -1, src_attn.h, src_attn.d_k).transpose(1, 2)
+            src_v = src_attn.linear_v(memory).view(n_batch, -1, src_attn.h, src_attn.d_k).transpose(1, 2)
+        scores = torch.matmul(src_q, src_k.transpose(-2, -1)) / math.sqrt(src_attn.d_k)
+        src = src_attn.forward_attention(src_v, scores, memory_mask)
+        if self.concat_after:
+            x = residual + self.concat_linear2(torch.cat((x, src), dim=-1))
+        else:
+            x = residual + self.dropout(src)
+        if not self.normalize_before:
+            x = self.norm2(x)
+
+        residual = x
+        if self.normalize_before:
+            x = self.norm3(x)
+        x = residual + self.dropout(self.feed_forward(x))
+        if not self.normalize_before:
+            x = self.norm3(x)
+
+        return x, {"key": k, "value": v, "src_key": src_k, "src_value": src_v}
+
 
 class DecoderLayerExport(nn.Module):
     def __init__(self, model):
@@ -268,7 +332,7 @@ class BaseTransformerDecoder(nn.Module, BatchScorerInterface):
         """
         tgt = ys_in_pad
         # tgt_mask: (B, 1, L)
-        tgt_mask = (~make_pad_mask(ys_in_lens)[:, None, :]).to(tgt.device)
+        tgt_mask = (~make_pad_mask(ys_in_lens, maxlen=tgt.size(1))[:, None, :]).to(tgt.device)
         # m: (1, L, L)
         m = subsequent_mask(tgt_mask.size(-1), device=tgt_mask.device).unsqueeze(0)
         # tgt_mask: (B, L, L)
@@ -303,6 +367,7 @@ class BaseTransformerDecoder(nn.Module, BatchScorerInterface):
             tgt_mask: torch.Tensor,
             memory: torch.Tensor,
             cache: List[torch.Tensor] = None,
+            memory_mask: torch.Tensor = None,
     ) -> Tuple[torch.Tensor, List[torch.Tensor]]:
         """Forward one step.
 
@@ -313,6 +378,7 @@ class BaseTransformerDecoder(nn.Module, BatchScorerInterface):
                       dtype=torch.bool in PyTorch 1.2+ (include 1.2)
             memory: encoded memory, float32  (batch, maxlen_in, feat)
             cache: cached output list of (batch, max_time_out-1, size)
+            memory_mask: encoded memory mask (batch, 1, maxlen_in), for padded memory
         Returns:
             y, cache: NN output value and cache per `self.decoders`.
             y.shape` is (batch, maxlen_out, token)
@@ -323,7 +389,7 @@ class BaseTransformerDecoder(nn.Module, BatchScorerInterface):
         new_cache = []
         for c, decoder in zip(cache, self.decoders):
             x, tgt_mask, memory, memory_mask = decoder(
-                x, tgt_mask, memory, None, cache=c
+                x, tgt_mask, memory, memory_mask, cache=c
             )
             new_cache.append(x)
 
@@ -336,31 +402,97 @@ class BaseTransformerDecoder(nn.Module, BatchScorerInterface):
 
         return y, new_cache
 
+    def use_kv_cache(self) -> bool:
+        """Whether all the blocks are DecoderLayer with MultiHeadedAttention, so that `forward_one_step_kv` applies."""
+        return all(
+            isinstance(decoder, DecoderLayer)
+            and type(decoder.self_attn) is MultiHeadedAttention
+            and type(decoder.src_attn) is MultiHeadedAttention
+            for decoder in self.decoders
+        )
+
+    def forward_one_step_kv(
+            self,
+            tgt: torch.Tensor,
+            memory: torch.Tensor,
+            kv_cache: dict = None,
+            memory_mask: torch.Tensor = None,
+    ) -> Tuple[torch.Tensor, dict]:
+        """Forward one step, only the last token through the blocks.
+
+        Args:
+            tgt: input token ids, int64 (batch, maxlen_out)
+            memory: encoded memory, float32  (batch, maxlen_in, feat)
+            kv_cache: "layers", the key / value caches per `self.decoders` of the previous tokens
+                (see `DecoderLayer.forward_kv`), and "memory" the source keys and values were computed from.
+                They are computed again if `memory` is another tensor.
+            memory_mask: encoded memory mask (batch, 1, maxlen_in), for padded memory
+        Returns:
+            y, kv_cache: NN output value (batch, token) and the caches with the last token.
+        """
+        # the positional encoding of the last token
+        x = self.embed(tgt)[:, -1:]
+        if kv_cache is None:
+            layer_caches = [None] * len(self.decoders)
+        elif kv_cache["memory"] is None or not is_same_tensor(kv_cache["memory"], memory):
+            layer_caches = [{"key": c["key"], "value": c["value"]} for c in kv_cache["layers"]]
+        else:
+            layer_caches = kv_cache["layers"]
+        new_cache = []
+        for c, decoder in zip(layer_caches, self.decoders):
+            x, c = decoder.forward_kv(x, memory, memory_mask, cache=c)
+            new_cache.append(c)
+
+        if self.normalize_before:
+            y = self.after_norm(x[:, -1])
+        else:
+            y = x[:, -1]
+        if self.output_layer is not None:
+            y = torch.log_softmax(self.output_layer(y), dim=-1)
+
+        return y, {"memory": memory, "layers": new_cache}
+
     def score(self, ys, state, x):
         """Score."""
+        if self.use_kv_cache():
+            logp, state = self.forward_one_step_kv(ys.unsqueeze(0), x.unsqueeze(0), kv_cache=state)
+            return logp.squeeze(0), state
         ys_mask = subsequent_mask(len(ys), device=x.device).unsqueeze(0)
         logp, state = self.forward_one_step(
             ys.unsqueeze(0), ys_mask, x.unsqueeze(0), cache=state
         )
         return logp.squeeze(0), state
 
+    def select_state(self, state: Any, i: int, new_id: int = None) -> Any:
+        """Select state with relative ids in the main beam search."""
+        if isinstance(state, dict):
+            return self.batch_rearrange_state(state, torch.tensor([i]))
+        return super().select_state(state, i, new_id)
+
     def batch_score(
-            self, ys: torch.Tensor, states: List[Any], xs: torch.Tensor
-    ) -> Tuple[torch.Tensor, List[Any]]:
+            self, ys: torch.Tensor, states: Any, xs: torch.Tensor, xs_mask: torch.Tensor = None
+    ) -> Tuple[torch.Tensor, Any]:
         """Score new token batch.
 
         Args:
             ys (torch.Tensor): torch.int64 prefix tokens (n_batch, ylen).
-            states (List[Any]): Scorer states for prefix tokens.
+            states (Any): Scorer states for prefix tokens, the list of the states of the hypotheses, or with
+                the key / value cache, the batched cache of the previous `batch_score`.
             xs (torch.Tensor):
                 The encoder feature that generates ys (n_batch, xlen, n_feat).
+            xs_mask (torch.Tensor): mask of the padded encoder feature (n_batch, 1, xlen)
 
         Returns:
-            tuple[torch.Tensor, List[Any]]: Tuple of
+            tuple[torch.Tensor, Any]: Tuple of
                 batchfied scores for next token with shape of `(n_batch, n_vocab)`
-                and next state list for ys.
+                and next states for ys, selected by `batch_rearrange_state`.
 
         """
+        if self.use_kv_cache():
+            if isinstance(states, (list, tuple)):
+                states = None if states[0] is None else self.merge_kv_cache(states)
+            return self.forward_one_step_kv(ys, xs, kv_cache=states, memory_mask=xs_mask)
+
         # merge states
         n_batch = len(ys)
         n_layers = len(self.decoders)
@@ -375,12 +507,47 @@ class BaseTransformerDecoder(nn.Module, BatchScorerInterface):
 
         # batch decoding
         ys_mask = subsequent_mask(ys.size(-1), device=xs.device).unsqueeze(0)
-        logp, states = self.forward_one_step(ys, ys_mask, xs, cache=batch_state)
+        logp, states = self.forward_one_step(ys, ys_mask, xs, cache=batch_state, memory_mask=xs_mask)
 
         # transpose state of [layer, batch] into [batch, layer]
         state_list = [[states[i][b] for i in range(n_layers)] for b in range(n_batch)]
         return logp, state_list
 
+    def batch_rearrange_state(self, states: Any, ids: torch.Tensor) -> Any:
+        """Rearrange the states of `batch_score` to the kept hypotheses.
+
+        All the keys and values, of the self-attention and of the source attention, are those of the kept
+        hypotheses. The source ones are reused by the next step if it is given the same memory tensor with as
+        many rows, as in BatchBeamSearch where the kept hypotheses of an utterance share its memory rows.
+        """
+        if not isinstance(states, dict):
+            return super().batch_rearrange_state(states, ids)
+        ids = ids.to(states["layers"][0]["key"].device)
+        return {
+            "memory": states["memory"],
+            "layers": [{k: v.index_select(0, ids) for k, v in c.items()} for c in states["layers"]],
+        }
+
+    @staticmethod
+    def merge_kv_cache(kv_caches: List[dict]) -> dict:
+        """Batch the self-attention key / value caches of single hypotheses (of batch 1, as given by `score`).
+
+        The memory of the batch is another tensor, so the source keys and values are computed again from it.
+        """
+        return {
+            "memory": None,
+            "layers": [
+                {k: torch.cat([c["layers"][i][k] for c in kv_caches]) for k in ("key", "value")}
+                for i in range(len(kv_caches[0]["layers"]))
+            ],
+        }
+
+
+def is_same_tensor(a: torch.Tensor, b: torch.Tensor) -> bool:
+    """Whether a and b are views of the same data, e.g. x and x.unsqueeze(0)."""
+    return a.data_ptr() == b.data_ptr() and a.numel() == b.numel() and a.dtype == b.dtype
+
+
 @tables.register("decoder_classes", "TransformerDecoder")
 class TransformerDecoder(BaseTransformerDecoder):
     def __init__(
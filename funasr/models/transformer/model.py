@@ -319,9 +319,10 @@ class Transformer(nn.Module):
     def init_beam_search(self,
                          **kwargs,
                          ):
-        from funasr.models.transformer.search import BeamSearch
+        from funasr.models.transformer.search import BeamSearch, BatchBeamSearch
         from funasr.models.transformer.scorers.ctc import CTCPrefixScorer
         from funasr.models.transformer.scorers.length_bonus import LengthBonus
+        from funasr.models.transformer.scorers.scorer_interface import BatchScorerInterface
     
         # 1. Build ASR model
         scorers = {}
@@ -339,8 +340,10 @@ class Transformer(nn.Module):
 
         
         # 3. Build ngram model
-        # ngram is not supported now
         ngram = None
+        if kwargs.get("ngram_file", None) is not None and kwargs.get("ngram_weight", 0.0) > 0:
+            from funasr.models.transformer.scorers.ngram import NgramScorer
+            ngram = NgramScorer(kwargs["ngram_file"], token_list, sos=self.sos, eos=self.eos)
         scorers["ngram"] = ngram
         
         weights = dict(
@@ -350,7 +353,12 @@ class Transformer(nn.Module):
             ngram=kwargs.get("ngram_weight", 0.0),
             length_bonus=kwargs.get("penalty", 0.0),
         )
-        beam_search = BeamSearch(
+        # vectorized over the utterances and hypotheses if all the scorers score batches
+        batch_beam_search = kwargs.get("batch_beam_search", True) and all(
+            isinstance(v, BatchScorerInterface) for k, v in scorers.items() if v is not None and weights.get(k, 0) != 0
+        )
+        beam_search_class = BatchBeamSearch if batch_beam_search else BeamSearch
+        beam_search = beam_search_class(
             beam_size=kwargs.get("beam_size", 10),
             weights=weights,
             scorers=scorers,
@@ -372,14 +380,14 @@ class Transformer(nn.Module):
              **kwargs,
              ):
         
-        if kwargs.get("batch_size", 1) > 1:
-            raise NotImplementedError("batch decoding is not implemented")
-        
         # init beamsearch
         if self.beam_search is None:
             logging.info("enable beam_search")
             self.init_beam_search(**kwargs)
             self.nbest = kwargs.get("nbest", 1)
+        is_batch_beam_search = hasattr(self.beam_search, "batch_search")
+        if kwargs.get("batch_size", 1) > 1 and not is_batch_beam_search:
+            raise NotImplementedError("batch decoding is not implemented")
 
         meta_data = {}
         if isinstance(data_in, torch.Tensor) and kwargs.get("data_type", "sound") == "fbank":  # fbank
@@ -410,17 +418,21 @@ class Transformer(nn.Module):
             encoder_out = encoder_out[0]
         
         # c. Passed the encoder result and the beam search
-        nbest_hyps = self.beam_search(
-            x=encoder_out[0], maxlenratio=kwargs.get("maxlenratio", 0.0), minlenratio=kwargs.get("minlenratio", 0.0)
-        )
-        
-        nbest_hyps = nbest_hyps[: self.nbest]
+        if is_batch_beam_search:
+            nbest_hyps_list = self.beam_search(
+                x=encoder_out, x_lens=encoder_out_lens, maxlenratio=kwargs.get("maxlenratio", 0.0),
+                minlenratio=kwargs.get("minlenratio", 0.0)
+            )
+        else:
+            nbest_hyps_list = [self.beam_search(
+                x=encoder_out[0], maxlenratio=kwargs.get("maxlenratio", 0.0), minlenratio=kwargs.get("minlenratio", 0.0)
+            )]
 
 
         results = []
         b, n, d = encoder_out.size()
         for i in range(b):
-
+            nbest_hyps = nbest_hyps_list[i][: self.nbest]
             for nbest_idx, hyp in enumerate(nbest_hyps):
                 ibest_writer = None
                 if kwargs.get("output_dir") is not None:
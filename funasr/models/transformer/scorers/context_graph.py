@@ -0,0 +1,204 @@
+"""Context graph scorer for hotword biasing in beam search."""
+from typing import Any
+from typing import List
+from typing import Tuple
+
+import numpy as np
+import torch
+
+from funasr.models.transformer.scorers.scorer_interface import BatchScorerInterface
+from funasr.utils.hotword_utils import HotwordCache, hotword_key
+
+
+class ContextGraph(BatchScorerInterface):
+    """Bonus of context_score per token of the hotwords matched by the hypotheses, with an Aho-Corasick automaton.
+
+    The hotwords (token id lists, set by `build`) are the paths of a trie stored as arrays, its nodes sorted by
+    depth, then by parent and token, so that a child is found with a binary search over `keys` (parent * n_vocab
+    + token of the nodes 1..), and `fail` is the node of the longest proper suffix in the trie. The state of a
+    hypothesis is its node: the bonus of a partial match is given token by token and taken back (`held`) when the
+    match fails, except the part secured by the longest complete hotword in its path (`base`), e.g. one ending
+    there through an output link, so that a hotword containing another one still goes on to its end. The state
+    goes back to the root at the end of a hotword without a longer one. A batch of states is scored over the
+    whole vocabulary at once, through the children of the nodes of their fail chains. The graphs are cached by
+    content, so a list of 10k+ hotwords is built once.
+    """
+
+    def __init__(self, n_vocab: int, eos: int, context_score: float = 1.0, cache_size: int = 4):
+        self.n_vocab = n_vocab
+        self.eos = eos
+        self.context_score = context_score
+        self.cache = HotwordCache(cache_size)
+        self.build([])
+
+    def build(self, hotword_list: List[List[int]]):
+        key = hotword_key(hotword_list)
+        graph = self.cache.get(key)
+        if graph is None:
+            graph = self.cache.put(key, {"arrays": self.build_arrays(key), "tensors": {}})
+        self.arrays, self.tensors = graph["arrays"], graph["tensors"]
+
+    def build_arrays(self, hotwords) -> dict:
+        hotwords = sorted({hw for hw in hotwords if len(hw) > 0})
+        node_ids = {(): 0}
+        parent, token, depth = [-1], [-1], [0]
+        for d in range(1, max((len(hw) for hw in hotwords), default=0) + 1):
+            prefixes = sorted({hw[:d] for hw in hotwords if len(hw) >= d}, key=lambda p: (node_ids[p[:-1]], p[-1]))
+            for prefix in prefixes:
+                node_ids[prefix] = len(parent)
+                parent.append(node_ids[prefix[:-1]])
+                token.append(prefix[-1])
+                depth.append(d)
+        parent, token, depth = np.array(parent), np.array(token), np.array(depth)
+        is_end = np.zeros(len(parent), dtype=bool)
+        is_end[[node_ids[hw] for hw in hotwords]] = True
+        keys = parent[1:].astype(np.int64) * self.n_vocab + token[1:]
+        node_score = depth * self.context_score
+
+        def child(nodes, tokens):
+            if len(keys) == 0:
+                return np.zeros_like(nodes)
+            k = nodes.astype(np.int64) * self.n_vocab + tokens
+            idx = np.minimum(np.searchsorted(keys, k), len(keys) - 1)
+            return np.where(keys[idx] == k, idx + 1, 0)
+
+        # fail links and output (the closest end node of the fail chain), by depth as in Aho-Corasick
+        fail = np.zeros(len(parent), dtype=np.int64)
+        output = np.full(len(parent), -1, dtype=np.int64)
+        # score of the longest complete hotword in the path of the node, either a prefix or through an output
+        base = np.zeros(len(parent))
+        for d in range(1, depth.max() + 1):
+            nodes = np.flatnonzero(depth == d)
+            if d > 1:
+                state = fail[parent[nodes]]
+                found = np.zeros(len(nodes), dtype=bool)
+                for _ in range(d):
+                    next_nodes = child(state, token[nodes])
+                    new = ~found & (next_nodes > 0)
+                    fail[nodes[new]] = next_nodes[new]
+                    found |= new
+                    state = fail[state]
+            output[nodes] = np.where(is_end[fail[nodes]], fail[nodes], output[fail[nodes]])
+            base[nodes] = np.maximum(base[parent[nodes]], np.where(
+                is_end[nodes], node_score[nodes], np.where(output[nodes] >= 0, node_score[output[nodes]], 0)))
+        held = node_score - base
+
+        # credited on arriving at a node from its parent, from which the held score of the previous state is
+        # subtracted: the score of the path beyond the one secured by the parent
+        target = node_score - base[np.maximum(parent, 0)]
+        target[0] = 0
+        # a complete hotword without a longer one goes back to the root, where the next match starts
+        has_children = np.zeros(len(parent), dtype=bool)
+        has_children[parent[1:]] = True
+        next_state = np.where(is_end & ~has_children, 0, np.arange(len(parent)))
+        root_scores = np.zeros(self.n_vocab, dtype=np.float32)
+        root_scores[token[depth == 1]] = target[depth == 1]
+        return {
+            "keys": keys,
+            "token": token.astype(np.int64),
+            "fail": fail,
+            "held": held.astype(np.float32),
+            "target": target.astype(np.float32),
+            "next_state": next_state.astype(np.int64),
+            # children of node i: nodes children[i] + 1 .. children[i + 1]
+            "children": np.searchsorted(keys, np.arange(len(parent) + 1, dtype=np.int64) * self.n_vocab),
+            # scores of the tokens from the root, the ones of every state without a longer match
+            "root_scores": root_scores,
+            "max_depth": int(depth.max()),
+        }
+
+    def get_tensors(self, device: torch.device) -> dict:
+        if device not in self.tensors:
+            self.tensors[device] = {
+                k: torch.from_numpy(v).to(device) if isinstance(v, np.ndarray) else v for k, v in self.arrays.items()
+            }
+        return self.tensors[device]
+
+    def advance(self, states: torch.Tensor, tokens: torch.Tensor) -> torch.Tensor:
+        t = self.get_tensors(states.device)
+        if len(t["keys"]) == 0:
+            return torch.zeros_like(states)
+        new_states = torch.zeros_like(states)
+        found = torch.zeros_like(states, dtype=torch.bool)
+        for _ in range(t["max_depth"] + 1):
+            keys = states * self.n_vocab + tokens
+            idx = torch.searchsorted(t["keys"], keys).clamp(max=len(t["keys"]) - 1)
+            new = ~found & (t["keys"][idx] == keys)
+            new_states = torch.where(new, idx + 1, new_states)
+            found |= new
+            states = t["fail"][states]
+        return t["next_state"][new_states]
+
+    def full_scores(self, states: torch.Tensor) -> torch.Tensor:
+        """Bonus of every token after the states (n_batch,): (n_batch, n_vocab)"""
+        t = self.get_tensors(states.device)
+        n_batch = len(states)
+        held = t["held"][states]
+        scores = t["root_scores"].unsqueeze(0) - held.unsqueeze(1)
+        chain = [states]
+        while bool((chain[-1] > 0).any()):
+            chain.append(t["fail"][chain[-1]])
+        rows = torch.arange(n_batch, device=states.device)
+        # from the shortest suffixes to the states, the deepest match of a token is written last
+        for nodes in reversed(chain):
+            starts = t["children"][nodes]
+            counts = torch.where(nodes > 0, t["children"][nodes + 1] - starts, torch.zeros_like(starts))
+            child_rows = torch.repeat_interleave(rows, counts)
+            if len(child_rows) == 0:
+                continue
+            offsets = torch.cumsum(counts, 0) - counts
+            children = starts[child_rows] + torch.arange(len(child_rows), device=states.device) - offsets[child_rows] + 1
+            scores[child_rows, t["token"][children]] = t["target"][children] - held[child_rows]
+        scores[:, self.eos] = -held
+        return scores
+
+    def init_state(self, x: torch.Tensor) -> Any:
+        return None
+
+    def score(self, y: torch.Tensor, state: Any, x: torch.Tensor) -> Tuple[torch.Tensor, Any]:
+        """Score new token.
+
+        Args:
+            y (torch.Tensor): 1D torch.int64 prefix tokens.
+            state: Scorer state for prefix tokens, the node of y[:-1] (None for the initial sos)
+            x (torch.Tensor): 2D encoder feature that generates ys.
+
+        Returns:
+            tuple[torch.Tensor, Any]: Tuple of
+                torch.float32 scores for next token (n_vocab)
+                and the node of y
+
+        """
+        scores, states = self.batch_score(y.unsqueeze(0), [state], x.unsqueeze(0))
+        return scores[0], states[0]
+
+    def batch_score(
+        self, ys: torch.Tensor, states: Any, xs: torch.Tensor
+    ) -> Tuple[torch.Tensor, torch.Tensor]:
+        """Score new token batch.
+
+        Args:
+            ys (torch.Tensor): torch.int64 prefix tokens (n_batch, ylen).
+            states: Scorer states for prefix tokens, the nodes of ys[:, :-1], as a list
+                (None for the initial sos) or the tensor returned by the previous `batch_score`.
+            xs (torch.Tensor):
+                The encoder feature that generates ys (n_batch, xlen, n_feat).
+
+        Returns:
+            tuple[torch.Tensor, torch.Tensor]: Tuple of
+                batchfied scores for next token with shape of `(n_batch, n_vocab)`
+                and the nodes of ys (n_batch,).
+
+        """
+        if isinstance(states, (list, tuple)):
+            is_init = torch.tensor([s is None for s in states], device=ys.device)
+            states = torch.tensor([0 if s is None else int(s) for s in states], device=ys.device)
+        else:
+            is_init = torch.zeros(len(ys), dtype=torch.bool, device=ys.device)
+        states = torch.where(is_init, torch.zeros_like(states), self.advance(states, ys[:, -1]))
+        return self.full_scores(states).to(xs.dtype), states
+
+    def batch_rearrange_state(self, states: Any, ids: torch.Tensor) -> Any:
+        if isinstance(states, torch.Tensor):
+            return states[ids.to(states.device)]
+        return super().batch_rearrange_state(states, ids)
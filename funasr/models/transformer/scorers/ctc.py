@@ -85,18 +85,23 @@ class CTCPrefixScorer(BatchPartialScorerInterface):
         )
         return tscore, (presub_score, new_st)
 
-    def batch_init_state(self, x: torch.Tensor):
+    def batch_init_state(self, x: torch.Tensor, xlens: torch.Tensor = None):
         """Get an initial state for decoding.
 
         Args:
-            x (torch.Tensor): The encoded feature tensor
+            x (torch.Tensor): The encoded feature tensor (T, D),
+                or (B, T, D) for the utterances of a batch
+            xlens (torch.Tensor): The lengths of the batched feature (B,)
 
         Returns: initial state
 
         """
-        logp = self.ctc.log_softmax(x.unsqueeze(0))  # assuming batch_size = 1
-        xlen = torch.tensor([logp.size(1)])
-        self.impl = CTCPrefixScoreTH(logp, xlen, 0, self.eos)
+        if x.dim() == 2:
+            x = x.unsqueeze(0)
+        logp = self.ctc.log_softmax(x)
+        if xlens is None:
+            xlens = torch.full((logp.size(0),), logp.size(1), dtype=torch.long)
+        self.impl = CTCPrefixScoreTH(logp, xlens.cpu(), 0, self.eos)
         return None
 
     def batch_score_partial(self, y, ids, state, x):
@@ -114,18 +119,36 @@ class CTCPrefixScorer(BatchPartialScorerInterface):
                 and next state for ys
 
         """
-        batch_state = (
-            (
-                torch.stack([s[0] for s in state], dim=2),
-                torch.stack([s[1] for s in state]),
-                state[0][2],
-                state[0][3],
+        if state is None or isinstance(state, tuple):
+            # already batched, see batch_select_state
+            batch_state = state
+        else:
+            batch_state = (
+                (
+                    torch.stack([s[0] for s in state], dim=2),
+                    torch.stack([s[1] for s in state]),
+                    state[0][2],
+                    state[0][3],
+                )
+                if state[0] is not None
+                else None
             )
-            if state[0] is not None
-            else None
-        )
         return self.impl(y, batch_state, ids)
 
+    def batch_select_state(self, state, best_ids: torch.Tensor):
+        """Select the batched states of the hypotheses kept in the beam.
+
+        Args:
+            state: CTC state of all the hypotheses, from `batch_score_partial`
+            best_ids (torch.Tensor): ids of the kept hypotheses (B, W),
+                as hyp * n_vocab + token among the hyps of each utterance
+
+        Returns:
+            state: batched state of the kept hypotheses
+
+        """
+        return self.impl.index_select_state(state, best_ids)
+
     def extend_prob(self, x: torch.Tensor):
         """Extend probs for decoding.
 
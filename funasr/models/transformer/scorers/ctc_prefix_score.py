@@ -76,8 +76,12 @@ class CTCPrefixScoreTH(object):
         :return new_state, ctc_local_scores (BW, O)
         """
         output_length = len(y[0]) - 1  # ignore sos
-        last_ids = [yi[-1] for yi in y]  # last output label ids
+        if isinstance(y, torch.Tensor):
+            last_ids = y[:, -1].to(self.device)  # last output label ids
+        else:
+            last_ids = torch.as_tensor([int(yi[-1]) for yi in y], device=self.device)
         n_bh = len(last_ids)  # batch * hyps
+        idx_bh = torch.arange(n_bh, device=self.device)
         n_hyps = n_bh // self.batch  # assuming each utterance has the same # of hyps
         self.scoring_num = scoring_ids.size(-1) if scoring_ids is not None else 0
         # prepare state info
@@ -133,13 +137,11 @@ class CTCPrefixScoreTH(object):
         r_sum = torch.logsumexp(r_prev, 1)
         log_phi = r_sum.unsqueeze(2).repeat(1, 1, snum)
         if scoring_ids is not None:
-            for idx in range(n_bh):
-                pos = scoring_idmap[idx, last_ids[idx]]
-                if pos >= 0:
-                    log_phi[:, idx, pos] = r_prev[:, 1, idx]
+            pos = scoring_idmap[idx_bh, last_ids]
+            scored = pos >= 0
+            log_phi[:, idx_bh[scored], pos[scored]] = r_prev[:, 1, idx_bh[scored]]
         else:
-            for idx in range(n_bh):
-                log_phi[:, idx, last_ids[idx]] = r_prev[:, 1, idx]
+            log_phi[:, idx_bh, last_ids] = r_prev[:, 1, idx_bh]
 
         # decide start and end frames based on attention weights
         if att_w is not None and self.margin > 0:
@@ -171,16 +173,15 @@ class CTCPrefixScoreTH(object):
                 torch.cat((log_phi_x[start:end], r[start - 1, 0].unsqueeze(0)), dim=0),
                 dim=0,
             )
-            for si in range(n_bh):
-                log_psi[si, scoring_ids[si]] = log_psi_[si]
+            log_psi.scatter_(1, scoring_ids, log_psi_)
         else:
             log_psi = torch.logsumexp(
                 torch.cat((log_phi_x[start:end], r[start - 1, 0].unsqueeze(0)), dim=0),
                 dim=0,
             )
 
-        for si in range(n_bh):
-            log_psi[si, self.eos] = r_sum[self.end_frames[si // n_hyps], si]
+        end_frames = self.end_frames.to(self.device)[idx_bh // n_hyps]
+        log_psi[:, self.eos] = r_sum[end_frames, idx_bh]
 
         # exclude blank probs
         log_psi[:, self.blank] = self.logzero
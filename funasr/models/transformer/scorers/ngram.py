@@ -0,0 +1,264 @@
+"""N-gram language model scorer for beam search (shallow fusion)."""
+import logging
+import math
+from typing import Any
+from typing import List
+from typing import Tuple
+from typing import Union
+
+import numpy as np
+import torch
+
+from funasr.models.transformer.scorers.scorer_interface import BatchScorerInterface
+
+
+class NgramLM:
+    """Backoff n-gram LM (ARPA) stored as an array-backed trie.
+
+    The nodes are the n-grams, node 0 being the empty context. They are sorted by order, then by the node of
+    their context and their word, so that the children of a node are contiguous and `keys` (context * n_words
+    + word of the nodes 1..) is sorted: a child is found with a binary search. `suffix` is the node of the
+    longest proper suffix in the model (the backoff link). The probabilities are natural logs.
+
+    `save` writes the arrays to a .npz, which loads without parsing the ARPA file.
+    """
+
+    def __init__(self, words, word, parent, prob, backoff, suffix, order):
+        self.words = list(words)
+        self.word2id = {w: i for i, w in enumerate(self.words)}
+        self.word = word
+        self.parent = parent
+        self.prob = prob
+        self.backoff = backoff
+        self.suffix = suffix
+        self.order = order
+        self.max_order = int(order.max()) if len(order) > 1 else 1
+        self.keys = parent[1:].astype(np.int64) * len(self.words) + word[1:]
+
+    @classmethod
+    def load(cls, path: str) -> "NgramLM":
+        """ARPA file, or .npz written by `save`"""
+        if path.endswith(".npz"):
+            arrays = np.load(path)
+            return cls(arrays["words"].tolist(), *(arrays[k] for k in
+                       ("word", "parent", "prob", "backoff", "suffix", "order")))
+        return cls.from_arpa(path)
+
+    def save(self, path: str):
+        np.savez(path, words=np.array(self.words), word=self.word, parent=self.parent, prob=self.prob,
+                 backoff=self.backoff, suffix=self.suffix, order=self.order)
+
+    @classmethod
+    def from_arpa(cls, path: str) -> "NgramLM":
+        ngrams = []  # per order: words, prob, backoff
+        with open(path, "r", encoding="utf-8") as fin:
+            for line in fin:
+                line = line.strip()
+                if not line or line.startswith("ngram ") or line == "\\data\\" or line == "\\end\\":
+                    continue
+                if line.startswith("\\") and line.endswith("-grams:"):
+                    ngrams.append([])
+                    continue
+                fields = line.split()
+                n = len(ngrams)
+                backoff = float(fields[n + 1]) if len(fields) > n + 1 else 0.0
+                ngrams[-1].append((tuple(fields[1:n + 1]), float(fields[0]), backoff))
+
+        words = [ngram[0][0] for ngram in ngrams[0]]
+        word2id = {w: i for i, w in enumerate(words)}
+        n_words = len(words)
+        ln10 = math.log(10)
+        columns = [[0], [-1], [0.0], [0.0], [0]]  # word, parent, prob, backoff, order of the root
+        node_ids = {(): 0}
+        for n, entries in enumerate(ngrams, 1):
+            parents, word, prob, backoff, kept = [], [], [], [], []
+            for ngram, p, b in entries:
+                parent = node_ids.get(ngram[:-1])
+                if parent is None or ngram[-1] not in word2id:
+                    continue
+                parents.append(parent)
+                word.append(word2id[ngram[-1]])
+                prob.append(p)
+                backoff.append(b)
+                kept.append(ngram)
+            if len(kept) < len(entries):
+                logging.warning(f"{len(entries) - len(kept)} {n}-grams without context in {path} are skipped")
+            parents, word = np.array(parents, dtype=np.int64), np.array(word, dtype=np.int64)
+            sort_idx = np.lexsort((word, parents))
+            offset = len(columns[0])
+            node_ids = {kept[i]: offset + j for j, i in enumerate(sort_idx.tolist())}
+            columns[0].extend(word[sort_idx].tolist())
+            columns[1].extend(parents[sort_idx].tolist())
+            columns[2].extend((np.array(prob)[sort_idx] * ln10).tolist())
+            columns[3].extend((np.array(backoff)[sort_idx] * ln10).tolist())
+            columns[4].extend([n] * len(kept))
+
+        lm = cls(
+            words,
+            np.array(columns[0], dtype=np.int32),
+            np.array(columns[1], dtype=np.int32),
+            np.array(columns[2], dtype=np.float32),
+            np.array(columns[3], dtype=np.float32),
+            np.zeros(len(columns[0]), dtype=np.int32),
+            np.array(columns[4], dtype=np.int8),
+        )
+        # the suffix of w1..wn is found from the suffix of its context w1..wn-1, as in Aho-Corasick
+        for n in range(2, lm.max_order + 1):
+            nodes = np.flatnonzero(lm.order == n)
+            state = lm.suffix[lm.parent[nodes]].astype(np.int64)
+            suffix = np.zeros(len(nodes), dtype=np.int64)
+            found = np.zeros(len(nodes), dtype=bool)
+            for _ in range(n):
+                child = lm.child(state, lm.word[nodes])
+                new = ~found & (child > 0)
+                suffix[new] = child[new]
+                found |= new
+                state = lm.suffix[state]
+            lm.suffix[nodes] = suffix
+        return lm
+
+    def child(self, nodes: np.ndarray, words: np.ndarray) -> np.ndarray:
+        """Nodes of the n-grams `nodes` followed by `words`, 0 if absent"""
+        keys = nodes.astype(np.int64) * len(self.words) + words
+        idx = np.minimum(np.searchsorted(self.keys, keys), len(self.keys) - 1)
+        return np.where(self.keys[idx] == keys, idx + 1, 0)
+
+
+class NgramScorer(BatchScorerInterface):
+    """N-gram LM shallow fusion in beam search, the ngram scorer of `init_beam_search`.
+
+    The LM is over the tokens of token_list (e.g. an ARPA file trained on the tokenized text), loaded from
+    ARPA or from the .npz of `NgramLM.save`. The state of a hypothesis is the node of its longest suffix in
+    the model, and a batch of states is scored over the whole vocabulary at once: from the unigrams, the
+    backoff weights of the suffixes are added and their children probabilities are written in, from the
+    shortest suffix to the longest. sos / eos are "<s>" (the initial context) and "</s>", the other tokens
+    absent from the LM are scored as "<unk>", or unk_score if the LM has no "<unk>".
+    """
+
+    def __init__(
+        self,
+        ngram: Union[str, NgramLM],
+        token_list: List[str],
+        sos: int,
+        eos: int,
+        unk_score: float = -100.0,
+    ):
+        self.lm = NgramLM.load(ngram) if isinstance(ngram, str) else ngram
+        lm = self.lm
+        n_words = len(lm.words)
+        # the column n_words is the score of the tokens absent from the LM
+        oov = lm.word2id.get("<unk>", n_words)
+        token2word = np.array([lm.word2id.get(token, oov) for token in token_list], dtype=np.int64)
+        token2word[eos] = lm.word2id.get("</s>", oov)
+        self.bos = int(lm.child(np.zeros(1), np.array([lm.word2id.get("<s>", oov)]))[0])
+        unigram = np.full(n_words + 1, unk_score * math.log(10), dtype=np.float32)
+        unigrams = np.flatnonzero(lm.order == 1)
+        unigram[lm.word[unigrams]] = lm.prob[unigrams]
+        children = np.searchsorted(lm.keys, np.arange(len(lm.word) + 1, dtype=np.int64) * n_words)
+        self.arrays = {
+            "token2word": token2word,
+            "unigram": unigram,
+            "word": lm.word.astype(np.int64),
+            "prob": lm.prob,
+            "backoff": lm.backoff,
+            "suffix": lm.suffix.astype(np.int64),
+            "order": lm.order.astype(np.int64),
+            "keys": lm.keys,
+            # children of node i: nodes children[i] + 1 .. children[i + 1]
+            "children": children.astype(np.int64),
+        }
+        self.tensors = {}
+
+    def get_tensors(self, device: torch.device) -> dict:
+        if device not in self.tensors:
+            self.tensors[device] = {k: torch.from_numpy(v).to(device) for k, v in self.arrays.items()}
+        return self.tensors[device]
+
+    def advance(self, states: torch.Tensor, tokens: torch.Tensor) -> torch.Tensor:
+        """States after `tokens`: their longest suffix in the model which is a context (below the max order)"""
+        t = self.get_tensors(states.device)
+        words = t["token2word"][tokens]
+        n_words = len(t["unigram"]) - 1
+        new_states = torch.zeros_like(states)
+        found = torch.zeros_like(states, dtype=torch.bool)
+        for _ in range(self.lm.max_order):
+            keys = states * n_words + words
+            idx = torch.searchsorted(t["keys"], keys).clamp(max=len(t["keys"]) - 1)
+            new = ~found & (t["keys"][idx] == keys)
+            new_states = torch.where(new, idx + 1, new_states)
+            found |= new
+            states = t["suffix"][states]
+        return torch.where(t["order"][new_states] == self.lm.max_order, t["suffix"][new_states], new_states)
+
+    def full_scores(self, states: torch.Tensor) -> torch.Tensor:
+        """Log probs of every token after the states (n_batch,): (n_batch, n_vocab)"""
+        t = self.get_tensors(states.device)
+        n_batch = len(states)
+        scores = t["unigram"].unsqueeze(0).repeat(n_batch, 1)
+        chain = [states]
+        while len(chain) < self.lm.max_order - 1 and bool((chain[-1] > 0).any()):
+            chain.append(t["suffix"][chain[-1]])
+        rows = torch.arange(n_batch, device=states.device)
+        for nodes in reversed(chain):
+            valid = nodes > 0
+            scores += torch.where(valid, t["backoff"][nodes], torch.zeros_like(t["backoff"][nodes])).unsqueeze(1)
+            starts = t["children"][nodes]
+            counts = torch.where(valid, t["children"][nodes + 1] - starts, torch.zeros_like(starts))
+            child_rows = torch.repeat_interleave(rows, counts)
+            if len(child_rows) == 0:
+                continue
+            offsets = torch.cumsum(counts, 0) - counts
+            children = starts[child_rows] + torch.arange(len(child_rows), device=states.device) - offsets[child_rows] + 1
+            scores[child_rows, t["word"][children]] = t["prob"][children]
+        return scores[:, t["token2word"]]
+
+    def init_state(self, x: torch.Tensor) -> Any:
+        return None
+
+    def score(self, y: torch.Tensor, state: Any, x: torch.Tensor) -> Tuple[torch.Tensor, Any]:
+        """Score new token.
+
+        Args:
+            y (torch.Tensor): 1D torch.int64 prefix tokens.
+            state: Scorer state for prefix tokens, the node of y[:-1] (None for the initial sos)
+            x (torch.Tensor): 2D encoder feature that generates ys.
+
+        Returns:
+            tuple[torch.Tensor, Any]: Tuple of
+                torch.float32 scores for next token (n_vocab)
+                and the node of y
+
+        """
+        scores, states = self.batch_score(y.unsqueeze(0), [state], x.unsqueeze(0))
+        return scores[0].to(x.dtype), states[0]
+
+    def batch_score(
+        self, ys: torch.Tensor, states: Any, xs: torch.Tensor
+    ) -> Tuple[torch.Tensor, torch.Tensor]:
+        """Score new token batch.
+
+        Args:
+            ys (torch.Tensor): torch.int64 prefix tokens (n_batch, ylen).
+            states: Scorer states for prefix tokens, the nodes of ys[:, :-1], as a list
+                (None for the initial sos) or the tensor returned by the previous `batch_score`.
+            xs (torch.Tensor):
+                The encoder feature that generates ys (n_batch, xlen, n_feat).
+
+        Returns:
+            tuple[torch.Tensor, torch.Tensor]: Tuple of
+                batchfied scores for next token with shape of `(n_batch, n_vocab)`
+                and the nodes of ys (n_batch,).
+
+        """
+        if isinstance(states, (list, tuple)):
+            is_init = torch.tensor([s is None for s in states], device=ys.device)
+            states = torch.tensor([0 if s is None else int(s) for s in states], device=ys.device)
+        else:
+            is_init = torch.zeros(len(ys), dtype=torch.bool, device=ys.device)
+        states = torch.where(is_init, torch.full_like(states, self.bos), self.advance(states, ys[:, -1]))
+        return self.full_scores(states).to(xs.dtype), states
+
+    def batch_rearrange_state(self, states: Any, ids: torch.Tensor) -> Any:
+        if isinstance(states, torch.Tensor):
+            return states[ids.to(states.device)]
+        return super().batch_rearrange_state(states, ids)
@@ -127,6 +127,18 @@ class BatchScorerInterface(ScorerInterface):
         scores = torch.cat(scores, 0).view(ys.shape[0], -1)
         return scores, outstates
 
+    def batch_rearrange_state(self, states: Any, ids: torch.Tensor) -> Any:
+        """Rearrange the states of `batch_score` to the kept hypotheses (optional).
+
+        Args:
+            states: Scorer states returned by `batch_score` for n_batch hypotheses.
+            ids (torch.Tensor): torch.int64 rows of the kept hypotheses (n_new,).
+
+        Returns: states of the n_new hypotheses, input of the next `batch_score`
+
+        """
+        return [states[i] for i in ids.tolist()]
+
 
 class PartialScorerInterface(ScorerInterface):
     """Partial scorer interface for beam search.
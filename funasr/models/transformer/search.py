@@ -1,4 +1,5 @@
 from itertools import chain
+import inspect
 import logging
 from typing import Any
 from typing import Dict
@@ -10,6 +11,7 @@ from typing import Union
 import torch
 
 from funasr.metrics.common import end_detect
+from funasr.models.transformer.scorers.scorer_interface import BatchScorerInterface
 from funasr.models.transformer.scorers.scorer_interface import PartialScorerInterface
 from funasr.models.transformer.scorers.scorer_interface import ScorerInterface
 
@@ -458,3 +460,263 @@ class BeamSearch(torch.nn.Module):
             else:
                 remained_hyps.append(hyp)
         return remained_hyps
+
+
+class BatchHypothesis(NamedTuple):
+    """Batchfied hypotheses data type: the running hypotheses of all the utterances."""
+
+    yseq: torch.Tensor  # (n_batch * beam, ylen)
+    score: torch.Tensor  # (n_batch * beam,)
+    scores: Dict[str, torch.Tensor] = dict()  # values: (n_batch * beam,)
+    states: Dict[str, Any] = dict()
+
+
+class BatchBeamSearch(BeamSearch):
+    """Beam search vectorized over the utterances of a batch and their hypotheses.
+
+    The running hypotheses are the n_batch * beam_size rows of BatchHypothesis, scored at once by
+    `batch_score` of the full scorers, whose states follow the kept rows by `batch_rearrange_state` (the key /
+    value caches of the decoders), and `batch_score_partial` of the partial ones (CTCPrefixScorer with
+    CTCPrefixScoreTH, whose batched state is selected by `batch_select_state`). The ended hypotheses and
+    the utterances whose search ended keep their rows with a -inf score, so that the shapes stay fixed and
+    the hypotheses selected are the ones of BeamSearch.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        for k, v in self.scorers.items():
+            assert isinstance(
+                v, BatchScorerInterface
+            ), f"{k} ({type(v)}) does not implement BatchScorerInterface"
+        # the full scorers which take the mask of padded encoder features
+        self.masked_scorers = [
+            k for k, v in self.full_scorers.items()
+            if "xs_mask" in inspect.signature(v.batch_score).parameters
+        ]
+
+    def init_batch_hyp(self, x: torch.Tensor, x_lens: torch.Tensor) -> BatchHypothesis:
+        """Get the initial hypotheses: beam_size rows per utterance, the first one with score 0.
+
+        Args:
+            x (torch.Tensor): The encoder output feature (B, T, D)
+            x_lens (torch.Tensor): The encoder output lengths (B,)
+
+        """
+        n_batch = x.size(0)
+        init_states = dict()
+        for k, d in self.full_scorers.items():
+            init_states[k] = [
+                d.batch_init_state(x[b, : x_lens[b]]) for b in range(n_batch) for _ in range(self.beam_size)
+            ]
+        for k, d in self.part_scorers.items():
+            init_states[k] = d.batch_init_state(x, x_lens)
+        score = torch.full((n_batch, self.beam_size), float("-inf"), dtype=x.dtype, device=x.device)
+        score[:, 0] = 0.0
+        return BatchHypothesis(
+            yseq=torch.full((n_batch * self.beam_size, 1), self.sos, dtype=torch.long, device=x.device),
+            score=score.view(-1),
+            scores={k: torch.zeros_like(score.view(-1)) for k in self.scorers},
+            states=init_states,
+        )
+
+    def batch_search(
+        self,
+        running_hyps: BatchHypothesis,
+        xs: torch.Tensor,
+        xs_mask: torch.Tensor = None,
+        am_score: torch.Tensor = None,
+    ) -> BatchHypothesis:
+        """Search new tokens for all the running hypotheses.
+
+        Args:
+            running_hyps (BatchHypothesis): Running hypotheses on beam
+            xs (torch.Tensor): Encoded speech feature of each hypothesis (n_batch * beam, T, D)
+            xs_mask (torch.Tensor): Mask of the padded feature (n_batch * beam, 1, T), None if no padding
+            am_score (torch.Tensor): Scores added to every token (n_batch * beam, n_vocab), e.g.
+                the Paraformer decoder output at this position
+
+        Returns:
+            BatchHypothesis: The beam_size best hypotheses of each utterance
+
+        """
+        n_bh = running_hyps.score.size(0)
+        n_batch = n_bh // self.beam_size
+        weighted_scores = torch.zeros(n_bh, self.n_vocab, dtype=xs.dtype, device=xs.device)
+        if am_score is not None:
+            weighted_scores += am_score
+        scores, states = dict(), dict()
+        for k, d in self.full_scorers.items():
+            if xs_mask is not None and k in self.masked_scorers:
+                scores[k], states[k] = d.batch_score(running_hyps.yseq, running_hyps.states[k], xs, xs_mask=xs_mask)
+            else:
+                scores[k], states[k] = d.batch_score(running_hyps.yseq, running_hyps.states[k], xs)
+            weighted_scores += self.weights[k] * scores[k]
+        # partial scoring
+        part_ids = None
+        if self.do_pre_beam:
+            pre_beam_scores = (
+                weighted_scores
+                if self.pre_beam_score_key == "full"
+                else scores[self.pre_beam_score_key]
+            )
+            part_ids = torch.topk(pre_beam_scores, self.pre_beam_size)[1]
+        for k, d in self.part_scorers.items():
+            scores[k], states[k] = d.batch_score_partial(running_hyps.yseq, part_ids, running_hyps.states[k], xs)
+            weighted_scores += self.weights[k] * scores[k]
+        if part_ids is not None:
+            # mask pruned in pre-beam not to select in topk
+            pruned = torch.full_like(weighted_scores, float("-inf"))
+            weighted_scores += pruned.scatter_(1, part_ids, 0.0)
+        # add previous hyp score
+        weighted_scores += running_hyps.score.unsqueeze(1)
+
+        # beam_size best of the (beam x n_vocab) candidates of each utterance
+        top_scores, top_ids = weighted_scores.view(n_batch, -1).topk(self.beam_size, dim=1)
+        prev_ids = (
+            top_ids // self.n_vocab
+            + torch.arange(n_batch, device=xs.device).unsqueeze(1) * self.beam_size
+        ).view(-1)
+        new_tokens = (top_ids % self.n_vocab).view(-1)
+        new_states = dict()
+        for k, d in self.full_scorers.items():
+            new_states[k] = None if states[k] is None else d.batch_rearrange_state(states[k], prev_ids)
+        for k, d in self.part_scorers.items():
+            new_states[k] = d.batch_select_state(states[k], top_ids)
+        return BatchHypothesis(
+            yseq=torch.cat((running_hyps.yseq[prev_ids], new_tokens.unsqueeze(1)), dim=1),
+            score=top_scores.view(-1),
+            scores={
+                k: running_hyps.scores[k][prev_ids] + scores[k][prev_ids, new_tokens]
+                for k in self.scorers
+            },
+            states=new_states,
+        )
+
+    def unbatch_hyp(self, running_hyps: BatchHypothesis, i: int, append_eos: bool = False) -> Hypothesis:
+        """Hypothesis of row i, with the states of the full scorers (for `final_score`)."""
+        yseq = running_hyps.yseq[i]
+        if append_eos:
+            yseq = self.append_token(yseq, self.eos)
+        return Hypothesis(
+            yseq=yseq,
+            # copies, the score of the ended rows is then set to -inf in place
+            score=running_hyps.score[i].clone(),
+            scores={k: v[i].clone() for k, v in running_hyps.scores.items()},
+            states={
+                k: None if running_hyps.states[k] is None else d.select_state(running_hyps.states[k], i)
+                for k, d in self.full_scorers.items()
+            },
+        )
+
+    def forward(
+        self,
+        x: torch.Tensor,
+        x_lens: torch.Tensor = None,
+        maxlenratio: float = 0.0,
+        minlenratio: float = 0.0,
+        am_scores: torch.Tensor = None,
+        am_lens: torch.Tensor = None,
+    ) -> Union[List[Hypothesis], List[List[Hypothesis]]]:
+        """Perform beam search on a batch of utterances.
+
+        Args:
+            x (torch.Tensor): Encoded speech feature (B, T, D), or (T, D) for one utterance
+            x_lens (torch.Tensor): Encoded speech lengths (B,), all T if None
+            maxlenratio (float): Input length ratio to obtain max output length, as BeamSearch.
+            minlenratio (float): Input length ratio to obtain min output length.
+            am_scores (torch.Tensor): Scores added to the tokens at each position (B, L, n_vocab),
+                e.g. the Paraformer decoder output, the max output lengths are then am_lens
+            am_lens (torch.Tensor): Number of positions of am_scores (B,)
+
+        Returns:
+            N-best decoding results of each utterance, or of the utterance if x is (T, D)
+
+        """
+        single = x.dim() == 2
+        if single:
+            x = x.unsqueeze(0)
+            am_scores = None if am_scores is None else am_scores.unsqueeze(0)
+        n_batch = x.size(0)
+        if x_lens is None:
+            x_lens = torch.full((n_batch,), x.size(1), dtype=torch.long)
+        x_lens = x_lens.to(x.device)
+        # set length bounds
+        if am_scores is not None:
+            if am_lens is None:
+                am_lens = torch.full((n_batch,), am_scores.size(1), dtype=torch.long)
+            maxlens = am_lens.tolist()
+        elif maxlenratio == 0:
+            maxlens = x_lens.tolist()
+        elif maxlenratio < 0:
+            maxlens = [-1 * int(maxlenratio)] * n_batch
+        else:
+            maxlens = [max(1, int(maxlenratio * l)) for l in x_lens.tolist()]
+        logging.info("decoder input lengths: " + str(x_lens.tolist()))
+        logging.info("max output lengths: " + str(maxlens))
+
+        # the encoder feature of each hypothesis
+        xs = x.repeat_interleave(self.beam_size, dim=0)
+        xs_mask = None
+        if (x_lens < x.size(1)).any():
+            xs_mask = (torch.arange(x.size(1), device=x.device).unsqueeze(0) < x_lens.unsqueeze(1)).unsqueeze(1)
+            xs_mask = xs_mask.repeat_interleave(self.beam_size, dim=0)
+
+        # main loop of prefix search
+        running_hyps = self.init_batch_hyp(x, x_lens)
+        ended_hyps = [[] for _ in range(n_batch)]
+        finished = [maxlen < 1 for maxlen in maxlens]
+        for i in range(max(maxlens)):
+            if all(finished):
+                break
+            logging.debug("position " + str(i))
+            am_score = None
+            if am_scores is not None:
+                am_score = am_scores[:, min(i, am_scores.size(1) - 1)].repeat_interleave(self.beam_size, dim=0)
+            running_hyps = self.batch_search(running_hyps, xs, xs_mask, am_score)
+            # post process of one iteration, the ended rows are given a -inf score
+            is_running = torch.isfinite(running_hyps.score).view(n_batch, -1).tolist()
+            is_eos = (running_hyps.yseq[:, -1] == self.eos).view(n_batch, -1).tolist()
+            ended_rows = []
+            for b in range(n_batch):
+                if finished[b]:
+                    ended_rows.extend(range(b * self.beam_size, (b + 1) * self.beam_size))
+                    continue
+                # add eos in the final loop to avoid that there are no ended hyps
+                last = i == maxlens[b] - 1
+                for j in range(self.beam_size):
+                    if is_running[b][j] and (last or is_eos[b][j]):
+                        row = b * self.beam_size + j
+                        hyp = self.unbatch_hyp(running_hyps, row, append_eos=last)
+                        ended_hyps[b].append(self.finalize_hyp(hyp))
+                        ended_rows.append(row)
+                remained = sum(r and not (last or e) for r, e in zip(is_running[b], is_eos[b]))
+                # end detection
+                if last or remained == 0 or (
+                    maxlenratio == 0.0 and end_detect([h.asdict() for h in ended_hyps[b]], i)
+                ):
+                    logging.info(f"utterance {b} finished at {i}")
+                    finished[b] = True
+                    ended_rows.extend(range(b * self.beam_size, (b + 1) * self.beam_size))
+            if len(ended_rows) > 0:
+                running_hyps.score[torch.tensor(ended_rows, device=x.device)] = float("-inf")
+
+        nbest_hyps = [sorted(hyps, key=lambda x: x.score, reverse=True) for hyps in ended_hyps]
+        for b, hyps in enumerate(nbest_hyps):
+            if len(hyps) == 0:
+                logging.warning(f"there is no N-best results for utterance {b}")
+                continue
+            best = hyps[0]
+            logging.info(f"total log probability: {best.score:.2f}")
+            logging.info(f"normalized log probability: {best.score / len(best.yseq):.2f}")
+            logging.info(f"total number of ended hypotheses: {len(hyps)}")
+        return nbest_hyps[0] if single else nbest_hyps
+
+    def finalize_hyp(self, hyp: Hypothesis) -> Hypothesis:
+        """Add the final scores of an ended hypothesis, e.g. Word LM needs to add final <eos> score."""
+        scores = dict(hyp.scores)
+        for k, d in self.full_scorers.items():
+            s = d.final_score(hyp.states[k])
+            scores[k] = scores[k] + s
+            hyp = hyp._replace(score=hyp.score + self.weights[k] * s)
+        return hyp._replace(scores=scores)
+
@@ -76,7 +76,7 @@ class OpenAIWhisperDecoderWarp(nn.Module):
         x = tgt.to(memory.dtype)
 
         if self.use_padmask:
-            memory_mask = (~make_pad_mask(hlens)[:, None, :]).to(memory.device)
+            memory_mask = (~make_pad_mask(hlens, maxlen=memory.size(1))[:, None, :]).to(memory.device)
         else:
             memory_mask = None
 
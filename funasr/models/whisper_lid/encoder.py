@@ -82,7 +82,7 @@ class OpenAIWhisperEncoderWarp(nn.Module):
             olens = None
 
         if self.use_padmask:
-            padding_mask = (~make_pad_mask(olens)[:, None, :]).to(x.device)
+            padding_mask = (~make_pad_mask(olens, maxlen=x.size(1))[:, None, :]).to(x.device)
         else:
             padding_mask = None
 
@@ -0,0 +1,90 @@
+import os
+import shutil
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import torch
+
+
+class AsyncCheckpointWriter:
+    """
+    Writes checkpoints in a background thread.
+
+    The state is first snapshotted into CPU memory (pinned when the source lives on GPU, the
+    pinned buffers are reused across saves), so training can continue while `torch.save` runs.
+    At most one write is in flight: a new `submit` waits for the previous one to finish, which
+    also guarantees that the reused buffers are not overwritten while being serialized.
+    """
+
+    def __init__(self, pin_memory: bool = True):
+        self.pin_memory = pin_memory and torch.cuda.is_available()
+        self._buffers = {}
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ckpt_writer")
+        self._future = None
+
+    def snapshot(self, obj, prefix=""):
+        """Recursively copy all tensors of a (nested) state dict into CPU memory."""
+        if isinstance(obj, dict):
+            return type(obj)((k, self.snapshot(v, f"{prefix}/{k}")) for k, v in obj.items())
+        elif isinstance(obj, (list, tuple)) and type(obj) in (list, tuple):
+            return type(obj)(self.snapshot(v, f"{prefix}/{i}") for i, v in enumerate(obj))
+        elif isinstance(obj, torch.Tensor):
+            if type(obj) is not torch.Tensor:
+                # e.g. ShardedTensor/DTensor from FSDP sharded state dicts, which are
+                # already offloaded to CPU copies by FSDP (offload_to_cpu=True)
+                return obj if obj.device.type == "cpu" else obj.cpu()
+            obj = obj.detach()
+            if obj.device.type == "cpu":
+                return obj.clone()
+            buf = self._buffers.get(prefix, None)
+            if buf is None or buf.shape != obj.shape or buf.dtype != obj.dtype:
+                buf = torch.empty(obj.shape, dtype=obj.dtype, device="cpu", pin_memory=self.pin_memory)
+                self._buffers[prefix] = buf
+            buf.copy_(obj, non_blocking=self.pin_memory)
+            return buf
+        else:
+            return obj
+
+    def submit(self, fn, state, *args, **kwargs):
+        """Snapshot `state` and run `fn(state, *args, **kwargs)` in the writer thread."""
+        self.wait()
+        state = self.snapshot(state)
+        if self.pin_memory:
+            # non_blocking device-to-host copies must be complete before the writer reads them
+            torch.cuda.synchronize()
+        self._future = self._executor.submit(fn, state, *args, **kwargs)
+
+    def wait(self):
+        """Block until the pending write (if any) is finished, re-raising its exception."""
+        if self._future is not None:
+            future, self._future = self._future, None
+            future.result()
+
+    def close(self):
+        self.wait()
+        self._executor.shutdown(wait=True)
+
+
+def link_checkpoint(src: str, dst: str, link_type: str = "hardlink"):
+    """
+    Make `dst` refer to the checkpoint `src` without serializing it again.
+
+    link_type: "hardlink", "symlink" or "copy". Links fall back to a plain file copy when the
+    file system does not support them. `dst` is replaced atomically.
+    """
+    tmp = f"{dst}.tmp{os.getpid()}"
+    if os.path.lexists(tmp):
+        os.remove(tmp)
+    try:
+        if link_type == "hardlink":
+            os.link(src, tmp)
+        elif link_type == "symlink":
+            os.symlink(os.path.relpath(src, os.path.dirname(os.path.abspath(dst))), tmp)
+        else:
+            shutil.copyfile(src, tmp)
+    except OSError as e:
+        logging.warning(f"Failed to {link_type} {src} -> {dst}: {e}, copy instead")
+        if os.path.lexists(tmp):
+            os.remove(tmp)
+        shutil.copyfile(src, tmp)
+    os.replace(tmp, dst)
@@ -0,0 +1,111 @@
+import os
+import json
+import time
+import logging
+
+import torch
+
+
+class ThroughputProfiler:
+    """
+    Instrumentation of the training loop to tell whether training is input-bound or compute-bound.
+
+    Per step it accumulates the time spent waiting for the DataLoader, copying the batch to the
+    device, forward, backward and optimizer step, and the loading throughput of every DataLoader
+    worker reported by the dataset (see `AudioDataset(profile_workers=True)`). A step is counted as
+    a stall when the data wait takes more than `stall_ratio` of the step time.
+
+    Interval statistics are written to the tensorboard writer, epoch statistics to
+    `{output_dir}/profile_rank{rank}.json`.
+    """
+    stages = ("data_wait", "to_device", "forward", "backward", "optim")
+
+    def __init__(self, output_dir: str = "./", rank: int = 0, stall_ratio: float = 0.5, sync_cuda: bool = True):
+        self.output_dir = output_dir
+        self.rank = rank
+        self.stall_ratio = stall_ratio
+        # cuda kernels are asynchronous, without synchronizing the timings are attributed to the wrong stage
+        self.sync_cuda = sync_cuda and torch.cuda.is_available()
+        self.summary = {}
+        self.epoch_stats = self._new_stats()
+        self.interval_stats = self._new_stats()
+
+    def _new_stats(self):
+        return {"steps": 0, "samples": 0, "stalls": 0, "skipped": 0, "time": {k: 0.0 for k in self.stages},
+                "workers": {}}
+
+    def now(self):
+        if self.sync_cuda:
+            torch.cuda.synchronize()
+        return time.perf_counter()
+
+    def update(self, stage_times: dict, num_samples: int = 0, worker_stats: dict = None, skipped: bool = False):
+        """Add a step, `skipped` if the model was not updated (non-finite grad norm)."""
+        step_time = sum(stage_times.values())
+        stall = step_time > 0 and stage_times.get("data_wait", 0.0) > self.stall_ratio * step_time
+        for stats in (self.epoch_stats, self.interval_stats):
+            stats["steps"] += 1
+            stats["samples"] += num_samples
+            stats["stalls"] += int(stall)
+            stats["skipped"] += int(skipped)
+            for k, v in stage_times.items():
+                stats["time"][k] += v
+            if worker_stats is not None:
+                worker = stats["workers"].setdefault(worker_stats["worker_id"], {"samples": 0, "load_time": 0.0})
+                worker["samples"] += worker_stats["num_samples"]
+                worker["load_time"] += worker_stats["load_time"]
+
+    def _summarize(self, stats):
+        total_time = sum(stats["time"].values())
+        steps = max(stats["steps"], 1)
+        summary = {
+            "steps": stats["steps"],
+            "samples": stats["samples"],
+            "samples_per_sec": stats["samples"] / total_time if total_time > 0 else 0.0,
+            "stall_steps": stats["stalls"],
+            "stall_fraction": stats["stalls"] / steps,
+            "skipped_steps": stats["skipped"],
+            "time_per_step": {k: v / steps for k, v in stats["time"].items()},
+            "time_fraction": {k: v / total_time if total_time > 0 else 0.0 for k, v in stats["time"].items()},
+            "workers_samples_per_sec": {
+                str(k): v["samples"] / v["load_time"] if v["load_time"] > 0 else 0.0
+                for k, v in sorted(stats["workers"].items())
+            },
+        }
+        summary["input_bound"] = summary["time_fraction"]["data_wait"] > self.stall_ratio
+        return summary
+
+    def log(self, writer=None, step: int = 0, tag: str = "train"):
+        """Write the statistics since the last call to tensorboard and warn if the input pipeline stalls."""
+        summary = self._summarize(self.interval_stats)
+        self.interval_stats = self._new_stats()
+        if summary["stall_fraction"] > 0.5:
+            logging.warning(
+                f"rank: {self.rank}, {summary['stall_fraction'] * 100:.1f}% of the last {summary['steps']} steps "
+                f"stalled on data loading (data_wait: {summary['time_fraction']['data_wait'] * 100:.1f}% of step time), "
+                f"consider more num_workers or a lighter preprocessing"
+            )
+        if writer is not None:
+            prefix = f"profile_rank{self.rank}"
+            writer.add_scalar(f"{prefix}_samples_per_sec/{tag}", summary["samples_per_sec"], step)
+            writer.add_scalar(f"{prefix}_stall_fraction/{tag}", summary["stall_fraction"], step)
+            for k in self.stages:
+                writer.add_scalar(f"{prefix}_time_{k}/{tag}", summary["time_per_step"][k], step)
+            for k, v in summary["workers_samples_per_sec"].items():
+                writer.add_scalar(f"{prefix}_worker{k}_samples_per_sec/{tag}", v, step)
+        return summary
+
+    def dump(self, epoch: int = 0):
+        """Append the summary of the finished epoch to the json file and start a new one."""
+        summary = self._summarize(self.epoch_stats)
+        self.epoch_stats = self._new_stats()
+        self.summary[f"epoch{epoch}"] = summary
+        logging.info(
+            f"rank: {self.rank}, epoch: {epoch}, profile: {summary['samples_per_sec']:.1f} samples/sec, "
+            f"time_fraction: { {k: round(v, 3) for k, v in summary['time_fraction'].items()} }, "
+            f"input_bound: {summary['input_bound']}"
+        )
+        os.makedirs(self.output_dir, exist_ok=True)
+        with open(os.path.join(self.output_dir, f"profile_rank{self.rank}.json"), "w") as fout:
+            json.dump(self.summary, fout, indent=2)
+        return summary
@@ -1,6 +1,7 @@
 import math
 import os
 import time
+import itertools
 import torch
 import logging
 from tqdm import tqdm
@@ -13,6 +14,8 @@ from pathlib import Path
 from funasr.train_utils.device_funcs import to_device
 from funasr.train_utils.recursive_op import recursive_average
 from funasr.train_utils.average_nbest_models import average_checkpoints
+from funasr.train_utils.async_checkpoint import AsyncCheckpointWriter, link_checkpoint
+from funasr.train_utils.throughput_profiler import ThroughputProfiler
 from torch.distributed.fsdp.sharded_grad_scaler import ShardedGradScaler
 
 @contextmanager
@@ -59,6 +62,19 @@ class Trainer:
                       max_epoch (int): The maximum number of epochs for training.
                       output_dir (str): The directory where model checkpoints will be saved. Default is './'.
                       resume (str, optional): The file path to a checkpoint to resume training from.
+                      async_checkpoint (bool): Snapshot the state into (pinned) cpu memory and write
+                                               checkpoints in a background thread. Default is False.
+                      sharded_checkpoint (bool): With FSDP, every rank saves its own shard to
+                                                 `model.pt.*.rank{rank}` instead of gathering the full
+                                                 state on rank 0. Default is False.
+                      checkpoint_link_type (str): How "model.pt" and "model.pt.best" refer to the saved
+                                                  checkpoint: "hardlink", "symlink" or "copy". Default is "hardlink".
+                      low_sync (bool): Reduce collective communications in distributed training: the number
+                                       of steps is agreed once per epoch, the loss is normalized per rank and
+                                       metrics are reduced every `log_interval` steps. Default is False.
+                      profile (bool): Time data loading, host to device copy, forward, backward and optimizer
+                                      step, and detect input pipeline stalls, see `ThroughputProfiler`.
+                                      Default is False.
         """
         
         self.output_dir = output_dir
@@ -83,6 +99,12 @@ class Trainer:
         self.accum_grad = kwargs.get("accum_grad", 1)
         self.grad_clip = kwargs.get("grad_clip", 10.0)
         self.grad_clip_type = kwargs.get("grad_clip_type", 2.0)
+        self.low_sync = kwargs.get("low_sync", False)
+        self.profile = kwargs.get("profile", False)
+        self.profile_conf = kwargs.get("profile_conf", {})
+        self.checkpoint_link_type = kwargs.get("checkpoint_link_type", "hardlink")
+        self.sharded_checkpoint = kwargs.get("sharded_checkpoint", False) and use_fsdp
+        self.checkpoint_writer = AsyncCheckpointWriter() if kwargs.get("async_checkpoint", False) else None
         
         
     
@@ -101,10 +123,15 @@ class Trainer:
         self.val_loss_avg = 0.0
         self.best_acc_idx = 0
         self.saved_ckpts = {}
+        self.pruned_ckpts = []
         self.step_or_epoch = -1
         self.best_step_or_epoch = ""
         self.val_acc_step_or_eoch = {}
         self.val_loss_step_or_eoch = {}
+        self.checkpoint_suffix = f".rank{self.rank}" if self.sharded_checkpoint else ""
+        self.profiler = None
+        if self.profile:
+            self.profiler = ThroughputProfiler(output_dir=self.output_dir, rank=self.rank, **self.profile_conf)
        
     def save_checkpoint(self, epoch,
                         step=None,
@@ -118,63 +145,62 @@ class Trainer:
         and the scheduler's state at the end of the given epoch. This method is
         intended to be called at the end of each epoch to save the training progress.
 
+        The checkpoint is serialized once; "model.pt" and "model.pt.best" are linked to it
+        (see `checkpoint_link_type`). With `async_checkpoint` the write happens in a background thread.
+
         Args:
             epoch (int): The epoch number at which the checkpoint is being saved.
         """
         
-        if self.rank == 0:
+        if self.sharded_checkpoint:
+            # every rank saves its own shard, offloaded to cpu by FSDP
+            from torch.distributed.fsdp import FullyShardedDataParallel as FSDP
+            from torch.distributed.fsdp import StateDictType, ShardedStateDictConfig, ShardedOptimStateDictConfig
+            with FSDP.state_dict_type(model,
+                                      StateDictType.SHARDED_STATE_DICT,
+                                      ShardedStateDictConfig(offload_to_cpu=True),
+                                      ShardedOptimStateDictConfig(offload_to_cpu=True)):
+                model_state = model.state_dict()
+                optim_state = FSDP.optim_state_dict(model, optim)
+
+        if self.rank == 0 or self.sharded_checkpoint:
             logging.info(f"Save checkpoint: {epoch}, rank: {self.local_rank}\n")
-            # self.step_or_epoch += 1
-            state = {
-                'epoch': epoch,
-                'state_dict': model.state_dict(),
-                'optimizer': optim.state_dict(),
-                'scheduler': scheduler.state_dict(),
-                "saved_ckpts": self.saved_ckpts,
-                "val_acc_step_or_eoch": self.val_acc_step_or_eoch,
-                "val_loss_step_or_eoch": self.val_loss_step_or_eoch,
-                "best_step_or_epoch": self.best_step_or_epoch,
-                "avg_keep_nbest_models_type": self.avg_keep_nbest_models_type,
-            }
-            if hasattr(model, "module"):
-                state["state_dict"] = model.module.state_dict()
-                
-            if scaler:
-                state["scaler_state"] = scaler.state_dict()
+            if not self.sharded_checkpoint:
+                model_state = model.module.state_dict() if hasattr(model, "module") else model.state_dict()
+                optim_state = optim.state_dict()
             # Create output directory if it does not exist
             os.makedirs(self.output_dir, exist_ok=True)
             if step is None:
                 ckpt_name = f'model.pt.ep{epoch}'
             else:
                 ckpt_name = f'model.pt.ep{epoch}.{step}'
-            filename = os.path.join(self.output_dir, ckpt_name)
-            torch.save(state, filename)
-            
-            logging.info(f'\nCheckpoint saved to {filename}\n')
-            latest = Path(os.path.join(self.output_dir, f'model.pt'))
-            torch.save(state, latest)
+            suffix = self.checkpoint_suffix
+            filename = os.path.join(self.output_dir, ckpt_name + suffix)
+            # "model.pt" and "model.pt.best" are links to the saved checkpoint instead of copies
+            links = [os.path.join(self.output_dir, f'model.pt{suffix}')]
             if self.best_step_or_epoch == "":
                 self.best_step_or_epoch = ckpt_name
-             
+
             if self.avg_keep_nbest_models_type == "acc":
                 if self.val_acc_step_or_eoch[ckpt_name] >= self.val_acc_step_or_eoch[self.best_step_or_epoch]:
                     self.best_step_or_epoch = ckpt_name
-                    best_ckpt = Path(os.path.join(self.output_dir, f'model.pt.best'))
-                    torch.save(state, best_ckpt)
+                    best_ckpt = os.path.join(self.output_dir, f'model.pt.best{suffix}')
+                    links.append(best_ckpt)
                     logging.info(f"Update best acc: {self.val_acc_step_or_eoch[self.best_step_or_epoch]:.4f}, {best_ckpt}")
                 else:
                     logging.info(f"No improvement in acc: {self.val_acc_step_or_eoch[ckpt_name]:.4f} < {self.val_acc_step_or_eoch[self.best_step_or_epoch]:.4f}")
             elif self.avg_keep_nbest_models_type == "loss":
                 if self.val_loss_step_or_eoch[ckpt_name] <= self.val_loss_step_or_eoch[self.best_step_or_epoch]:
                     self.best_step_or_epoch = ckpt_name
-                    best_ckpt = Path(os.path.join(self.output_dir, f'model.pt.best'))
-                    torch.save(state, best_ckpt)
+                    best_ckpt = os.path.join(self.output_dir, f'model.pt.best{suffix}')
+                    links.append(best_ckpt)
                     logging.info(f"Update best loss: {self.val_loss_step_or_eoch[self.best_step_or_epoch]:.4f}, {best_ckpt}")
                 else:
                     logging.info(f"No improvement in loss: {self.val_loss_step_or_eoch[ckpt_name]:.4f} > {self.val_loss_step_or_eoch[self.best_step_or_epoch]:.4f}")
             else:
                 print("Undo")
             self.saved_ckpts[ckpt_name] = getattr(self, f"val_{self.avg_keep_nbest_models_type}_step_or_eoch")[ckpt_name]
+            removes = []
             if self.keep_nbest_models > 0:
                 if len(self.saved_ckpts) > self.keep_nbest_models:
                     if self.avg_keep_nbest_models_type == "acc":
@@ -183,14 +209,57 @@ class Trainer:
                         key = max(self.saved_ckpts, key=self.saved_ckpts.get)
                     if key in self.saved_ckpts:
                         del self.saved_ckpts[key]
-                    filename = os.path.join(self.output_dir, key)
-                    logging.info(f"Delete: {filename}")
-                    if os.path.exists(filename):
-                        os.remove(filename)
-                
+                    self.pruned_ckpts.append(key)
+                # a pruned checkpoint is deleted once the latest/best symlinks no longer refer to it
+                for key in list(self.pruned_ckpts):
+                    if self.checkpoint_link_type == "symlink" and key in (ckpt_name, self.best_step_or_epoch):
+                        logging.info(f"Keep {key}, it is the target of the latest/best symlink")
+                    else:
+                        self.pruned_ckpts.remove(key)
+                        removes.append(os.path.join(self.output_dir, key + suffix))
+
+            state = {
+                'epoch': epoch,
+                'state_dict': model_state,
+                'optimizer': optim_state,
+                'scheduler': scheduler.state_dict(),
+                "saved_ckpts": dict(self.saved_ckpts),
+                "pruned_ckpts": list(self.pruned_ckpts),
+                "val_acc_step_or_eoch": dict(self.val_acc_step_or_eoch),
+                "val_loss_step_or_eoch": dict(self.val_loss_step_or_eoch),
+                "best_step_or_epoch": self.best_step_or_epoch,
+                "avg_keep_nbest_models_type": self.avg_keep_nbest_models_type,
+                "sharded_checkpoint": self.sharded_checkpoint,
+            }
+            if scaler:
+                state["scaler_state"] = scaler.state_dict()
+
+            if self.checkpoint_writer is not None:
+                self.checkpoint_writer.submit(self._write_checkpoint, state, filename, links, removes)
+            else:
+                self._write_checkpoint(state, filename, links, removes)
+
         if self.use_ddp or self.use_fsdp:
             dist.barrier()
-    
+
+    def _write_checkpoint(self, state, filename, links, removes):
+        """Serialize `state` once, then link "latest"/"best" to it and drop pruned checkpoints."""
+        tmp = f"{filename}.tmp"
+        torch.save(state, tmp)
+        os.replace(tmp, filename)
+        logging.info(f'\nCheckpoint saved to {filename}\n')
+        for dst in links:
+            link_checkpoint(filename, dst, self.checkpoint_link_type)
+        for path in removes:
+            logging.info(f"Delete: {path}")
+            if os.path.exists(path):
+                os.remove(path)
+
+    def wait_for_checkpoint(self):
+        """Block until the pending asynchronous checkpoint (if any) is on disk."""
+        if self.checkpoint_writer is not None:
+            self.checkpoint_writer.wait()
+
     def resume_checkpoint(self,
                           model=None,
                           optim=None,
@@ -205,8 +274,25 @@ class Trainer:
             resume_path (str): The file path to the checkpoint to resume from.
         """
         if self.resume:
-            ckpt = os.path.join(self.output_dir, "model.pt")
-            if os.path.isfile(ckpt):
+            ckpt = os.path.join(self.output_dir, f"model.pt{self.checkpoint_suffix}")
+            if os.path.isfile(ckpt) and self.sharded_checkpoint:
+                from torch.distributed.fsdp import FullyShardedDataParallel as FSDP
+                from torch.distributed.fsdp import StateDictType
+                checkpoint = torch.load(ckpt, map_location="cpu")
+                self.start_epoch = checkpoint['epoch'] + 1
+                with FSDP.state_dict_type(model, StateDictType.SHARDED_STATE_DICT):
+                    model.load_state_dict(checkpoint['state_dict'])
+                    optim.load_state_dict(FSDP.optim_state_dict_to_load(model, optim, checkpoint['optimizer']))
+                scheduler.load_state_dict(checkpoint['scheduler'])
+                if scaler is not None and 'scaler_state' in checkpoint:
+                    scaler.load_state_dict(checkpoint['scaler_state'])
+                self.saved_ckpts = checkpoint["saved_ckpts"]
+                self.pruned_ckpts = checkpoint.get("pruned_ckpts", [])
+                self.val_acc_step_or_eoch = checkpoint["val_acc_step_or_eoch"]
+                self.val_loss_step_or_eoch = checkpoint["val_loss_step_or_eoch"]
+                self.best_step_or_epoch = checkpoint["best_step_or_epoch"]
+                print(f"Checkpoint loaded successfully from '{ckpt}'")
+            elif os.path.isfile(ckpt):
                 checkpoint = torch.load(ckpt, map_location="cpu")
                 self.start_epoch = checkpoint['epoch'] + 1
                 # self.model.load_state_dict(checkpoint['state_dict'])
@@ -231,6 +317,7 @@ class Trainer:
                     scaler.load_state_dict(checkpoint['scaler_state'])
                 
                 self.saved_ckpts = checkpoint["saved_ckpts"]
+                self.pruned_ckpts = checkpoint.get("pruned_ckpts", [])
                 self.val_acc_step_or_eoch = checkpoint["val_acc_step_or_eoch"] if "val_acc_step_or_eoch" in checkpoint else {}
                 self.val_loss_step_or_eoch = checkpoint["val_loss_step_or_eoch"] if "val_loss_step_or_eoch" in checkpoint else {}
                 self.best_step_or_epoch = checkpoint["best_step_or_epoch"] if "best_step_or_epoch" in checkpoint else ""
@@ -272,10 +359,19 @@ class Trainer:
         iterator_stop = torch.tensor(0).to(self.device)
 
         dataloader_train.batch_sampler.set_epoch(epoch)
+        low_sync = self.low_sync and (self.use_ddp or self.use_fsdp)
+        data_iter = iter(dataloader_train)
+        if low_sync:
+            # every rank runs the same number of steps, no per-batch iterator_stop check
+            data_iter = itertools.islice(data_iter, self.plan_num_steps(dataloader_train))
+            # local [loss_sum, loss_num, acc_sum, acc_num], reduced in one call every log_interval steps
+            local_metrics = torch.zeros(4, dtype=torch.float32, device=self.device)
+        # with profiling, the time stamps wait for the pending cuda kernels
+        tick = self.profiler.now if self.profiler is not None else time.perf_counter
         time_beg = time.perf_counter()
         time5 = time_beg
-        for batch_idx, batch in enumerate(dataloader_train):
-            if self.use_ddp or self.use_fsdp:
+        for batch_idx, batch in enumerate(data_iter):
+            if (self.use_ddp or self.use_fsdp) and not low_sync:
                 dist.all_reduce(iterator_stop, dist.ReduceOp.SUM)
                 if iterator_stop > 0:
                     break
@@ -283,21 +379,25 @@ class Trainer:
             time1 = time.perf_counter()
             speed_stats["data_load"] = f"{time1-time_beg:0.3f}"
 
-            batch = to_device(batch, self.device)
+            worker_stats = batch.pop("worker_stats", None)
+            num_samples = next((v.shape[0] for v in batch.values() if isinstance(v, torch.Tensor)), 0)
+            # the collated batches are pinned, the copy overlaps with the host side work
+            batch = to_device(batch, self.device, non_blocking=True)
+            optim_time = 0.0
 
             my_context = nullcontext
             if self.use_ddp or self.use_fsdp:
                 my_context = model.no_sync if batch_idx % accum_grad != 0 else my_context
             with my_context():
-                time2 = time.perf_counter()
+                time2 = tick()
                 with maybe_autocast(self.use_fp16):
                     retval = model(**batch)
                     
-                time3 = time.perf_counter()
+                time3 = tick()
                 speed_stats["forward_time"] = f"{time3 - time2:0.3f}"
                 loss, stats, weight = retval
                 stats = {k: v for k, v in stats.items() if v is not None}
-                if self.use_ddp or self.use_fsdp:
+                if (self.use_ddp or self.use_fsdp) and not low_sync:
                     # Apply weighted averaging for loss and stats
                     loss = (loss * weight.type(loss.dtype)).sum()
                     # if distributed, this method can also apply all_reduce()
@@ -315,13 +415,23 @@ class Trainer:
                     scaler.scale(loss).backward()
                 else:
                     loss.backward()
-                time4 = time.perf_counter()
+                time4 = tick()
                 speed_stats["backward_time"] = f"{time4 - time3:0.3f}"
                 
-                self.train_loss_avg = (self.train_loss_avg*batch_idx + loss.detach().cpu().item())/(batch_idx+1)
-                if "acc" in stats:
-                    self.train_acc_avg = (self.train_acc_avg * batch_idx + stats["acc"].detach().cpu().item()) / (batch_idx + 1)
-                if self.use_ddp or self.use_fsdp:
+                if low_sync:
+                    local_metrics[0] += loss.detach().float()
+                    local_metrics[1] += 1
+                    if "acc" in stats:
+                        local_metrics[2] += stats["acc"].detach().float()
+                        local_metrics[3] += 1
+                    if (batch_idx + 1) % self.log_interval == 0:
+                        self.reduce_train_metrics(local_metrics)
+                    
+                else:
+                    self.train_loss_avg = (self.train_loss_avg*batch_idx + loss.detach().cpu().item())/(batch_idx+1)
+                    if "acc" in stats:
+                        self.train_acc_avg = (self.train_acc_avg * batch_idx + stats["acc"].detach().cpu().item()) / (batch_idx + 1)
+                if (self.use_ddp or self.use_fsdp) and not low_sync:
                     train_loss_avg = torch.tensor(self.train_loss_avg, dtype=torch.float32).to(self.device)
                     train_acc_avg = torch.tensor(self.train_acc_avg, dtype=torch.float32).to(self.device)
                     dist.all_reduce(train_loss_avg, op=dist.ReduceOp.SUM)
@@ -344,10 +454,24 @@ class Trainer:
                             f"The grad norm is {grad_norm}. Skipping updating the model."
                         )
                         optim.zero_grad()  # Reset gradients
+                        if self.profiler is not None:
+                            self.update_profiler(batch_idx,
+                                                 {"data_wait": time1 - time_beg,
+                                                  "to_device": time2 - time1,
+                                                  "forward": time3 - time2,
+                                                  "backward": time4 - time3,
+                                                  "optim": 0.0,
+                                                  },
+                                                 num_samples=num_samples,
+                                                 worker_stats=worker_stats,
+                                                 writer=writer,
+                                                 skipped=True,
+                                                 )
+                        time_beg = time.perf_counter()
                         continue
                 
                 # Execute an optimization step (update model parameters)
-                if self.use_ddp or self.use_fsdp:
+                if (self.use_ddp or self.use_fsdp) and not low_sync:
                     dist.barrier()
                 if self.use_fp16:
                     scaler.step(optim)
@@ -357,9 +481,10 @@ class Trainer:
                 scheduler.step()
                 # Clear gradients for the next accumulation stage
                 optim.zero_grad(set_to_none=True)
-                total_time = f"{time.perf_counter() - time5:0.3f}"
+                total_time = f"{tick() - time5:0.3f}"
                 time5 = time.perf_counter()
-                speed_stats["optim_time"] = f"{time5 - time4:0.3f}"
+                optim_time = time5 - time4
+                speed_stats["optim_time"] = f"{optim_time:0.3f}"
     
                 speed_stats["total_time"] = total_time
                 lr = scheduler.get_last_lr()[0]
@@ -376,6 +501,19 @@ class Trainer:
                          tag="train",
                          )
 
+            if self.profiler is not None:
+                self.update_profiler(batch_idx,
+                                     {"data_wait": time1 - time_beg,
+                                      "to_device": time2 - time1,
+                                      "forward": time3 - time2,
+                                      "backward": time4 - time3,
+                                      "optim": optim_time,
+                                      },
+                                     num_samples=num_samples,
+                                     worker_stats=worker_stats,
+                                     writer=writer,
+                                     )
+
             if (batch_idx + 1) % self.validate_interval == 0:
                 self.validate_epoch(
                     model=model,
@@ -390,15 +528,52 @@ class Trainer:
 
             time_beg = time.perf_counter()
         else:
-            if self.use_ddp or self.use_fsdp:
+            if (self.use_ddp or self.use_fsdp) and not low_sync:
                 iterator_stop.fill_(1)
                 dist.all_reduce(iterator_stop, dist.ReduceOp.SUM)
                 
+        if low_sync:
+            self.reduce_train_metrics(local_metrics)
+        if self.profiler is not None:
+            self.profiler.dump(epoch)
         if self.use_ddp or self.use_fsdp:
             dist.barrier()
             iterator_stop = torch.tensor(0).to(self.device)
         
-        
+    def update_profiler(self, batch_idx, stage_times, num_samples=0, worker_stats=None, writer=None, skipped=False):
+        """Add the step timings to the throughput profiler, and log them every `log_interval` steps."""
+        self.profiler.update(stage_times, num_samples=num_samples, worker_stats=worker_stats, skipped=skipped)
+        if (batch_idx + 1) % self.log_interval == 0:
+            self.profiler.log(writer, self.batch_total)
+
+    def plan_num_steps(self, dataloader):
+        """
+        Number of batches every rank trains on in this epoch.
+
+        The batch sampler records its per-rank plan (`num_batches`) when the dataloader iterator
+        is created, the minimum over ranks is agreed with a single all_reduce.
+        """
+        batch_sampler = dataloader.batch_sampler
+        num_batches = getattr(batch_sampler, "num_batches", None)
+        if num_batches is None:
+            num_batches = len(batch_sampler)
+        num_steps = torch.tensor(num_batches, dtype=torch.int64, device=self.device)
+        dist.all_reduce(num_steps, op=dist.ReduceOp.MIN)
+        num_steps = int(num_steps.item())
+        if num_steps < num_batches:
+            logging.info(f"rank: {self.rank}, drop {num_batches - num_steps} batches to keep ranks in step")
+        return num_steps
+
+    def reduce_train_metrics(self, local_metrics):
+        """All-reduce the locally accumulated loss/acc sums in one call and update the epoch averages."""
+        metrics = local_metrics.clone()
+        dist.all_reduce(metrics, op=dist.ReduceOp.SUM)
+        metrics = metrics.tolist()
+        if metrics[1] > 0:
+            self.train_loss_avg = metrics[0] / metrics[1]
+        if metrics[3] > 0:
+            self.train_acc_avg = metrics[2] / metrics[3]
+
 
     def validate_epoch(self,
                        model=None,
@@ -432,7 +607,8 @@ class Trainer:
                         break
                 time1 = time.perf_counter()
                 speed_stats["data_load"] = f"{time1 - time5:0.3f}"
-                batch = to_device(batch, self.device)
+                batch.pop("worker_stats", None)
+                batch = to_device(batch, self.device, non_blocking=True)
                 time2 = time.perf_counter()
                 retval = model(**batch)
                 time3 = time.perf_counter()
@@ -549,6 +725,9 @@ class Trainer:
         
     def close(self, writer=None):
         
+        if self.checkpoint_writer is not None:
+            self.checkpoint_writer.close()
+
         if self.use_ddp or self.use_fsdp:
             dist.barrier()
         
@@ -0,0 +1,180 @@
+import time
+import logging
+from typing import Dict, List
+
+import torch
+
+
+class BucketStats:
+    """Hits of the shape buckets and padding overhead of a compiled model."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.hits = {}
+        self.misses = {}
+        self.valid_frames = {}
+        self.padded_frames = {}
+
+    def update(self, name, bucket=None, valid=0, padded=0):
+        if bucket is None:
+            self.misses[name] = self.misses.get(name, 0) + 1
+            return
+        hits = self.hits.setdefault(name, {})
+        hits[bucket] = hits.get(bucket, 0) + 1
+        self.valid_frames[name] = self.valid_frames.get(name, 0) + valid
+        self.padded_frames[name] = self.padded_frames.get(name, 0) + padded
+
+    def summary(self):
+        summary = {}
+        for name in sorted(set(self.hits) | set(self.misses)):
+            num_hits = sum(self.hits.get(name, {}).values())
+            num_calls = num_hits + self.misses.get(name, 0)
+            valid = self.valid_frames.get(name, 0)
+            padded = self.padded_frames.get(name, 0)
+            summary[name] = {
+                "calls": num_calls,
+                "hit_rate": num_hits / max(num_calls, 1),
+                "buckets": {f"{b}x{t}": n for (b, t), n in sorted(self.hits.get(name, {}).items())},
+                # padded positions (batch and time) over the valid ones of the bucketed calls
+                "padding_overhead": padded / max(valid, 1),
+            }
+        return summary
+
+
+def next_bucket(length, buckets):
+    for bucket in buckets:
+        if length <= bucket:
+            return bucket
+    return None
+
+
+def pad_batch_time(x, batch_size, length):
+    """Pad (B, T, ...) to (batch_size, length, ...): the time with zeros, the batch with copies of the first row."""
+    if x.size(1) < length:
+        x = torch.nn.functional.pad(x, [0, 0] * (x.dim() - 2) + [0, length - x.size(1)])
+    if x.size(0) < batch_size:
+        x = torch.cat([x, x[:1].expand(batch_size - x.size(0), *x.shape[1:])], dim=0)
+    return x
+
+
+def pad_batch(x, batch_size):
+    if x.size(0) < batch_size:
+        x = torch.cat([x, x[:1].expand(batch_size - x.size(0), *x.shape[1:])], dim=0)
+    return x
+
+
+def unpad_outputs(outputs, batch_size, padded_length, length):
+    if isinstance(outputs, torch.Tensor):
+        if outputs.dim() > 0 and outputs.size(0) != batch_size:
+            outputs = outputs[:batch_size]
+        if outputs.dim() > 1 and outputs.size(1) == padded_length:
+            outputs = outputs[:, :length]
+        return outputs
+    if isinstance(outputs, (list, tuple)):
+        return type(outputs)(unpad_outputs(o, batch_size, padded_length, length) for o in outputs)
+    return outputs
+
+
+class BucketedFunction:
+    """
+    Calls `fn` compiled with static shapes: the sequence arguments (index -> buckets of their time dim) are
+    padded to the next bucket and the batch to the next batch bucket, so that at most one graph is compiled
+    per bucket. The lengths arguments keep the valid lengths, the models mask the padded frames. Batch
+    rows, and the time of the outputs aligned with `out_arg`, are removed from the outputs. Shapes above
+    the largest bucket run the eager `fn`.
+    """
+
+    def __init__(self, fn, name: str, bucket_args: Dict[int, List[int]], batch_buckets: List[int],
+                 stats: BucketStats, out_arg: int = 0, **compile_kwargs):
+        self.fn = fn
+        self.name = name
+        self.bucket_args = bucket_args
+        self.batch_buckets = batch_buckets
+        self.stats = stats
+        self.out_arg = out_arg
+        self.compiled_fn = torch.compile(fn, dynamic=False, **compile_kwargs)
+
+    def __call__(self, *args, **kwargs):
+        batch_size = args[0].size(0)
+        padded_batch_size = next_bucket(batch_size, self.batch_buckets)
+        lengths = {i: args[i].size(1) for i in self.bucket_args}
+        padded_lengths = {i: next_bucket(lengths[i], buckets) for i, buckets in self.bucket_args.items()}
+        if padded_batch_size is None or any(length is None for length in padded_lengths.values()):
+            self.stats.update(self.name)
+            return self.fn(*args, **kwargs)
+
+        args = list(args)
+        for i, arg in enumerate(args):
+            if not isinstance(arg, torch.Tensor) or arg.dim() == 0:
+                continue
+            if i in self.bucket_args:
+                args[i] = pad_batch_time(arg, padded_batch_size, padded_lengths[i])
+            else:
+                args[i] = pad_batch(arg, padded_batch_size)
+        outputs = self.compiled_fn(*args, **kwargs)
+
+        valid = batch_size * lengths[self.out_arg]
+        bucket = (padded_batch_size, padded_lengths[self.out_arg])
+        self.stats.update(self.name, bucket, valid, padded_batch_size * padded_lengths[self.out_arg] - valid)
+        return unpad_outputs(outputs, batch_size, padded_lengths[self.out_arg], lengths[self.out_arg])
+
+
+def compile_model(model, **kwargs):
+    """
+    Opt-in compiled inference (`AutoModel(..., compile=True)`): `model.encode` and, for the paraformer family,
+    `model.cal_decoder_with_predictor` are replaced by `BucketedFunction`s compiled with torch.compile (inductor,
+    also on cpu), and all the buckets are compiled at startup unless compile_warmup=False.
+
+    compile_buckets: encoder input frames (after lfr), default [128, 256, 512, 1024]
+    compile_token_buckets: decoder tokens, default [32, 64, 128, 256]
+    compile_batch_buckets: batch sizes, default [1]
+    compile_backend / compile_mode: torch.compile backend and mode
+    """
+    stats = BucketStats()
+    buckets = sorted(kwargs.get("compile_buckets", None) or [128, 256, 512, 1024])
+    token_buckets = sorted(kwargs.get("compile_token_buckets", None) or [32, 64, 128, 256])
+    batch_buckets = sorted(kwargs.get("compile_batch_buckets", None) or [1])
+    compile_kwargs = {"backend": kwargs.get("compile_backend", "inductor")}
+    if kwargs.get("compile_mode", None) is not None:
+        compile_kwargs["mode"] = kwargs["compile_mode"]
+    # one graph per bucket and function
+    num_graphs = len(batch_buckets) * len(buckets) * (len(token_buckets) + 1)
+    torch._dynamo.config.cache_size_limit = max(torch._dynamo.config.cache_size_limit, num_graphs)
+
+    model.encode = BucketedFunction(model.encode, "encoder", {0: buckets}, batch_buckets, stats,
+                                    out_arg=0, **compile_kwargs)
+    has_decoder = hasattr(model, "cal_decoder_with_predictor")
+    if has_decoder:
+        # (encoder_out, encoder_out_lens, sematic_embeds, ys_pad_lens), the encoder time is bucketed again
+        # as the encoder outputs are cut to the valid length
+        model.cal_decoder_with_predictor = BucketedFunction(model.cal_decoder_with_predictor, "decoder",
+                                                            {0: buckets, 2: token_buckets}, batch_buckets, stats,
+                                                            out_arg=2, **compile_kwargs)
+
+    input_size = kwargs.get("input_size", None)
+    if kwargs.get("compile_warmup", True) and input_size is not None:
+        beg_time = time.perf_counter()
+        param = next(model.parameters())
+        with torch.no_grad():
+            for batch_size in batch_buckets:
+                for length in buckets:
+                    speech = torch.randn(batch_size, length, input_size, device=param.device, dtype=param.dtype)
+                    speech_lengths = torch.full((batch_size,), length, dtype=torch.int32, device=param.device)
+                    encoder_out, encoder_out_lens = model.encode(speech, speech_lengths)[:2]
+                    if isinstance(encoder_out, tuple):
+                        encoder_out = encoder_out[0]
+                    if not has_decoder:
+                        continue
+                    for num_tokens in token_buckets:
+                        if num_tokens > encoder_out.size(1):
+                            break
+                        embeds = torch.randn(batch_size, num_tokens, encoder_out.size(-1), device=param.device,
+                                             dtype=param.dtype)
+                        embeds_lengths = torch.full((batch_size,), num_tokens, dtype=torch.int64,
+                                                    device=param.device)
+                        model.cal_decoder_with_predictor(encoder_out, encoder_out_lens, embeds, embeds_lengths)
+        logging.info(f"compiled buckets in {time.perf_counter() - beg_time:.1f}s")
+    stats.reset()
+    return stats
@@ -50,19 +50,59 @@ def _onnx(model,
 	)
 	
 	if quantize:
-		from onnxruntime.quantization import QuantType, quantize_dynamic
-		import onnx
+		# quantize: True / "dynamic", or "static" calibrated on calib_data (default: the export input)
+		from funasr.utils.quantize_utils import quantize_and_check
 		quant_model_path = model_path.replace(".onnx", "_quant.onnx")
 		if not os.path.exists(quant_model_path):
-			onnx_model = onnx.load(model_path)
-			nodes = [n.name for n in onnx_model.graph.node]
-			nodes_to_exclude = [m for m in nodes if 'output' in m or 'bias_encoder' in m or 'bias_decoder' in m]
-			quantize_dynamic(
-				model_input=model_path,
-				model_output=quant_model_path,
-				op_types_to_quantize=['MatMul'],
-				per_channel=True,
-				reduce_range=False,
-				weight_type=QuantType.QUInt8,
-				nodes_to_exclude=nodes_to_exclude,
-			)
\ No newline at end of file
+			calib_data = kwargs.pop("calib_data", None)
+			quantize_and_check(model,
+			                   model_path,
+			                   quant_model_path,
+			                   quantize=quantize,
+			                   calib_data=calib_data if calib_data is not None else data_in,
+			                   **kwargs
+			                   )
+
+def export_torchscripts(model,
+                        data_in=None,
+						quantize: bool = False,
+						device: str = "cpu",
+						**kwargs):
+	model_scripts = model.export(**kwargs)
+	export_dir = kwargs.get("output_dir", os.path.dirname(kwargs.get("init_param")))
+	os.makedirs(export_dir, exist_ok=True)
+	
+	if not isinstance(model_scripts, (list, tuple)):
+		model_scripts = (model_scripts,)
+	for m in model_scripts:
+		m.eval()
+		_torchscripts(m,
+		              path=export_dir,
+		              quantize=quantize,
+		              device=device,
+		              )
+		print("output dir: {}".format(export_dir))
+	
+	return export_dir
+
+
+def _torchscripts(model, path, quantize: bool = False, device: str = "cpu"):
+	# the model is traced with its export dummy inputs, the same graph as the onnx export:
+	# model.onnx -> model.torchscripts, decoder.onnx -> decoder.torchscripts (streaming paraformer)
+	dummy_input = model.export_dummy_inputs()
+	if not isinstance(dummy_input, (list, tuple)):
+		dummy_input = (dummy_input,)
+	dummy_input = tuple(i.to(device) for i in dummy_input)
+	model = model.to(device)
+	
+	export_name = model.export_name() if hasattr(model, "export_name") else "model.onnx"
+	model_path = os.path.join(path, export_name.replace(".onnx", ".torchscripts"))
+	model_script = torch.jit.trace(model, dummy_input, check_trace=False)
+	model_script.save(model_path)
+	
+	if quantize and device == "cpu":
+		quant_model_path = model_path.replace(".torchscripts", "_quant.torchscripts")
+		if not os.path.exists(quant_model_path):
+			model_quant = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+			model_script = torch.jit.trace(model_quant, dummy_input, check_trace=False)
+			model_script.save(quant_model_path)
@@ -0,0 +1,66 @@
+import re
+from functools import lru_cache
+from collections import OrderedDict
+
+
+class HotwordCache:
+    """
+    LRU cache of the hotword lists of the contextual models, keyed by content: the token ids of a hotword text
+    (by its hash) and their bias encoder outputs (by the token ids and the device), so that a repeated list is
+    neither tokenized nor encoded again.
+    """
+
+    def __init__(self, max_size: int = 16):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        value = self.entries.get(key)
+        if value is not None:
+            self.entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+        return value
+
+
+def hotword_key(hotword_list):
+    """hashable content of a list of token id lists"""
+    return tuple(tuple(int(i) for i in hw) for hw in hotword_list)
+
+
+@lru_cache(maxsize=8)
+def load_seg_dict(seg_dict_file):
+    seg_dict = {}
+    assert isinstance(seg_dict_file, str)
+    with open(seg_dict_file, "r", encoding="utf8") as f:
+        lines = f.readlines()
+        for line in lines:
+            s = line.strip().split()
+            key = s[0]
+            value = s[1:]
+            seg_dict[key] = " ".join(value)
+    return seg_dict
+
+
+def seg_tokenize(txt, seg_dict):
+    pattern = re.compile(r'^[\u4E00-\u9FA50-9]+$')
+    out_txt = ""
+    for word in txt:
+        word = word.lower()
+        if word in seg_dict:
+            out_txt += seg_dict[word] + " "
+        else:
+            if pattern.match(word):
+                for char in word:
+                    if char in seg_dict:
+                        out_txt += seg_dict[char] + " "
+                    else:
+                        out_txt += "<unk>" + " "
+            else:
+                out_txt += "<unk>" + " "
+    return out_txt.strip().split()
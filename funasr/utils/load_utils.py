@@ -78,6 +78,8 @@ def load_audio_text_image_video(data_or_path_or_list, fs: int = 16000, audio_fs:
             kwargs["cache"]["is_streaming_input"] = False
     elif isinstance(data_or_path_or_list, str) and data_type == "text" and tokenizer is not None:
         data_or_path_or_list = tokenizer.encode(data_or_path_or_list)
+    elif isinstance(data_or_path_or_list, bytes):  # int16 pcm bytes
+        data_or_path_or_list = torch.from_numpy(load_bytes(data_or_path_or_list))
     elif isinstance(data_or_path_or_list, np.ndarray):  # audio sample point
         data_or_path_or_list = torch.from_numpy(data_or_path_or_list).squeeze()  # [n_samples,]
     elif isinstance(data_or_path_or_list, str) and data_type == "kaldi_ark":
@@ -101,20 +103,90 @@ def load_audio_text_image_video(data_or_path_or_list, fs: int = 16000, audio_fs:
         data_or_path_or_list = resampler(data_or_path_or_list[None, :])[0, :]
     return data_or_path_or_list
 
-def load_bytes(input):
+def load_bytes(input, out=None):
+    """
+    int16 pcm bytes to float32 samples in [-1, 1): one pass over a view of the bytes, written into `out`
+    (a float32 array of the same length) if given.
+    """
     middle_data = np.frombuffer(input, dtype=np.int16)
-    middle_data = np.asarray(middle_data)
-    if middle_data.dtype.kind not in 'iu':
-        raise TypeError("'middle_data' must be an array of integers")
-    dtype = np.dtype('float32')
-    if dtype.kind != 'f':
-        raise TypeError("'dtype' must be a floating point type")
-    
-    i = np.iinfo(middle_data.dtype)
-    abs_max = 2 ** (i.bits - 1)
-    offset = i.min + abs_max
-    array = np.frombuffer((middle_data.astype(dtype) - offset) / abs_max, dtype=np.float32)
-    return array
+    if out is None:
+        out = np.empty(len(middle_data), dtype=np.float32)
+    # the scale is a power of two, so the product is exactly (x - offset) / abs_max with offset 0 for int16
+    np.multiply(middle_data, np.float32(1.0 / 32768), out=out)
+    return out
+
+
+class PcmBuffer:
+    """
+    Preallocated float32 samples of one stream, for the streaming models: the chunks received (int16 pcm bytes are
+    converted straight into the storage) are appended after the unread samples, and `samples()` gives a tensor view
+    of the unread ones, without concatenation. When the storage end is reached the unread tail is moved to the
+    front, and the storage is only grown if it does not fit, so that the views stay contiguous.
+    """
+
+    def __init__(self, capacity: int = 16000 * 4):
+        self.storage = np.empty(capacity, dtype=np.float32)
+        self.start = 0
+        self.end = 0
+
+    def __len__(self):
+        return self.end - self.start
+
+    def reserve(self, num_samples: int):
+        if self.end + num_samples <= len(self.storage):
+            return
+        unread = len(self)
+        if unread + num_samples > len(self.storage):
+            storage = np.empty(max(unread + num_samples, 2 * len(self.storage)), dtype=np.float32)
+            storage[:unread] = self.storage[self.start:self.end]
+            self.storage = storage
+        elif unread > 0:
+            self.storage[:unread] = self.storage[self.start:self.end]
+        self.start, self.end = 0, unread
+
+    def append(self, data):
+        """data: int16 pcm bytes, or float samples as np.ndarray / torch.Tensor"""
+        if isinstance(data, (bytes, bytearray, memoryview)):
+            num_samples = len(data) // 2
+            self.reserve(num_samples)
+            load_bytes(data, out=self.storage[self.end:self.end + num_samples])
+        else:
+            if isinstance(data, torch.Tensor):
+                data = data.detach().cpu().numpy()
+            data = np.asarray(data).reshape(-1)
+            num_samples = len(data)
+            self.reserve(num_samples)
+            self.storage[self.end:self.end + num_samples] = data
+        self.end += num_samples
+
+    def samples(self):
+        """view of the unread samples, valid until the next append"""
+        return torch.from_numpy(self.storage[self.start:self.end])
+
+    def consume(self, num_samples: int):
+        self.start = min(self.start + num_samples, self.end)
+        if self.start == self.end:
+            self.start = self.end = 0
+
+    def reset(self):
+        self.start = self.end = 0
+
+
+def load_audio_to_buffer(data_in, buffer: PcmBuffer, fs: int = 16000, audio_fs: int = 16000, **kwargs):
+    """
+    Appends the audio of one stream (batch_size 1) to `buffer` and returns the view of its unread samples. int16 pcm
+    bytes at the model rate are converted into the buffer directly, the other inputs via load_audio_text_image_video.
+    """
+    data = data_in[0] if isinstance(data_in, (list, tuple)) and len(data_in) == 1 else data_in
+    if isinstance(data, bytes) and audio_fs == fs:
+        buffer.append(data)
+    else:
+        audio_sample_list = load_audio_text_image_video(data_in, fs=fs, audio_fs=audio_fs, **kwargs)
+        if isinstance(data_in, (list, tuple)):
+            assert len(audio_sample_list) == 1, "batch_size must be set 1"
+            audio_sample_list = audio_sample_list[0]
+        buffer.append(audio_sample_list)
+    return buffer.samples()
 
 def extract_fbank(data, data_len = None, data_type: str="sound", frontend=None, **kwargs):
     if isinstance(data, np.ndarray):
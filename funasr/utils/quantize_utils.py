@@ -0,0 +1,245 @@
+import os
+import json
+import time
+import logging
+
+import numpy as np
+
+from funasr.metrics.wer import compute_wer_by_line
+from funasr.utils.load_utils import load_audio_text_image_video, extract_fbank
+
+
+def export_nodes_to_exclude(model_path):
+    """Nodes kept in float: the output projections and the hotword bias layers."""
+    import onnx
+    onnx_model = onnx.load(model_path)
+    nodes = [n.name for n in onnx_model.graph.node]
+    return [m for m in nodes if 'output' in m or 'bias_encoder' in m or 'bias_decoder' in m]
+
+
+def supports_calibration(model):
+    # speech models (paraformer, fsmn-vad) and text models (ct-transformer)
+    return hasattr(model, "export_input_names") and model.export_input_names()[0] in ("speech", "inputs")
+
+
+def make_onnx_inputs(model, data, frontend=None, tokenizer=None, **kwargs):
+    """
+    The onnx feeds of one utterance (wav path or waveform for speech models, text for punctuation models),
+    computed with the frontend / tokenizer of the torch model. The inputs which do not come from the data
+    (e.g. the fsmn-vad caches) are zeros shaped like the export dummy inputs.
+    """
+    input_names = model.export_input_names()
+    feeds = {}
+    if input_names[0] == "inputs":
+        from funasr.models.ct_transformer.utils import split_words
+        text = load_audio_text_image_video(data, data_type="text")
+        tokens = split_words(text, jieba_usr_dict=getattr(model, "jieba_usr_dict", None))
+        tokens_int = tokenizer.encode(tokens)
+        feeds["inputs"] = np.array([tokens_int], dtype=np.int32)
+        feeds["text_lengths"] = np.array([len(tokens_int)], dtype=np.int32)
+    else:
+        audio = load_audio_text_image_video(data, fs=frontend.fs, audio_fs=kwargs.get("fs", 16000))
+        speech, speech_lengths = extract_fbank(audio, data_type="sound", frontend=frontend)
+        feeds[input_names[0]] = speech.cpu().numpy()
+        if len(input_names) > 1 and input_names[1] == "speech_lengths":
+            feeds["speech_lengths"] = speech_lengths.cpu().numpy().reshape(-1).astype(np.int32)
+    dummy_inputs = model.export_dummy_inputs()
+    for name, dummy in zip(input_names, dummy_inputs):
+        if name not in feeds:
+            feeds[name] = np.zeros(dummy.shape, dtype=dummy.cpu().numpy().dtype)
+    return feeds
+
+
+class CalibrationReader:
+    """Feeds of the calibration data for onnxruntime `quantize_static`."""
+
+    def __init__(self, model, data_list, calib_num=100, **kwargs):
+        self.model = model
+        self.data_list = data_list[:calib_num] if calib_num > 0 else data_list
+        self.kwargs = kwargs
+        self.index = 0
+
+    def get_next(self):
+        if self.index >= len(self.data_list):
+            return None
+        data = self.data_list[self.index]
+        self.index += 1
+        return make_onnx_inputs(self.model, data, **self.kwargs)
+
+    def rewind(self):
+        self.index = 0
+
+
+def quantize_onnx(model, model_path, quant_model_path, quantize="dynamic", calib_data=None, **kwargs):
+    """
+    INT8 quantization of the MatMul weights of an exported model.
+
+    quantize: "dynamic" (True), activations quantized at runtime; "static", activation ranges calibrated
+        on `calib_data` (wav list / wav.scp / jsonl, or text for punctuation models, at most calib_num items)
+        and stored as QDQ nodes. Models without calibration support fall back to dynamic.
+    """
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    quantize = "dynamic" if quantize is True else quantize
+    nodes_to_exclude = export_nodes_to_exclude(model_path)
+    if quantize == "static" and not supports_calibration(model):
+        logging.warning(f"static quantization is not supported for {os.path.basename(model_path)}, use dynamic")
+        quantize = "dynamic"
+    if quantize == "dynamic":
+        quantize_dynamic(
+            model_input=model_path,
+            model_output=quant_model_path,
+            op_types_to_quantize=['MatMul'],
+            per_channel=True,
+            reduce_range=False,
+            weight_type=QuantType.QUInt8,
+            nodes_to_exclude=nodes_to_exclude,
+        )
+    elif quantize == "static":
+        from onnxruntime.quantization import CalibrationMethod, QuantFormat, quantize_static
+        from funasr.auto.auto_model import prepare_data_iterator
+
+        _, data_list = prepare_data_iterator(calib_data) if calib_data is not None else ([], [])
+        data_list = [data for data in data_list if data is not None]
+        if not len(data_list):
+            raise ValueError("static quantization requires calibration data: input=wav.scp or calib_data=wav.scp")
+        reader = CalibrationReader(model, data_list, calib_num=kwargs.get("calib_num", 100),
+                                   frontend=kwargs.get("frontend"), tokenizer=kwargs.get("tokenizer"),
+                                   fs=kwargs.get("fs", 16000))
+        quantize_static(
+            model_input=model_path,
+            model_output=quant_model_path,
+            calibration_data_reader=reader,
+            quant_format=QuantFormat.QDQ,
+            op_types_to_quantize=['MatMul'],
+            per_channel=True,
+            reduce_range=False,
+            activation_type=QuantType.QUInt8,
+            weight_type=QuantType.QInt8,
+            nodes_to_exclude=nodes_to_exclude,
+            calibrate_method=CalibrationMethod.MinMax,
+            extra_options={"MatMulConstBOnly": True},
+        )
+    else:
+        raise ValueError(f"Unsupported quantize: {quantize}, choose from dynamic, static")
+    return quantize
+
+
+def model_size(model_path):
+    """Size of an onnx model in MB, with its external data file if any."""
+    paths = [model_path, model_path + ".data"]
+    return sum(os.path.getsize(path) for path in paths if os.path.exists(path)) / 1024 / 1024
+
+
+def decode_tokens(outputs, tokenizer):
+    """Greedy paraformer hypothesis as a list of characters, as funasr_onnx decodes it."""
+    logits, token_num = outputs[0], outputs[1]
+    token_int = logits[0, :int(token_num[0])].argmax(axis=-1).tolist()
+    # remove blank and eos, the tokens 0 and 2
+    token_int = [i for i in token_int if i not in (0, 2)]
+    text = tokenizer.tokens2text(tokenizer.ids2tokens(token_int))
+    return list(text.replace(" ", "").replace("@@", ""))
+
+
+def evaluate_quantized(model, model_path, quant_model_path, test_data, test_text=None, **kwargs):
+    """
+    Compare the INT8 model with the FP32 model on a local test set: file size, latency per utterance and
+    accuracy. For paraformer the accuracy is the CER against the references of `test_text` (key text),
+    or of the INT8 hypotheses against the FP32 ones without references; for fsmn-vad and ct-transformer,
+    whose outputs are frame / token classes, it is the agreement of the argmax classes with FP32.
+    """
+    import onnxruntime
+    from funasr.auto.auto_model import prepare_data_iterator
+
+    key_list, data_list = prepare_data_iterator(test_data)
+    refs = {}
+    if test_text is not None:
+        with open(test_text, "r", encoding="utf-8") as fin:
+            for line in fin:
+                items = line.strip().split(maxsplit=1)
+                if len(items) == 2:
+                    refs[items[0]] = list(items[1].replace(" ", ""))
+
+    sess_opt = onnxruntime.SessionOptions()
+    sess_opt.intra_op_num_threads = kwargs.get("quant_test_threads", 1)
+    sessions = {name: onnxruntime.InferenceSession(path, sess_options=sess_opt, providers=["CPUExecutionProvider"])
+                for name, path in (("fp32", model_path), ("int8", quant_model_path))}
+    is_asr = model.export_input_names()[:2] == ["speech", "speech_lengths"] and kwargs.get("tokenizer") is not None
+    latency = {"fp32": 0.0, "int8": 0.0}
+    errors = {"fp32": 0, "int8": 0, "int8_vs_fp32": 0}
+    num_ref_chars, num_fp32_chars, num_agree, num_classes = 0, 0, 0, 0
+    for key, data in zip(key_list, data_list):
+        feeds = make_onnx_inputs(model, data, **kwargs)
+        outputs = {}
+        for name, session in sessions.items():
+            time_beg = time.perf_counter()
+            outputs[name] = session.run(None, feeds)
+            latency[name] += time.perf_counter() - time_beg
+        if is_asr:
+            hyps = {name: decode_tokens(outputs[name], kwargs["tokenizer"]) for name in sessions}
+            errors["int8_vs_fp32"] += compute_wer_by_line(hyps["int8"], hyps["fp32"])["wrong"]
+            num_fp32_chars += len(hyps["fp32"])
+            if key in refs:
+                for name in sessions:
+                    errors[name] += compute_wer_by_line(hyps[name], refs[key])["wrong"]
+                num_ref_chars += len(refs[key])
+        else:
+            fp32_classes = outputs["fp32"][0].argmax(axis=-1)
+            num_agree += int((outputs["int8"][0].argmax(axis=-1) == fp32_classes).sum())
+            num_classes += fp32_classes.size
+
+    num_utts = max(len(data_list), 1)
+    size = {name: model_size(path) for name, path in (("fp32", model_path), ("int8", quant_model_path))}
+    report = {
+        "model": os.path.basename(model_path),
+        "num_utts": len(data_list),
+        "size_mb": {**size, "ratio": size["int8"] / size["fp32"]},
+        "latency_ms": {"fp32": latency["fp32"] * 1000 / num_utts, "int8": latency["int8"] * 1000 / num_utts,
+                       "speedup": latency["fp32"] / latency["int8"] if latency["int8"] > 0 else 0.0},
+    }
+    if is_asr:
+        report["cer_int8_vs_fp32"] = errors["int8_vs_fp32"] * 100 / max(num_fp32_chars, 1)
+        if num_ref_chars > 0:
+            report["cer"] = {"fp32": errors["fp32"] * 100 / num_ref_chars, "int8": errors["int8"] * 100 / num_ref_chars}
+            report["cer"]["delta"] = report["cer"]["int8"] - report["cer"]["fp32"]
+    else:
+        report["agreement"] = num_agree / max(num_classes, 1)
+    return report
+
+
+def check_quantized(report, max_cer_delta=0.5, min_agreement=0.98):
+    """Accuracy gate of the INT8 model, returns the reason of the rejection or None."""
+    if "cer" in report:
+        if report["cer"]["delta"] > max_cer_delta:
+            return f"CER {report['cer']['fp32']:.2f}% -> {report['cer']['int8']:.2f}%, delta > {max_cer_delta}"
+    elif "cer_int8_vs_fp32" in report:
+        if report["cer_int8_vs_fp32"] > max_cer_delta:
+            return f"CER of INT8 against FP32 hypotheses {report['cer_int8_vs_fp32']:.2f}% > {max_cer_delta}"
+    elif report["agreement"] < min_agreement:
+        return f"agreement with FP32 {report['agreement']:.4f} < {min_agreement}"
+    return None
+
+
+def quantize_and_check(model, model_path, quant_model_path, quantize="dynamic", calib_data=None, **kwargs):
+    """
+    Quantize the exported model and, when `quant_test_data` is given, gate it on a local test set: the
+    report is written to `{quant_model_path}.json` and a rejected model is renamed to `*_quant.rejected.onnx`
+    (funasr_onnx loads `model_quant.onnx` only), raising a RuntimeError.
+    """
+    mode = quantize_onnx(model, model_path, quant_model_path, quantize=quantize, calib_data=calib_data, **kwargs)
+    test_data = kwargs.get("quant_test_data", None)
+    if test_data is None:
+        return None
+    report = evaluate_quantized(model, model_path, quant_model_path, test_data,
+                                test_text=kwargs.get("quant_test_text", None), **kwargs)
+    report["quantize"] = mode
+    reason = check_quantized(report, max_cer_delta=kwargs.get("quant_max_cer_delta", 0.5),
+                             min_agreement=kwargs.get("quant_min_agreement", 0.98))
+    report["accepted"] = reason is None
+    with open(quant_model_path.replace(".onnx", ".json"), "w", encoding="utf-8") as fout:
+        json.dump(report, fout, indent=2, ensure_ascii=False)
+    logging.info(f"quantization report: {report}")
+    if reason is not None:
+        os.replace(quant_model_path, quant_model_path.replace(".onnx", ".rejected.onnx"))
+        raise RuntimeError(f"INT8 model {quant_model_path} rejected: {reason}")
+    return report
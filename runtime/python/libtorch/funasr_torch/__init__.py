@@ -1,2 +1,4 @@
 # -*- encoding: utf-8 -*-
 from .paraformer_bin import Paraformer
+from .paraformer_online_bin import Paraformer as ParaformerOnline
+from .vad_bin import Fsmn_vad_online
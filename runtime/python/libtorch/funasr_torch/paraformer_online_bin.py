@@ -0,0 +1,291 @@
+# -*- encoding: utf-8 -*-
+# Copyright FunASR (https://github.com/alibaba-damo-academy/FunASR). All Rights Reserved.
+#  MIT License  (https://opensource.org/licenses/MIT)
+
+import os.path
+import json
+from pathlib import Path
+from typing import List, Union, Tuple
+
+import librosa
+import numpy as np
+import torch
+
+from .utils.utils import (CharTokenizer, TokenIDConverter, get_logger,
+                          read_yaml)
+from .utils.postprocess_utils import sentence_postprocess
+from .utils.frontend import WavFrontendOnline
+
+logging = get_logger()
+
+
+@torch.jit.script
+def cif_chunk(hidden: torch.Tensor, alphas: torch.Tensor,
+              threshold: float) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor, torch.Tensor]:
+    """
+    Continuous integrate-and-fire of one chunk without the frame loop: with the cumulative sum c_t of the
+    alphas, frame t contributes to token k the part of [c_t - alpha_t, c_t] inside [k, k + 1) * threshold,
+    which is what the sequential integration of `cif_search` computes (a frame fires at most one token).
+
+    hidden: (B, T, D), the cif_hidden cache prepended; alphas: (B, T), the cif_alphas cache prepended
+    return: acoustic_embeds (B, N, D), token_num (B,), cif_hidden (B, 1, D), cif_alphas (B, 1)
+    """
+    batch_size, len_time, hidden_size = hidden.size(0), hidden.size(1), hidden.size(2)
+    csum = torch.cumsum(alphas, dim=1)
+    prev = csum - alphas
+    token_num = torch.floor(csum[:, -1] / threshold).to(torch.int32)
+    max_token_num = int(token_num.max())
+    # the token being integrated after the last fire is the slot token_num
+    bounds = torch.arange(max_token_num + 1, device=alphas.device, dtype=alphas.dtype) * threshold
+    lower = torch.maximum(prev.unsqueeze(-1), bounds[None, None, :])
+    upper = torch.minimum(csum.unsqueeze(-1), bounds[None, None, :] + threshold)
+    weights = torch.clamp(upper - lower, min=0.0)
+    embeds = torch.bmm(weights.transpose(1, 2), hidden)
+
+    slots = torch.arange(max_token_num + 1, device=alphas.device)[None, :]
+    acoustic_embeds = embeds[:, :max_token_num] * (slots[:, :max_token_num] < token_num[:, None]).unsqueeze(-1)
+    cif_alphas = csum[:, -1:] - token_num[:, None].to(alphas.dtype) * threshold
+    cif_hidden = torch.gather(embeds, 1, token_num.long().view(batch_size, 1, 1).expand(batch_size, 1, hidden_size))
+    cif_hidden = torch.where(cif_alphas[:, :, None] > 0.0, cif_hidden / cif_alphas[:, :, None].clamp(min=1e-8),
+                             cif_hidden)
+    return acoustic_embeds, token_num, cif_hidden, cif_alphas
+
+
+class Paraformer():
+    """
+    Streaming Paraformer with TorchScript models exported by
+    `AutoModel(model="paraformer-zh-streaming").export(type="torchscripts")`: `model.torchscripts` (encoder and
+    predictor weights of a chunk) and `decoder.torchscripts` (decoder of a chunk with its fsmn caches).
+
+    Every stage takes its cache as tensors and returns the updated ones, kept in the `cache` of the param_dict:
+    feats (overlap frames of the encoder), cif_hidden / cif_alphas (predictor), decoder_fsmn (decoder), so the
+    chunk step runs without python state besides the flags is_final / last_chunk. The cif is a scripted
+    function computed without the frame loop.
+    """
+    def __init__(self, model_dir: Union[str, Path] = None,
+                 batch_size: int = 1,
+                 chunk_size: List = None,
+                 device_id: Union[str, int] = "-1",
+                 quantize: bool = False,
+                 intra_op_num_threads: int = 1,
+                 **kwargs
+                 ):
+
+        if not Path(model_dir).exists():
+            raise FileNotFoundError(f'{model_dir} does not exist.')
+
+        encoder_model_file = os.path.join(model_dir, 'model.torchscripts')
+        decoder_model_file = os.path.join(model_dir, 'decoder.torchscripts')
+        if quantize:
+            encoder_model_file = os.path.join(model_dir, 'model_quant.torchscripts')
+            decoder_model_file = os.path.join(model_dir, 'decoder_quant.torchscripts')
+        config_file = os.path.join(model_dir, 'config.yaml')
+        cmvn_file = os.path.join(model_dir, 'am.mvn')
+        config = read_yaml(config_file)
+        token_list = os.path.join(model_dir, 'tokens.json')
+        with open(token_list, 'r', encoding='utf-8') as f:
+            token_list = json.load(f)
+
+        self.converter = TokenIDConverter(token_list)
+        self.tokenizer = CharTokenizer()
+        self.frontend = WavFrontendOnline(
+            cmvn_file=cmvn_file,
+            **config['frontend_conf']
+        )
+        self.device = torch.device("cpu") if int(device_id) == -1 else torch.device("cuda", int(device_id))
+        if self.device.type == "cpu":
+            torch.set_num_threads(intra_op_num_threads)
+        self.encoder = torch.jit.load(encoder_model_file, map_location=self.device).eval()
+        self.decoder = torch.jit.load(decoder_model_file, map_location=self.device).eval()
+        self.batch_size = batch_size
+        self.chunk_size = chunk_size if chunk_size is not None else [5, 10, 5]
+        self.encoder_output_size = config["encoder_conf"]["output_size"]
+        self.fsmn_layer = config["decoder_conf"]["num_blocks"]
+        self.fsmn_lorder = config["decoder_conf"]["kernel_size"] - 1
+        self.fsmn_dims = config["encoder_conf"]["output_size"]
+        self.feats_dims = config["frontend_conf"]["n_mels"] * config["frontend_conf"]["lfr_m"]
+        self.cif_threshold = config["predictor_conf"]["threshold"]
+        self.tail_threshold = config["predictor_conf"]["tail_threshold"]
+        # inverse timescales of the sinusoidal position encoding, positions start from 1
+        depth = self.feats_dims
+        log_timescale_increment = np.log(10000.0) / (depth / 2 - 1)
+        self.inv_timescales = torch.exp(torch.arange(depth // 2, dtype=torch.float32) * (-log_timescale_increment))
+
+    def prepare_cache(self, cache: dict = None, batch_size=1):
+        if cache is None:
+            cache = {}
+        if len(cache) > 0:
+            return cache
+        cache["start_idx"] = 0
+        cache["cif_hidden"] = torch.zeros((batch_size, 1, self.encoder_output_size), device=self.device)
+        cache["cif_alphas"] = torch.zeros((batch_size, 1), device=self.device)
+        cache["chunk_size"] = self.chunk_size
+        cache["last_chunk"] = False
+        cache["feats"] = torch.zeros((batch_size, self.chunk_size[0] + self.chunk_size[2], self.feats_dims),
+                                     device=self.device)
+        cache["decoder_fsmn"] = [torch.zeros((batch_size, self.fsmn_dims, self.fsmn_lorder), device=self.device)
+                                 for _ in range(self.fsmn_layer)]
+        return cache
+
+    def position_encoding(self, feats: torch.Tensor, start_idx: int = 0) -> torch.Tensor:
+        positions = torch.arange(start_idx + 1, start_idx + 1 + feats.shape[1], dtype=torch.float32)
+        scaled_time = positions[:, None] * self.inv_timescales[None, :]
+        encoding = torch.cat((torch.sin(scaled_time), torch.cos(scaled_time)), dim=1)
+        return feats + encoding[None].to(feats.device)
+
+    def add_overlap_chunk(self, feats: torch.Tensor, cache: dict = None):
+        if not cache:
+            return feats
+        # process last chunk
+        overlap_feats = torch.cat((cache["feats"], feats), dim=1)
+        if cache["is_final"]:
+            cache["feats"] = overlap_feats[:, -self.chunk_size[0]:, :]
+            if not cache["last_chunk"]:
+                padding_length = sum(self.chunk_size) - overlap_feats.shape[1]
+                overlap_feats = torch.nn.functional.pad(overlap_feats, (0, 0, 0, padding_length))
+        else:
+            cache["feats"] = overlap_feats[:, -(self.chunk_size[0] + self.chunk_size[2]):, :]
+        return overlap_feats
+
+    def __call__(self, audio_in: np.ndarray, **kwargs):
+        waveforms = np.expand_dims(audio_in, axis=0)
+        param_dict = kwargs.get('param_dict', dict())
+        is_final = param_dict.get('is_final', False)
+        cache = param_dict.get('cache', dict())
+        asr_res = []
+
+        if waveforms.shape[1] < 16 * 60 and is_final and len(cache) > 0:
+            cache["last_chunk"] = True
+            feats = cache["feats"]
+            feats_len = torch.tensor([feats.shape[1]], dtype=torch.int32, device=self.device)
+            asr_res = self.infer(feats, feats_len, cache)
+            return asr_res
+
+        feats, feats_len = self.extract_feat(waveforms, is_final)
+        if feats.shape[1] != 0:
+            feats = self.position_encoding(feats * self.encoder_output_size ** 0.5, cache.get("start_idx", 0))
+            cache = self.prepare_cache(cache)
+            cache["is_final"] = is_final
+            cache["start_idx"] += feats.shape[1]
+            if is_final:
+                if feats.shape[1] + self.chunk_size[2] <= self.chunk_size[1]:
+                    cache["last_chunk"] = True
+                    feats = self.add_overlap_chunk(feats, cache)
+                else:
+                    # first chunk
+                    feats_chunk1 = self.add_overlap_chunk(feats[:, :self.chunk_size[1], :], cache)
+                    feats_len = torch.tensor([feats_chunk1.shape[1]], dtype=torch.int32, device=self.device)
+                    asr_res_chunk1 = self.infer(feats_chunk1, feats_len, cache)
+
+                    # last chunk
+                    cache["last_chunk"] = True
+                    feats_chunk2 = self.add_overlap_chunk(
+                        feats[:, -(feats.shape[1] + self.chunk_size[2] - self.chunk_size[1]):, :], cache)
+                    feats_len = torch.tensor([feats_chunk2.shape[1]], dtype=torch.int32, device=self.device)
+                    asr_res_chunk2 = self.infer(feats_chunk2, feats_len, cache)
+
+                    asr_res_chunk = asr_res_chunk1 + asr_res_chunk2
+                    res = {}
+                    for pred in asr_res_chunk:
+                        for key, value in pred.items():
+                            if key in res:
+                                res[key][0] += value[0]
+                                res[key][1].extend(value[1])
+                            else:
+                                res[key] = [value[0], value[1]]
+                    return [res]
+            else:
+                feats = self.add_overlap_chunk(feats, cache)
+
+            feats_len = torch.tensor([feats.shape[1]], dtype=torch.int32, device=self.device)
+            asr_res = self.infer(feats, feats_len, cache)
+
+        return asr_res
+
+    def infer_chunk(self, feats: torch.Tensor, feats_len: torch.Tensor, cif_hidden: torch.Tensor,
+                    cif_alphas: torch.Tensor, decoder_fsmn: List[torch.Tensor], last_chunk: bool = False):
+        """
+        One chunk through the encoder, predictor and decoder with explicit caches:
+        (feats, feats_len, cif_hidden, cif_alphas, decoder_fsmn) -> (logits, token_num, cif_hidden, cif_alphas,
+        decoder_fsmn), logits is None when no token fires in the chunk.
+        """
+        with torch.no_grad():
+            # encoder forward
+            enc, enc_len, alphas = self.encoder(feats, feats_len)
+
+            # predictor forward, only the frames of the chunk (without the left / right context) fire
+            alphas = alphas.clone()
+            alphas[:, :self.chunk_size[0]] = 0.0
+            alphas[:, sum(self.chunk_size[:2]):] = 0.0
+            hidden = torch.cat((cif_hidden, enc), dim=1)
+            alphas = torch.cat((cif_alphas, alphas), dim=1)
+            if last_chunk:
+                batch_size = hidden.shape[0]
+                hidden = torch.cat((hidden, hidden.new_zeros((batch_size, 1, hidden.shape[2]))), dim=1)
+                alphas = torch.cat((alphas, alphas.new_full((batch_size, 1), self.tail_threshold)), dim=1)
+            acoustic_embeds, token_num, cif_hidden, cif_alphas = cif_chunk(hidden, alphas, self.cif_threshold)
+
+            # decoder forward
+            logits = None
+            if acoustic_embeds.shape[1] > 0:
+                logits, _, out_caches = self.decoder(enc, enc_len, acoustic_embeds, token_num, *decoder_fsmn)
+                decoder_fsmn = [item[:, :, -self.fsmn_lorder:] for item in out_caches]
+        return logits, token_num, cif_hidden, cif_alphas, decoder_fsmn
+
+    def infer(self, feats: torch.Tensor, feats_len: torch.Tensor, cache):
+        logits, token_num, cache["cif_hidden"], cache["cif_alphas"], cache["decoder_fsmn"] = self.infer_chunk(
+            feats, feats_len, cache["cif_hidden"], cache["cif_alphas"], cache["decoder_fsmn"], cache["last_chunk"])
+        asr_res = []
+        if logits is not None:
+            preds = self.decode(logits.cpu().numpy(), token_num.cpu().numpy())
+            for pred in preds:
+                pred = sentence_postprocess(pred)
+                asr_res.append({'preds': pred})
+        return asr_res
+
+    def load_data(self,
+                  wav_content: Union[str, np.ndarray, List[str]], fs: int = None) -> List:
+        def load_wav(path: str) -> np.ndarray:
+            waveform, _ = librosa.load(path, sr=fs)
+            return waveform
+
+        if isinstance(wav_content, np.ndarray):
+            return [wav_content]
+
+        if isinstance(wav_content, str):
+            return [load_wav(wav_content)]
+
+        if isinstance(wav_content, list):
+            return [load_wav(path) for path in wav_content]
+
+        raise TypeError(
+            f'The type of {wav_content} is not in [str, np.ndarray, list]')
+
+    def extract_feat(self,
+                     waveforms: np.ndarray, is_final: bool = False
+                     ) -> Tuple[torch.Tensor, torch.Tensor]:
+        waveforms_lens = np.zeros(waveforms.shape[0]).astype(np.int32)
+        for idx, waveform in enumerate(waveforms):
+            waveforms_lens[idx] = waveform.shape[-1]
+
+        feats, feats_len = self.frontend.extract_fbank(waveforms, waveforms_lens, is_final)
+        feats = torch.from_numpy(feats.astype(np.float32)).to(self.device)
+        if feats.dim() != 3:
+            feats = feats.reshape(waveforms.shape[0], 0, self.feats_dims)
+        return feats, torch.from_numpy(np.array(feats_len).astype(np.int32))
+
+    def decode(self, am_scores: np.ndarray, token_nums: int) -> List[str]:
+        return [self.decode_one(am_score, token_num)
+                for am_score, token_num in zip(am_scores, token_nums)]
+
+    def decode_one(self,
+                   am_score: np.ndarray,
+                   valid_token_num: int) -> List[str]:
+        token_int = am_score[:valid_token_num].argmax(axis=-1).tolist()
+
+        # remove blank symbol id, which is assumed to be 0, and eos
+        token_int = list(filter(lambda x: x not in (0, 2), token_int))
+
+        # Change integer-ids to tokens
+        token = self.converter.ids2tokens(token_int)
+        return token
@@ -0,0 +1,120 @@
+# -*- encoding: utf-8 -*-
+# Copyright FunASR (https://github.com/alibaba-damo-academy/FunASR). All Rights Reserved.
+#  MIT License  (https://opensource.org/licenses/MIT)
+
+import os.path
+from pathlib import Path
+from typing import List, Union, Tuple
+
+import librosa
+import numpy as np
+import torch
+
+from .utils.utils import get_logger, read_yaml
+from .utils.frontend import WavFrontendOnline
+from .utils.e2e_vad import E2EVadModel
+
+logging = get_logger()
+
+
+class Fsmn_vad_online():
+    """
+    Streaming FSMN-VAD with the TorchScript model exported by
+    `AutoModel(model="fsmn-vad").export(type="torchscripts")` (`model.torchscripts`).
+
+    The fsmn memory of every layer is passed to the scripted model as tensors and the updated ones are returned,
+    they are kept in the `in_cache` of the param_dict as with `funasr_onnx.Fsmn_vad_online`.
+    """
+    def __init__(self, model_dir: Union[str, Path] = None,
+                 batch_size: int = 1,
+                 device_id: Union[str, int] = "-1",
+                 quantize: bool = False,
+                 intra_op_num_threads: int = 1,
+                 max_end_sil: int = None,
+                 **kwargs
+                 ):
+        if not Path(model_dir).exists():
+            raise FileNotFoundError(f'{model_dir} does not exist.')
+
+        model_file = os.path.join(model_dir, 'model.torchscripts')
+        if quantize:
+            model_file = os.path.join(model_dir, 'model_quant.torchscripts')
+        config_file = os.path.join(model_dir, 'config.yaml')
+        cmvn_file = os.path.join(model_dir, 'am.mvn')
+        config = read_yaml(config_file)
+
+        self.frontend = WavFrontendOnline(
+            cmvn_file=cmvn_file,
+            **config['frontend_conf']
+        )
+        self.device = torch.device("cpu") if int(device_id) == -1 else torch.device("cuda", int(device_id))
+        if self.device.type == "cpu":
+            torch.set_num_threads(intra_op_num_threads)
+        self.model = torch.jit.load(model_file, map_location=self.device).eval()
+        self.batch_size = batch_size
+        self.vad_scorer = E2EVadModel(config["model_conf"])
+        self.max_end_sil = max_end_sil if max_end_sil is not None else config["model_conf"]["max_end_silence_time"]
+        self.encoder_conf = config["encoder_conf"]
+
+    def prepare_cache(self, in_cache: list = None):
+        if in_cache is None:
+            in_cache = []
+        if len(in_cache) > 0:
+            return in_cache
+        fsmn_layers = self.encoder_conf["fsmn_layers"]
+        proj_dim = self.encoder_conf["proj_dim"]
+        lorder = self.encoder_conf["lorder"]
+        for i in range(fsmn_layers):
+            cache = torch.zeros((1, proj_dim, lorder - 1, 1), dtype=torch.float32, device=self.device)
+            in_cache.append(cache)
+        return in_cache
+
+    def __call__(self, audio_in: np.ndarray, **kwargs) -> List:
+        waveforms = np.expand_dims(audio_in, axis=0)
+
+        param_dict = kwargs.get('param_dict', dict())
+        is_final = param_dict.get('is_final', False)
+        feats, feats_len = self.extract_feat(waveforms, is_final)
+        segments = []
+        if feats.size != 0:
+            in_cache = param_dict.get('in_cache', list())
+            in_cache = self.prepare_cache(in_cache)
+            feats = torch.from_numpy(feats).to(self.device)
+            scores, param_dict['in_cache'] = self.infer(feats, in_cache)
+            waveforms = self.frontend.get_waveforms()
+            segments = self.vad_scorer(scores.cpu().numpy(), waveforms, is_final=is_final,
+                                       max_end_sil=self.max_end_sil, online=True)
+        return segments
+
+    def load_data(self,
+                  wav_content: Union[str, np.ndarray, List[str]], fs: int = None) -> List:
+        def load_wav(path: str) -> np.ndarray:
+            waveform, _ = librosa.load(path, sr=fs)
+            return waveform
+
+        if isinstance(wav_content, np.ndarray):
+            return [wav_content]
+
+        if isinstance(wav_content, str):
+            return [load_wav(wav_content)]
+
+        if isinstance(wav_content, list):
+            return [load_wav(path) for path in wav_content]
+
+        raise TypeError(
+            f'The type of {wav_content} is not in [str, np.ndarray, list]')
+
+    def extract_feat(self,
+                     waveforms: np.ndarray, is_final: bool = False
+                     ) -> Tuple[np.ndarray, np.ndarray]:
+        waveforms_lens = np.zeros(waveforms.shape[0]).astype(np.int32)
+        for idx, waveform in enumerate(waveforms):
+            waveforms_lens[idx] = waveform.shape[-1]
+
+        feats, feats_len = self.frontend.extract_fbank(waveforms, waveforms_lens, is_final)
+        return feats.astype(np.float32), feats_len.astype(np.int32)
+
+    def infer(self, feats: torch.Tensor, in_cache: List[torch.Tensor]) -> Tuple[torch.Tensor, List[torch.Tensor]]:
+        with torch.no_grad():
+            scores, out_caches = self.model(feats, *in_cache)
+        return scores, list(out_caches)
@@ -0,0 +1,12 @@
+from funasr_onnx import AsrPipeline
+from pathlib import Path
+
+asr_model_dir = "damo/speech_paraformer-large_asr_nat-zh-cn-16k-common-vocab8404-pytorch"
+vad_model_dir = "damo/speech_fsmn_vad_zh-cn-16k-common-pytorch"
+punc_model_dir = "damo/punc_ct-transformer_zh-cn-common-vocab272727-pytorch"
+wav_path = '{}/.cache/modelscope/hub/damo/speech_fsmn_vad_zh-cn-16k-common-pytorch/example/vad_example.wav'.format(Path.home())
+
+model = AsrPipeline(asr_model_dir, vad_model_dir, punc_model_dir, batch_size_s=300)
+
+result = model(wav_path)
+print(result)
@@ -1,6 +1,10 @@
 # -*- encoding: utf-8 -*-
 from .paraformer_bin import Paraformer, ContextualParaformer, SeacoParaformer
+from .paraformer_online_bin import Paraformer as ParaformerOnline
+from .paraformer_online_bin import ParaformerOnlineStreams
 from .vad_bin import Fsmn_vad
 from .vad_bin import Fsmn_vad_online
 from .punc_bin import CT_Transformer
 from .punc_bin import CT_Transformer_VadRealtime
+from .pipeline_bin import AsrPipeline
+from .utils.session_pool import SessionPool
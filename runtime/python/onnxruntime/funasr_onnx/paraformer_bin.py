@@ -36,6 +36,9 @@ class Paraformer():
                  quantize: bool = False,
                  intra_op_num_threads: int = 4,
                  cache_dir: str = None,
+                 batch_size_frames: int = 0,
+                 sort_by_length: bool = True,
+                 io_binding: bool = False,
                  **kwargs
                  ):
         if not Path(model_dir).exists():
@@ -80,8 +83,11 @@ class Paraformer():
             cmvn_file=cmvn_file,
             **config['frontend_conf']
         )
-        self.ort_infer = OrtInferSession(model_file, device_id, intra_op_num_threads=intra_op_num_threads)
+        self.ort_infer = OrtInferSession(model_file, device_id, intra_op_num_threads=intra_op_num_threads,
+                                         io_binding=io_binding)
         self.batch_size = batch_size
+        self.batch_size_frames = batch_size_frames
+        self.sort_by_length = sort_by_length
         self.plot_timestamp_to = plot_timestamp_to
         if "predictor_bias" in config['model_conf'].keys():
             self.pred_bias = config['model_conf']['predictor_bias']
@@ -94,42 +100,75 @@ class Paraformer():
 
     def __call__(self, wav_content: Union[str, np.ndarray, List[str]], **kwargs) -> List:
         waveform_list = self.load_data(wav_content, self.frontend.opts.frame_opts.samp_freq)
-        waveform_nums = len(waveform_list)
-        asr_res = []
-        for beg_idx in range(0, waveform_nums, self.batch_size):
-            
-            end_idx = min(waveform_nums, beg_idx + self.batch_size)
-            feats, feats_len = self.extract_feat(waveform_list[beg_idx:end_idx])
-            try:
-                outputs = self.infer(feats, feats_len)
-                am_scores, valid_token_lens = outputs[0], outputs[1]
-                if len(outputs) == 4:
-                    # for BiCifParaformer Inference
-                    us_alphas, us_peaks = outputs[2], outputs[3]
-                else:
-                    us_alphas, us_peaks = None, None
-            except ONNXRuntimeError:
-                #logging.warning(traceback.format_exc())
-                logging.warning("input wav is silence or noise")
-                preds = ['']
+        asr_res = [None] * len(waveform_list)
+        for batch_idx in self.make_batches(waveform_list):
+            batch_res = self.infer_batch([waveform_list[i] for i in batch_idx])
+            for i, res in zip(batch_idx, batch_res):
+                asr_res[i] = res
+        return [res for res in asr_res if res is not None]
+
+    def make_batches(self, waveform_list: List[np.ndarray]) -> List[List[int]]:
+        """
+        Split the waveforms into batches of indices. With sort_by_length the waveforms are sorted by
+        duration, so that a long waveform does not pad a batch of short ones. A batch holds at most
+        batch_size waveforms and, if batch_size_frames > 0, at most batch_size_frames padded fbank
+        frames (number of waveforms * frames of the longest one).
+        """
+        lengths = [len(waveform) for waveform in waveform_list]
+        if self.sort_by_length:
+            order = sorted(range(len(lengths)), key=lambda i: lengths[i])
+        else:
+            order = list(range(len(lengths)))
+        frame_opts = self.frontend.opts.frame_opts
+        frame_shift = int(frame_opts.samp_freq * frame_opts.frame_shift_ms / 1000)
+        batches, batch, max_frames = [], [], 0
+        for i in order:
+            frames = lengths[i] // frame_shift + 1
+            if len(batch) and (len(batch) >= self.batch_size or (self.batch_size_frames > 0 and
+                               (len(batch) + 1) * max(max_frames, frames) > self.batch_size_frames)):
+                batches.append(batch)
+                batch, max_frames = [], 0
+            batch.append(i)
+            max_frames = max(max_frames, frames)
+        if len(batch):
+            batches.append(batch)
+        return batches
+
+    def infer_batch(self, waveform_list: List[np.ndarray]) -> List:
+        """Recognize the waveforms as one padded batch, the results are aligned with the inputs
+        (None for every waveform when the session fails, e.g. on silence or noise)."""
+        feats, feats_len = self.extract_feat(waveform_list)
+        try:
+            outputs = self.infer(feats, feats_len)
+            am_scores, valid_token_lens = outputs[0], outputs[1]
+            if len(outputs) == 4:
+                # for BiCifParaformer Inference
+                us_alphas, us_peaks = outputs[2], outputs[3]
             else:
-                preds = self.decode(am_scores, valid_token_lens)
-                if us_peaks is None:
-                    for pred in preds:
-                        if self.language == "en-bpe":
-                            pred = sentence_postprocess_sentencepiece(pred)
-                        else:
-                            pred = sentence_postprocess(pred)
-                        asr_res.append({'preds': pred})
+                us_alphas, us_peaks = None, None
+        except ONNXRuntimeError:
+            #logging.warning(traceback.format_exc())
+            logging.warning("input wav is silence or noise")
+            return [None] * len(waveform_list)
+
+        asr_res = []
+        preds = self.decode(am_scores, valid_token_lens)
+        if us_peaks is None:
+            for pred in preds:
+                if self.language == "en-bpe":
+                    pred = sentence_postprocess_sentencepiece(pred)
                 else:
-                    for pred, us_peaks_ in zip(preds, us_peaks):
-                        raw_tokens = pred
-                        timestamp, timestamp_raw = time_stamp_lfr6_onnx(us_peaks_, copy.copy(raw_tokens))
-                        text_proc, timestamp_proc, _ = sentence_postprocess(raw_tokens, timestamp_raw)
-                        # logging.warning(timestamp)
-                        if len(self.plot_timestamp_to):
-                            self.plot_wave_timestamp(waveform_list[0], timestamp, self.plot_timestamp_to)
-                        asr_res.append({'preds': text_proc, 'timestamp': timestamp_proc, "raw_tokens": raw_tokens})
+                    pred = sentence_postprocess(pred)
+                asr_res.append({'preds': pred})
+        else:
+            for pred, us_peaks_ in zip(preds, us_peaks):
+                raw_tokens = pred
+                timestamp, timestamp_raw = time_stamp_lfr6_onnx(us_peaks_, copy.copy(raw_tokens))
+                text_proc, timestamp_proc, _ = sentence_postprocess(raw_tokens, timestamp_raw)
+                # logging.warning(timestamp)
+                if len(self.plot_timestamp_to):
+                    self.plot_wave_timestamp(waveform_list[0], timestamp, self.plot_timestamp_to)
+                asr_res.append({'preds': text_proc, 'timestamp': timestamp_proc, "raw_tokens": raw_tokens})
         return asr_res
 
     def plot_wave_timestamp(self, wav, text_timestamp, dest):
@@ -168,7 +207,7 @@ class Paraformer():
             return [load_wav(wav_content)]
 
         if isinstance(wav_content, list):
-            return [load_wav(path) for path in wav_content]
+            return [load_wav(path) if isinstance(path, str) else path for path in wav_content]
 
         raise TypeError(
             f'The type of {wav_content} is not in [str, np.ndarray, list]')
@@ -189,13 +228,11 @@ class Paraformer():
 
     @staticmethod
     def pad_feats(feats: List[np.ndarray], max_feat_len: int) -> np.ndarray:
-        def pad_feat(feat: np.ndarray, cur_len: int) -> np.ndarray:
-            pad_width = ((0, max_feat_len - cur_len), (0, 0))
-            return np.pad(feat, pad_width, 'constant', constant_values=0)
-
-        feat_res = [pad_feat(feat, feat.shape[0]) for feat in feats]
-        feats = np.array(feat_res).astype(np.float32)
-        return feats
+        # one allocation for the whole batch, the rows are copied in place
+        feats_pad = np.zeros((len(feats), max_feat_len, feats[0].shape[-1]), dtype=np.float32)
+        for i, feat in enumerate(feats):
+            feats_pad[i, :feat.shape[0]] = feat
+        return feats_pad
 
     def infer(self, feats: np.ndarray,
               feats_len: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
@@ -245,6 +282,9 @@ class ContextualParaformer(Paraformer):
                  quantize: bool = False,
                  intra_op_num_threads: int = 4,
                  cache_dir: str = None,
+                 batch_size_frames: int = 0,
+                 sort_by_length: bool = True,
+                 io_binding: bool = False,
                  **kwargs
                  ):
 
@@ -299,10 +339,13 @@ class ContextualParaformer(Paraformer):
             cmvn_file=cmvn_file,
             **config['frontend_conf']
         )
-        self.ort_infer_bb = OrtInferSession(model_bb_file, device_id, intra_op_num_threads=intra_op_num_threads)
+        self.ort_infer_bb = OrtInferSession(model_bb_file, device_id, intra_op_num_threads=intra_op_num_threads,
+                                            io_binding=io_binding)
         self.ort_infer_eb = OrtInferSession(model_eb_file, device_id, intra_op_num_threads=intra_op_num_threads)
 
         self.batch_size = batch_size
+        self.batch_size_frames = batch_size_frames
+        self.sort_by_length = sort_by_length
         self.plot_timestamp_to = plot_timestamp_to
         if "predictor_bias" in config['model_conf'].keys():
             self.pred_bias = config['model_conf']['predictor_bias']
@@ -314,6 +357,16 @@ class ContextualParaformer(Paraformer):
                  hotwords: str,
                  **kwargs) -> List:
         # make hotword list
+        bias_embed = self.embed_hotwords(hotwords)
+        waveform_list = self.load_data(wav_content, self.frontend.opts.frame_opts.samp_freq)
+        asr_res = [None] * len(waveform_list)
+        for batch_idx in self.make_batches(waveform_list):
+            batch_res = self.infer_batch([waveform_list[i] for i in batch_idx], bias_embed)
+            for i, res in zip(batch_idx, batch_res):
+                asr_res[i] = res
+        return [res for res in asr_res if res is not None]
+
+    def embed_hotwords(self, hotwords: str) -> np.ndarray:
         hotwords, hotwords_length = self.proc_hotword(hotwords)
         # import pdb; pdb.set_trace()
         [bias_embed] = self.eb_infer(hotwords, hotwords_length)
@@ -321,27 +374,23 @@ class ContextualParaformer(Paraformer):
         bias_embed = bias_embed.transpose(1, 0, 2)
         _ind = np.arange(0, len(hotwords)).tolist()
         bias_embed = bias_embed[_ind, hotwords_length.tolist()]
-        waveform_list = self.load_data(wav_content, self.frontend.opts.frame_opts.samp_freq)
-        waveform_nums = len(waveform_list)
-        asr_res = []
-        for beg_idx in range(0, waveform_nums, self.batch_size):
-            end_idx = min(waveform_nums, beg_idx + self.batch_size)
-            feats, feats_len = self.extract_feat(waveform_list[beg_idx:end_idx])
-            bias_embed = np.expand_dims(bias_embed, axis=0)
-            bias_embed = np.repeat(bias_embed, feats.shape[0], axis=0)
-            try:
-                outputs = self.bb_infer(feats, feats_len, bias_embed)
-                am_scores, valid_token_lens = outputs[0], outputs[1]
-            except ONNXRuntimeError:
-                #logging.warning(traceback.format_exc())
-                logging.warning("input wav is silence or noise")
-                preds = ['']
-            else:
-                preds = self.decode(am_scores, valid_token_lens)
-                for pred in preds:
-                    pred = sentence_postprocess(pred)
-                    asr_res.append({'preds': pred})
-        return asr_res
+        return bias_embed
+
+    def infer_batch(self, waveform_list: List[np.ndarray], bias_embed: np.ndarray) -> List:
+        """Recognize the waveforms as one padded batch with the hotword embeddings of `embed_hotwords`,
+        the results are aligned with the inputs (None for every waveform when the session fails)."""
+        feats, feats_len = self.extract_feat(waveform_list)
+        bias_embed = np.expand_dims(bias_embed, axis=0)
+        bias_embed = np.repeat(bias_embed, feats.shape[0], axis=0)
+        try:
+            outputs = self.bb_infer(feats, feats_len, bias_embed)
+            am_scores, valid_token_lens = outputs[0], outputs[1]
+        except ONNXRuntimeError:
+            #logging.warning(traceback.format_exc())
+            logging.warning("input wav is silence or noise")
+            return [None] * len(waveform_list)
+        preds = self.decode(am_scores, valid_token_lens)
+        return [{'preds': sentence_postprocess(pred)} for pred in preds]
 
     def proc_hotword(self, hotwords):
         hotwords = hotwords.split(" ")
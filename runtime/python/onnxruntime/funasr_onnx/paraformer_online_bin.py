@@ -17,10 +17,38 @@ from .utils.frontend import WavFrontendOnline, SinusoidalPositionEncoderOnline
 logging = get_logger()
 
 
+def cif_batch(hidden: np.ndarray, alphas: np.ndarray, threshold: float):
+    """
+    Continuous integrate-and-fire of a batch of chunks without the frame loop: with the cumulative sum c_t of the
+    alphas, frame t contributes to token k the part of [c_t - alpha_t, c_t] inside [k, k + 1) * threshold,
+    which is what the sequential integration computes (a frame fires at most one token).
+
+    hidden: (B, T, D), the cif_hidden cache prepended; alphas: (B, T), the cif_alphas cache prepended
+    return: acoustic_embeds (B, N, D), token_num (B,), cif_hidden (B, 1, D), cif_alphas (B, 1)
+    """
+    batch_size = hidden.shape[0]
+    csum = np.cumsum(alphas, axis=1)
+    prev = csum - alphas
+    token_num = np.floor(csum[:, -1] / threshold).astype(np.int32)
+    max_token_num = int(token_num.max()) if batch_size > 0 else 0
+    # the token being integrated after the last fire is the slot token_num
+    bounds = np.arange(max_token_num + 1, dtype=alphas.dtype) * threshold
+    weights = np.minimum(csum[:, :, None], bounds + threshold) - np.maximum(prev[:, :, None], bounds)
+    embeds = np.matmul(np.clip(weights, 0.0, None).transpose(0, 2, 1), hidden)
+
+    fired = np.arange(max_token_num)[None, :] < token_num[:, None]
+    acoustic_embeds = embeds[:, :max_token_num] * fired[:, :, None]
+    cif_alphas = (csum[:, -1:] - token_num[:, None] * threshold).astype(np.float32)
+    cif_hidden = embeds[np.arange(batch_size), token_num][:, None, :]
+    cif_hidden = np.where(cif_alphas[:, :, None] > 0.0, cif_hidden / np.maximum(cif_alphas, 1e-8)[:, :, None],
+                          cif_hidden).astype(np.float32)
+    return acoustic_embeds, token_num, cif_hidden, cif_alphas
+
+
 class Paraformer():
     def __init__(self, model_dir: Union[str, Path] = None,
                  batch_size: int = 1,
-                 chunk_size: List = [5, 10, 5],
+                 chunk_size: List = None,
                  device_id: Union[str, int] = "-1",
                  quantize: bool = False,
                  intra_op_num_threads: int = 4,
@@ -78,7 +106,7 @@ class Paraformer():
         self.ort_decoder_infer = OrtInferSession(decoder_model_file, device_id,
                                                  intra_op_num_threads=intra_op_num_threads)
         self.batch_size = batch_size
-        self.chunk_size = chunk_size
+        self.chunk_size = chunk_size if chunk_size is not None else [5, 10, 5]
         self.encoder_output_size = config["encoder_conf"]["output_size"]
         self.fsmn_layer = config["decoder_conf"]["num_blocks"]
         self.fsmn_lorder = config["decoder_conf"]["kernel_size"] - 1
@@ -87,7 +115,9 @@ class Paraformer():
         self.cif_threshold = config["predictor_conf"]["threshold"]
         self.tail_threshold = config["predictor_conf"]["tail_threshold"]
 
-    def prepare_cache(self, cache: dict = {}, batch_size=1):
+    def prepare_cache(self, cache: dict = None, batch_size=1):
+        if cache is None:
+            cache = {}
         if len(cache) > 0:
             return cache
         cache["start_idx"] = 0
@@ -102,8 +132,8 @@ class Paraformer():
             cache["decoder_fsmn"].append(fsmn_cache)
         return cache
 
-    def add_overlap_chunk(self, feats: np.ndarray, cache: dict = {}):
-        if len(cache) == 0:
+    def add_overlap_chunk(self, feats: np.ndarray, cache: dict = None):
+        if not cache:
             return feats
         # process last chunk
         overlap_feats = np.concatenate((cache["feats"], feats), axis=1)
@@ -256,11 +286,6 @@ class Paraformer():
 
     def cif_search(self, hidden, alphas, cache=None):
         batch_size, len_time, hidden_size = hidden.shape
-        token_length = []
-        list_fires = []
-        list_frames = []
-        cache_alphas = []
-        cache_hiddens = []
         alphas[:, :self.chunk_size[0]] = 0.0
         alphas[:, sum(self.chunk_size[:2]):] = 0.0
         if cache is not None and "cif_alphas" in cache and "cif_hidden" in cache:
@@ -273,49 +298,192 @@ class Paraformer():
             hidden = np.concatenate((hidden, tail_hidden), axis=1)
             alphas = np.concatenate((alphas, tail_alphas), axis=1)
 
-        len_time = alphas.shape[1]
-        for b in range(batch_size):
-            integrate = 0.0
-            frames = np.zeros(hidden_size).astype(np.float32)
-            list_frame = []
-            list_fire = []
-            for t in range(len_time):
-                alpha = alphas[b][t]
-                if alpha + integrate < self.cif_threshold:
-                    integrate += alpha
-                    list_fire.append(integrate)
-                    frames += alpha * hidden[b][t]
-                else:
-                    frames += (self.cif_threshold - integrate) * hidden[b][t]
-                    list_frame.append(frames)
-                    integrate += alpha
-                    list_fire.append(integrate)
-                    integrate -= self.cif_threshold
-                    frames = integrate * hidden[b][t]
-
-            cache_alphas.append(integrate)
-            if integrate > 0.0:
-                cache_hiddens.append(frames / integrate)
-            else:
-                cache_hiddens.append(frames)
-
-            token_length.append(len(list_frame))
-            list_fires.append(list_fire)
-            list_frames.append(list_frame)
-
-        max_token_len = max(token_length)
-        list_ls = []
-        for b in range(batch_size):
-            pad_frames = np.zeros((max_token_len - token_length[b], hidden_size)).astype(np.float32)
-            if token_length[b] == 0:
-                list_ls.append(pad_frames)
+        acoustic_embeds, token_length, cache["cif_hidden"], cache["cif_alphas"] = cif_batch(
+            hidden, alphas, self.cif_threshold)
+        return acoustic_embeds.astype(np.float32), token_length
+
+
+
+
+class ParaformerOnlineStreams(Paraformer):
+    """
+    Many concurrent streams of the online Paraformer in one engine: every call is a tick that takes the new chunk
+    of some streams and runs the encoder, the cif and the decoder once for all of them.
+
+    The model caches of the streams are stacked into batched arrays, one row per stream: cif_hidden (S, 1, D),
+    cif_alphas (S, 1) and the decoder fsmn caches (S, D, lorder) of every layer. The frontend, the position and
+    the overlap feats stay per stream. Streams join with `add_stream` (or with their first chunk) and leave with
+    `remove_stream` (or after their final chunk) between ticks.
+
+    The chunks of a tick are batched by length for the encoder and by number of tokens for the decoder, so that
+    every stream gets the results of a single stream `Paraformer`: the right padding of a batch would enter the
+    fsmn caches of the streams with less tokens. In steady state all the chunks have the same length.
+    """
+    def __init__(self, model_dir: Union[str, Path] = None,
+                 chunk_size: List = None,
+                 device_id: Union[str, int] = "-1",
+                 quantize: bool = False,
+                 intra_op_num_threads: int = 4,
+                 cache_dir: str = None,
+                 **kwargs
+                 ):
+        super().__init__(model_dir, batch_size=1, chunk_size=chunk_size, device_id=device_id, quantize=quantize,
+                         intra_op_num_threads=intra_op_num_threads, cache_dir=cache_dir, **kwargs)
+        # stream id -> per stream cache, and the stream of every row of the batched caches
+        self.streams = {}
+        self.stream_ids = []
+        self.cif_hidden = np.zeros((0, 1, self.encoder_output_size), dtype=np.float32)
+        self.cif_alphas = np.zeros((0, 1), dtype=np.float32)
+        self.decoder_fsmn = [np.zeros((0, self.fsmn_dims, self.fsmn_lorder), dtype=np.float32)
+                             for _ in range(self.fsmn_layer)]
+
+    def add_stream(self, stream_id):
+        if stream_id in self.streams:
+            raise ValueError(f"stream {stream_id} already exists")
+        # the online frontend keeps the samples and frames between chunks, one per stream
+        frontend = copy.copy(self.frontend)
+        frontend.cache_reset()
+        self.streams[stream_id] = {"frontend": frontend, "row": len(self.stream_ids)}
+        self.stream_ids.append(stream_id)
+        self.cif_hidden = np.concatenate((self.cif_hidden, np.zeros((1, 1, self.encoder_output_size), dtype=np.float32)))
+        self.cif_alphas = np.concatenate((self.cif_alphas, np.zeros((1, 1), dtype=np.float32)))
+        self.decoder_fsmn = [np.concatenate((cache, np.zeros_like(cache, shape=(1,) + cache.shape[1:])))
+                             for cache in self.decoder_fsmn]
+
+    def remove_stream(self, stream_id):
+        row = self.streams.pop(stream_id)["row"]
+        del self.stream_ids[row]
+        self.cif_hidden = np.delete(self.cif_hidden, row, axis=0)
+        self.cif_alphas = np.delete(self.cif_alphas, row, axis=0)
+        self.decoder_fsmn = [np.delete(cache, row, axis=0) for cache in self.decoder_fsmn]
+        for i in range(row, len(self.stream_ids)):
+            self.streams[self.stream_ids[i]]["row"] = i
+
+    def __call__(self, audio_in: dict, is_final: dict = None, **kwargs) -> dict:
+        """
+        audio_in: stream id -> samples of the new chunk (600ms for chunk_size [5, 10, 5])
+        is_final: stream id -> last chunk of the stream, the stream is removed after it
+        return: stream id -> asr_res, as returned by `Paraformer.__call__`
+        """
+        is_final = is_final if is_final is not None else dict()
+        chunks = dict()
+        for stream_id, waveform in audio_in.items():
+            if stream_id not in self.streams:
+                self.add_stream(stream_id)
+            chunks[stream_id] = self.prepare_chunks(self.streams[stream_id], waveform,
+                                                    is_final.get(stream_id, False))
+
+        results = {stream_id: [] for stream_id in audio_in}
+        # a final chunk longer than the chunk size is decoded in two chunks
+        num_rounds = max([len(chunk) for chunk in chunks.values()], default=0)
+        for i in range(num_rounds):
+            stream_ids = [stream_id for stream_id, chunk in chunks.items() if len(chunk) > i]
+            asr_res = self.infer_streams([self.streams[stream_id]["row"] for stream_id in stream_ids],
+                                         [chunks[stream_id][i] for stream_id in stream_ids])
+            for stream_id, res in zip(stream_ids, asr_res):
+                results[stream_id].append(res)
+
+        for stream_id, asr_res in results.items():
+            if len(asr_res) > 1:
+                res = {}
+                for pred in asr_res[0] + asr_res[1]:
+                    for key, value in pred.items():
+                        if key in res:
+                            res[key][0] += value[0]
+                            res[key][1].extend(value[1])
+                        else:
+                            res[key] = [value[0], value[1]]
+                results[stream_id] = [res]
             else:
-                list_ls.append(np.concatenate((list_frames[b], pad_frames), axis=0))
+                results[stream_id] = asr_res[0] if len(asr_res) > 0 else []
+            if is_final.get(stream_id, False):
+                self.remove_stream(stream_id)
+        return results
 
-        cache["cif_alphas"] = np.stack(cache_alphas, axis=0)
-        cache["cif_alphas"] = np.expand_dims(cache["cif_alphas"], axis=0)
-        cache["cif_hidden"] = np.stack(cache_hiddens, axis=0)
-        cache["cif_hidden"] = np.expand_dims(cache["cif_hidden"], axis=0)
+    def prepare_chunks(self, cache: dict, audio_in: np.ndarray, is_final: bool = False) -> List:
+        """The (feats, last_chunk) to infer for one stream in this tick, as in `Paraformer.__call__`."""
+        waveforms = np.expand_dims(audio_in, axis=0)
+        if waveforms.shape[1] < 16 * 60 and is_final and "feats" in cache:
+            cache["last_chunk"] = True
+            return [(cache["feats"], True)]
+
+        waveforms_lens = np.array([waveforms.shape[1]], dtype=np.int32)
+        feats, _ = cache["frontend"].extract_fbank(waveforms, waveforms_lens, is_final)
+        if feats.size == 0:
+            return []
+        feats = feats.astype(np.float32) * self.encoder_output_size ** 0.5
+        if "feats" not in cache:
+            cache["start_idx"] = 0
+            cache["last_chunk"] = False
+            cache["feats"] = np.zeros((1, self.chunk_size[0] + self.chunk_size[2], self.feats_dims), dtype=np.float32)
+        cache["is_final"] = is_final
+
+        # fbank -> position encoding -> overlap chunk
+        feats = self.pe.forward(feats, cache["start_idx"])
+        cache["start_idx"] += feats.shape[1]
+        if not is_final:
+            return [(self.add_overlap_chunk(feats, cache), False)]
+        if feats.shape[1] + self.chunk_size[2] <= self.chunk_size[1]:
+            cache["last_chunk"] = True
+            return [(self.add_overlap_chunk(feats, cache), True)]
+        feats_chunk1 = self.add_overlap_chunk(feats[:, :self.chunk_size[1], :], cache)
+        cache["last_chunk"] = True
+        feats_chunk2 = self.add_overlap_chunk(
+            feats[:, -(feats.shape[1] + self.chunk_size[2] - self.chunk_size[1]):, :], cache)
+        return [(feats_chunk1, False), (feats_chunk2, True)]
+
+    def infer_streams(self, rows: List[int], chunks: List[Tuple[np.ndarray, bool]]) -> List:
+        batch_size = len(rows)
+        rows = np.array(rows)
+        # encoder forward, the chunks of the same length in one batch
+        enc_list, enc_lens, alphas_list = [None] * batch_size, np.zeros(batch_size, dtype=np.int32), [None] * batch_size
+        for idxs in self.group_by([chunk[0].shape[1] for chunk in chunks]):
+            feats = np.concatenate([chunks[i][0] for i in idxs], axis=0)
+            feats_len = np.full(len(idxs), feats.shape[1], dtype=np.int32)
+            enc, enc_len, cif_alphas = self.ort_encoder_infer([feats, feats_len])
+            for j, i in enumerate(idxs):
+                enc_list[i], enc_lens[i], alphas_list[i] = enc[j], enc_len[j], cif_alphas[j]
+
+        # predictor forward: the zero alphas of the padding and of the tail of the chunks not last do not fire
+        len_time = max(enc.shape[0] for enc in enc_list)
+        enc = np.zeros((batch_size, len_time, self.encoder_output_size), dtype=np.float32)
+        alphas = np.zeros((batch_size, len_time + 1), dtype=np.float32)
+        for i in range(batch_size):
+            enc[i, :enc_list[i].shape[0]] = enc_list[i]
+            alphas[i, :alphas_list[i].shape[0]] = alphas_list[i]
+            alphas[i, :self.chunk_size[0]] = 0.0
+            alphas[i, sum(self.chunk_size[:2]):alphas_list[i].shape[0]] = 0.0
+            if chunks[i][1]:
+                alphas[i, len_time] = self.tail_threshold
+        hidden = np.concatenate((self.cif_hidden[rows], enc, np.zeros_like(enc[:, :1])), axis=1)
+        alphas = np.concatenate((self.cif_alphas[rows], alphas), axis=1)
+        acoustic_embeds, acoustic_embeds_len, self.cif_hidden[rows], self.cif_alphas[rows] = cif_batch(
+            hidden, alphas, self.cif_threshold)
+
+        # decoder forward, the streams with the same number of tokens in one batch
+        asr_res = [[] for _ in range(batch_size)]
+        keys = [(int(acoustic_embeds_len[i]), enc_list[i].shape[0]) for i in range(batch_size)]
+        for idxs in self.group_by(keys):
+            token_num, enc_len = keys[idxs[0]]
+            if token_num == 0:
+                continue
+            idxs = np.array(idxs)
+            dec_input = [enc[idxs, :enc_len], enc_lens[idxs], acoustic_embeds[idxs, :token_num].astype(np.float32),
+                         acoustic_embeds_len[idxs]]
+            dec_input.extend([cache[rows[idxs]] for cache in self.decoder_fsmn])
+            dec_output = self.ort_decoder_infer(dec_input)
+            logits, sample_ids, out_caches = dec_output[0], dec_output[1], dec_output[2:]
+            for cache, out_cache in zip(self.decoder_fsmn, out_caches):
+                cache[rows[idxs]] = out_cache[:, :, -self.fsmn_lorder:]
 
-        return np.stack(list_ls, axis=0).astype(np.float32), np.stack(token_length, axis=0).astype(np.int32)
+            preds = self.decode(logits, acoustic_embeds_len[idxs])
+            for i, pred in zip(idxs, preds):
+                asr_res[i].append({'preds': sentence_postprocess(pred)})
+        return asr_res
 
+    @staticmethod
+    def group_by(keys: List) -> List[List[int]]:
+        groups = dict()
+        for i, key in enumerate(keys):
+            groups.setdefault(key, []).append(i)
+        return list(groups.values())
@@ -0,0 +1,132 @@
+# -*- encoding: utf-8 -*-
+# Copyright FunASR (https://github.com/alibaba-damo-academy/FunASR). All Rights Reserved.
+#  MIT License  (https://opensource.org/licenses/MIT)
+
+import os.path
+from pathlib import Path
+from typing import List, Union
+
+import numpy as np
+
+from .paraformer_bin import Paraformer, ContextualParaformer
+from .vad_bin import Fsmn_vad
+from .punc_bin import CT_Transformer
+from .utils.utils import get_logger
+
+logging = get_logger()
+
+
+class AsrPipeline():
+    """
+    Long audio recognition with onnx models, the counterpart of `AutoModel(model=..., vad_model=..., punc_model=...)`:
+    the audio is segmented by the FSMN-VAD model, the segments are sorted by duration and batched by
+    total duration into `Paraformer.infer_batch`, the timestamps are shifted by the segment starts and
+    the text of all segments is punctuated by CT-Transformer.
+
+    asr_model / vad_model / punc_model: model_dir (model_name in modelscope or local path) or an already
+    built `Paraformer` (or `ContextualParaformer`, `SeacoParaformer`) / `Fsmn_vad` / `CT_Transformer`
+    instance. punc_model is optional.
+    """
+    def __init__(self, asr_model: Union[str, Path, Paraformer] = None,
+                 vad_model: Union[str, Path, Fsmn_vad] = None,
+                 punc_model: Union[str, Path, CT_Transformer] = None,
+                 batch_size_s: int = 300,
+                 batch_size_threshold_s: int = 60,
+                 device_id: Union[str, int] = "-1",
+                 quantize: bool = False,
+                 intra_op_num_threads: int = 4,
+                 cache_dir: str = None,
+                 **kwargs
+                 ):
+        model_kwargs = dict(device_id=device_id, quantize=quantize, intra_op_num_threads=intra_op_num_threads,
+                            cache_dir=cache_dir, **kwargs)
+        if isinstance(asr_model, (str, Path)):
+            asr_model = Paraformer(asr_model, **model_kwargs)
+        if isinstance(vad_model, (str, Path)):
+            vad_model = Fsmn_vad(vad_model, **model_kwargs)
+        if isinstance(punc_model, (str, Path)):
+            punc_model = CT_Transformer(punc_model, **model_kwargs)
+        self.asr_model = asr_model
+        self.vad_model = vad_model
+        self.punc_model = punc_model
+        self.batch_size_ms = max(int(batch_size_s * 1000), 1)
+        self.batch_size_threshold_ms = int(batch_size_threshold_s * 1000)
+        self.fs = self.asr_model.frontend.opts.frame_opts.samp_freq
+
+    def __call__(self, wav_content: Union[str, np.ndarray, List[str]], hotwords: str = None, **kwargs) -> List:
+        waveform_list = self.asr_model.load_data(wav_content, self.fs)
+        if isinstance(wav_content, list):
+            keys = [os.path.splitext(os.path.basename(path))[0] for path in wav_content]
+        elif isinstance(wav_content, str):
+            keys = [os.path.splitext(os.path.basename(wav_content))[0]]
+        else:
+            keys = ["wav_0"]
+
+        bias_embed = None
+        if isinstance(self.asr_model, ContextualParaformer):
+            bias_embed = self.asr_model.embed_hotwords(hotwords if hotwords is not None else "")
+        elif hotwords:
+            logging.warning("{} does not support hotwords, ignore them: {}. Use a ContextualParaformer or "
+                            "SeacoParaformer asr_model.".format(type(self.asr_model).__name__, hotwords))
+
+        results = []
+        for key, waveform in zip(keys, waveform_list):
+            result = self.infer_one(waveform, bias_embed)
+            result["key"] = key
+            results.append(result)
+        return results
+
+    def infer_one(self, waveform: np.ndarray, bias_embed: np.ndarray = None) -> dict:
+        # step.1: vad segments in ms, [[beg, end], ...]
+        vad_res = self.vad_model(waveform)
+        vad_segments = vad_res[0] if len(vad_res) else []
+        result = {"text": ""}
+        if not len(vad_segments):
+            logging.info("decoding, empty speech")
+            return result
+
+        # step.2: batches of segments sorted by duration, at most batch_size_ms of speech per batch
+        n = len(vad_segments)
+        durations = [seg[1] - seg[0] for seg in vad_segments]
+        order = sorted(range(n), key=lambda i: durations[i])
+        batch_size_ms = max(self.batch_size_ms, durations[order[0]])
+        restored = [None] * n
+        batch_size_ms_cum = 0
+        beg_idx = 0
+        for j in range(n):
+            batch_size_ms_cum += durations[order[j]]
+            if j < n - 1 and batch_size_ms_cum + durations[order[j + 1]] < batch_size_ms \
+                    and durations[order[j + 1]] < self.batch_size_threshold_ms:
+                continue
+            batch_size_ms_cum = 0
+            end_idx = j + 1
+            speech_list = []
+            for i in order[beg_idx:end_idx]:
+                beg, end = vad_segments[i]
+                speech_list.append(waveform[int(beg * self.fs / 1000):min(int(end * self.fs / 1000), len(waveform))])
+            if bias_embed is None:
+                batch_res = self.asr_model.infer_batch(speech_list)
+            else:
+                batch_res = self.asr_model.infer_batch(speech_list, bias_embed)
+            for i, res in zip(order[beg_idx:end_idx], batch_res):
+                restored[i] = res
+            beg_idx = end_idx
+
+        # step.3: concatenate the segments in time order, shifting the timestamps by the segment start
+        texts = []
+        for seg, res in zip(vad_segments, restored):
+            if res is None:
+                continue
+            preds = res["preds"]
+            text = preds[0] if isinstance(preds, tuple) else preds
+            if len(text):
+                texts.append(text)
+            if "timestamp" in res:
+                result.setdefault("timestamp", []).extend([[t[0] + seg[0], t[1] + seg[0]] for t in res["timestamp"]])
+        result["text"] = " ".join(texts)
+
+        # step.4: punctuation
+        if self.punc_model is not None and len(result["text"]):
+            result["raw_text"] = result["text"]
+            result["text"] = self.punc_model(result["text"])[0]
+        return result
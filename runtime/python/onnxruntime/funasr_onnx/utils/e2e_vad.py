@@ -8,6 +8,8 @@ from typing import List, Tuple, Dict, Any
 import math
 import numpy as np
 
+from .vad_utils import compute_decibel, compute_frame_probs, compute_frame_states
+
 class VadStateMachine(Enum):
     kVadInStateStartPointNotDetected = 1
     kVadInStateInSpeechSegment = 2
@@ -61,7 +63,7 @@ class VADXOptions:
             speech_noise_thres: float = 0.6,
             fe_prior_thres: float = 1e-4,
             silence_pdf_num: int = 1,
-            sil_pdf_ids: List[int] = [0],
+            sil_pdf_ids: List[int] = None,
             speech_noise_thresh_low: float = -0.1,
             speech_noise_thresh_high: float = 0.3,
             output_frame_probs: bool = False,
@@ -91,7 +93,7 @@ class VADXOptions:
         self.speech_noise_thres = speech_noise_thres
         self.fe_prior_thres = fe_prior_thres
         self.silence_pdf_num = silence_pdf_num
-        self.sil_pdf_ids = sil_pdf_ids
+        self.sil_pdf_ids = sil_pdf_ids if sil_pdf_ids is not None else [0]
         self.speech_noise_thresh_low = speech_noise_thresh_low
         self.speech_noise_thresh_high = speech_noise_thresh_high
         self.output_frame_probs = output_frame_probs
@@ -287,10 +289,7 @@ class E2EVadModel():
             self.data_buf_size = self.data_buf_all_size
         else:
             self.data_buf_all_size += len(self.waveform[0])
-        for offset in range(0, self.waveform.shape[1] - frame_sample_length + 1, frame_shift_length):
-            self.decibel.append(
-                10 * math.log10(np.square((self.waveform[0][offset: offset + frame_sample_length])).sum() + \
-                                0.000001))
+        self.decibel.extend(compute_decibel(self.waveform[0], frame_sample_length, frame_shift_length).tolist())
 
     def ComputeScores(self, scores: np.ndarray) -> None:
         # scores = self.encoder(feats, in_cache)  # return B * T * D
@@ -339,12 +338,8 @@ class E2EVadModel():
             expected_sample_number = self.data_buf_size
 
         cur_seg.doa = 0
-        for sample_cpy_out in range(0, data_to_pop):
-            # cur_seg.buffer[out_pos ++] = data_buf_.back();
-            out_pos += 1
-        for sample_cpy_out in range(data_to_pop, expected_sample_number):
-            # cur_seg.buffer[out_pos++] = data_buf_.back()
-            out_pos += 1
+        # cur_seg.buffer[out_pos++] = data_buf_.back() for the samples to pop and the expected ones
+        out_pos += max(data_to_pop, 0) + max(expected_sample_number - data_to_pop, 0)
         if cur_seg.end_ms != start_frm * self.vad_opts.frame_in_ms:
             print('Something wrong with the VAD algorithm\n')
         self.data_buf_start_frame += frm_cnt
@@ -404,49 +399,18 @@ class E2EVadModel():
             vad_latency += int(self.vad_opts.lookback_time_start_point / self.vad_opts.frame_in_ms)
         return vad_latency
 
-    def GetFrameState(self, t: int) -> FrameState:
-        frame_state = FrameState.kFrameStateInvalid
-        cur_decibel = self.decibel[t]
-        cur_snr = cur_decibel - self.noise_average_decibel
-        # for each frame, calc log posterior probability of each state
-        if cur_decibel < self.vad_opts.decibel_thres:
-            frame_state = FrameState.kFrameStateSil
-            self.DetectOneFrame(frame_state, t, False)
-            return frame_state
-
-        sum_score = 0.0
-        noise_prob = 0.0
+    def GetFrameStates(self, beg: int, end: int) -> Tuple[np.ndarray, np.ndarray, Tuple]:
+        """Speech (1) or silence (0) of the frames [beg, end), with their decibel and probs."""
+        decibel = np.array(self.decibel[beg:end], dtype=np.float64)
         assert len(self.sil_pdf_ids) == self.vad_opts.silence_pdf_num
-        if len(self.sil_pdf_ids) > 0:
-            assert len(self.scores) == 1  # 只支持batch_size = 1的测试
-            sil_pdf_scores = [self.scores[0][t - self.idx_pre_chunk][sil_pdf_id] for sil_pdf_id in self.sil_pdf_ids]
-            sum_score = sum(sil_pdf_scores)
-            noise_prob = math.log(sum_score) * self.vad_opts.speech_2_noise_ratio
-            total_score = 1.0
-            sum_score = total_score - sum_score
-        speech_prob = math.log(sum_score)
-        if self.vad_opts.output_frame_probs:
-            frame_prob = E2EVadFrameProb()
-            frame_prob.noise_prob = noise_prob
-            frame_prob.speech_prob = speech_prob
-            frame_prob.score = sum_score
-            frame_prob.frame_id = t
-            self.frame_probs.append(frame_prob)
-        if math.exp(speech_prob) >= math.exp(noise_prob) + self.speech_noise_thres:
-            if cur_snr >= self.vad_opts.snr_thres and cur_decibel >= self.vad_opts.decibel_thres:
-                frame_state = FrameState.kFrameStateSpeech
-            else:
-                frame_state = FrameState.kFrameStateSil
-        else:
-            frame_state = FrameState.kFrameStateSil
-            if self.noise_average_decibel < -99.9:
-                self.noise_average_decibel = cur_decibel
-            else:
-                self.noise_average_decibel = (cur_decibel + self.noise_average_decibel * (
-                        self.vad_opts.noise_frame_num_used_for_snr
-                        - 1)) / self.vad_opts.noise_frame_num_used_for_snr
-
-        return frame_state
+        assert len(self.scores) == 1  # 只支持batch_size = 1的测试
+        scores = self.scores[0][beg - self.idx_pre_chunk:end - self.idx_pre_chunk]
+        noise_prob, speech_prob, speech_score = compute_frame_probs(scores, self.sil_pdf_ids,
+                                                                    self.vad_opts.speech_2_noise_ratio)
+        frame_states, self.noise_average_decibel = compute_frame_states(
+            decibel, noise_prob, speech_prob, self.noise_average_decibel, self.speech_noise_thres,
+            self.vad_opts.snr_thres, self.vad_opts.decibel_thres, self.vad_opts.noise_frame_num_used_for_snr)
+        return frame_states, decibel, (noise_prob, speech_prob, speech_score)
 
     def __call__(self, score: np.ndarray, waveform: np.ndarray,
                 is_final: bool = False, max_end_sil: int = 800, online: bool = False
@@ -497,26 +461,35 @@ class E2EVadModel():
     def DetectCommonFrames(self) -> int:
         if self.vad_state_machine == VadStateMachine.kVadInStateEndPointDetected:
             return 0
-        for i in range(self.vad_opts.nn_eval_block_size - 1, -1, -1):
-            frame_state = FrameState.kFrameStateInvalid
-            frame_state = self.GetFrameState(self.frm_cnt - 1 - i)
-            self.DetectOneFrame(frame_state, self.frm_cnt - 1 - i, False)
+        self.DetectFrames(False)
         self.idx_pre_chunk += self.scores.shape[1]
         return 0
 
     def DetectLastFrames(self) -> int:
         if self.vad_state_machine == VadStateMachine.kVadInStateEndPointDetected:
             return 0
-        for i in range(self.vad_opts.nn_eval_block_size - 1, -1, -1):
-            frame_state = FrameState.kFrameStateInvalid
-            frame_state = self.GetFrameState(self.frm_cnt - 1 - i)
-            if i != 0:
-                self.DetectOneFrame(frame_state, self.frm_cnt - 1 - i, False)
-            else:
-                self.DetectOneFrame(frame_state, self.frm_cnt - 1, True)
-
+        self.DetectFrames(True)
         return 0
 
+    def DetectFrames(self, is_final: bool) -> None:
+        # the frame states of the block are computed at once, only the state machine steps per frame
+        beg = self.frm_cnt - self.vad_opts.nn_eval_block_size
+        frame_states, decibel, (noise_prob, speech_prob, speech_score) = self.GetFrameStates(beg, self.frm_cnt)
+        for i in range(len(frame_states)):
+            t = beg + i
+            if decibel[i] < self.vad_opts.decibel_thres:
+                # the frames below decibel_thres go through the detection twice
+                self.DetectOneFrame(FrameState.kFrameStateSil, t, False)
+            elif self.vad_opts.output_frame_probs:
+                frame_prob = E2EVadFrameProb()
+                frame_prob.noise_prob = noise_prob[i]
+                frame_prob.speech_prob = speech_prob[i]
+                frame_prob.score = speech_score[i]
+                frame_prob.frame_id = t
+                self.frame_probs.append(frame_prob)
+            frame_state = FrameState.kFrameStateSpeech if frame_states[i] else FrameState.kFrameStateSil
+            self.DetectOneFrame(frame_state, t, is_final and t == self.frm_cnt - 1)
+
     def DetectOneFrame(self, cur_frm_state: FrameState, cur_frm_idx: int, is_final_frame: bool) -> None:
         tmp_cur_frm_state = FrameState.kFrameStateInvalid
         if cur_frm_state == FrameState.kFrameStateSpeech:
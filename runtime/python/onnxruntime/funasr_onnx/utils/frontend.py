@@ -26,6 +26,7 @@ class WavFrontend():
             lfr_m: int = 1,
             lfr_n: int = 1,
             dither: float = 1.0,
+            numpy_fbank: bool = True,
             **kwargs,
     ) -> None:
 
@@ -47,40 +48,129 @@ class WavFrontend():
 
         if self.cmvn_file:
             self.cmvn = self.load_cmvn()
+        # the numpy fbank supports the kaldi options used by the funasr models, fall back to
+        # kaldi_native_fbank for the others
+        self.numpy_fbank = numpy_fbank and opts.frame_opts.snip_edges and not opts.use_energy \
+            and opts.use_log_fbank and opts.use_power and not opts.mel_opts.htk_mode \
+            and opts.frame_opts.window_type in ("hamming", "hanning", "povey", "rectangular", "blackman")
+        if self.numpy_fbank:
+            self.fbank_window, self.fbank_mel_banks = self.init_numpy_fbank(opts)
         self.fbank_fn = None
         self.fbank_beg_idx = 0
+        self.fbank_mat = None
         self.reset_status()
 
+    @staticmethod
+    def init_numpy_fbank(opts) -> Tuple[np.ndarray, np.ndarray]:
+        """Window (frame_length,) and mel filter bank (padded_length // 2 + 1, num_bins) of kaldi."""
+        frame_opts, mel_opts = opts.frame_opts, opts.mel_opts
+        fs = frame_opts.samp_freq
+        frame_length = int(fs * frame_opts.frame_length_ms / 1000)
+        padded_length = 1 << (frame_length - 1).bit_length() if frame_opts.round_to_power_of_two else frame_length
+
+        a = 2 * np.pi / (frame_length - 1)
+        i = np.arange(frame_length)
+        window_type = frame_opts.window_type
+        if window_type == "hanning":
+            window = 0.5 - 0.5 * np.cos(a * i)
+        elif window_type == "hamming":
+            window = 0.54 - 0.46 * np.cos(a * i)
+        elif window_type == "povey":
+            window = (0.5 - 0.5 * np.cos(a * i)) ** 0.85
+        elif window_type == "rectangular":
+            window = np.ones(frame_length)
+        else:
+            window = frame_opts.blackman_coeff - 0.5 * np.cos(a * i) + (0.5 - frame_opts.blackman_coeff) * np.cos(2 * a * i)
+
+        def mel_scale(freq):
+            return 1127.0 * np.log(1.0 + freq / 700.0)
+
+        high_freq = mel_opts.high_freq if mel_opts.high_freq > 0 else mel_opts.high_freq + 0.5 * fs
+        mel_low, mel_high = mel_scale(mel_opts.low_freq), mel_scale(high_freq)
+        mel_delta = (mel_high - mel_low) / (mel_opts.num_bins + 1)
+        bins = np.arange(mel_opts.num_bins)[:, None]
+        left_mel = mel_low + bins * mel_delta
+        center_mel = mel_low + (bins + 1) * mel_delta
+        right_mel = mel_low + (bins + 2) * mel_delta
+        # the nyquist bin gets no weight, as in kaldi
+        mel = mel_scale(fs / padded_length * np.arange(padded_length // 2))[None, :]
+        weights = np.where(mel <= center_mel, (mel - left_mel) / (center_mel - left_mel),
+                           (right_mel - mel) / (right_mel - center_mel))
+        weights = np.where((mel > left_mel) & (mel < right_mel), weights, 0.0)
+        mel_banks = np.pad(weights, ((0, 0), (0, 1))).T
+        return window.astype(np.float32), mel_banks.astype(np.float32)
+
+    def compute_fbank(self, waveform: np.ndarray) -> np.ndarray:
+        """
+        Kaldi fbank (frames, num_bins) of a whole waveform (already scaled to the int16 range).
+        All frames are framed, windowed and transformed at once with numpy, the result equals
+        kaldi_native_fbank up to float32 rounding.
+        """
+        if not self.numpy_fbank:
+            fbank_fn = knf.OnlineFbank(self.opts)
+            fbank_fn.accept_waveform(self.opts.frame_opts.samp_freq, waveform)
+            return self.get_frames(fbank_fn, 0, fbank_fn.num_frames_ready)
+
+        frame_opts = self.opts.frame_opts
+        frame_length = self.fbank_window.shape[0]
+        frame_shift = int(frame_opts.samp_freq * frame_opts.frame_shift_ms / 1000)
+        padded_length = (self.fbank_mel_banks.shape[0] - 1) * 2
+        waveform = np.ascontiguousarray(waveform, dtype=np.float32)
+        num_frames = 1 + (waveform.shape[0] - frame_length) // frame_shift if waveform.shape[0] >= frame_length else 0
+        if num_frames == 0:
+            return np.empty((0, self.opts.mel_opts.num_bins), dtype=np.float32)
+
+        stride = waveform.strides[0]
+        frames = np.lib.stride_tricks.as_strided(waveform, (num_frames, frame_length),
+                                                 (stride * frame_shift, stride)).copy()
+        if frame_opts.dither != 0.0:
+            frames += np.random.standard_normal(frames.shape).astype(np.float32) * frame_opts.dither
+        if frame_opts.remove_dc_offset:
+            frames -= frames.mean(axis=1, keepdims=True)
+        if frame_opts.preemph_coeff != 0.0:
+            frames[:, 1:] -= frame_opts.preemph_coeff * frames[:, :-1].copy()
+            frames[:, 0] -= frame_opts.preemph_coeff * frames[:, 0]
+        frames *= self.fbank_window
+        spectrum = np.fft.rfft(frames, n=padded_length)
+        power = (spectrum.real ** 2 + spectrum.imag ** 2).astype(np.float32)
+        mel_energies = power @ self.fbank_mel_banks
+        return np.log(np.maximum(mel_energies, np.finfo(np.float32).eps))
+
+    @staticmethod
+    def get_frames(fbank_fn, beg_idx: int, end_idx: int) -> np.ndarray:
+        if end_idx <= beg_idx:
+            return np.empty((0, fbank_fn.dim), dtype=np.float32)
+        return np.stack([fbank_fn.get_frame(i) for i in range(beg_idx, end_idx)]).astype(np.float32)
+
     def fbank(self,
               waveform: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
         waveform = waveform * (1 << 15)
-        self.fbank_fn = knf.OnlineFbank(self.opts)
-        self.fbank_fn.accept_waveform(self.opts.frame_opts.samp_freq, waveform.tolist())
-        frames = self.fbank_fn.num_frames_ready
-        mat = np.empty([frames, self.opts.mel_opts.num_bins])
-        for i in range(frames):
-            mat[i, :] = self.fbank_fn.get_frame(i)
-        feat = mat.astype(np.float32)
-        feat_len = np.array(mat.shape[0]).astype(np.int32)
+        feat = self.compute_fbank(waveform)
+        feat_len = np.array(feat.shape[0]).astype(np.int32)
         return feat, feat_len
 
     def fbank_online(self,
               waveform: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
         waveform = waveform * (1 << 15)
         # self.fbank_fn = knf.OnlineFbank(self.opts)
-        self.fbank_fn.accept_waveform(self.opts.frame_opts.samp_freq, waveform.tolist())
+        self.fbank_fn.accept_waveform(self.opts.frame_opts.samp_freq, waveform)
         frames = self.fbank_fn.num_frames_ready
-        mat = np.empty([frames, self.opts.mel_opts.num_bins])
-        for i in range(self.fbank_beg_idx, frames):
-            mat[i, :] = self.fbank_fn.get_frame(i)
-        # self.fbank_beg_idx += (frames-self.fbank_beg_idx)
-        feat = mat.astype(np.float32)
-        feat_len = np.array(mat.shape[0]).astype(np.int32)
+        # only the newly ready frames are copied, into a buffer growing by doubling
+        if self.fbank_mat is None or self.fbank_mat.shape[0] < frames:
+            mat = np.empty([max(frames, 2 * self.fbank_beg_idx), self.opts.mel_opts.num_bins], dtype=np.float32)
+            if self.fbank_mat is not None:
+                mat[:self.fbank_beg_idx] = self.fbank_mat[:self.fbank_beg_idx]
+            self.fbank_mat = mat
+        self.fbank_mat[self.fbank_beg_idx:frames] = self.get_frames(self.fbank_fn, self.fbank_beg_idx, frames)
+        self.fbank_beg_idx = frames
+        feat = self.fbank_mat[:frames]
+        feat_len = np.array(feat.shape[0]).astype(np.int32)
         return feat, feat_len
 
     def reset_status(self):
         self.fbank_fn = knf.OnlineFbank(self.opts)
         self.fbank_beg_idx = 0
+        self.fbank_mat = None
 
     def lfr_cmvn(self, feat: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
         if self.lfr_m != 1 or self.lfr_n != 1:
@@ -207,7 +297,6 @@ class WavFrontendOnline(WavFrontend):
             input: np.ndarray,
             input_lengths: np.ndarray
     ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
-        self.fbank_fn = knf.OnlineFbank(self.opts)
         batch_size = input.shape[0]
         if self.input_cache is None:
             self.input_cache = np.empty((batch_size, 0), dtype=np.float32)
@@ -228,13 +317,9 @@ class WavFrontendOnline(WavFrontend):
                     waveform[:((frame_num - 1) * self.frame_shift_sample_length + self.frame_sample_length)])
                 waveform = waveform * (1 << 15)
                 
-                self.fbank_fn.accept_waveform(self.opts.frame_opts.samp_freq, waveform.tolist())
-                frames = self.fbank_fn.num_frames_ready
-                mat = np.empty([frames, self.opts.mel_opts.num_bins])
-                for i in range(frames):
-                    mat[i, :] = self.fbank_fn.get_frame(i)
-                feat = mat.astype(np.float32)
-                feat_len = np.array(mat.shape[0]).astype(np.int32)
+                # every chunk (with the cached samples) is computed from scratch, as a whole waveform
+                feat = self.compute_fbank(waveform)
+                feat_len = np.array(feat.shape[0]).astype(np.int32)
                 feats.append(feat)
                 feats_lens.append(feat_len)
 
@@ -333,20 +418,17 @@ class WavFrontendOnline(WavFrontend):
         self.input_cache = None
         self.lfr_splice_cache = []
 
-def load_bytes(input):
+def load_bytes(input, out=None):
+    """
+    int16 pcm bytes to float32 samples in [-1, 1): one pass over a view of the bytes, written into `out`
+    (a float32 array of the same length) if given.
+    """
     middle_data = np.frombuffer(input, dtype=np.int16)
-    middle_data = np.asarray(middle_data)
-    if middle_data.dtype.kind not in 'iu':
-        raise TypeError("'middle_data' must be an array of integers")
-    dtype = np.dtype('float32')
-    if dtype.kind != 'f':
-        raise TypeError("'dtype' must be a floating point type")
-
-    i = np.iinfo(middle_data.dtype)
-    abs_max = 2 ** (i.bits - 1)
-    offset = i.min + abs_max
-    array = np.frombuffer((middle_data.astype(dtype) - offset) / abs_max, dtype=np.float32)
-    return array
+    if out is None:
+        out = np.empty(len(middle_data), dtype=np.float32)
+    # the scale is a power of two, so the product is exactly (x - offset) / abs_max with offset 0 for int16
+    np.multiply(middle_data, np.float32(1.0 / 32768), out=out)
+    return out
 
 
 class SinusoidalPositionEncoderOnline():
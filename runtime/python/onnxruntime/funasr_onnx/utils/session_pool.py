@@ -0,0 +1,154 @@
+# -*- encoding: utf-8 -*-
+# Copyright FunASR (https://github.com/alibaba-damo-academy/FunASR). All Rights Reserved.
+#  MIT License  (https://opensource.org/licenses/MIT)
+
+import os
+import glob
+import queue
+import threading
+from concurrent.futures import Future
+from typing import Callable, List
+
+from .utils import get_logger
+
+logging = get_logger()
+
+
+def parse_cpulist(cpulist: str) -> List[int]:
+    """'0-3,8,10-11' -> [0, 1, 2, 3, 8, 10, 11]"""
+    cpus = []
+    for item in cpulist.strip().split(","):
+        if not item:
+            continue
+        if "-" in item:
+            beg, end = item.split("-")
+            cpus.extend(range(int(beg), int(end) + 1))
+        else:
+            cpus.append(int(item))
+    return cpus
+
+
+def get_available_cpus() -> List[int]:
+    """The cpus this process may run on, ordered by NUMA node so that consecutive cpus share a node."""
+    if hasattr(os, "sched_getaffinity"):
+        cpus = sorted(os.sched_getaffinity(0))
+    else:
+        cpus = list(range(os.cpu_count() or 1))
+    cpu_node = {}
+    for node_dir in sorted(glob.glob("/sys/devices/system/node/node[0-9]*")):
+        try:
+            with open(os.path.join(node_dir, "cpulist"), "r") as f:
+                node = int(os.path.basename(node_dir)[4:])
+                for cpu in parse_cpulist(f.read()):
+                    cpu_node[cpu] = node
+        except (OSError, ValueError):
+            continue
+    return sorted(cpus, key=lambda cpu: (cpu_node.get(cpu, 0), cpu))
+
+
+def partition_cpus(cpus: List[int], num_instances: int) -> List[List[int]]:
+    """Split the cpus into num_instances contiguous groups of (almost) equal size."""
+    num_instances = max(1, min(num_instances, len(cpus)))
+    size, rest = divmod(len(cpus), num_instances)
+    groups, beg = [], 0
+    for i in range(num_instances):
+        end = beg + size + (1 if i < rest else 0)
+        groups.append(cpus[beg:end])
+        beg = end
+    return groups
+
+
+class SessionPool():
+    """
+    A pool of model instances (e.g. `Paraformer`, `AsrPipeline`) served by a request queue, for servers
+    handling concurrent requests.
+
+    The cpus of the process are partitioned into num_instances groups (ordered by NUMA node, so a group
+    stays on one node when possible). Every instance is built by its own worker thread with
+    `build_fn(intra_op_num_threads=len(group))` after the thread is pinned to its cpu group, so the
+    intra-op thread pool of its onnxruntime sessions inherits the pinning. An instance is only used by
+    its worker, which also keeps stateful models (io binding, vad caches) safe. Requests are taken
+    from a shared queue by the first idle worker.
+
+    num_instances: number of model instances, default one per 4 cpus
+    pin_cpus: pin the workers to their cpu group (linux only)
+    max_queue_size: maximum number of waiting requests, 0 for unbounded
+    """
+    def __init__(self, build_fn: Callable,
+                 num_instances: int = None,
+                 cpus: List[int] = None,
+                 pin_cpus: bool = True,
+                 max_queue_size: int = 0,
+                 ):
+        cpus = cpus if cpus is not None else get_available_cpus()
+        if num_instances is None:
+            num_instances = max(1, len(cpus) // 4)
+        self.cpu_groups = partition_cpus(cpus, num_instances)
+        self.num_instances = len(self.cpu_groups)
+        self.pin_cpus = pin_cpus and hasattr(os, "sched_setaffinity")
+        self.requests = queue.Queue(maxsize=max_queue_size)
+        # the instances are built one after another, e.g. not to download a model concurrently
+        self.build_lock = threading.Lock()
+        self.instances = [None] * self.num_instances
+        self.workers = []
+        ready = [threading.Event() for _ in range(self.num_instances)]
+        errors = []
+        for i, group in enumerate(self.cpu_groups):
+            worker = threading.Thread(target=self._worker, args=(i, group, build_fn, ready[i], errors),
+                                      name=f"session_pool_{i}", daemon=True)
+            worker.start()
+            self.workers.append(worker)
+        for event in ready:
+            event.wait()
+        if errors:
+            self.close()
+            raise errors[0]
+        logging.info(f"session pool: {self.num_instances} instances on cpus {self.cpu_groups}")
+
+    def _worker(self, index: int, cpus: List[int], build_fn: Callable, ready: threading.Event, errors: list):
+        try:
+            if self.pin_cpus:
+                # pid 0 is the calling thread on linux, the threads it creates inherit the affinity
+                os.sched_setaffinity(0, cpus)
+            with self.build_lock:
+                self.instances[index] = build_fn(intra_op_num_threads=len(cpus))
+        except Exception as e:
+            errors.append(e)
+            return
+        finally:
+            ready.set()
+
+        instance = self.instances[index]
+        while True:
+            request = self.requests.get()
+            if request is None:
+                break
+            future, fn, args, kwargs = request
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                result = fn(instance, *args, **kwargs) if fn is not None else instance(*args, **kwargs)
+            except BaseException as e:
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+
+    def submit(self, *args, **kwargs) -> Future:
+        """Queue `instance(*args, **kwargs)`, asyncio servers can await `asyncio.wrap_future(future)`."""
+        return self.apply(None, *args, **kwargs)
+
+    def apply(self, fn: Callable, *args, **kwargs) -> Future:
+        """Queue `fn(instance, *args, **kwargs)`, e.g. to call another method of the instance."""
+        future = Future()
+        self.requests.put((future, fn, args, kwargs))
+        return future
+
+    def __call__(self, *args, **kwargs):
+        return self.submit(*args, **kwargs).result()
+
+    def close(self):
+        for _ in self.workers:
+            self.requests.put(None)
+        for worker in self.workers:
+            worker.join()
+        self.workers = []
@@ -178,7 +178,7 @@ class ONNXRuntimeError(Exception):
 
 
 class OrtInferSession():
-    def __init__(self, model_file, device_id=-1, intra_op_num_threads=4):
+    def __init__(self, model_file, device_id=-1, intra_op_num_threads=4, io_binding=False):
         device_id = str(device_id)
         sess_opt = SessionOptions()
         sess_opt.intra_op_num_threads = intra_op_num_threads
@@ -216,14 +216,35 @@ class OrtInferSession():
                           'https://onnxruntime.ai/docs/execution-providers/CUDA-ExecutionProvider.html',
                           RuntimeWarning)
 
+        self.input_names = self.get_input_names()
+        self.output_names = self.get_output_names()
+        # io binding: the numpy inputs are bound without copy and one binding is kept across calls,
+        # instead of building the feeds and fetches in every session.run
+        self.io_binding = self.session.io_binding() if io_binding else None
+
     def __call__(self,
                  input_content: List[Union[np.ndarray, np.ndarray]]) -> np.ndarray:
-        input_dict = dict(zip(self.get_input_names(), input_content))
         try:
-            return self.session.run(self.get_output_names(), input_dict)
+            if self.io_binding is not None:
+                return self.run_with_io_binding(input_content)
+            input_dict = dict(zip(self.input_names, input_content))
+            return self.session.run(self.output_names, input_dict)
         except Exception as e:
             raise ONNXRuntimeError('ONNXRuntime inferece failed.') from e
 
+    def run_with_io_binding(self, input_content: List[np.ndarray]) -> List[np.ndarray]:
+        for name, value in zip(self.input_names, input_content):
+            self.io_binding.bind_cpu_input(name, np.ascontiguousarray(value))
+        # the output shapes depend on the data (e.g. the number of predicted tokens), so the outputs
+        # are bound unallocated and sized by onnxruntime in every run
+        for name in self.output_names:
+            self.io_binding.bind_output(name)
+        self.session.run_with_iobinding(self.io_binding)
+        outputs = self.io_binding.copy_outputs_to_cpu()
+        self.io_binding.clear_binding_inputs()
+        self.io_binding.clear_binding_outputs()
+        return outputs
+
     def get_input_names(self, ):
         return [v.name for v in self.session.get_inputs()]
 
@@ -0,0 +1,60 @@
+# -*- encoding: utf-8 -*-
+# Copyright FunASR (https://github.com/alibaba-damo-academy/FunASR). All Rights Reserved.
+#  MIT License  (https://opensource.org/licenses/MIT)
+
+# Array part of the fsmn-vad post-processing, numpy only and shared by the pytorch model and the runtimes, so that
+# they give the same segments: keep funasr/models/fsmn_vad_streaming/vad_utils.py, funasr_onnx/utils/vad_utils.py
+# and funasr_torch/utils/vad_utils.py identical. Only the state machine of the detection steps per frame.
+
+from typing import List, Tuple
+
+import numpy as np
+
+
+def compute_decibel(waveform: np.ndarray, frame_sample_length: int, frame_shift_length: int) -> np.ndarray:
+    """10 * log10(energy) of all the frames of a 1-d waveform."""
+    num_frames = (len(waveform) - frame_sample_length) // frame_shift_length + 1
+    if num_frames <= 0:
+        return np.zeros(0, dtype=np.float64)
+    frames = np.lib.stride_tricks.sliding_window_view(waveform, frame_sample_length)[::frame_shift_length]
+    energy = np.einsum("ij,ij->i", frames, frames) + np.float32(0.000001)
+    return 10 * np.log10(energy.astype(np.float64))
+
+
+def compute_frame_probs(scores: np.ndarray, sil_pdf_ids: List[int],
+                        speech_2_noise_ratio: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    scores: (T, D) posteriors of the frames
+    return: noise_prob, speech_prob (log domain) and the speech score of every frame
+    """
+    sil_score = scores[:, sil_pdf_ids].sum(axis=1)
+    speech_score = 1.0 - sil_score
+    with np.errstate(divide="ignore"):
+        noise_prob = np.log(sil_score.astype(np.float64)) * speech_2_noise_ratio
+        speech_prob = np.log(speech_score.astype(np.float64))
+    return noise_prob, speech_prob, speech_score
+
+
+def compute_frame_states(decibel: np.ndarray, noise_prob: np.ndarray, speech_prob: np.ndarray,
+                         noise_average_decibel: float, speech_noise_thres: float, snr_thres: float,
+                         decibel_thres: float, noise_frame_num_used_for_snr: int) -> Tuple[np.ndarray, float]:
+    """
+    Speech (1) or silence (0) of every frame. The frames quieter than decibel_thres are silence, the others are
+    speech if their speech prob passes the noise prob by speech_noise_thres and their snr passes snr_thres. The
+    running noise average over the non speech frames is the only recursion.
+    return: frame_states, noise_average_decibel
+    """
+    frame_states = np.zeros(len(decibel), dtype=np.int8)
+    is_speech = (np.exp(speech_prob) >= np.exp(noise_prob) + speech_noise_thres).tolist()
+    loud = np.flatnonzero(decibel >= decibel_thres).tolist()
+    decibel = decibel.tolist()
+    for t in loud:
+        cur_decibel = decibel[t]
+        if is_speech[t]:
+            frame_states[t] = cur_decibel - noise_average_decibel >= snr_thres
+        elif noise_average_decibel < -99.9:
+            noise_average_decibel = cur_decibel
+        else:
+            noise_average_decibel = (cur_decibel + noise_average_decibel * (
+                    noise_frame_num_used_for_snr - 1)) / noise_frame_num_used_for_snr
+    return frame_states, noise_average_decibel
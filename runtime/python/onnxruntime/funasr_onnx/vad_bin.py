@@ -78,7 +78,9 @@ class Fsmn_vad():
 		self.max_end_sil = max_end_sil if max_end_sil is not None else config["model_conf"]["max_end_silence_time"]
 		self.encoder_conf = config["encoder_conf"]
 	
-	def prepare_cache(self, in_cache: list = []):
+	def prepare_cache(self, in_cache: list = None):
+		if in_cache is None:
+			in_cache = []
 		if len(in_cache) > 0:
 			return in_cache
 		fsmn_layers = self.encoder_conf["fsmn_layers"]
@@ -244,7 +246,9 @@ class Fsmn_vad_online():
 		self.max_end_sil = max_end_sil if max_end_sil is not None else config["model_conf"]["max_end_silence_time"]
 		self.encoder_conf = config["encoder_conf"]
 	
-	def prepare_cache(self, in_cache: list = []):
+	def prepare_cache(self, in_cache: list = None):
+		if in_cache is None:
+			in_cache = []
 		if len(in_cache) > 0:
 			return in_cache
 		fsmn_layers = self.encoder_conf["fsmn_layers"]
@@ -1,4 +1,5 @@
 import argparse
+import asyncio
 import base64
 import io
 import soundfile as sf
@@ -6,12 +7,25 @@ import uvicorn
 from fastapi import FastAPI, Body
 app = FastAPI()
 
-from funasr_onnx import Paraformer
+from funasr_onnx import Paraformer, Fsmn_vad, CT_Transformer, AsrPipeline, SessionPool
 model_dir = "damo/speech_paraformer-large_asr_nat-zh-cn-16k-common-vocab8404-onnx"
-model = Paraformer(model_dir, batch_size=1, quantize=True)
+# long audio: vad segmentation, batched asr of the segments and punctuation
+vad_model_dir = "damo/speech_fsmn_vad_zh-cn-16k-common-onnx"
+punc_model_dir = "damo/punc_ct-transformer_zh-cn-common-vocab272727-onnx"
+# number of model instances serving the requests in parallel, None: one instance per 4 cpus
+num_instances = None
+
+def build_pipeline(intra_op_num_threads=4):
+    model = Paraformer(model_dir, batch_size=1, quantize=True, intra_op_num_threads=intra_op_num_threads)
+    vad_model = Fsmn_vad(vad_model_dir, quantize=True, intra_op_num_threads=intra_op_num_threads)
+    punc_model = CT_Transformer(punc_model_dir, quantize=True, intra_op_num_threads=intra_op_num_threads)
+    return AsrPipeline(model, vad_model, punc_model)
+pool = SessionPool(build_pipeline, num_instances=num_instances)
 
 async def recognition_onnx(waveform):
-    result=model(waveform)[0]["preds"][0]
+    # the event loop keeps accepting requests while a pool worker decodes
+    result = await asyncio.wrap_future(pool.apply(lambda pipeline, wav: pipeline.asr_model(wav), waveform))
+    result = result[0]["preds"][0]
     return result
 @app.post("/api/asr")
 async def asr(item: dict = Body(...)):
@@ -26,6 +40,23 @@ async def asr(item: dict = Body(...)):
     return ret
 
 
+async def recognition_pipeline_onnx(waveform):
+    result = await asyncio.wrap_future(pool.submit(waveform))
+    result = result[0]
+    return result
+@app.post("/api/asr_pipeline")
+async def asr_pipeline(item: dict = Body(...)):
+    try:
+        audio_bytes = base64.b64decode(bytes(item['wav_base64'], 'utf-8'))
+        waveform, _ = sf.read(io.BytesIO(audio_bytes), dtype='float32')
+        result = await recognition_pipeline_onnx(waveform)
+        ret = {"results": result["text"], "timestamp": result.get("timestamp", []), "code": 0}
+    except:
+        print('请求出错，这里是处理出错的')
+        ret = {"results": '', "timestamp": [], "code": 1}
+    return ret
+
+
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='API Service')
     parser.add_argument('--listen', default='0.0.0.0', type=str, help='the network to listen')
@@ -0,0 +1,47 @@
+import time
+import librosa
+from funasr.utils.types import str2bool
+
+import argparse
+parser = argparse.ArgumentParser()
+parser.add_argument('--model_dir', type=str, required=True)
+parser.add_argument('--wav_file', type=str, required=True, help='wav.scp')
+parser.add_argument('--quantize', type=str2bool, default=False, help='quantized model')
+parser.add_argument('--threads_per_instance', type=int, default=1, help='intra_op_num_threads of every instance')
+parser.add_argument('--max_cpus', type=int, default=0, help='largest number of cpus to benchmark, 0: all')
+args = parser.parse_args()
+
+from funasr.runtime.python.onnxruntime.funasr_onnx import Paraformer, SessionPool
+from funasr.runtime.python.onnxruntime.funasr_onnx.utils.session_pool import get_available_cpus
+
+wav_file_f = open(args.wav_file, 'r')
+wav_files = wav_file_f.readlines()
+wav_paths = [line.split("\t")[1].strip() if "\t" in line else line.split(" ")[1].strip() for line in wav_files]
+waveforms = [librosa.load(wav_path, sr=16000)[0] for wav_path in wav_paths]
+duration_time = sum(len(waveform) for waveform in waveforms) / 16.0
+
+
+def build_model(intra_op_num_threads=1):
+    return Paraformer(args.model_dir, batch_size=1, quantize=args.quantize, intra_op_num_threads=intra_op_num_threads)
+
+
+# every request is one utterance, as sent by concurrent clients
+cpus = get_available_cpus()
+max_cpus = min(args.max_cpus, len(cpus)) if args.max_cpus > 0 else len(cpus)
+num_cpus_list = sorted(set([n for n in [1, 2, 4, 8, 16, 32, 64, 128] if n < max_cpus] + [max_cpus]))
+base_throughput = None
+for num_cpus in num_cpus_list:
+    num_instances = max(1, num_cpus // args.threads_per_instance)
+    pool = SessionPool(build_model, num_instances=num_instances, cpus=cpus[:num_cpus])
+    # warm-up
+    [future.result() for future in [pool.submit(waveform) for waveform in waveforms[:num_instances]]]
+    beg_time = time.time()
+    futures = [pool.submit(waveform) for waveform in waveforms]
+    [future.result() for future in futures]
+    duration = (time.time() - beg_time) * 1000
+    pool.close()
+    throughput = len(waveforms) / duration * 1000
+    base_throughput = base_throughput or throughput
+    print("cpus: {}, instances: {}, total_time_comput_ms: {}, total_time_wav_ms: {}, rtf: {:.5}, "
+          "utts/sec: {:.2f}, speedup: {:.2f}".format(num_cpus, num_instances, int(duration), int(duration_time),
+                                                    duration / duration_time, throughput, throughput / base_throughput))
@@ -0,0 +1,78 @@
+import time
+import librosa
+import numpy as np
+import torch
+from funasr.utils.types import str2bool
+
+import argparse
+parser = argparse.ArgumentParser()
+parser.add_argument('--model_dir', type=str, required=True, help='paraformer streaming model, exported with type=torchscripts')
+parser.add_argument('--vad_model_dir', type=str, default=None, help='fsmn-vad model, exported with type=torchscripts')
+parser.add_argument('--wav_file', type=str, required=True, help='wav.scp')
+parser.add_argument('--quantize', type=str2bool, default=False, help='quantized model')
+parser.add_argument('--intra_op_num_threads', type=int, default=1, help='torch threads')
+parser.add_argument('--chunk_size', type=str, default='0,10,5', help='chunk_size of paraformer streaming, 600ms')
+parser.add_argument('--vad_chunk_ms', type=int, default=200, help='chunk of fsmn-vad')
+args = parser.parse_args()
+
+from funasr import AutoModel
+from funasr.runtime.python.libtorch.funasr_torch import ParaformerOnline, Fsmn_vad_online
+
+torch.set_num_threads(args.intra_op_num_threads)
+chunk_size = [int(x) for x in args.chunk_size.split(',')]
+
+wav_file_f = open(args.wav_file, 'r')
+wav_files = wav_file_f.readlines()
+wav_paths = [line.split("\t")[1].strip() if "\t" in line else line.split(" ")[1].strip() for line in wav_files]
+waveforms = [librosa.load(wav_path, sr=16000)[0] for wav_path in wav_paths]
+
+
+def run_chunks(step, stride, name):
+    # latency of every chunk, the first utterance is a warm-up
+    latency = []
+    for n, waveform in enumerate(waveforms[:1] + waveforms):
+        num_chunks = (len(waveform) - 1) // stride + 1
+        state = {}
+        for i in range(num_chunks):
+            beg_time = time.perf_counter()
+            step(waveform[i * stride:(i + 1) * stride], i == num_chunks - 1, state)
+            if n > 0:
+                latency.append((time.perf_counter() - beg_time) * 1000)
+    latency = np.array(latency)
+    print("{}: chunks: {}, chunk_ms: {}, latency_ms mean: {:.2f}, p50: {:.2f}, p90: {:.2f}, p99: {:.2f}".format(
+        name, len(latency), stride // 16, latency.mean(), np.percentile(latency, 50), np.percentile(latency, 90),
+        np.percentile(latency, 99)))
+    return latency
+
+
+def eager_step(model, **kwargs):
+    def step(chunk, is_final, state):
+        model.generate(input=chunk, cache=state, is_final=is_final, disable_pbar=True, **kwargs)
+    return step
+
+
+def script_step(model):
+    def step(chunk, is_final, state):
+        state["is_final"] = is_final
+        state.setdefault("cache", {})
+        model(chunk, param_dict=state)
+    return step
+
+
+# paraformer streaming: eager generate_chunk vs torchscript encoder / cif / decoder with tensor caches
+stride = chunk_size[1] * 960
+eager = AutoModel(model=args.model_dir, disable_update=True, device="cpu")
+base = run_chunks(eager_step(eager, chunk_size=chunk_size, encoder_chunk_look_back=0, decoder_chunk_look_back=0),
+                  stride, "paraformer eager")
+script = ParaformerOnline(args.model_dir, chunk_size=chunk_size, quantize=args.quantize,
+                          intra_op_num_threads=args.intra_op_num_threads)
+latency = run_chunks(script_step(script), stride, "paraformer torchscript")
+print("paraformer speedup: {:.2f}".format(base.mean() / latency.mean()))
+
+if args.vad_model_dir is not None:
+    stride = args.vad_chunk_ms * 16
+    eager = AutoModel(model=args.vad_model_dir, disable_update=True, device="cpu")
+    base = run_chunks(eager_step(eager, chunk_size=args.vad_chunk_ms), stride, "fsmn-vad eager")
+    script = Fsmn_vad_online(args.vad_model_dir, quantize=args.quantize, intra_op_num_threads=args.intra_op_num_threads)
+    latency = run_chunks(script_step(script), stride, "fsmn-vad torchscript")
+    print("fsmn-vad speedup: {:.2f}".format(base.mean() / latency.mean()))
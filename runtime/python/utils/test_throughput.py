@@ -0,0 +1,46 @@
+import time
+import librosa
+from funasr.utils.types import str2bool
+
+import argparse
+parser = argparse.ArgumentParser()
+parser.add_argument('--model_dir', type=str, required=True)
+parser.add_argument('--wav_file', type=str, required=True, help='wav.scp')
+parser.add_argument('--quantize', type=str2bool, default=False, help='quantized model')
+parser.add_argument('--intra_op_num_threads', type=int, default=4, help='intra_op_num_threads for onnx')
+parser.add_argument('--batch_size', type=int, default=16, help='max number of waveforms per batch')
+parser.add_argument('--batch_size_frames', type=int, default=0, help='max padded fbank frames per batch, 0: unlimited')
+parser.add_argument('--num_runs', type=int, default=3)
+args = parser.parse_args()
+
+from funasr.runtime.python.onnxruntime.funasr_onnx import Paraformer
+
+wav_file_f = open(args.wav_file, 'r')
+wav_files = wav_file_f.readlines()
+wav_paths = [line.split("\t")[1].strip() if "\t" in line else line.split(" ")[1].strip() for line in wav_files]
+waveforms = [librosa.load(wav_path, sr=16000)[0] for wav_path in wav_paths]
+duration_time = sum(len(waveform) for waveform in waveforms) / 16.0
+
+# baseline: batches in input order through session.run, vs duration sorted batches through io binding
+configs = {
+    "baseline": dict(sort_by_length=False, io_binding=False, batch_size_frames=0),
+    "sorted_io_binding": dict(sort_by_length=True, io_binding=True, batch_size_frames=args.batch_size_frames),
+}
+results = {}
+for name, conf in configs.items():
+    model = Paraformer(args.model_dir, batch_size=args.batch_size, quantize=args.quantize,
+                       intra_op_num_threads=args.intra_op_num_threads, **conf)
+    # warm-up
+    model(waveforms[:args.batch_size])
+    total = 0.0
+    for i in range(args.num_runs):
+        beg_time = time.time()
+        results[name] = model(waveforms)
+        total += time.time() - beg_time
+    duration = total / args.num_runs * 1000
+    print("{}: total_time_comput_ms: {}, total_time_wav_ms: {}, rtf: {:.5}, utts/sec: {:.2f}".format(
+        name, int(duration), int(duration_time), duration / duration_time, len(waveforms) / duration * 1000))
+
+# the results are returned in the input order, the padding may change the output of some utterances slightly
+num_diff = sum(a['preds'] != b['preds'] for a, b in zip(results["baseline"], results["sorted_io_binding"]))
+print("utterances with different results: {} / {}".format(num_diff, len(waveforms)))
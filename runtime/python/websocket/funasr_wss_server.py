@@ -52,6 +52,14 @@ parser.add_argument("--punc_model_revision",
                     type=str,
                     default="v2.0.4",
                     help="")
+parser.add_argument("--spk_model",
+                    type=str,
+                    default="",
+                    help="speaker model from modelscope for online diarization, e.g. iic/speech_campplus_sv_zh-cn_16k-common")
+parser.add_argument("--spk_model_revision",
+                    type=str,
+                    default="master",
+                    help="")
 parser.add_argument("--ngpu",
                     type=int,
                     default=1,
@@ -124,6 +132,18 @@ if args.punc_model != "":
 else:
 	model_punc = None
 
+if args.spk_model != "":
+	model_spk = AutoModel(model=args.spk_model,
+	                      model_revision=args.spk_model_revision,
+	                      ngpu=args.ngpu,
+	                      ncpu=args.ncpu,
+	                      device=args.device,
+	                      disable_pbar=True,
+	                      disable_log=True,
+	                      )
+else:
+	model_spk = None
+
 
 
 print("model loaded! only support one client at the same time now!!!!")
@@ -136,6 +156,7 @@ async def ws_reset(websocket):
 	websocket.status_dict_vad["cache"] = {}
 	websocket.status_dict_vad["is_final"] = True
 	websocket.status_dict_punc["cache"] = {}
+	websocket.status_dict_spk["cache"] = {}
 	
 	await websocket.close()
 
@@ -158,6 +179,7 @@ async def ws_serve(websocket, path):
 	websocket.status_dict_asr_online = {"cache": {}, "is_final": False}
 	websocket.status_dict_vad = {'cache': {}, "is_final": False}
 	websocket.status_dict_punc = {'cache': {}}
+	websocket.status_dict_spk = {'cache': {}, "online_diarization": True}
 	websocket.chunk_interval = 10
 	websocket.vad_pre_idx = 0
 	speech_start = False
@@ -283,8 +305,13 @@ async def async_asr(websocket, audio_in):
 		if len(rec_result["text"])>0:
 			# print("offline", rec_result)
 			mode = "2pass-offline" if "2pass" in websocket.mode else websocket.mode
-			message = json.dumps({"mode": mode, "text": rec_result["text"], "wav_name": websocket.wav_name,"is_final":websocket.is_speaking})
-			await websocket.send(message)
+			message = {"mode": mode, "text": rec_result["text"], "wav_name": websocket.wav_name,"is_final":websocket.is_speaking}
+			if model_spk is not None:
+				# speaker of the finalized segment, the speakers of the stream are kept in the cache until the end
+				spk_result = model_spk.generate(input=audio_in, is_final=not websocket.is_speaking,
+				                                **websocket.status_dict_spk)[0]
+				message["spk"] = spk_result["spk"]
+			await websocket.send(json.dumps(message))
 
 
 async def async_asr_online(websocket, audio_in):
@@ -143,6 +143,9 @@ setup(
         "funasr = funasr.bin.inference:main_hydra",
         "funasr-train = funasr.bin.train:main_hydra",
         "funasr-export = funasr.bin.export:main_hydra",
+        "funasr-benchmark-dataloader = funasr.bin.benchmark_dataloader:main_hydra",
+        "funasr-benchmark-llm-packing = funasr.bin.benchmark_llm_packing:main_hydra",
+        "funasr-benchmark-cluster = funasr.bin.benchmark_cluster:main_hydra",
         "scp2jsonl = funasr.datasets.audio_datasets.scp2jsonl:main_hydra",
         "jsonl2scp = funasr.datasets.audio_datasets.jsonl2scp:main_hydra",
         "funasr-scp2jsonl = funasr.datasets.audio_datasets.scp2jsonl:main_hydra",
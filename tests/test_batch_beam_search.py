@@ -0,0 +1,80 @@
+import unittest
+
+import torch
+
+from funasr.models.ctc.ctc import CTC
+from funasr.models.paraformer.search import BatchBeamSearchPara, BeamSearchPara
+from funasr.models.transformer.decoder import TransformerDecoder
+from funasr.models.transformer.scorers.ctc import CTCPrefixScorer
+from funasr.models.transformer.scorers.length_bonus import LengthBonus
+from funasr.models.transformer.search import BatchBeamSearch, BeamSearch
+
+
+class TestBatchBeamSearch(unittest.TestCase):
+    vocab_size = 12
+    sos = eos = 11
+
+    def setUp(self):
+        torch.manual_seed(0)
+        self.decoder = TransformerDecoder(self.vocab_size, 16, attention_heads=2, linear_units=32, num_blocks=2).eval()
+        self.ctc = CTC(self.vocab_size, 16).eval()
+        # padded encoder outputs of a batch
+        self.x_lens = torch.tensor([13, 20, 9])
+        self.x = torch.randn(len(self.x_lens), self.x_lens.max(), 16) * 2
+        for b, length in enumerate(self.x_lens.tolist()):
+            self.x[b, length:] = 0.0
+
+    def build(self, search_class, ctc_weight, beam_size=3, decoder=True, **kwargs):
+        scorers = dict(length_bonus=LengthBonus(self.vocab_size))
+        if decoder:
+            scorers["decoder"] = self.decoder
+        if ctc_weight > 0:
+            scorers["ctc"] = CTCPrefixScorer(ctc=self.ctc, eos=self.eos)
+        return search_class(scorers=scorers,
+                            weights=dict(decoder=1.0 - ctc_weight, ctc=ctc_weight, length_bonus=0.5),
+                            beam_size=beam_size,
+                            vocab_size=self.vocab_size,
+                            sos=self.sos,
+                            eos=self.eos,
+                            **kwargs)
+
+    def assert_same_hyps(self, batch_hyps, hyps):
+        self.assertEqual(len(batch_hyps), len(hyps))
+        for batch_hyp, hyp in zip(batch_hyps, hyps):
+            self.assertEqual(batch_hyp.yseq.tolist(), hyp.yseq.tolist())
+            torch.testing.assert_close(torch.as_tensor(batch_hyp.score, dtype=torch.float32),
+                                       torch.as_tensor(hyp.score, dtype=torch.float32), rtol=1e-4, atol=1e-4)
+            for k, v in hyp.scores.items():
+                torch.testing.assert_close(torch.as_tensor(batch_hyp.scores[k], dtype=torch.float32),
+                                           torch.as_tensor(v, dtype=torch.float32), rtol=1e-4, atol=1e-4)
+
+    def test_beam_search(self):
+        for ctc_weight, maxlenratio, beam_size in [(0.0, 0.0, 3), (0.3, 0.0, 3), (0.3, 0.5, 4), (1.0, 0.0, 2)]:
+            with self.subTest(ctc_weight=ctc_weight, maxlenratio=maxlenratio, beam_size=beam_size):
+                pre_beam_score_key = None if ctc_weight == 1.0 else "full"
+                batch_beam_search = self.build(BatchBeamSearch, ctc_weight, beam_size,
+                                               pre_beam_score_key=pre_beam_score_key)
+                beam_search = self.build(BeamSearch, ctc_weight, beam_size, pre_beam_score_key=pre_beam_score_key)
+                with torch.no_grad():
+                    nbest_hyps_list = batch_beam_search(self.x, self.x_lens, maxlenratio=maxlenratio)
+                    for b, length in enumerate(self.x_lens.tolist()):
+                        nbest_hyps = beam_search(self.x[b, :length], maxlenratio=maxlenratio)
+                        self.assertGreater(len(nbest_hyps), 0)
+                        self.assert_same_hyps(nbest_hyps_list[b], nbest_hyps)
+
+    def test_beam_search_para(self):
+        am_lens = torch.tensor([5, 7, 3])
+        am_scores = torch.randn(len(am_lens), am_lens.max(), self.vocab_size).log_softmax(dim=-1)
+        # the am scores are the Paraformer decoder output, the decoder is not a scorer there
+        batch_beam_search = self.build(BatchBeamSearchPara, 0.5, decoder=False, pre_beam_score_key="full")
+        beam_search = self.build(BeamSearchPara, 0.5, decoder=False, pre_beam_score_key="full")
+        with torch.no_grad():
+            nbest_hyps_list = batch_beam_search(self.x, am_scores, x_lens=self.x_lens, am_lens=am_lens)
+            for b, (length, am_length) in enumerate(zip(self.x_lens.tolist(), am_lens.tolist())):
+                nbest_hyps = beam_search(self.x[b, :length], am_scores[b, :am_length])
+                self.assertGreater(len(nbest_hyps), 0)
+                self.assert_same_hyps(nbest_hyps_list[b], nbest_hyps)
+
+
+if __name__ == '__main__':
+    unittest.main()
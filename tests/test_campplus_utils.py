@@ -0,0 +1,140 @@
+import copy
+import unittest
+
+import numpy as np
+
+from funasr.models.campplus.utils import distribute_spk, merge_seque, postprocess, smooth
+
+
+# reference implementations, the per-segment loops the vectorized functions replaced
+def ref_postprocess(segments, vad_segments, labels, embeddings):
+    assert len(segments) == len(labels)
+    labels = ref_correct_labels(labels)
+    distribute_res = []
+    for i in range(len(segments)):
+        distribute_res.append([segments[i][0], segments[i][1], labels[i]])
+    distribute_res = ref_merge_seque(distribute_res)
+    for i in range(1, len(distribute_res)):
+        if distribute_res[i - 1][1] > distribute_res[i][0] + 1e-4:
+            p = (distribute_res[i][0] + distribute_res[i - 1][1]) / 2
+            distribute_res[i][0] = p
+            distribute_res[i - 1][1] = p
+    return ref_smooth(distribute_res)
+
+
+def ref_correct_labels(labels):
+    labels_id = 0
+    id2id = {}
+    new_labels = []
+    for i in labels:
+        if i not in id2id:
+            id2id[i] = labels_id
+            labels_id += 1
+        new_labels.append(id2id[i])
+    return np.array(new_labels)
+
+
+def ref_merge_seque(distribute_res):
+    res = [distribute_res[0]]
+    for i in range(1, len(distribute_res)):
+        if distribute_res[i][2] != res[-1][2] or distribute_res[i][0] > res[-1][1]:
+            res.append(distribute_res[i])
+        else:
+            res[-1][1] = distribute_res[i][1]
+    return res
+
+
+def ref_smooth(res, mindur=1):
+    if len(res) < 2:
+        return res
+    for i in range(len(res)):
+        res[i][0] = round(res[i][0], 2)
+        res[i][1] = round(res[i][1], 2)
+        if res[i][1] - res[i][0] < mindur:
+            if i == 0:
+                res[i][2] = res[i + 1][2]
+            elif i == len(res) - 1:
+                res[i][2] = res[i - 1][2]
+            elif res[i][0] - res[i - 1][1] <= res[i + 1][0] - res[i][1]:
+                res[i][2] = res[i - 1][2]
+            else:
+                res[i][2] = res[i + 1][2]
+    return ref_merge_seque(res)
+
+
+def ref_distribute_spk(sentence_list, sd_time_list):
+    sd_sentence_list = []
+    for d in sentence_list:
+        sentence_start = d['start']
+        sentence_end = d['end']
+        sentence_spk = 0
+        max_overlap = 0
+        for sd_time in sd_time_list:
+            spk_st, spk_ed, spk = sd_time
+            spk_st = spk_st * 1000
+            spk_ed = spk_ed * 1000
+            overlap = max(min(sentence_end, spk_ed) - max(sentence_start, spk_st), 0)
+            if overlap > max_overlap:
+                max_overlap = overlap
+                sentence_spk = spk
+        d['spk'] = int(sentence_spk)
+        sd_sentence_list.append(d)
+    return sd_sentence_list
+
+
+def random_segments(rng, num_segments):
+    # sliding windows like sv_chunk, with random hops, lengths and gaps
+    segments, start = [], rng.uniform(0, 2)
+    for _ in range(num_segments):
+        length = rng.choice([rng.uniform(0.1, 1.0), rng.uniform(1.0, 1.5)])
+        segments.append([start, start + length])
+        start += rng.choice([length * 0.5, length, length + rng.uniform(0, 1.0)])
+    return segments
+
+
+class TestCampplusUtils(unittest.TestCase):
+    def setUp(self):
+        self.rng = np.random.RandomState(0)
+
+    def assert_same(self, func, ref_func, *args):
+        try:
+            expected = ref_func(*copy.deepcopy(args))
+        except Exception as e:
+            with self.assertRaises(type(e)):
+                func(*copy.deepcopy(args))
+            return
+        self.assertEqual(func(*copy.deepcopy(args)), expected)
+
+    def test_postprocess(self):
+        for num_segments in [0, 1, 2, 3] + [int(n) for n in self.rng.randint(4, 40, 500)]:
+            segments = random_segments(self.rng, num_segments)
+            labels = self.rng.choice([3, 7, 1, 5][:self.rng.randint(1, 5)], num_segments)
+            embeddings = self.rng.randn(num_segments, 4)
+            self.assert_same(postprocess, ref_postprocess, segments, [], labels, embeddings)
+
+    def test_merge_seque_and_smooth(self):
+        for num_segments in [0, 1, 2] + [int(n) for n in self.rng.randint(3, 30, 500)]:
+            segments = [[st, ed, int(label)] for (st, ed), label in
+                        zip(random_segments(self.rng, num_segments), self.rng.randint(0, 3, num_segments))]
+            self.assert_same(merge_seque, ref_merge_seque, segments)
+            self.assert_same(smooth, ref_smooth, segments)
+
+    def test_distribute_spk(self):
+        for i in range(500):
+            sd_time_list = ref_postprocess(*copy.deepcopy(
+                [random_segments(self.rng, 10), [], self.rng.randint(0, 3, 10), None]))
+            if i % 5 == 0:
+                # unsorted segments, scored against every sentence
+                self.rng.shuffle(sd_time_list)
+            start = 0
+            sentence_list = []
+            for _ in range(self.rng.randint(0, 8)):
+                start += int(self.rng.randint(0, 3000))
+                end = start + int(self.rng.randint(0, 4000))
+                sentence_list.append({"start": start, "end": end, "text": "a"})
+                start = end
+            self.assert_same(distribute_spk, ref_distribute_spk, sentence_list, sd_time_list)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import unittest
+
+import numpy as np
+
+from funasr.models.campplus.cluster_backend import ClusterBackend
+
+
+# reference implementation, the per-label loop merge_by_cos replaced
+def ref_merge_by_cos(labels, embs, cos_thr):
+    assert cos_thr > 0 and cos_thr <= 1
+    while True:
+        spk_num = labels.max() + 1
+        if spk_num == 1:
+            break
+        spk_center = []
+        for i in range(spk_num):
+            spk_emb = embs[labels == i].mean(0)
+            spk_center.append(spk_emb)
+        assert len(spk_center) > 0
+        spk_center = np.stack(spk_center, axis=0)
+        norm_spk_center = spk_center / np.linalg.norm(
+            spk_center, axis=1, keepdims=True)
+        affinity = np.matmul(norm_spk_center, norm_spk_center.T)
+        affinity = np.triu(affinity, 1)
+        spks = np.unravel_index(np.argmax(affinity), affinity.shape)
+        if affinity[spks] < cos_thr:
+            break
+        for i in range(len(labels)):
+            if labels[i] == spks[1]:
+                labels[i] = spks[0]
+            elif labels[i] > spks[1]:
+                labels[i] -= 1
+    return labels
+
+
+class TestMergeByCos(unittest.TestCase):
+    def setUp(self):
+        self.rng = np.random.RandomState(0)
+        self.cluster_backend = ClusterBackend()
+
+    def random_case(self):
+        # speakers around a few centers, so that some of the clusters are close enough to be merged
+        num_centers = self.rng.randint(1, 6)
+        spk_num = self.rng.randint(1, 9)
+        num_embs = self.rng.randint(spk_num, 200)
+        centers = self.rng.randn(num_centers, 16)
+        spk_center = centers[self.rng.randint(0, num_centers, spk_num)] + self.rng.randn(spk_num, 16) * 0.4
+        labels = np.concatenate([np.arange(spk_num), self.rng.randint(0, spk_num, num_embs - spk_num)])
+        self.rng.shuffle(labels)
+        embs = (spk_center[labels] + self.rng.randn(num_embs, 16) * 0.5).astype(np.float32)
+        return labels, embs
+
+    def test_merge_by_cos(self):
+        num_merged = 0
+        for i in range(300):
+            labels, embs = self.random_case()
+            if i % 3 == 0:
+                # unlabeled embeddings keep -1
+                labels[self.rng.rand(len(labels)) < 0.1] = -1
+                if labels.max() < 0 or len(np.unique(labels[labels >= 0])) != labels.max() + 1:
+                    continue
+            cos_thr = self.rng.choice([0.5, 0.78, 0.9])
+            expected = ref_merge_by_cos(labels.copy(), embs, cos_thr)
+            merged = self.cluster_backend.merge_by_cos(labels.copy(), embs, cos_thr)
+            np.testing.assert_array_equal(merged, expected)
+            num_merged += expected.max() < labels.max()
+        self.assertGreater(num_merged, 50)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import unittest
+
+import torch
+
+from funasr.models.paraformer.model import Paraformer
+from funasr.utils.compile_utils import compile_model
+
+
+class CountingBackend:
+    """torch.compile backend running the captured graphs eagerly, counting the compilations"""
+
+    def __init__(self):
+        self.num_graphs = 0
+
+    def __call__(self, gm, example_inputs):
+        self.num_graphs += 1
+        return gm.forward
+
+
+class TestCompileModel(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        torch._dynamo.reset()
+        torch.manual_seed(0)
+        cls.model = Paraformer(encoder="SANMEncoder",
+                               encoder_conf={"output_size": 16, "attention_heads": 2, "linear_units": 32,
+                                             "num_blocks": 2, "input_layer": "pe"},
+                               decoder="ParaformerSANMDecoder",
+                               decoder_conf={"attention_heads": 2, "linear_units": 32, "num_blocks": 2},
+                               predictor="CifPredictorV2",
+                               predictor_conf={"idim": 16, "threshold": 1.0, "l_order": 1, "r_order": 1},
+                               input_size=20,
+                               vocab_size=10,
+                               ).eval()
+        cls.encode = cls.model.encode
+        cls.cal_decoder_with_predictor = cls.model.cal_decoder_with_predictor
+        cls.backend = CountingBackend()
+        cls.stats = compile_model(cls.model, input_size=20, compile_backend=cls.backend,
+                                  compile_buckets=[16, 32], compile_token_buckets=[4, 8],
+                                  compile_batch_buckets=[1, 2])
+
+    @classmethod
+    def tearDownClass(cls):
+        torch._dynamo.reset()
+
+    def setUp(self):
+        self.stats.reset()
+
+    def test_bucketed_outputs(self):
+        num_graphs = self.backend.num_graphs
+        self.assertGreater(num_graphs, 0)
+        with torch.no_grad():
+            for batch_size, lengths, num_tokens in [(1, [11], 3), (2, [20, 13], 5), (2, [32, 7], 8), (1, [16], 4)]:
+                speech = torch.randn(batch_size, max(lengths), 20)
+                speech_lengths = torch.tensor(lengths, dtype=torch.int32)
+                encoder_out, encoder_out_lens = self.model.encode(speech, speech_lengths)
+                encoder_out_ref, encoder_out_lens_ref = self.encode(speech, speech_lengths)
+                self.assertEqual(encoder_out.shape, encoder_out_ref.shape)
+                self.assertTrue(torch.equal(encoder_out_lens, encoder_out_lens_ref))
+                for i, length in enumerate(lengths):
+                    torch.testing.assert_close(encoder_out[i, :length], encoder_out_ref[i, :length],
+                                               rtol=1e-4, atol=1e-5)
+
+                embeds = torch.randn(batch_size, num_tokens, 16)
+                embeds_lengths = torch.full((batch_size,), num_tokens, dtype=torch.int64)
+                embeds_lengths[-1] = max(num_tokens - 2, 1)
+                decoder_out, _ = self.model.cal_decoder_with_predictor(encoder_out, encoder_out_lens, embeds,
+                                                                       embeds_lengths)
+                decoder_out_ref, _ = self.cal_decoder_with_predictor(encoder_out_ref, encoder_out_lens_ref, embeds,
+                                                                     embeds_lengths)
+                self.assertEqual(decoder_out.shape, decoder_out_ref.shape)
+                for i, length in enumerate(embeds_lengths.tolist()):
+                    torch.testing.assert_close(decoder_out[i, :length], decoder_out_ref[i, :length],
+                                               rtol=1e-4, atol=1e-5)
+        # every shape fell into a bucket compiled at warmup
+        self.assertEqual(self.backend.num_graphs, num_graphs)
+        summary = self.stats.summary()
+        self.assertEqual(summary["encoder"]["hit_rate"], 1.0)
+        self.assertEqual(summary["decoder"]["hit_rate"], 1.0)
+
+    def test_above_largest_bucket(self):
+        num_graphs = self.backend.num_graphs
+        speech = torch.randn(1, 40, 20)
+        speech_lengths = torch.tensor([40], dtype=torch.int32)
+        with torch.no_grad():
+            encoder_out, _ = self.model.encode(speech, speech_lengths)
+            encoder_out_ref, _ = self.encode(speech, speech_lengths)
+        torch.testing.assert_close(encoder_out, encoder_out_ref)
+        self.assertEqual(self.backend.num_graphs, num_graphs)
+        self.assertEqual(self.stats.summary()["encoder"]["hit_rate"], 0.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import unittest
+
+import torch
+
+from funasr.models.transformer.scorers.context_graph import ContextGraph
+
+
+class TestContextGraph(unittest.TestCase):
+    n_vocab = 12
+    eos = 11
+
+    def step_scores(self, graph, seq):
+        """Bonus of each token of seq, then of the final eos"""
+        ys = torch.tensor([[self.eos]])
+        states = [None]
+        scores = []
+        for token in seq + [self.eos]:
+            s, states = graph.batch_score(ys, states, torch.zeros(1, 1, 1))
+            scores.append(float(s[0, token]))
+            ys = torch.cat([ys, torch.tensor([[token]])], dim=1)
+        return scores
+
+    def test_hotword_containing_another(self):
+        graph = ContextGraph(self.n_vocab, self.eos, context_score=1.0)
+        graph.build([[1, 2, 3, 4], [2, 3]])
+        self.assertEqual(self.step_scores(graph, [1, 2, 3, 4]), [1.0, 1.0, 1.0, 1.0, 0.0])
+        # the inner hotword is kept when the longer one fails
+        self.assertAlmostEqual(sum(self.step_scores(graph, [1, 2, 3, 5])), 2.0)
+        self.assertAlmostEqual(sum(self.step_scores(graph, [1, 2])), 0.0)
+
+        graph.build([[1, 2, 3, 4], [3]])
+        self.assertEqual(self.step_scores(graph, [1, 2, 3, 4]), [1.0, 1.0, 1.0, 1.0, 0.0])
+        self.assertAlmostEqual(sum(self.step_scores(graph, [1, 2, 3])), 1.0)
+        self.assertAlmostEqual(sum(self.step_scores(graph, [1, 2, 3, 3])), 2.0)
+
+    def test_overlapping_hotwords(self):
+        graph = ContextGraph(self.n_vocab, self.eos, context_score=1.5)
+        graph.build([[1, 2], [1, 2, 3], [4, 5, 6], [2, 3]])
+        self.assertAlmostEqual(sum(self.step_scores(graph, [7, 1, 2, 8])), 3.0)
+        self.assertAlmostEqual(sum(self.step_scores(graph, [1, 2, 3])), 4.5)
+        self.assertAlmostEqual(sum(self.step_scores(graph, [4, 5, 7])), 0.0)
+        self.assertAlmostEqual(sum(self.step_scores(graph, [4, 5, 6, 4, 5, 6])), 9.0)
+        self.assertAlmostEqual(sum(self.step_scores(graph, [4, 4, 5, 6])), 4.5)
+
+    def test_batch_matches_single(self):
+        graph = ContextGraph(self.n_vocab, self.eos, context_score=1.0)
+        graph.build([[1, 2, 3, 9], [2, 3], [2, 3, 4, 5], [3, 4], [9]])
+        seqs = [[1, 2, 3, 4, 5], [2, 3, 4, 6, 9], [1, 2, 3, 9, 3], [3, 4, 3, 4, 2]]
+        ys = torch.full((len(seqs), 1), self.eos)
+        states = [None] * len(seqs)
+        batch_scores = []
+        for i in range(len(seqs[0]) + 1):
+            s, states = graph.batch_score(ys, states, torch.zeros(len(seqs), 1, 1))
+            tokens = torch.tensor([seq[i] if i < len(seq) else self.eos for seq in seqs])
+            batch_scores.append(s[torch.arange(len(seqs)), tokens].tolist())
+            ys = torch.cat([ys, tokens.unsqueeze(1)], dim=1)
+        for b, seq in enumerate(seqs):
+            self.assertEqual([row[b] for row in batch_scores], self.step_scores(graph, seq))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+import os
+import unittest
+from types import SimpleNamespace
+
+import torch
+import yaml
+
+import funasr
+from funasr.models.contextual_paraformer.model import ContextualParaformer
+from funasr.models.seaco_paraformer.model import SeacoParaformer
+from funasr.tokenizer.char_tokenizer import CharTokenizer
+from funasr.utils.hotword_utils import HotwordCache, hotword_key
+
+
+def build_model(model_class, name, vocab_size):
+    """a small model of the template config of funasr/models/{name}"""
+    with open(os.path.join(os.path.dirname(funasr.__file__), "models", name, "template.yaml")) as f:
+        conf = yaml.safe_load(f)
+    conf["encoder_conf"].update(output_size=32, linear_units=32, num_blocks=1)
+    conf["decoder_conf"].update(linear_units=32, num_blocks=2, att_layer_num=2)
+    if "seaco_decoder_conf" in conf:
+        conf["seaco_decoder_conf"].update(linear_units=32, num_blocks=1)
+    conf["predictor_conf"]["idim"] = 32
+    for key in ["inner_dim", "bias_encoder_dim"]:
+        if key in conf["model_conf"]:
+            conf["model_conf"][key] = 32
+    torch.manual_seed(0)
+    model = model_class(**conf, **conf["model_conf"], input_size=20, vocab_size=vocab_size)
+    return model.eval()
+
+
+class CountingTokenizer(CharTokenizer):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.num_calls = 0
+
+    def tokens2ids(self, tokens):
+        self.num_calls += 1
+        return super().tokens2ids(tokens)
+
+
+class TestHotwordCache(unittest.TestCase):
+    token_list = ["<blank>", "<s>", "</s>", "a", "b", "c", "d", "<unk>"]
+
+    def count_calls(self, module):
+        calls = []
+        module.register_forward_hook(lambda *args: calls.append(1))
+        return calls
+
+    def test_lru(self):
+        cache = HotwordCache(max_size=2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        self.assertEqual(cache.get("a"), 1)
+        cache.put("c", 3)
+        # "b" is the least recently used
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), 1)
+        self.assertEqual(cache.get("c"), 3)
+
+    def test_generate_hotwords_list(self):
+        model = build_model(ContextualParaformer, "contextual_paraformer", len(self.token_list))
+        tokenizer = CountingTokenizer(token_list=self.token_list)
+        frontend = SimpleNamespace(cmvn_file=None)
+        hotword_list = model.generate_hotwords_list("a b c d", tokenizer=tokenizer, frontend=frontend)
+        self.assertEqual(hotword_list, [[3], [4], [5], [6], [model.sos]])
+        self.assertEqual(tokenizer.num_calls, 4)
+        # hit: the same content is not tokenized again
+        self.assertIs(model.generate_hotwords_list("a b c d", tokenizer=tokenizer, frontend=frontend), hotword_list)
+        self.assertEqual(tokenizer.num_calls, 4)
+        # miss: another list
+        self.assertEqual(model.generate_hotwords_list("d c", tokenizer=tokenizer, frontend=frontend),
+                         [[6], [5], [model.sos]])
+        self.assertEqual(tokenizer.num_calls, 6)
+
+    def test_contextual_bias_encoder(self):
+        model = build_model(ContextualParaformer, "contextual_paraformer", len(self.token_list))
+        calls = self.count_calls(model.bias_encoder)
+        encoder_out = torch.randn(2, 9, 32)
+        encoder_out_lens = torch.tensor([9, 7])
+        sematic_embeds = torch.randn(2, 3, 32)
+        ys_pad_lens = torch.tensor([3, 2])
+        hw_list = [[3, 4], [5], [1]]
+        with torch.no_grad():
+            out, _ = model.cal_decoder_with_predictor(encoder_out, encoder_out_lens, sematic_embeds, ys_pad_lens,
+                                                      hw_list=hw_list)
+            self.assertEqual(len(calls), 1)
+            self.assertIsNotNone(model.hotword_cache.get(("bias_encoder", hotword_key(hw_list), "cpu")))
+            # hit
+            out_cached, _ = model.cal_decoder_with_predictor(encoder_out, encoder_out_lens, sematic_embeds,
+                                                             ys_pad_lens, hw_list=[list(hw) for hw in hw_list])
+            self.assertEqual(len(calls), 1)
+            torch.testing.assert_close(out_cached, out)
+            # miss
+            model.cal_decoder_with_predictor(encoder_out, encoder_out_lens, sematic_embeds, ys_pad_lens,
+                                             hw_list=[[6], [1]])
+            self.assertEqual(len(calls), 2)
+            # training always encodes
+            model.train()
+            model.cal_decoder_with_predictor(encoder_out, encoder_out_lens, sematic_embeds, ys_pad_lens,
+                                             hw_list=hw_list)
+            self.assertEqual(len(calls), 3)
+
+    def test_seaco_bias_encoder(self):
+        model = build_model(SeacoParaformer, "seaco_paraformer", len(self.token_list))
+        calls = self.count_calls(model.bias_encoder)
+        encoder_out = torch.randn(2, 9, 32)
+        encoder_out_lens = torch.tensor([9, 7])
+        sematic_embeds = torch.randn(2, 3, 32)
+        ys_pad_lens = torch.tensor([3, 2])
+        hw_list = [[3, 4], [5], [6, 3], [1]]
+        with torch.no_grad():
+            out = model._seaco_decode_with_ASF(encoder_out, encoder_out_lens, sematic_embeds, ys_pad_lens, hw_list)
+            self.assertEqual(len(calls), 1)
+            self.assertIsNotNone(model.hotword_cache.get(("bias_encoder", hotword_key(hw_list), "cpu")))
+            # hit, also with the filter keeping 2 of the hotwords
+            out_cached = model._seaco_decode_with_ASF(encoder_out, encoder_out_lens, sematic_embeds, ys_pad_lens,
+                                                      hw_list)
+            model._seaco_decode_with_ASF(encoder_out, encoder_out_lens, sematic_embeds, ys_pad_lens, hw_list,
+                                         nfilter=2)
+            self.assertEqual(len(calls), 1)
+            torch.testing.assert_close(out_cached, out)
+            # miss
+            model._seaco_decode_with_ASF(encoder_out, encoder_out_lens, sematic_embeds, ys_pad_lens, [[6], [1]])
+            self.assertEqual(len(calls), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import unittest
+
+import torch
+
+from funasr.models.sa_asr.transformer_decoder import TransformerDecoder as SAASRTransformerDecoder
+from funasr.models.transformer.decoder import TransformerDecoder
+from funasr.models.transformer.utils.mask import subsequent_mask
+
+
+class TestKVCache(unittest.TestCase):
+    vocab_size = 12
+
+    def setUp(self):
+        torch.manual_seed(0)
+        self.decoders = [
+            TransformerDecoder(self.vocab_size, 16, attention_heads=2, linear_units=32, num_blocks=2).eval(),
+            TransformerDecoder(self.vocab_size, 16, attention_heads=2, linear_units=32, num_blocks=2,
+                               normalize_before=False, concat_after=True).eval(),
+            SAASRTransformerDecoder(self.vocab_size, 16, attention_heads=2, linear_units=32, num_blocks=2).eval(),
+        ]
+
+    def full_step(self, decoder, ys, memory, memory_mask=None):
+        """scores of the next token with all the tokens through the blocks, without cache"""
+        ys_mask = subsequent_mask(ys.size(-1), device=ys.device).unsqueeze(0)
+        logp, _ = decoder.forward_one_step(ys, ys_mask, memory, cache=None, memory_mask=memory_mask)
+        return logp
+
+    def test_score(self):
+        x = torch.randn(11, 16)
+        ys = torch.randint(0, self.vocab_size, (7,))
+        for decoder in self.decoders:
+            self.assertTrue(decoder.use_kv_cache())
+            state = None
+            with torch.no_grad():
+                for i in range(1, len(ys) + 1):
+                    logp, state = decoder.score(ys[:i], state, x)
+                    torch.testing.assert_close(logp, self.full_step(decoder, ys[None, :i], x[None])[0],
+                                               rtol=1e-5, atol=1e-5)
+
+    def test_batch_score(self):
+        # 2 utterances of padded memory, 3 hypotheses each, rearranged within their utterance after each step
+        x_lens = torch.tensor([9, 6])
+        x = torch.randn(2, 9, 16)
+        xs = x.repeat_interleave(3, dim=0)
+        xs_mask = (torch.arange(9)[None] < x_lens[:, None]).unsqueeze(1).repeat_interleave(3, dim=0)
+        for decoder in self.decoders:
+            ys = torch.zeros(6, 1, dtype=torch.long)
+            states = [None] * 6
+            with torch.no_grad():
+                for i in range(6):
+                    logp, states = decoder.batch_score(ys, states, xs, xs_mask=xs_mask)
+                    torch.testing.assert_close(logp, self.full_step(decoder, ys, xs, xs_mask), rtol=1e-5, atol=1e-5)
+                    prev_ids = (torch.randint(0, 3, (2, 3)) + torch.tensor([[0], [3]])).view(-1)
+                    new_tokens = torch.randint(0, self.vocab_size, (6,))
+                    states = decoder.batch_rearrange_state(states, prev_ids)
+                    ys = torch.cat((ys[prev_ids], new_tokens[:, None]), dim=1)
+                    for c in states["layers"]:
+                        self.assertTrue(all(v.size(0) == 6 for v in c.values()))
+
+                # one hypothesis, scored on its own by `score` from then on
+                state = decoder.select_state(states, 4)
+                for c in state["layers"]:
+                    self.assertTrue(all(v.size(0) == 1 for v in c.values()))
+                logp, _ = decoder.score(ys[4], state, x[1, :6])
+                torch.testing.assert_close(logp, self.full_step(decoder, ys[4:5], x[1:2, :6])[0],
+                                           rtol=1e-5, atol=1e-5)
+
+                # the states of single hypotheses, batched again
+                states = [decoder.select_state(states, i) for i in [5, 0, 3]]
+                logp, _ = decoder.batch_score(ys[[5, 0, 3]], states, xs[[5, 0, 3]], xs_mask=xs_mask[[5, 0, 3]])
+                torch.testing.assert_close(logp, self.full_step(decoder, ys[[5, 0, 3]], xs[[5, 0, 3]],
+                                                                xs_mask[[5, 0, 3]]), rtol=1e-5, atol=1e-5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+import itertools
+import math
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import torch
+
+from funasr.models.transformer.scorers.ngram import NgramLM, NgramScorer
+
+
+def random_arpa(rng, words, max_order=3):
+    """n-grams of a random backoff LM: {ngram: (log10 prob, log10 backoff)}, the contexts of all n-grams kept"""
+    ngrams = {(w,): (rng.uniform(-3, -0.5), rng.uniform(-1, 0)) for w in words}
+    ngrams[("<s>",)] = (-99.0, rng.uniform(-1, 0))
+    for n in range(2, max_order + 1):
+        contexts = [ngram for ngram in ngrams if len(ngram) == n - 1 and ngram[-1] != "</s>"]
+        for context in contexts:
+            for w in words:
+                if w != "<s>" and rng.rand() < 0.4:
+                    backoff = rng.uniform(-1, 0) if n < max_order and w != "</s>" else None
+                    ngrams[context + (w,)] = (rng.uniform(-3, -0.1), backoff)
+    return ngrams
+
+
+def write_arpa(path, ngrams):
+    max_order = max(len(ngram) for ngram in ngrams)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\\data\\\n")
+        for n in range(1, max_order + 1):
+            f.write(f"ngram {n}={sum(len(ngram) == n for ngram in ngrams)}\n")
+        for n in range(1, max_order + 1):
+            f.write(f"\n\\{n}-grams:\n")
+            for ngram, (prob, backoff) in ngrams.items():
+                if len(ngram) == n:
+                    fields = [f"{prob:.6f}", *ngram] + ([] if backoff is None else [f"{backoff:.6f}"])
+                    f.write("\t".join(fields) + "\n")
+        f.write("\n\\end\\\n")
+
+
+# reference implementation, the backoff recursion over the n-gram dict
+def ref_score(ngrams, max_order, history, w):
+    history = tuple(history[len(history) - max_order + 1:])
+    score = 0.0
+    while history + (w,) not in ngrams:
+        if history in ngrams and ngrams[history][1] is not None:
+            score += ngrams[history][1]
+        history = history[1:]
+    return (score + ngrams[history + (w,)][0]) * math.log(10)
+
+
+class TestNgramScorer(unittest.TestCase):
+    token_list = ["<blank>", "a", "b", "c", "d", "e", "f", "<unk>", "</s>"]
+    sos = eos = 8
+
+    def setUp(self):
+        self.rng = np.random.RandomState(0)
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        # "<blank>" and "f" are not in the LM, they are scored as "<unk>"
+        self.ngrams = random_arpa(self.rng, ["</s>", "<unk>", "a", "b", "c", "d", "e"])
+        self.arpa = os.path.join(self.tmp_dir.name, "lm.arpa")
+        write_arpa(self.arpa, self.ngrams)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def words(self, tokens):
+        words = []
+        for token in tokens:
+            word = "</s>" if token == self.eos else self.token_list[token]
+            words.append(word if (word,) in self.ngrams else "<unk>")
+        return words
+
+    def ref_scores(self, tokens):
+        history = ["<s>"] + self.words(tokens)
+        return [ref_score(self.ngrams, 3, history, w) for w in self.words(range(len(self.token_list)))]
+
+    def test_score(self):
+        scorer = NgramScorer(self.arpa, self.token_list, sos=self.sos, eos=self.eos)
+        x = torch.zeros(1, 4)
+        # all the prefixes of length 3, and random longer ones
+        prefixes = [list(p) for p in itertools.product(range(8), repeat=3)]
+        prefixes += [self.rng.randint(0, 8, 12).tolist() for _ in range(50)]
+        for prefix in prefixes:
+            state = scorer.init_state(x)
+            y = torch.tensor([self.sos])
+            for i in range(len(prefix) + 1):
+                scores, state = scorer.score(y, state, x)
+                np.testing.assert_allclose(scores.numpy(), self.ref_scores(prefix[:i]), rtol=1e-5, atol=1e-5)
+                if i < len(prefix):
+                    y = torch.cat((y, torch.tensor([prefix[i]])))
+
+    def test_batch_score(self):
+        lm = NgramLM.load(self.arpa)
+        npz = os.path.join(self.tmp_dir.name, "lm.npz")
+        lm.save(npz)
+        for ngram in [self.arpa, npz]:
+            scorer = NgramScorer(ngram, self.token_list, sos=self.sos, eos=self.eos)
+            xs = torch.zeros(6, 1, 4)
+            ys = torch.full((6, 1), self.sos, dtype=torch.long)
+            states = [None] * 6
+            for _ in range(8):
+                scores, states = scorer.batch_score(ys, states, xs)
+                for b in range(6):
+                    np.testing.assert_allclose(scores[b].numpy(), self.ref_scores(ys[b, 1:].tolist()),
+                                               rtol=1e-5, atol=1e-5)
+                prev_ids = torch.from_numpy(self.rng.randint(0, 6, 6))
+                states = scorer.batch_rearrange_state(states, prev_ids)
+                ys = torch.cat((ys[prev_ids], torch.from_numpy(self.rng.randint(0, 8, (6, 1)))), dim=1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+import json
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import torch
+
+from funasr.datasets.audio_datasets.datasets import AudioDataset
+from funasr.frontends.wav_frontend import WavFrontend
+from funasr.models.conformer.encoder import ConformerEncoder
+from funasr.models.paraformer.model import Paraformer
+from funasr.models.sanm.encoder import SANMEncoder
+from funasr.models.transformer.encoder import TransformerEncoder
+from funasr.tokenizer.char_tokenizer import CharTokenizer
+from funasr.utils.load_utils import extract_fbank
+
+
+class TestPadToMultiple(unittest.TestCase):
+    def setUp(self):
+        torch.manual_seed(0)
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.data_list = os.path.join(self.tmp_dir.name, "data.jsonl")
+        rng = np.random.RandomState(0)
+        self.frontend = WavFrontend(n_mels=20, dither=0.0)
+        self.tokenizer = CharTokenizer(token_list=["<blank>", "<s>", "</s>", "a", "b", "c", "<unk>"])
+        self.vocab_size = len(self.tokenizer.token_list)
+        # samples as returned by AudioDataset.__getitem__, built from waveforms in memory
+        self.samples = []
+        with open(self.data_list, "w") as f:
+            for i, (num_samples, target) in enumerate([(5600, "abcab"), (3700, "cba")]):
+                waveform = torch.from_numpy(rng.uniform(-0.1, 0.1, num_samples).astype(np.float32))
+                speech, speech_lengths = extract_fbank(waveform, data_type="sound", frontend=self.frontend, is_final=True)
+                text = torch.tensor(self.tokenizer.encode(target), dtype=torch.int64)
+                self.samples.append({"speech": speech[0, :, :],
+                                     "speech_lengths": speech_lengths,
+                                     "text": text,
+                                     "text_lengths": torch.tensor([len(text)], dtype=torch.int32),
+                                     })
+                f.write(json.dumps({"key": str(i), "source": f"{i}.wav", "target": target}) + "\n")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def collate(self, pad_to_multiple):
+        dataset = AudioDataset(self.data_list,
+                               index_ds="IndexDSJsonl",
+                               frontend=self.frontend,
+                               tokenizer=self.tokenizer,
+                               pad_to_multiple=pad_to_multiple,
+                               pin_memory=False,
+                               )
+        batch = dataset.collator(self.samples)
+        batch["speech_lengths"] = batch["speech_lengths"][:, 0]
+        batch["text_lengths"] = batch["text_lengths"][:, 0]
+        return batch
+
+    def test_collator(self):
+        batch = self.collate(pad_to_multiple=8)
+        self.assertEqual(batch["speech"].size(1) % 8, 0)
+        self.assertGreater(batch["speech"].size(1), batch["speech_lengths"].max())
+        self.assertTrue((batch["speech"][0, batch["speech_lengths"][0]:] == 0.0).all())
+        self.assertEqual(batch["text"].size(1), batch["text_lengths"].max())
+        self.assertTrue((batch["text"][1, batch["text_lengths"][1]:] == -1).all())
+
+    def test_encoders(self):
+        batch = self.collate(pad_to_multiple=1)
+        batch_padded = self.collate(pad_to_multiple=8)
+        encoders = [TransformerEncoder(20, output_size=16, attention_heads=2, linear_units=32, num_blocks=2,
+                                       input_layer="linear"),
+                    # the convolution module and the legacy relative shift see the padded length
+                    ConformerEncoder(20, output_size=16, attention_heads=2, linear_units=32, num_blocks=2,
+                                     input_layer="linear", pos_enc_layer_type="abs_pos",
+                                     selfattention_layer_type="selfattn", use_cnn_module=False),
+                    SANMEncoder(20, output_size=16, attention_heads=2, linear_units=32, num_blocks=2, input_layer="pe"),
+                    ]
+        for encoder in encoders:
+            encoder.eval()
+            with torch.no_grad():
+                out, out_lens, _ = encoder(batch["speech"], batch["speech_lengths"])
+                out_padded, out_lens_padded, _ = encoder(batch_padded["speech"], batch_padded["speech_lengths"])
+            self.assertTrue(torch.equal(out_lens, out_lens_padded))
+            for i, length in enumerate(out_lens.tolist()):
+                torch.testing.assert_close(out_padded[i, :length], out[i, :length], rtol=1e-4, atol=1e-5)
+
+    def test_conv2d_subsampling(self):
+        # the subsampled mask keeps the padded length, the longest sample may gain a frame like any shorter one
+        batch_padded = self.collate(pad_to_multiple=8)
+        encoder = TransformerEncoder(20, output_size=16, attention_heads=2, linear_units=32, num_blocks=2).eval()
+        with torch.no_grad():
+            out, out_lens, _ = encoder(batch_padded["speech"], batch_padded["speech_lengths"])
+        self.assertLessEqual(out_lens.max().item(), out.size(1))
+
+    def test_paraformer(self):
+        model = Paraformer(encoder="SANMEncoder",
+                           encoder_conf={"output_size": 16, "attention_heads": 2, "linear_units": 32, "num_blocks": 2,
+                                         "input_layer": "pe"},
+                           decoder="ParaformerSANMDecoder",
+                           decoder_conf={"attention_heads": 2, "linear_units": 32, "num_blocks": 2},
+                           predictor="CifPredictorV2",
+                           predictor_conf={"idim": 16, "threshold": 1.0, "l_order": 1, "r_order": 1},
+                           input_size=20,
+                           vocab_size=self.vocab_size,
+                           ctc_weight=0.3,
+                           predictor_weight=1.0,
+                           sampling_ratio=0.0,
+                           )
+        model.eval()
+        with torch.no_grad():
+            loss, stats, _ = model(**self.collate(pad_to_multiple=1))
+            loss_padded, stats_padded, _ = model(**self.collate(pad_to_multiple=8))
+        self.assertTrue(torch.isfinite(loss_padded).all())
+        torch.testing.assert_close(stats_padded["loss_ctc"], stats["loss_ctc"])
+        # the predictor convolution reads the padded encoder frames of the longest sample
+        torch.testing.assert_close(loss_padded, loss, rtol=1e-2, atol=1e-2)
+
+
+if __name__ == '__main__':
+    unittest.main()
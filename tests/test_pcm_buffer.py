@@ -0,0 +1,66 @@
+import unittest
+
+import numpy as np
+import torch
+
+from funasr.utils.load_utils import PcmBuffer, load_audio_to_buffer, load_bytes
+
+
+# reference implementation, the conversion load_bytes replaced
+def ref_load_bytes(input):
+    middle_data = np.frombuffer(input, dtype=np.int16)
+    i = np.iinfo(middle_data.dtype)
+    abs_max = 2 ** (i.bits - 1)
+    offset = i.min + abs_max
+    return np.frombuffer((middle_data.astype(np.float32) - offset) / abs_max, dtype=np.float32)
+
+
+class TestPcmBuffer(unittest.TestCase):
+    def setUp(self):
+        self.rng = np.random.RandomState(0)
+
+    def random_pcm(self, num_samples):
+        pcm = self.rng.randint(-32768, 32768, num_samples).astype(np.int16)
+        pcm[:2] = [-32768, 32767][:num_samples]
+        return pcm.tobytes()
+
+    def test_load_bytes(self):
+        for num_samples in [0, 2, 1000, 9600]:
+            data = self.random_pcm(num_samples)
+            np.testing.assert_array_equal(load_bytes(data), ref_load_bytes(data))
+            out = np.full(num_samples, np.nan, dtype=np.float32)
+            self.assertIs(load_bytes(data, out=out), out)
+            np.testing.assert_array_equal(out, ref_load_bytes(data))
+
+    def test_concatenation(self):
+        # the streaming inference: the samples left by the previous call followed by the chunk, the m samples of the
+        # incomplete chunk are kept for the next call
+        chunk_stride_samples = 9600
+        for capacity in [16000 * 4, 100]:
+            buffer = PcmBuffer(capacity=capacity)
+            prev_samples = torch.empty(0)
+            for i in range(60):
+                num_samples = int(self.rng.choice([0, 1, 800, 9600, 12345, 40000]))
+                is_final = i % 20 == 19
+                if i % 2:
+                    data = self.random_pcm(num_samples)
+                    chunk = torch.from_numpy(ref_load_bytes(data).copy())
+                else:
+                    chunk = torch.from_numpy(self.rng.uniform(-1, 1, num_samples).astype(np.float32))
+                    data = chunk.clone() if i % 4 else chunk.numpy().copy()
+                audio_sample = load_audio_to_buffer(data, buffer)
+                expected = torch.cat((prev_samples, chunk))
+                self.assertTrue(torch.equal(audio_sample, expected))
+
+                m = 0 if is_final else len(expected) % chunk_stride_samples
+                buffer.consume(len(audio_sample) - m)
+                prev_samples = expected[len(expected) - m:]
+                if is_final:
+                    buffer.reset()
+                    prev_samples = torch.empty(0)
+                self.assertEqual(len(buffer), len(prev_samples))
+                self.assertTrue(torch.equal(buffer.samples(), prev_samples))
+
+
+if __name__ == '__main__':
+    unittest.main()
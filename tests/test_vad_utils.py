@@ -0,0 +1,164 @@
+import math
+import os
+import sys
+import unittest
+
+import numpy as np
+import torch
+
+from funasr.models.fsmn_vad_streaming.model import FsmnVADStreaming
+from funasr.models.fsmn_vad_streaming.vad_utils import compute_decibel, compute_frame_probs, compute_frame_states
+
+RUNTIME_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "runtime", "python")
+
+
+# reference implementations, the per-frame torch code the array functions replaced
+def ref_decibel(waveform, frame_sample_length, frame_shift_length):
+    decibel = []
+    for offset in range(0, waveform.shape[0] - frame_sample_length + 1, frame_shift_length):
+        decibel.append(10 * math.log10((waveform[offset: offset + frame_sample_length]).square().sum() + 0.000001))
+    return decibel
+
+
+def ref_frame_state(cur_decibel, scores_t, noise_average_decibel, sil_pdf_ids, speech_2_noise_ratio,
+                    speech_noise_thres, snr_thres, decibel_thres, noise_frame_num_used_for_snr):
+    cur_snr = cur_decibel - noise_average_decibel
+    if cur_decibel < decibel_thres:
+        return 0, noise_average_decibel
+    sum_score = sum([scores_t[sil_pdf_id] for sil_pdf_id in sil_pdf_ids])
+    noise_prob = math.log(sum_score) * speech_2_noise_ratio
+    sum_score = 1.0 - sum_score
+    speech_prob = math.log(sum_score)
+    if math.exp(speech_prob) >= math.exp(noise_prob) + speech_noise_thres:
+        return int(cur_snr >= snr_thres and cur_decibel >= decibel_thres), noise_average_decibel
+    if noise_average_decibel < -99.9:
+        return 0, cur_decibel
+    return 0, (cur_decibel + noise_average_decibel * (noise_frame_num_used_for_snr - 1)) / noise_frame_num_used_for_snr
+
+
+def speech_waveform(rng, bursts, num_samples):
+    """quiet noise with loud bursts at the (beg, end) samples"""
+    waveform = rng.uniform(-1e-4, 1e-4, num_samples)
+    for beg, end in bursts:
+        waveform[beg:end] = rng.uniform(-0.3, 0.3, end - beg)
+    return waveform.astype(np.float32)
+
+
+def speech_scores(rng, bursts, num_frames, num_pdfs=4):
+    """posteriors with a low silence score in the frames of the bursts"""
+    sil_score = rng.uniform(0.7, 0.99, num_frames)
+    for beg, end in bursts:
+        sil_score[beg // 160:end // 160] = rng.uniform(0.0, 0.3, end // 160 - beg // 160)
+    other = rng.dirichlet(np.ones(num_pdfs - 1), num_frames) * (1.0 - sil_score)[:, None]
+    return np.concatenate([sil_score[:, None], other], axis=1).astype(np.float32)[None]
+
+
+class TestVadUtils(unittest.TestCase):
+    def setUp(self):
+        self.rng = np.random.RandomState(0)
+
+    def test_identical_copies(self):
+        with open(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "funasr", "models",
+                               "fsmn_vad_streaming", "vad_utils.py")) as f:
+            source = f.read()
+        for package in [os.path.join("onnxruntime", "funasr_onnx"), os.path.join("libtorch", "funasr_torch")]:
+            with open(os.path.join(RUNTIME_DIR, package, "utils", "vad_utils.py")) as f:
+                self.assertEqual(f.read(), source)
+
+    def test_compute_decibel(self):
+        for num_samples in [0, 399, 400, 401, 560, 16000, 16123]:
+            waveform = self.rng.uniform(-0.5, 0.5, num_samples).astype(np.float32)
+            waveform[:num_samples // 3] *= 1e-4
+            decibel = compute_decibel(waveform, 400, 160)
+            expected = ref_decibel(torch.from_numpy(waveform), 400, 160)
+            self.assertEqual(len(decibel), len(expected))
+            np.testing.assert_allclose(decibel, expected, rtol=1e-5, atol=1e-4)
+
+    def test_compute_frame_states(self):
+        for sil_pdf_ids, speech_2_noise_ratio, speech_noise_thres, snr_thres, decibel_thres in [
+            ([0], 1.0, 0.6, -100.0, -100.0),
+            ([0], 1.0, -0.2, 10.0, -40.0),
+            ([0, 2], 0.5, 0.1, 5.0, -60.0),
+        ]:
+            num_frames = 300
+            scores = torch.from_numpy(self.rng.dirichlet(np.ones(4) * 0.5, num_frames).astype(np.float32))
+            decibel = np.concatenate([self.rng.uniform(-120, -30, num_frames // 2),
+                                      self.rng.uniform(-50, 20, num_frames - num_frames // 2)])
+            self.rng.shuffle(decibel)
+            noise_prob, speech_prob, _ = compute_frame_probs(scores.numpy(), sil_pdf_ids, speech_2_noise_ratio)
+            noise_average_decibel = -100.0
+            frame_states, noise_average_decibel = compute_frame_states(
+                decibel, noise_prob, speech_prob, noise_average_decibel, speech_noise_thres, snr_thres,
+                decibel_thres, 20)
+
+            expected_states = []
+            expected_noise_average_decibel = -100.0
+            for t in range(num_frames):
+                state, expected_noise_average_decibel = ref_frame_state(
+                    decibel[t], scores[t], expected_noise_average_decibel, sil_pdf_ids, speech_2_noise_ratio,
+                    speech_noise_thres, snr_thres, decibel_thres, 20)
+                expected_states.append(state)
+            self.assertEqual(frame_states.tolist(), expected_states)
+            self.assertAlmostEqual(noise_average_decibel, expected_noise_average_decibel, places=6)
+
+    def run_torch(self, waveform_chunks, scores_chunks, streaming, **vad_opts):
+        model = FsmnVADStreaming(encoder="FSMN",
+                                 encoder_conf={"input_dim": 8, "input_affine_dim": 8, "fsmn_layers": 1,
+                                               "linear_dim": 8, "proj_dim": 8, "lorder": 2, "rorder": 0,
+                                               "lstride": 1, "rstride": 0, "output_affine_dim": 8,
+                                               "output_dim": 4},
+                                 **vad_opts).eval()
+        # the posteriors of the encoder are replaced by the given scores
+        chunk_scores = []
+        model.encoder.register_forward_hook(lambda module, args, output: chunk_scores.pop(0))
+        cache = model.init_cache({})
+        segments = []
+        with torch.no_grad():
+            for i, (waveform, scores) in enumerate(zip(waveform_chunks, scores_chunks)):
+                chunk_scores.append(torch.from_numpy(scores))
+                segments_i = model(torch.zeros(1, scores.shape[1], 8), torch.from_numpy(waveform)[None], cache=cache,
+                                   is_final=i == len(scores_chunks) - 1, is_streaming_input=streaming)
+                if len(segments_i) > 0:
+                    segments.extend(*segments_i)
+        return segments
+
+    def run_runtime(self, package, waveform_chunks, scores_chunks, streaming, **vad_opts):
+        sys.path.insert(0, os.path.join(RUNTIME_DIR, os.path.dirname(package)))
+        try:
+            e2e_vad = __import__(f"{os.path.basename(package)}.utils.e2e_vad", fromlist=["E2EVadModel"])
+        finally:
+            sys.path.pop(0)
+        vad_scorer = e2e_vad.E2EVadModel(vad_opts)
+        segments = []
+        for i, (waveform, scores) in enumerate(zip(waveform_chunks, scores_chunks)):
+            segments_i = vad_scorer(scores, waveform[None], is_final=i == len(scores_chunks) - 1,
+                                    max_end_sil=vad_opts.get("max_end_silence_time", 800), online=streaming)
+            if len(segments_i) > 0:
+                segments.extend(*segments_i)
+        return segments
+
+    def test_segments(self):
+        num_samples = 16000 * 6
+        bursts = [(8000, 24000), (30000, 33000), (48000, 72000), (72800, 80000), (95000, 95900)]
+        waveform = speech_waveform(self.rng, bursts, num_samples + 240)
+        scores = speech_scores(self.rng, bursts, num_samples // 160)
+        # no decibel_thres: the frames below it are detected twice, at an index the pytorch model shifts by the
+        # dropped frames and the runtimes do not, so their segments already differed there
+        for vad_opts in [{}, {"snr_thres": 10.0}, {"max_end_silence_time": 300}, {"speech_2_noise_ratio": 0.8}]:
+            for streaming, chunk_frames in [(False, num_samples // 160), (True, 60), (True, 20)]:
+                waveform_chunks, scores_chunks = [], []
+                for beg in range(0, num_samples // 160, chunk_frames):
+                    end = min(beg + chunk_frames, num_samples // 160)
+                    waveform_chunks.append(waveform[beg * 160:end * 160 + 240])
+                    scores_chunks.append(scores[:, beg:end])
+                segments = self.run_torch(waveform_chunks, scores_chunks, streaming, **vad_opts)
+                self.assertGreater(len(segments), 0)
+                for package in ["onnxruntime/funasr_onnx", "libtorch/funasr_torch"]:
+                    with self.subTest(vad_opts=vad_opts, streaming=streaming, chunk_frames=chunk_frames,
+                                      package=package):
+                        self.assertEqual(self.run_runtime(package, waveform_chunks, scores_chunks, streaming,
+                                                          **vad_opts), segments)
+
+
+if __name__ == '__main__':
+    unittest.main()